@@ -57,3 +57,87 @@ def physiolabxr():
     except KeyboardInterrupt:
         print('App terminate by KeyboardInterrupt')
         sys.exit()
+
+
+def physiolabxr_record():
+    """
+    records streams without the GUI, for example
+        physiolabxr-record --preset MyExperiment --out recordings --start --duration 60
+    a running recorder is controlled with
+        physiolabxr-record --command start --subject S01
+    see physiolabxr.sub_process.HeadlessRecorder
+    """
+    import argparse
+    import json
+    import time
+
+    from physiolabxr.configs.configs import AppConfigs
+
+    parser = argparse.ArgumentParser(prog='physiolabxr-record', description='Record streams to .dats without the PhysioLabXR GUI')
+    parser.add_argument('--preset', help='name of the experiment preset whose streams are recorded')
+    parser.add_argument('--streams', nargs='+', default=[], help='names of stream presets recorded in addition to those of the experiment')
+    parser.add_argument('--out', help='directory the recordings are saved to, defaults to the recording file location in the settings')
+    parser.add_argument('--port', type=int, default=AppConfigs.headless_recorder_port, help='port of the control socket on localhost')
+    parser.add_argument('--start', action='store_true', help='start recording as soon as the streams are started')
+    parser.add_argument('--duration', type=float, help='seconds to record for before exiting, implies --start')
+    parser.add_argument('--subject', default='')
+    parser.add_argument('--session', default='')
+    parser.add_argument('--command', choices=['start', 'stop', 'status', 'exit'], help='send a command to a running recorder, print its reply and exit')
+    parser.add_argument('--device-args', nargs='+', action='append', default=[], metavar=('STREAM', 'NAME=VALUE'),
+                        help='arguments of the start_stream of a custom device, as given in its options in the GUI, e.g., --device-args DSI24 bluetooth_port=COM5')
+    parser.add_argument('--telemetry-port', type=int, default=AppConfigs.stream_telemetry_port, help='serve the health of the streams over HTTP on localhost at this port, 0 to not serve')
+    args = parser.parse_args()
+
+    from physiolabxr.sub_process.HeadlessRecorder import HeadlessRecorder, create_stream_interface, send_headless_recorder_command
+    if args.command is not None:
+        kwargs = {'subject': args.subject, 'session': args.session} if args.command == 'start' else {}
+        print(json.dumps(send_headless_recorder_command(args.command, args.port, **kwargs), indent=4))
+        return
+
+    AppConfigs(_reset=False)  # create the singleton app configs object, before the presets
+    from physiolabxr.configs import config
+    from physiolabxr.presets.Presets import Presets
+    presets = Presets(_preset_root=AppConfigs()._preset_path, _reset=False)
+    if args.preset is not None and args.preset not in presets.experiment_presets:
+        parser.error(f'--preset {args.preset}: no experiment preset of this name, must be one of {list(presets.experiment_presets)}')
+    stream_names = list(presets.experiment_presets[args.preset]) if args.preset is not None else []
+    stream_names += [stream_name for stream_name in args.streams if stream_name not in stream_names]
+    if len(stream_names) == 0:
+        parser.error('no stream to record, give an experiment preset with --preset or stream presets with --streams')
+    unknown_stream_names = [stream_name for stream_name in stream_names if stream_name not in presets.stream_presets]
+    if len(unknown_stream_names) > 0:
+        parser.error(f'no stream preset named {unknown_stream_names}')
+    start_stream_args = {}
+    for device_args in args.device_args:
+        if any('=' not in arg for arg in device_args[1:]):
+            parser.error(f'--device-args {" ".join(device_args)}: the arguments must be NAME=VALUE')
+        start_stream_args[device_args[0]] = dict(arg.split('=', 1) for arg in device_args[1:])
+    out_dir = args.out if args.out is not None else config.settings.value('recording_file_location', config.DEFAULT_DATA_DIR)
+
+    recorder = HeadlessRecorder({stream_name: create_stream_interface(presets.stream_presets[stream_name]) for stream_name in stream_names},
+                                out_dir, experiment_name=args.preset or '', control_port=args.port,
+                                eviction_interval=AppConfigs().eviction_interval / 1e3, pull_interval=AppConfigs().pull_data_interval / 1e3,
+                                max_queue_size=AppConfigs().recording_writer_max_queue_size, jpeg_quality=AppConfigs().video_recording_jpeg_quality,
+                                nominal_sampling_rates={stream_name: presets.stream_presets[stream_name].nominal_sampling_rate for stream_name in stream_names},
+                                start_stream_args=start_stream_args)
+    recorder.start()
+    print(f'physiolabxr-record: acquiring {stream_names}, control socket at tcp://127.0.0.1:{recorder.control_port}')
+    telemetry_server = None
+    if args.telemetry_port > 0:
+        from physiolabxr.utils.stream_telemetry import TelemetryServer
+        telemetry_server = TelemetryServer(args.telemetry_port)
+        telemetry_server.start()
+        print(f'physiolabxr-record: stream telemetry at http://127.0.0.1:{telemetry_server.port}/metrics')
+    if args.start or args.duration is not None:
+        recorder.start_recording(args.subject, args.session)
+    start_time = time.perf_counter()
+    try:
+        while recorder.is_alive():
+            recorder.join(timeout=0.5)
+            if args.duration is not None and time.perf_counter() - start_time >= args.duration:
+                recorder.running = False  # the recording is stopped before the thread ends
+    except KeyboardInterrupt:
+        recorder.running = False
+    recorder.join()
+    if telemetry_server is not None:
+        telemetry_server.stop()
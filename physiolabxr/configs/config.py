@@ -117,6 +117,7 @@ MAX_TS_CHANNEL_NUM = 4000
 # Scripting
 CONSOLE_LOG_MAX_NUM_ROWS = 1000
 script_fps_counter_buffer_size = 10000
+script_output_staging_initial_capacity = 1024  # frames preallocated per script output for RenaScript.append_output
 
 valid_preset_categories = ['other', 'video', 'exp']
 
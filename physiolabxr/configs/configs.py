@@ -35,6 +35,15 @@ class RecordingFileFormat(Enum):
         return cls.dats.get_file_extension()
 
 
+class VideoRecordingCodec(Enum):
+    """
+    How the frames of the video and screen capture streams are stored in .dats recordings, see RNStream.video_codecs
+    """
+    raw = "uncompressed"
+    jpeg = "JPEG (lossy)"
+    png = "PNG (lossless)"
+
+
 class AppConfigsEncoder(json.JSONEncoder):
     """
     JSON encoder that can handle enums and objects whose metaclass is SubPreset.
@@ -91,13 +100,20 @@ class AppConfigs(metaclass=Singleton):
     auto_select_zmq_if_exceed_n_channels: bool = True
     auto_select_zmq_n_channels: int = int(2 ** 9)
     last_replayed_file_path: str = None
+    replay_look_ahead_duration: float = 5.  # seconds of the recording read ahead of the replay, bounds the memory the replay uses
 
     # recording configs
     recording_file_format: RecordingFileFormat = RecordingFileFormat.dats
     eviction_interval: int = 1000
+    recording_writer_max_queue_size: int = 8  # evicted buffers waiting to be written before eviction blocks
+    video_recording_codec: VideoRecordingCodec = VideoRecordingCodec.raw  # compresses the video streams in .dats recordings
+    video_recording_jpeg_quality: int = 90
 
     # data worker configs
     pull_data_interval: int = 2  # in milliseconds, how often does the sensor/LSL pulls data from their designated sources
+    stream_worker_subprocess: bool = False  # pull every LSL, ZMQ, device and audio stream in its own process, see SubprocessInterface
+    stream_worker_ring_nbytes: int = 2 ** 26  # the shared memory each stream process writes its frames to
+    stream_telemetry_port: int = 0  # serve the health of the streams on localhost at this port, see TelemetryServer, 0 to not serve
 
     # monitor capture
     is_monitor_available: bool = True
@@ -121,11 +137,13 @@ class AppConfigs(metaclass=Singleton):
     replay_stream_starting_port = 10000
     output_stream_starting_port = 11000
     test_port_starting_port = 12000
+    headless_recorder_port = 14000  # the control socket of physiolabxr-record
     # replay_port_range = 9980, 9990
     zmq_lost_connection_timeout = 4000  # in milliseconds
 
     # scripting
     add_default_rpc_output = True
+    scripting_shared_memory_input: bool = True  # pass the script inputs through shared memory, otherwise they are sent over TCP
 
     # Tobii Pro Fusion Eye Tracker Manager
     tobii_app_path: str = None
@@ -182,7 +200,7 @@ class AppConfigs(metaclass=Singleton):
             self.apply_pyscreeze_patches()
             img = pyscreeze.screenshot()
             self.is_monitor_available = True
-        except NotImplementedError as e:
+        except Exception as e:  # NotImplementedError, or no screenshot backend, e.g., on a headless machine
             self.is_monitor_available = False
             self.monitor_error_message = str(e)
 
@@ -25,6 +25,11 @@ TERMINATE_SUCCESS_COMMAND = 't'
 
 PERFORMANCE_REQUEST_COMMAND = 'p!'
 
+PLAYBACK_RATE_COMMAND = 'pr!'
+PLAYBACK_RATE_SUCCESS_INFO = 'pr'
+PLAYBACK_RATE_SEPARATOR = '?rate='  # LOAD_COMMAND, START_REPLAY_COMMAND and PLAYBACK_RATE_COMMAND can end with ?rate={playback rate}
+UNTHROTTLED_PLAYBACK_RATE = float('inf')  # replay as fast as the outlets take the data
+
 # scripting
 SCRIPT_INFO_PREFIX = 'SO!'
 SCRIPT_WARNING_PREFIX = 'SW!'
@@ -34,6 +39,7 @@ SCRIPT_STOP_REQUEST = 'stop'
 SCRIPT_STOP_SUCCESS = 'stopsuccess'
 SCRIPT_INFO_REQUEST = 'i'
 DATA_BUFFER_PREFIX = 'd'.encode('utf-8')
+SHARED_MEMORY_PREFIX = 's'.encode('utf-8')  # the data are in shared memory rings, the message only holds the ring infos
 SCRIPT_PARAM_CHANGE = 'p'
 INCLUDE_RPC = 1
 EXCLUDE_RPC = 2
@@ -77,6 +83,30 @@ def parse_slider_moved_command(command_to_parse):
 
     return command_to_parse.split(':')[1]
 
+def add_playback_rate(command, playback_rate):
+    """
+    Append the playback rate to a replay command, e.g., sr?rate=2.0. The rate is a multiple of real time,
+    UNTHROTTLED_PLAYBACK_RATE replays as fast as the outlets take the data.
+    """
+    return f'{command}{PLAYBACK_RATE_SEPARATOR}{float(playback_rate)}'
+
+
+def parse_playback_rate(command_to_parse):
+    """
+    Separates the playback rate appended by add_playback_rate from a replay command.
+
+    Params:
+        command_to_parse: command received from ReplayTab.
+
+    Returns:
+        command: the command without the playback rate.
+        playback_rate: the playback rate, None if the command does not have one.
+    """
+    if PLAYBACK_RATE_SEPARATOR not in command_to_parse:
+        return command_to_parse, None
+    command, playback_rate = command_to_parse.rsplit(PLAYBACK_RATE_SEPARATOR, 1)
+    return command, float(playback_rate)
+
 class bcolors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
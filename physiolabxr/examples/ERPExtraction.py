@@ -1,7 +1,7 @@
 import numpy as np
 
 from physiolabxr.scripting.RenaScript import RenaScript
-from physiolabxr.scripting.physio.epochs import get_event_locked_data, buffer_event_locked_data, get_baselined_event_locked_data
+from physiolabxr.scripting.physio.epochs import EpochExtractor, get_baselined_event_locked_data
 
 
 class ERPExtraction(RenaScript):
@@ -18,7 +18,7 @@ class ERPExtraction(RenaScript):
         self.tmax = 0.8  # Time after event marker to include in the epoch
         self.baseline_time = 0.1  # Time period since the ERP epoch start to use as baseline
         self.erp_length = int((self.tmax - self.tmin) * 128)  # Length of the ERP epoch in samples
-        self.event_locked_data_buffer = {}  # Dictionary to store event-locked data
+        self.epoch_extractor = EpochExtractor(self.events, self.tmin, self.tmax, srate=128)  # Extracts and stores the event-locked data as the event markers arrive
         self.eeg_channels = self.get_stream_info('Example-BioSemi-Midline', 'ChannelNames')  # List of EEG channels
         self.srate = self.get_stream_info('Example-BioSemi-Midline', 'NominalSamplingRate')  # Sampling rate of the EEG data in Hz
 
@@ -27,15 +27,8 @@ class ERPExtraction(RenaScript):
     def loop(self):
         # first check if the inputs are available
         if 'Example-EventMarker' in self.inputs.keys() and 'Example-BioSemi-Midline' in self.inputs.keys():
-            event_locked_data, last_event_time = get_event_locked_data(event_marker=self.inputs['Example-EventMarker'],
-                                                                       data=self.inputs['Example-BioSemi-Midline'],
-                                                                       events_of_interest=self.events,
-                                                                       tmin=self.tmin,
-                                                                       tmax=self.tmax,
-                                                                       srate=128,
-                                                                       return_last_event_time=True, verbose=1)
-            self.inputs.clear_up_to(last_event_time)  # Clear the input buffer up to the last event time to avoid processing duplicate data
-            self.event_locked_data_buffer = buffer_event_locked_data(event_locked_data, self.event_locked_data_buffer)  # Buffer the event-locked data for further processing
+            event_locked_data = self.epoch_extractor.extract(event_marker=self.inputs['Example-EventMarker'], data=self.inputs['Example-BioSemi-Midline'])  # only the events that arrived since the last loop are epoched
+            self.event_locked_data_buffer = self.epoch_extractor.epochs  # all the event-locked data extracted so far
 
             if len(event_locked_data) > 0:  # if there's new data
                 if self.params['ChannelToPlot'] in self.eeg_channels:  # check if the channel to plot chosen in the params is valid
@@ -91,24 +91,19 @@ class AudioInputInterface(DeviceInterface):
         # return True
 
 
-def create_audio_input_interface(stream_name):
+def get_audio_input_interface_args(stream_name):
+    """
+    the arguments of the AudioInputInterface of a stream, from its preset
+    """
+    return (stream_name,
+            get_audio_device_index(stream_name),
+            get_stream_num_channels(stream_name),
+            PresetType.AUDIO,
+            get_audio_device_data_type(stream_name).value,
+            get_audio_device_frames_per_buffer(stream_name),
+            get_audio_device_sampling_rate(stream_name),
+            get_stream_nominal_sampling_rate(stream_name))
+
 
-    _audio_device_index = get_audio_device_index(stream_name)
-    _audio_device_channel = get_stream_num_channels(stream_name)
-    _device_type = PresetType.AUDIO
-    audio_device_data_format = get_audio_device_data_type(stream_name)
-    audio_device_frames_per_buffer = get_audio_device_frames_per_buffer(stream_name)
-    audio_device_sampling_rate = get_audio_device_sampling_rate(stream_name)
-    device_nominal_sampling_rate = get_stream_nominal_sampling_rate(stream_name)
-
-    audio_input_device_interface = AudioInputInterface(
-        stream_name,
-        _audio_device_index,
-        _audio_device_channel,
-        _device_type,
-        audio_device_data_format.value,
-        audio_device_frames_per_buffer,
-        audio_device_sampling_rate,
-        device_nominal_sampling_rate
-    )
-    return audio_input_device_interface
+def create_audio_input_interface(stream_name):
+    return AudioInputInterface(*get_audio_input_interface_args(stream_name))
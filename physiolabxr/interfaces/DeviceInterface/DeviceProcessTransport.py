@@ -0,0 +1,158 @@
+import time
+
+import numpy as np
+import zmq
+
+
+class DeviceProcessSender:
+    """Sends the samples of a device from the process that reads the device to its DeviceInterface.
+
+    The samples are batched into a preallocated float32 array and sent as raw bytes with their float64 timestamps, a batch
+    is sent when it has max_batch_size samples or when its first sample is older than max_batch_interval seconds.
+
+    Every message is a multipart message whose first frame is its type, as the json messages the device processes used
+    to send:
+        * b'd' for data, followed by the samples (n_samples, n_channels) as float32 and the timestamps as float64
+        * b'i' for info, followed by the message in utf-8
+        * b'e' for error, followed by the message in utf-8. The DeviceInterface stops the stream when it receives one
+
+    Example, in the device process:
+        sender = DeviceProcessSender(port, n_channels=24)
+        # in the sample callback of the device
+        sender.send_sample(frame, timestamp)
+        # when the device process terminates
+        sender.close()
+    """
+    def __init__(self, port, n_channels, max_batch_size=16, max_batch_interval=0.01):
+        """
+        Args:
+            port (int or str): the port of the DeviceProcessReceiver in the DeviceInterface
+            n_channels (int): the number of channels of every sample
+            max_batch_size (int): the most samples sent in one message
+            max_batch_interval (float): the longest time in seconds a sample waits for its batch to be sent. Checked when
+                a sample is added, call flush when no more sample is coming.
+        """
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.PUSH)
+        self.socket.connect(f"tcp://localhost:{port}")
+
+        self.n_channels = n_channels
+        self.max_batch_interval = max_batch_interval
+        self._samples = np.empty((max_batch_size, n_channels), dtype=np.float32)
+        self._timestamps = np.empty(max_batch_size, dtype=np.float64)
+        self._n_samples = 0
+        self._batch_start_time = None
+
+    def send_sample(self, frame, timestamp):
+        """Add a sample to the batch, and send the batch if it is full or due.
+
+        Args:
+            frame: the n_channels values of the sample
+            timestamp (float): the timestamp of the sample
+        """
+        self._samples[self._n_samples] = frame
+        self._timestamps[self._n_samples] = timestamp
+        self._n_samples += 1
+        if self._batch_start_time is None:
+            self._batch_start_time = time.perf_counter()
+        if self._n_samples == len(self._timestamps) or time.perf_counter() - self._batch_start_time >= self.max_batch_interval:
+            self.flush()
+
+    def flush(self):
+        """Send the samples in the batch, if any."""
+        if self._n_samples > 0:
+            self.socket.send_multipart([b'd', self._samples[:self._n_samples], self._timestamps[:self._n_samples]])
+            self._n_samples = 0
+            self._batch_start_time = None
+
+    def send_message(self, message):
+        """Send an info message, after the samples before it."""
+        self.flush()
+        self.socket.send_multipart([b'i', message.encode('utf-8')])
+
+    def send_error(self, message):
+        """Send an error message, the DeviceInterface stops the stream when it receives it."""
+        self.flush()
+        self.socket.send_multipart([b'e', message.encode('utf-8')])
+
+    def close(self):
+        self.flush()
+        self.socket.close()
+        self.context.term()
+
+
+class DeviceProcessReceiver:
+    """Receives the messages of a DeviceProcessSender in a DeviceInterface.
+
+    The socket binds to a random port, pass the port to the device process so it can create its DeviceProcessSender.
+
+    Example, in the DeviceInterface:
+        def __init__(self):
+            ...
+            self.receiver = DeviceProcessReceiver(error_type=MyDeviceException)
+        def start_stream(self):
+            # start the device process with self.receiver.port
+        def process_frames(self):
+            return self.receiver.process_frames()
+        def stop_stream(self):
+            # terminate the device process
+            self.receiver.drain()
+        def __del__(self):
+            self.receiver.close()
+    """
+    def __init__(self, error_type=Exception):
+        """
+        Args:
+            error_type (type): the exception raised by process_frames when the device process sends an error
+        """
+        self.error_type = error_type
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.PULL)
+        self.socket.bind("tcp://*:0")  # Bind to port 0 for an available random port
+        self.port = self.socket.getsockopt(zmq.LAST_ENDPOINT).decode("utf-8").split(":")[-1]
+
+    def process_frames(self):
+        """Receive all the available messages from the device process.
+
+        Returns:
+            the frames (n_channels, n_samples) as float32, the timestamps and the info messages, as
+            DeviceInterface.process_frames returns them. Empty lists if no sample is available.
+
+        Raises:
+            error_type if the device process has sent an error
+        """
+        samples, timestamps, messages = [], [], []
+        while True:  # get all available data
+            try:
+                message_type, *parts = self.socket.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+            except zmq.error.Again:
+                break
+            message_type = message_type.bytes
+            if message_type == b'd':
+                batch_timestamps = np.frombuffer(parts[1], dtype=np.float64)
+                samples.append(np.frombuffer(parts[0], dtype=np.float32).reshape(len(batch_timestamps), -1))
+                timestamps.append(batch_timestamps)
+            elif message_type == b'i':
+                messages.append(parts[0].bytes.decode('utf-8'))
+            elif message_type == b'e':
+                raise self.error_type(parts[0].bytes.decode('utf-8'))  # this will cause stop_stream to be called
+
+        if len(samples) > 0:
+            return np.concatenate(samples).T, np.concatenate(timestamps), messages
+        else:
+            return samples, timestamps, messages
+
+    def drain(self):
+        """Discard the messages in the socket buffer, so that the next time the stream is started, we don't get old data.
+
+        Call this after the device process has been terminated.
+        """
+        while True:
+            try:
+                self.socket.recv_multipart(flags=zmq.NOBLOCK)
+            except zmq.error.Again:
+                break
+
+    def close(self):
+        self.socket.close()
+        self.context.term()
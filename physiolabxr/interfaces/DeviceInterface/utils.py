@@ -21,28 +21,44 @@ def create_custom_device_classes(device_name):
         An instance of the relevant device interface class.
         An instance of the relevant device options class, if it is defined. This will be None if the options class is not defined.
     """
+    return create_custom_device_interface(device_name), get_custom_device_options_class(device_name)
+
+
+def _import_custom_device_module(device_name):
     module_name = f"physiolabxr.interfaces.DeviceInterface.{device_name}"
     try:
         # Define the path to the device's module based on the stream_name
         # Dynamically import the module containing the interface class
-        module = importlib.import_module(module_name)
-        # Dynamically get the class from the module
-        device_interface_class = getattr(module, f"{device_name}_Interface")
+        return importlib.import_module(module_name)
     except ModuleNotFoundError as e:
         raise NotImplementedError(
             f"create_custom_device_classes: DeviceInterface class is "
             f"{device_name}_Interface is not implemented under {module_name}: {e}")
+
+
+def create_custom_device_interface(device_name):
+    """Creates the interface of a custom device, see create_custom_device_classes.
+
+    This is also how the process of a SubprocessInterface creates the interface.
+    """
+    module = _import_custom_device_module(device_name)
+    # Dynamically get the class from the module
+    device_interface_class = getattr(module, f"{device_name}_Interface")
     # Instantiate and return the interface object
     try:
-        interface_instance = device_interface_class()
+        return device_interface_class()
     except Exception as e:
         raise Exception(f"Error creating device interface for {device_name}: {e}")
 
+
+def get_custom_device_options_class(device_name):
+    """Gets the options class of a custom device, None if it is not defined, see create_custom_device_classes.
+    """
+    module = _import_custom_device_module(device_name)
     try:
         options_class = getattr(module, f"{device_name}_Options")
     except ModuleNotFoundError as e:
         options_class = None
         print(f"Options class not found for {device_name}, will not have options UI for this device.")
 
-    return interface_instance, options_class
-
+    return options_class
@@ -4,35 +4,55 @@ import warnings
 import numpy as np
 
 try:
-    from pylsl import StreamInlet, LostError, resolve_byprop
+    from pylsl import StreamInlet, LostError, resolve_byprop, proc_none, proc_clocksync, proc_dejitter
 except:
     warnings.warn("pylsl is not installed, LSL interface will not work.")
 from physiolabxr.exceptions.exceptions import LSLStreamNotFoundError, ChannelMismatchError
 from physiolabxr.configs import config
 from physiolabxr.configs.config import stream_availability_wait_time
+from physiolabxr.presets.PresetEnums import DataType
 from physiolabxr.utils.stream_shared import lsl_continuous_resolver
 
 
+def get_lsl_numpy_dtype(channel_format):
+    """
+    @return: the numpy dtype of an LSL channel format, None for string streams
+    """
+    for data_type in DataType.get_lsl_supported_types():
+        if data_type.get_lsl_type() == channel_format:
+            return np.dtype(data_type.get_data_type())
+    return None
+
+
 class LSLInletInterface:
     """
     LSLInletInterface will  not try to connect to the outlet at init
 
-
+    Numeric streams are pulled straight into a numpy array that liblsl writes to, see process_frames, string streams are
+    pulled as lists.
     """
-    def __init__(self, lsl_stream_name, num_chan):
+    def __init__(self, lsl_stream_name, num_chan, time_correction=False, dejitter=False, max_samples=1024):
         """
 
         @param lsl_stream_name:
         @param num_chan: the number of channels as in the preset. It will throw an error if when starting the sensor,
         it finds that the number of channels in the opened streams is different from this number, which is from the
         preset
+        @param time_correction: if the timestamps are mapped to the local clock by LSL, the same as adding
+        inlet.time_correction() to them
+        @param dejitter: if the jitter of the timestamps is smoothed out by LSL
+        @param max_samples: the most samples pulled by one call of process_frames
         """
 
         self.lsl_stream_name = lsl_stream_name
         self.lsl_num_chan = num_chan
+        self.time_correction = time_correction
+        self.dejitter = dejitter
+        self.max_samples = max_samples
         self.streams = None
         self.inlet = None
         self.data_type = None
+        self.numpy_dtype = None
 
     def start_stream(self):
         # connect to the sensor
@@ -41,7 +61,7 @@ class LSLInletInterface:
             self.streams = resolve_byprop('type', self.lsl_stream_name, timeout=stream_availability_wait_time)
         if len(self.streams) < 1:
             raise LSLStreamNotFoundError(f'Unable to find LSL Stream with given name or type: {self.lsl_stream_name}')
-        self.inlet = StreamInlet(self.streams[0])
+        self.inlet = StreamInlet(self.streams[0], processing_flags=self.get_processing_flags())
         self.inlet.open_stream()
         actual_num_channels = self.inlet.channel_count
 
@@ -51,18 +71,34 @@ class LSLInletInterface:
             self.inlet.close_stream()
             raise ChannelMismatchError(actual_num_channels)
         self.data_type = self.inlet.channel_format
+        self.numpy_dtype = get_lsl_numpy_dtype(self.data_type)
         print('LSLInletInterface: resolved, created and opened inlet for lsl stream with type ' + self.lsl_stream_name)
 
     def is_stream_available(self):
         available_streams = [x.name() for x in lsl_continuous_resolver.results()] + [x.type() for x in lsl_continuous_resolver.results()]
         return self.lsl_stream_name in available_streams
 
+    def get_processing_flags(self):
+        return (proc_clocksync if self.time_correction else proc_none) | (proc_dejitter if self.dejitter else proc_none)
+
     def process_frames(self):
         """
-        @return: one or more frames of the sensor
+        @return: one or more frames of the sensor, (n_channels, n_samples), and their float64 timestamps.
+        The frames of a numeric stream are a view of an array pulled into by liblsl, without the lists pylsl builds
+        otherwise. The array is new for every pull, the frames are handed to other threads
         """
+        if self.numpy_dtype is None:
+            return self._process_frames_as_lists()
+        pull_buffer = np.empty((self.max_samples, self.lsl_num_chan), dtype=self.numpy_dtype)  # sample-major as liblsl writes it
+        try:
+            _, timestamps = self.inlet.pull_chunk(max_samples=self.max_samples, dest_obj=pull_buffer)
+        except LostError:
+            timestamps = []  # TODO handle stream lost
+        return pull_buffer[:len(timestamps)].T, np.asarray(timestamps, dtype=np.float64)
+
+    def _process_frames_as_lists(self):
         try:
-            frames, timestamps = self.inlet.pull_chunk()
+            frames, timestamps = self.inlet.pull_chunk(max_samples=self.max_samples)
         except LostError:
             frames, timestamps = [], []
             pass  # TODO handle stream lost
@@ -111,6 +147,6 @@ if __name__ == "__main__":
     unityLSL_inferface.stop_stream()
 
 
-def create_lsl_interface(lsl_name, num_channels):
-    interface = LSLInletInterface(lsl_name, num_channels)
+def create_lsl_interface(lsl_name, num_channels, time_correction=False, dejitter=False):
+    interface = LSLInletInterface(lsl_name, num_channels, time_correction, dejitter)
     return interface
@@ -0,0 +1,298 @@
+import atexit
+import pickle
+import threading
+import traceback
+import warnings
+import weakref
+from multiprocessing import Process, Pipe, util  # util registers its exit function on import, see _close_subprocess_interfaces
+
+import numpy as np
+
+from physiolabxr.utils.shared_memory_utils import SharedMemoryRing
+
+
+def get_interface_attributes(interface):
+    """
+    the attributes of an interface that can be sent to another process, e.g., lsl_stream_name or _device_name
+    """
+    return {k: v for k, v in vars(interface).items() if isinstance(v, (bool, int, float, str, type(None)))}
+
+
+def run_interface_process(create_interface, create_interface_args, command_conn, data_conn, pull_interval, ring_nbytes):
+    """
+    the process of a SubprocessInterface: creates the interface, runs the commands it is sent, and pulls the interface
+    while it is streaming. The frames are written to a SharedMemoryRing, a new ring is announced on data_conn when the
+    frame shape or dtype changes, with the messages of the interface and the error that stops the stream.
+    """
+    try:
+        interface = create_interface(*create_interface_args)
+    except Exception as e:
+        traceback.print_exc()
+        command_conn.send(('error', _picklable_exception(e), None))
+        return
+    command_conn.send(('ok', None, get_interface_attributes(interface)))
+
+    ring = None
+    is_streaming = False
+    try:
+        while True:
+            if command_conn.poll(pull_interval if is_streaming else None):
+                try:
+                    command, args, kwargs = command_conn.recv()
+                except EOFError:  # the main process has exited
+                    break
+                if command == 'exit':
+                    break
+                try:
+                    rtn = getattr(interface, command)(*args, **kwargs)
+                    if command == 'start_stream':
+                        is_streaming = True
+                    elif command == 'stop_stream':
+                        is_streaming = False
+                    command_conn.send(('ok', rtn, get_interface_attributes(interface)))
+                except Exception as e:
+                    traceback.print_exc()
+                    command_conn.send(('error', _picklable_exception(e), get_interface_attributes(interface)))
+            if not is_streaming:
+                continue
+            try:
+                frames, timestamps, *messages = interface.process_frames()
+                if len(messages) > 0 and len(messages[0]) > 0:
+                    data_conn.send(('messages', list(messages[0])))
+                if len(timestamps) > 0:
+                    frames, timestamps = np.asarray(frames), np.asarray(timestamps, dtype=np.float64)
+                    if ring is None or ring.frame_shape != frames.shape[:-1] or ring.dtype != frames.dtype:
+                        if ring is not None:  # the reader keeps the old ring mapped until it has read it
+                            ring.close()
+                        frame_nbytes = max(int(np.prod(frames.shape[:-1])) * frames.dtype.itemsize, 1)
+                        ring = SharedMemoryRing(frames.shape[:-1], frames.dtype, max(2 * len(timestamps), ring_nbytes // frame_nbytes))
+                        data_conn.send(('ring', ring.get_info()))
+                    ring.write(frames, timestamps)
+            except Exception as e:
+                traceback.print_exc()
+                data_conn.send(('error', _picklable_exception(e)))
+                is_streaming = False  # as the workers stop the stream when their interface raises
+    finally:
+        if ring is not None:
+            ring.close()
+        if is_streaming:
+            interface.stop_stream()
+
+
+def _picklable_exception(e):
+    try:
+        pickle.loads(pickle.dumps(e))  # e.g., exceptions whose init does not take their args cannot be unpickled
+        return e
+    except Exception:
+        return RuntimeError(f'{type(e).__name__}: {e}')
+
+
+class SubprocessInterface:
+    """
+    Runs an interface, e.g., LSLInletInterface, ZMQInterface, a DeviceInterface or AudioInputInterface, in its own
+    process, so that pulling and decoding a busy stream does not hold the GIL of the main process, and is not held up
+    by it. It has the methods of the interfaces, the workers use it in place of their interface when
+    AppConfigs().stream_worker_subprocess is True, see create_worker_interface.
+
+    The process pulls the interface every pull_interval while the stream is started, and writes the frames to a
+    SharedMemoryRing. process_frames reads the frames written since its last call straight from the shared memory, by
+    how far the ring is written, so the frames cost no message between the processes. Only a new ring, the messages of
+    a device and the error that stops the stream are sent over a pipe.
+
+    The other methods are run in the process and wait for its reply, their exception is reraised. The attributes of the
+    interface that are plain values, e.g., lsl_stream_name, are copied after every method call.
+
+    The methods can be called from several threads, as the workers check the availability of their stream on their
+    thread while the GUI thread starts and stops it: the method calls, and the reads of what the process has sent,
+    are each serialized by a lock.
+
+    The process holds about ring_nbytes of frames, or two pulls if they are larger. If the main process falls further
+    behind, the oldest frames are overwritten and a warning is given, see SharedMemoryRing.read.
+    """
+    def __init__(self, create_interface, *create_interface_args, returns_messages=False, pull_interval=0.002, ring_nbytes=2 ** 26):
+        """
+        :param create_interface: a function or class that creates the interface in the process, must be picklable
+        :param create_interface_args: the arguments of create_interface
+        :param returns_messages: if the process_frames of the interface returns messages, as a DeviceInterface does
+        """
+        self._command_lock = threading.RLock()  # a reply is received by the thread that sent the command
+        self._data_lock = threading.RLock()  # held while the data pipe and the ring are read
+        self._command_conn, child_command_conn = Pipe()
+        self._data_conn, child_data_conn = Pipe(duplex=False)
+        # not daemonic, so that the interface can start processes of its own, e.g., DSI24_Interface
+        self._process = Process(target=run_interface_process, args=(create_interface, create_interface_args, child_command_conn, child_data_conn, pull_interval, ring_nbytes))
+        self._process.start()
+        _subprocess_interfaces.add(self)
+        self._attributes = {}
+        self._ring = None
+        self._next_ring_info = None
+        self._read_count = 0
+        self.returns_messages = returns_messages
+        self._receive_reply()
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_attributes'][name]
+        except KeyError:
+            raise AttributeError(f"'{type(self).__name__}' has no attribute '{name}' that is a plain value of its interface")
+
+    def call(self, command, *args, **kwargs):
+        """
+        run a method of the interface in its process
+        @return: what the method returns
+        """
+        with self._command_lock:
+            self._command_conn.send((command, args, kwargs))
+            return self._receive_reply()
+
+    def _receive_reply(self):
+        try:
+            status, rtn, attributes = self._command_conn.recv()
+        except EOFError:
+            raise RuntimeError(f'the process of the interface has exited with code {self._process.exitcode}')
+        if attributes is not None:
+            self._attributes = attributes
+        if status == 'error':
+            raise rtn
+        return rtn
+
+    def start_stream(self, *args, **kwargs):
+        self._discard()  # what is left from the last time the stream was started
+        return self.call('start_stream', *args, **kwargs)
+
+    def stop_stream(self):
+        return self.call('stop_stream')
+
+    def is_stream_available(self, *args, **kwargs):
+        return self.call('is_stream_available', *args, **kwargs)
+
+    def process_frames(self):
+        """
+        @return: the frames (time axis last) and timestamps written since the last call, and the messages of the
+            interface if its process_frames returns them. Empty arrays if nothing was written.
+            Raises the exception that stopped the stream in the process
+        """
+        messages = []
+        with self._data_lock:
+            error = self._drain(messages)
+            chunk = self._read_ring()
+        if chunk is None:
+            frames, timestamps = np.empty(0), np.empty(0)
+        else:
+            frames, timestamps = np.array(chunk[0]), np.array(chunk[1])  # copied out of the ring, which the process writes over
+        if error is not None:
+            raise error
+        if self.returns_messages:
+            return frames, timestamps, messages
+        return frames, timestamps
+
+    def _drain(self, messages=None):
+        """
+        handle what the process has sent, the messages are added to messages.
+        A new ring is opened once the frames of the current one are read, so the frames returned by a call of
+        process_frames have the same shape: if the current ring has frames that are not read, the new ring is opened by
+        the next call.
+        @return: the exception that stopped the stream, None if there is none
+        """
+        if self._next_ring_info is not None:
+            self._open_ring(self._next_ring_info)
+        error = None
+        while self._data_conn.poll():
+            message_type, *contents = self._data_conn.recv()
+            if message_type == 'ring':
+                if self._ring is not None and self._ring.write_count > self._read_count:  # the process has moved on, the current ring is complete
+                    self._next_ring_info = contents[0]
+                    break
+                self._open_ring(contents[0])
+            elif message_type == 'messages':
+                if messages is not None:
+                    messages.extend(contents[0])
+            elif message_type == 'error':
+                error = contents[0]
+        return error
+
+    def _discard(self):
+        """
+        discard what the process has sent and written
+        """
+        with self._data_lock:
+            while True:
+                self._drain()
+                self._read_ring()
+                if self._next_ring_info is None and not self._data_conn.poll():
+                    break
+
+    def _open_ring(self, info):
+        self._close_ring()
+        self._next_ring_info = None
+        try:
+            self._ring = SharedMemoryRing.open(info)
+        except FileNotFoundError:  # already replaced by the process, its frames are lost
+            warnings.warn(f'SubprocessInterface: ring {info["name"]} was replaced before it was read')
+        self._read_count = 0
+
+    def _read_ring(self):
+        """
+        @return: the frames and timestamps written to the current ring since the last read, None if none
+        """
+        if self._ring is None:
+            return None
+        write_count = self._ring.write_count
+        if write_count == self._read_count:
+            return None
+        frames, timestamps = self._ring.read(self._read_count, write_count)
+        self._read_count = write_count
+        return frames, timestamps
+
+    def _close_ring(self):
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def close(self):
+        """
+        stop the process, the stream is stopped if it is started
+        """
+        with self._command_lock:
+            if self._process.is_alive():
+                try:
+                    self._command_conn.send(('exit', (), {}))
+                except (BrokenPipeError, OSError):
+                    pass
+                self._process.join(timeout=5)
+                if self._process.is_alive():
+                    warnings.warn(f'SubprocessInterface: the process of the interface did not exit, terminating it')
+                    self._process.terminate()
+        with self._data_lock:
+            self._close_ring()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_subprocess_interfaces = weakref.WeakSet()
+
+
+@atexit.register
+def _close_subprocess_interfaces():
+    """
+    multiprocessing joins the processes that are not daemonic when the main process exits, an interface that is not
+    closed would wait for its next command forever. Registered after multiprocessing.util is imported, so run before
+    its exit function
+    """
+    for interface in list(_subprocess_interfaces):
+        interface.close()
+
+
+def create_worker_interface(create_interface, *create_interface_args, returns_messages=False):
+    """
+    create the interface of a stream worker, in its own process if AppConfigs().stream_worker_subprocess is True
+    """
+    from physiolabxr.configs.configs import AppConfigs
+    if AppConfigs().stream_worker_subprocess:
+        return SubprocessInterface(create_interface, *create_interface_args, returns_messages=returns_messages,
+                                   pull_interval=AppConfigs().pull_data_interval / 1e3, ring_nbytes=AppConfigs().stream_worker_ring_nbytes)
+    return create_interface(*create_interface_args)
@@ -0,0 +1,102 @@
+import numpy as np
+import zmq
+
+from physiolabxr.exceptions.exceptions import InvalidZMQMessageError
+from physiolabxr.utils.networking_utils import decode_zmq_samples
+from physiolabxr.utils.time_utils import get_clock_time
+
+
+def decode_zmq_frame(message, data_type):
+    """
+    decode a [topic, data] frame, timestamped on arrival, or a [topic, timestamps, data] frame with one or more
+    samples, see send_zmq_samples. The parts can be bytes or buffers, e.g., of the frames received with copy=False
+    @return: topic name, timestamps, n_channels x n_samples data
+    """
+    try:
+        if len(message) == 2:
+            topic_name = bytes(message[0]).decode('utf-8')
+            timestamps = np.array([get_clock_time()])
+            data = np.expand_dims(np.frombuffer(message[1], dtype=data_type), axis=-1)
+        elif len(message) == 3:
+            topic_name = bytes(message[0]).decode('utf-8')
+            timestamps, data = decode_zmq_samples(message[1], message[2], data_type)  # timestamp can be 64-bit float or 32-bit float
+        else:
+            raise InvalidZMQMessageError(f'ZMQ message has invalid length: {len(message)} != 1, 2, or 3')
+    except Exception as e:
+        raise InvalidZMQMessageError(f'ZMQ message cannot be decoded: {e}')
+    return topic_name, timestamps, data
+
+
+class ZMQInterface:
+    """
+    Subscribes to a ZMQ stream published on a PUB socket, the same way as ZMQWorker but without Qt, for acquisition
+    loops that run on plain threads, see HeadlessRecorder.
+
+    The socket connects at init, like LSLInletInterface it can be started and stopped.
+
+    process_frames drains the socket without copying the messages out of ZMQ, and decodes the samples of all the
+    messages at once. A message can carry many samples, see send_zmq_samples, publishers that send chunks cost far less
+    to receive than ones that send a sample per message.
+    """
+    def __init__(self, port_number, subtopic, data_type):
+        self.data_type = data_type if isinstance(data_type, str) else data_type.value
+        self.sub_address = "tcp://localhost:%s" % port_number
+        self.subtopic = subtopic
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.SUB)
+        self.socket.connect(self.sub_address)
+        self.socket.setsockopt_string(zmq.SUBSCRIBE, self.subtopic)
+        self.poller = zmq.Poller()
+        self.poller.register(self.socket, zmq.POLLIN)
+        self.is_streaming = False
+
+    def start_stream(self):
+        self.is_streaming = True
+
+    def is_stream_available(self, timeout=0):
+        return len(dict(self.poller.poll(timeout=timeout))) > 0
+
+    def process_frames(self):
+        """
+        @return: the frames (n_channels, n_samples) and timestamps of all the messages received since the last call,
+        empty lists if none. Raises InvalidZMQMessageError if a message cannot be decoded, or its number of channels
+        differs from the messages before it in the call
+        """
+        timestamp_frames, data_frames = [], []
+        n_samples, n_channels = 0, None
+        itemsize = np.dtype(self.data_type).itemsize
+        while True:
+            try:
+                message = [self.socket.recv(flags=zmq.NOBLOCK, copy=False)]
+            except zmq.error.Again:
+                break
+            while message[-1].more:  # the parts of a message arrive together, Frame.more is cheaper than recv_multipart asking the socket
+                message.append(self.socket.recv(copy=False))
+            if len(message) == 3 and len(message[1]) != 4 and len(message[1]) % 8 == 0:  # float64 timestamps, see send_zmq_samples
+                timestamp_frame, data_frame = message[1], message[2]
+            else:  # decoded on its own, e.g., the [topic, data] frames timestamped on arrival
+                _, timestamps, data = decode_zmq_frame([frame.buffer for frame in message], self.data_type)
+                timestamp_frame, data_frame = timestamps.astype(np.float64).tobytes(), np.ascontiguousarray(data.T).tobytes()
+            message_n_samples = len(timestamp_frame) // 8
+            if message_n_samples == 0 or len(data_frame) % (message_n_samples * itemsize) != 0:
+                raise InvalidZMQMessageError(f'ZMQ message cannot be decoded: {len(data_frame)} bytes of data for {message_n_samples} samples of {self.data_type}')
+            message_n_channels = len(data_frame) // (message_n_samples * itemsize)
+            if n_channels is not None and message_n_channels != n_channels:
+                raise InvalidZMQMessageError(f'ZMQ message has {message_n_channels} channels, the messages before it have {n_channels}')
+            n_channels = message_n_channels
+            timestamp_frames.append(timestamp_frame)
+            data_frames.append(data_frame)
+            n_samples += message_n_samples
+        if n_samples == 0:
+            return [], []
+        # the frames of all the messages are joined and decoded at once
+        timestamps = np.frombuffer(b''.join(timestamp_frames), dtype=np.float64)
+        data = np.frombuffer(b''.join(data_frames), dtype=self.data_type).reshape((n_samples, n_channels))
+        return np.ascontiguousarray(data.T), timestamps.copy()
+
+    def stop_stream(self):
+        self.is_streaming = False
+
+    def close(self):
+        self.socket.close()
+        self.context.term()
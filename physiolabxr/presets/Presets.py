@@ -90,6 +90,9 @@ class StreamPreset(metaclass=SubPreset):
         networking_interface: name of the networking interface to use to receive the stream. This is set from the _presets
         class when calling the add_stream_preset function. If from json preset file loaded at startup, this information
         is obtained by which folder the preset file is in (i.e., LSLPresets, ZMQPresets, or DevicePresets under the _presets folder)
+
+        lsl_time_correction, lsl_dejitter: the postprocessing LSL applies to the timestamps of an LSL stream, see
+        LSLInletInterface
     """
     stream_name: str
 
@@ -109,6 +112,9 @@ class StreamPreset(metaclass=SubPreset):
 
     data_processor_only_apply_to_visualization: bool = False
 
+    lsl_time_correction: bool = False
+    lsl_dejitter: bool = False
+
     def __post_init__(self):
         """
         StreamPreset's post init function. It will set the display_duration attribute based on the default_display_duration in the config file.
@@ -207,6 +207,13 @@ def get_stream_num_channels(stream_name):
     return Presets().stream_presets[stream_name].num_channels
 
 
+def get_stream_lsl_postprocessing(stream_name):
+    """
+    @return: lsl_time_correction, lsl_dejitter of the stream, see LSLInletInterface
+    """
+    return Presets().stream_presets[stream_name].lsl_time_correction, Presets().stream_presets[stream_name].lsl_dejitter
+
+
 def create_custom_data_stream_preset(stream_name, num_channels, nominal_sample_rate: int=None, data_type=DataType.float32):
     if is_stream_name_in_presets(stream_name):
         raise ValueError(f'Stream preset with stream name {stream_name} already exists.')
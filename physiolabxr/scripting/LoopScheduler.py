@@ -0,0 +1,136 @@
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from physiolabxr.scripting.scripting_enums import LoopScheduling
+
+# the edges of the bins of the jitter histogram in seconds, the last bin holds everything above the last edge
+jitter_histogram_bin_edges = np.array([0, 1e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 1e-1])
+
+
+class LoopScheduler:
+    """
+    Decides when RenaScript calls loop() and keeps the timing of the loops.
+
+    RenaScript polls its sockets with the timeout from get_poll_timeout, tells the scheduler about the inputs it
+    receives with on_input, and runs a loop when is_due. A loop is wrapped in on_loop_start and on_loop_end.
+
+    The timing kept, since the script started:
+        * deadline misses: a loop's deadline is one period after it was due, it is missed if the loop has not sent its
+          outputs by then
+        * skipped loops: loops not run because the script was a full period late, with FIXED_RATE_SKIP
+        * jitter: how late a loop starts after it is due, i.e., after its scheduled time with the fixed rates, or after
+          the input that triggers it arrives otherwise
+        * input-to-output latency: from the arrival of the oldest input a loop consumes to when its outputs are sent,
+          for loops with outputs
+    """
+    def __init__(self, scheduling: LoopScheduling, run_frequency, trigger_input=None, trigger_sample_count=1, clock=time.perf_counter):
+        """
+        :param run_frequency: the rate of the fixed rate schedulings, also sets the deadlines of the others
+        :param trigger_input: the input whose samples trigger the loop, with DATA_TRIGGERED
+        :param trigger_sample_count: the number of new samples on trigger_input that trigger the loop, with DATA_TRIGGERED
+        :param clock: returns the time in seconds
+        """
+        self.scheduling = scheduling
+        self.period = 1 / run_frequency
+        self.trigger_input = trigger_input
+        self.trigger_sample_count = trigger_sample_count
+        self.clock = clock
+
+        self.due_time = None  # when the next loop became or becomes due, None if it is not due yet
+        self.new_trigger_samples = 0
+        self.input_arrival_time = None  # the arrival of the oldest input not consumed by a loop yet
+        self.loop_due_time = None
+        self.loop_input_arrival_time = None
+
+        self.loop_count = 0
+        self.deadline_miss_count = 0
+        self.skipped_loop_count = 0
+        self.jitters = deque(maxlen=int(run_frequency * 2))
+        self.max_jitter = 0
+        self.jitter_histogram = np.zeros(len(jitter_histogram_bin_edges), dtype=int)
+        self.latencies = deque(maxlen=int(run_frequency * 2))
+        self.max_latency = 0
+
+    def start(self):
+        """
+        start the schedule, the first loop of the fixed rates is due now
+        """
+        if self.scheduling in (LoopScheduling.FIXED_RATE_CATCH_UP, LoopScheduling.FIXED_RATE_SKIP, LoopScheduling.FREE_RUNNING):
+            self.due_time = self.clock()
+
+    def get_poll_timeout(self):
+        """
+        :return: how long to wait for the sockets in milliseconds, None to wait until a message arrives
+        """
+        if self.due_time is None:
+            return None
+        # poll rounds down to whole milliseconds, the rest is spun through with zero timeouts
+        return max(0., (self.due_time - self.clock()) * 1e3)
+
+    def on_input(self, data_dict):
+        """
+        :param data_dict: the inputs received, stream name -> (frames, timestamps)
+        """
+        now = self.clock()
+        if self.input_arrival_time is None:
+            self.input_arrival_time = now
+        if self.scheduling == LoopScheduling.RUN_SIGNAL:
+            if self.due_time is None:
+                self.due_time = now
+        elif self.scheduling == LoopScheduling.DATA_TRIGGERED and self.trigger_input in data_dict:
+            self.new_trigger_samples += len(data_dict[self.trigger_input][1])
+            if self.due_time is None and self.new_trigger_samples >= self.trigger_sample_count:
+                self.due_time = now
+
+    def is_due(self):
+        return self.due_time is not None and self.clock() >= self.due_time
+
+    def on_loop_start(self):
+        now = self.clock()
+        self.loop_due_time, self.loop_input_arrival_time = self.due_time, self.input_arrival_time
+        self.input_arrival_time = None
+        jitter = now - self.due_time
+        self.jitters.append(jitter)
+        self.max_jitter = max(jitter, self.max_jitter)
+        self.jitter_histogram[np.searchsorted(jitter_histogram_bin_edges, jitter, side='right') - 1] += 1
+
+        if self.scheduling == LoopScheduling.FIXED_RATE_CATCH_UP:
+            self.due_time += self.period
+        elif self.scheduling == LoopScheduling.FIXED_RATE_SKIP:
+            n_skipped = math.floor(jitter / self.period)
+            self.skipped_loop_count += n_skipped
+            self.due_time += (n_skipped + 1) * self.period
+        elif self.scheduling == LoopScheduling.DATA_TRIGGERED:
+            self.new_trigger_samples %= self.trigger_sample_count  # the samples past a multiple count toward the next loop
+            self.due_time = None
+        elif self.scheduling == LoopScheduling.RUN_SIGNAL:
+            self.due_time = None
+
+    def on_loop_end(self, has_output):
+        """
+        :param has_output: whether the loop sent outputs
+        """
+        now = self.clock()
+        self.loop_count += 1
+        if now > self.loop_due_time + self.period:
+            self.deadline_miss_count += 1
+        if has_output and self.loop_input_arrival_time is not None:
+            latency = now - self.loop_input_arrival_time
+            self.latencies.append(latency)
+            self.max_latency = max(latency, self.max_latency)
+        if self.scheduling == LoopScheduling.FREE_RUNNING:
+            self.due_time = now
+
+    def get_info(self):
+        """
+        the timing sent to the main app with the realtime info of the script, see RenaScript
+        :return: loop count, deadline miss count, skipped loop count, mean jitter, max jitter, mean latency,
+            max latency, followed by the counts of the jitter histogram
+        """
+        return np.concatenate([[self.loop_count, self.deadline_miss_count, self.skipped_loop_count,
+                                np.mean(self.jitters) if len(self.jitters) else 0., self.max_jitter,
+                                np.mean(self.latencies) if len(self.latencies) else 0., self.max_latency],
+                               self.jitter_histogram]).astype(np.float64)
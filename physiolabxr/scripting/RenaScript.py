@@ -26,14 +26,17 @@ except:
 from physiolabxr.exceptions.exceptions import BadOutputError, ZMQPortOccupiedError, RenaError, ScriptSetupError
 from physiolabxr.presets.PresetEnums import PresetType
 from physiolabxr.presets.ScriptPresets import ScriptOutput
+from physiolabxr.configs.config import script_output_staging_initial_capacity
 from physiolabxr.configs.shared import SCRIPT_STOP_REQUEST, SCRIPT_STOP_SUCCESS, SCRIPT_INFO_REQUEST, \
     SCRIPT_PARAM_CHANGE
-from physiolabxr.scripting.scripting_enums import ParamChange
+from physiolabxr.scripting.LoopScheduler import LoopScheduler
+from physiolabxr.scripting.scripting_enums import ParamChange, LoopScheduling
 from physiolabxr.sub_process.TCPInterface import RenaTCPInterface
-from physiolabxr.utils.data_utils import validate_output
-from physiolabxr.utils.buffers import get_fps, DataBuffer
-from physiolabxr.utils.lsl_utils import create_lsl_outlet
-from physiolabxr.utils.networking_utils import recv_string_router, send_string_router, send_router, recv_data_dict
+from physiolabxr.utils.data_utils import validate_output, validate_output_data
+from physiolabxr.utils.buffers import get_fps, DataBuffer, SlidingWindowBuffer
+from physiolabxr.utils.lsl_utils import create_lsl_outlet, push_lsl_chunk
+from physiolabxr.utils.networking_utils import recv_string_router, send_string_router, send_router, recv_data_dict, send_zmq_samples
+from physiolabxr.utils.shared_memory_utils import SharedMemoryRingReader
 
 
 class RenaScript(ABC, threading.Thread):
@@ -76,9 +79,11 @@ class RenaScript(ABC, threading.Thread):
         self.loop_durations = deque(maxlen=run_frequency * 2)
         self.max_loop_duration = 0
         self.run_while_start_times = deque(maxlen=run_frequency * 2)
+        self.loop_scheduler = LoopScheduler(LoopScheduling.RUN_SIGNAL, run_frequency)  # see set_loop_scheduling
         # setup inputs and outputs
         self.input_names = inputs
         self.inputs = DataBuffer(stream_buffer_sizes=buffer_sizes)
+        self.shared_memory_reader = SharedMemoryRingReader()  # for the inputs the main app writes to shared memory
         self.run_frequency = run_frequency
         # set up the outputs
         self.output_presets: Dict[str, ScriptOutput] = {o.stream_name: o for o in outputs}
@@ -89,6 +94,8 @@ class RenaScript(ABC, threading.Thread):
         self.outputs = None  # dict holding the output data
 
         self.output_outlets = {}
+        # frames appended with append_output, sent as one chunk per loop
+        self._output_staging = {o.stream_name: SlidingWindowBuffer((o.num_channels,), o.data_type.get_data_type(), initial_capacity=script_output_staging_initial_capacity) for o in outputs}
 
         try:
             self._create_output_streams()
@@ -120,7 +127,7 @@ class RenaScript(ABC, threading.Thread):
     @abstractmethod
     def loop(self):
         """
-        Loop is called <run frequency> times per second
+        Loop is called <run frequency> times per second, unless it is scheduled otherwise with set_loop_scheduling
         """
         pass
 
@@ -140,87 +147,23 @@ class RenaScript(ABC, threading.Thread):
             self.redirect_stderr.send_buffered_messages()
         # start the loop here, accept interrupt command
         logging.info('Entering loop')
+        # the loop is scheduled on the messages of all the sockets, the info requests and commands are answered as they
+        # arrive, and do not wait for the next input
+        poller = zmq.Poller()
+        for socket_interface in (self.input_socket_interface, self.info_socket_interface, self.command_socket_interface):
+            poller.register(socket_interface.socket, zmq.POLLIN)
+        self.loop_scheduler.start()
         while True:
-            self.outputs = dict([(s_name, None) for s_name in self.output_outlets.keys()])  # reset the output to be default values
-            data_dict = recv_data_dict(self.input_socket_interface)
-            self.update_input_buffer(data_dict)
-            loop_start_time = time.time()
-            try:
-                self.loop()
-            except Exception as e:
-                # print('Exception in loop(): {0} {1}'.format(type(e), e))
-                traceback.print_exc()
-                # print(traceback.format_exc())
-                self.redirect_stderr.send_buffered_messages()
-            this_loop_outputs = time.time() - loop_start_time
-            self.loop_durations.append(this_loop_outputs)
-            self.max_loop_duration = max(this_loop_outputs, self.max_loop_duration)
-            self.run_while_start_times.append(loop_start_time)
-            # receive info request from main process
-            info_msg_routing_id = recv_string_router(self.info_socket_interface, is_block=False)
-            if info_msg_routing_id is not None:
-                request = info_msg_routing_id[0]
-                if request == SCRIPT_INFO_REQUEST:
-                    send_router(np.array([get_fps(self.run_while_start_times), np.mean(self.loop_durations), self.max_loop_duration]),
-                                self.info_routing_id, self.info_socket_interface)
-                else:
-                    logging.warning('unknown info request: ' + request)
-            # receive command from main process
-            command_msg_routing_id = recv_string_router(self.command_socket_interface, is_block=False)
-            if command_msg_routing_id is not None:
-                command = command_msg_routing_id[0]
-                if command == SCRIPT_STOP_REQUEST:
-                    break
-                if command == SCRIPT_PARAM_CHANGE:
-                    # receive the rest of the mssage about parameter change
-                    change_info, _ = recv_string_router(self.command_socket_interface, is_block=True)
-                    _, value = self.command_socket_interface.socket.recv_multipart()  # first element is routing ID
-                    change_str, param_name, param_type = change_info.split('|')
-                    change = ParamChange(change_str)
-                    if change == ParamChange.ADD or change == ParamChange.CHANGE:
-                        # self.params[param_name] = np.frombuffer(np.array(value).tobytes(), dtype=param_type)[0]
-                        self.params[param_name] = json.loads(value.decode('utf-8'))
-                    else:
-                        self.params.pop(param_name)
-                    logging.info('RenaScript: param changed')
-                else:
-                    logging.warning('unknown command: ' + command)
-            # send the output if they are updated in the loop
-            for stream_name, data in self.outputs.items():
-                if stream_name not in self.output_outlets:
-                    logging.error(f'RenaScript: output stream with name {stream_name} not found')
-                    continue
-                outlet = self.output_outlets[stream_name]
-                if data is not None:
-                    try:
-                        _data, timestamp, is_data_chunk, is_timestamp_chunk = validate_output(data, self.output_num_channels[stream_name])
-                        _data = _data.astype(self.output_presets[stream_name].data_type.get_data_type())
-                        clock_time = get_clock_time()
-                        _timestamp = clock_time if timestamp is None else timestamp  # timestamp is not a chunk when data is not chunk
-                        if pylsl_imported and isinstance(outlet, StreamOutlet):
-                            if is_data_chunk and is_timestamp_chunk:
-                                for i in range(len(_data)):
-                                    outlet.push_sample(_data[i].tolist(), timestamp=timestamp[i])  # 0.0 is default value, using it will use the local clock
-                            elif is_data_chunk and not is_timestamp_chunk:
-                                outlet.push_chunk(_data.tolist(), timestamp=_timestamp)  # timestamp is a number or None if not provided by the user
-                            else:
-                                # timestamp will never be a chunk in this case when data is not chunk
-                                outlet.push_sample(_data.tolist(), timestamp=_timestamp)  # 0.0 is default value, using it will use the local clock
-                        else:  # this is a zmq socket
-                            if is_data_chunk and is_timestamp_chunk:
-                                for i in range(len(_data)):
-                                    outlet.send_multipart([bytes(stream_name, "utf-8"), np.array(timestamp[i]), np.ascontiguousarray(_data[i])])
-                            elif is_data_chunk and not is_timestamp_chunk:
-                                for i in range(len(_data)):
-                                    outlet.send_multipart([bytes(stream_name, "utf-8"), np.array(_timestamp), np.ascontiguousarray(_data[i])])
-                            else:
-                                outlet.send_multipart([bytes(stream_name, "utf-8"), np.array(_timestamp), _data])
-                    except Exception as e:
-                        if type(e) == BadOutputError:
-                            logging.error('Bad output data is given to stream {0}: {1}'.format(stream_name, str(e)))
-                        else:
-                            logging.error('Unknown error occurred when trying to send output data: {0}'.format(str(e)))
-                        traceback.print_exc()
+            events = dict(poller.poll(self.loop_scheduler.get_poll_timeout()))
+            if self.input_socket_interface.socket in events:
+                data_dict = recv_data_dict(self.input_socket_interface, self.shared_memory_reader)
+                self.loop_scheduler.on_input(self.update_input_buffer(data_dict))
+            if self.info_socket_interface.socket in events:
+                self._process_info_request()
+            if self.command_socket_interface.socket in events and not self._process_command():
+                break
+            if self.loop_scheduler.is_due():
+                self._run_loop()
         # exiting the script loop
         try:
             self.cleanup()
@@ -228,9 +171,112 @@ class RenaScript(ABC, threading.Thread):
             traceback.print_exc()
             self.redirect_stderr.send_buffered_messages()
         if self.rpc_server is not None: self.rpc_server.stop(None)
+        self.shared_memory_reader.close()
         logging.info('RenaScript: sending stop success to main app')
         send_string_router(SCRIPT_STOP_SUCCESS, self.command_routing_id, self.command_socket_interface)
 
+    def _run_loop(self):
+        self.loop_scheduler.on_loop_start()
+        self.outputs = dict([(s_name, None) for s_name in self.output_outlets.keys()])  # reset the output to be default values
+        loop_start_time = time.time()
+        try:
+            self.loop()
+        except Exception as e:
+            # print('Exception in loop(): {0} {1}'.format(type(e), e))
+            traceback.print_exc()
+            # print(traceback.format_exc())
+            self.redirect_stderr.send_buffered_messages()
+        this_loop_outputs = time.time() - loop_start_time
+        self.loop_durations.append(this_loop_outputs)
+        self.max_loop_duration = max(this_loop_outputs, self.max_loop_duration)
+        self.run_while_start_times.append(loop_start_time)
+        has_output = any(data is not None for data in self.outputs.values()) or any(len(staging) > 0 for staging in self._output_staging.values())
+        self._send_outputs()
+        self.loop_scheduler.on_loop_end(has_output)
+
+    def _process_info_request(self):
+        """
+        the realtime info is the loop rate, the mean and max loop durations, followed by the timing of the scheduler,
+        see LoopScheduler.get_info
+        """
+        info_msg_routing_id = recv_string_router(self.info_socket_interface, is_block=False)
+        if info_msg_routing_id is not None:
+            request = info_msg_routing_id[0]
+            if request == SCRIPT_INFO_REQUEST:
+                send_router(np.concatenate([[get_fps(self.run_while_start_times), np.mean(self.loop_durations) if len(self.loop_durations) else 0., self.max_loop_duration],
+                                            self.loop_scheduler.get_info()]),
+                            self.info_routing_id, self.info_socket_interface)
+            else:
+                logging.warning('unknown info request: ' + request)
+
+    def _process_command(self):
+        """
+        :return: False if the script is asked to stop
+        """
+        command_msg_routing_id = recv_string_router(self.command_socket_interface, is_block=False)
+        if command_msg_routing_id is not None:
+            command = command_msg_routing_id[0]
+            if command == SCRIPT_STOP_REQUEST:
+                return False
+            if command == SCRIPT_PARAM_CHANGE:
+                # receive the rest of the mssage about parameter change
+                change_info, _ = recv_string_router(self.command_socket_interface, is_block=True)
+                _, value = self.command_socket_interface.socket.recv_multipart()  # first element is routing ID
+                change_str, param_name, param_type = change_info.split('|')
+                change = ParamChange(change_str)
+                if change == ParamChange.ADD or change == ParamChange.CHANGE:
+                    # self.params[param_name] = np.frombuffer(np.array(value).tobytes(), dtype=param_type)[0]
+                    self.params[param_name] = json.loads(value.decode('utf-8'))
+                else:
+                    self.params.pop(param_name)
+                logging.info('RenaScript: param changed')
+            else:
+                logging.warning('unknown command: ' + command)
+        return True
+
+    def _send_outputs(self):
+        """
+        send the output if they are updated in the loop
+        """
+        for stream_name, data in self.outputs.items():
+            if stream_name not in self.output_outlets:
+                logging.error(f'RenaScript: output stream with name {stream_name} not found')
+                continue
+            outlet = self.output_outlets[stream_name]
+            if data is not None:
+                try:
+                    _data, timestamp, is_data_chunk, is_timestamp_chunk = validate_output(data, self.output_num_channels[stream_name])
+                    _data = _data.astype(self.output_presets[stream_name].data_type.get_data_type(), copy=False)
+                    clock_time = get_clock_time()
+                    _timestamp = clock_time if timestamp is None else timestamp  # timestamp is not a chunk when data is not chunk
+                    if is_data_chunk and (is_timestamp_chunk or not (pylsl_imported and isinstance(outlet, StreamOutlet))):
+                        # one push_chunk or one multi-sample frame for the whole chunk
+                        timestamps = np.asarray(timestamp, dtype=np.float64) if is_timestamp_chunk else np.full(len(_data), _timestamp, dtype=np.float64)
+                        self._send_output_chunk(stream_name, outlet, _data.T, timestamps)
+                    elif pylsl_imported and isinstance(outlet, StreamOutlet):
+                        if is_data_chunk:
+                            outlet.push_chunk(_data.tolist(), timestamp=_timestamp)  # timestamp is a number or None if not provided by the user
+                        else:
+                            # timestamp will never be a chunk in this case when data is not chunk
+                            outlet.push_sample(_data.tolist(), timestamp=_timestamp)  # 0.0 is default value, using it will use the local clock
+                    else:  # this is a zmq socket
+                        outlet.send_multipart([bytes(stream_name, "utf-8"), np.array(_timestamp), _data])
+                except Exception as e:
+                    if type(e) == BadOutputError:
+                        logging.error('Bad output data is given to stream {0}: {1}'.format(stream_name, str(e)))
+                    else:
+                        logging.error('Unknown error occurred when trying to send output data: {0}'.format(str(e)))
+                    traceback.print_exc()
+        # send the frames appended in the loop
+        for stream_name, staging in self._output_staging.items():
+            if len(staging) > 0 and stream_name in self.output_outlets:
+                try:
+                    self._send_output_chunk(stream_name, self.output_outlets[stream_name], staging.data, staging.timestamps)
+                except Exception as e:
+                    logging.error('Unknown error occurred when trying to send output data: {0}'.format(str(e)))
+                    traceback.print_exc()
+            staging.reset()
+
     def __del__(self):
         self.stdout_socket_interface.socket.close()
         self.input_socket_interface.socket.close()
@@ -253,6 +299,7 @@ class RenaScript(ABC, threading.Thread):
 
             self.sim_clock = time.time()
         self.inputs.update_buffers(data_dict)
+        return data_dict  # the simulated inputs when simulating
         # check_buffer_timestamps_monotonic(self.inputs) TODO
         # confirm timestamsp are monotonousely increasing
         # self.inputs = dict([(n, np.empty(0)) for n in self.input_names])
@@ -277,6 +324,16 @@ class RenaScript(ABC, threading.Thread):
         elif info == 'DataType':
             return self.presets.stream_presets[stream_name].data_type
 
+    def _send_output_chunk(self, stream_name, outlet, data, timestamps):
+        """
+        send a chunk in one call, keeping the timestamp of every frame
+        @param data: n_channels x n_frames
+        """
+        if pylsl_imported and isinstance(outlet, StreamOutlet):
+            push_lsl_chunk(outlet, data, timestamps)
+        else:  # this is a zmq socket
+            send_zmq_samples(outlet, stream_name, timestamps, data)
+
     def _create_output_streams(self):
         for stream_name, o_preset in self.output_presets.items():
             if o_preset.interface_type == PresetType.LSL:
@@ -290,6 +347,30 @@ class RenaScript(ABC, threading.Thread):
                     raise ZMQPortOccupiedError(o_preset.port_number)
                 self.output_outlets[stream_name] = socket
 
+    def set_loop_scheduling(self, scheduling: LoopScheduling, trigger_input: str=None, trigger_sample_count: int=1) -> None:
+        """
+        Set when loop is called, call this function in init.
+        By default, loop is called every time the main app forwards the inputs, which it does <run frequency> times per second.
+
+        @param scheduling: one of
+            LoopScheduling.RUN_SIGNAL: the default
+            LoopScheduling.FIXED_RATE_CATCH_UP: <run frequency> times per second on the script's own clock, loops that
+                start late are run back to back until the script catches up
+            LoopScheduling.FIXED_RATE_SKIP: <run frequency> times per second on the script's own clock, loops that
+                are a full period late are skipped
+            LoopScheduling.DATA_TRIGGERED: every time trigger_sample_count new samples arrive on trigger_input
+            LoopScheduling.FREE_RUNNING: as fast as possible
+        @param trigger_input: name of the input that triggers the loop, must be given with DATA_TRIGGERED
+        @param trigger_sample_count: number of new samples that trigger the loop, with DATA_TRIGGERED
+
+        The deadline misses, jitter and input-to-output latency of the loops are shown in the scripting widget, see LoopScheduler.
+        """
+        if scheduling == LoopScheduling.DATA_TRIGGERED and trigger_input not in self.input_names:
+            raise ValueError(f'The trigger input {trigger_input} is not an input of this script, the inputs are {self.input_names}')
+        if trigger_sample_count < 1:
+            raise ValueError(f'trigger_sample_count must be at least 1, got {trigger_sample_count}')
+        self.loop_scheduler = LoopScheduler(scheduling, self.run_frequency, trigger_input, trigger_sample_count)
+
     def set_output(self, stream_name: str, data: Union[np.ndarray, list, tuple], timestamp: Union[np.ndarray, list, tuple, float]=None) -> None:
         """
         Set the output data of the given stream,
@@ -308,6 +389,28 @@ class RenaScript(ABC, threading.Thread):
         """
         self.outputs[stream_name] = {'data': data, 'timestamp': timestamp}
 
+    def append_output(self, stream_name: str, data: Union[np.ndarray, list, tuple], timestamp: Union[np.ndarray, list, tuple, float]=None) -> None:
+        """
+        Append frames to the output of the given stream. Unlike set_output, which replaces the output, the frames
+        appended in a loop accumulate, and they are sent together as one chunk at the end of the loop, keeping the
+        timestamp of every frame. Use this to output many frames per loop, e.g., features computed at a higher rate
+        than the run frequency.
+
+        The frames are copied into a buffer preallocated for the stream, so appending does not allocate.
+
+        @param stream_name: the name of the stream to append to
+        @param data: a frame or frames, in the same format as for set_output
+        @param timestamp: a number for all the frames or one per frame, the local clock is used if not given
+        """
+        if stream_name not in self._output_staging:
+            raise BadOutputError(f'output stream with name {stream_name} not found')
+        _data, is_chunk = validate_output_data(data, self.output_num_channels[stream_name])
+        _data = _data.reshape((-1, self.output_num_channels[stream_name]))  # frames x channels
+        if timestamp is None:
+            timestamp = get_clock_time()
+        timestamps = np.broadcast_to(np.asarray(timestamp, dtype=np.float64), (len(_data),))
+        self._output_staging[stream_name].append(_data.T, timestamps)
+
 
 
 
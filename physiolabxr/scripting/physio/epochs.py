@@ -7,6 +7,8 @@ import numpy as np
 import scipy
 from scipy.signal import spectrogram
 
+from physiolabxr.scripting.physio.utils import times_to_indices
+
 
 def get_event_locked_data(event_marker, data, events_of_interest, tmin, tmax, srate, return_last_event_time=False, event_channel=0, verbose=None, **kwargs):
     """this function is used to get event locked data from a single modality or multiple modalities.
@@ -88,26 +90,26 @@ def _get_event_locked_data(event_marker, event_channel, data, events_of_interest
     assert tmin < tmax, 'tmin must be less than tmax'
     event_marker, event_marker_time = event_marker
     event_marker = event_marker[event_channel]
+    event_marker_time = np.asarray(event_marker_time)
     data, data_time = data
     events_of_interest = [e for e in events_of_interest if e in event_marker]
-    rtn = {e: [] for e in events_of_interest}
+    rtn = {}
     latest_event_start_time = -1
     epoch_length = int((tmax - tmin) * srate)
     reject_count = defaultdict(int)
     for e in events_of_interest:
         this_event_marker_time = event_marker_time[event_marker == e]
-        data_event_starts = [np.argmin(abs(data_time - (s+tmin))) for s in this_event_marker_time]
-        data_event_ends = [epoch_length + s for s in data_event_starts]
-        for i, j, e_time in zip(data_event_starts, data_event_ends, this_event_marker_time):
-            if j < len(data_time):  # if the epoch is not cut off by the end of the data
-                if reject is not None:
-                    if np.max(np.max(data[:, i:j], axis=0) - np.min(data[:, i:j], axis=0)) > reject:
-                        reject_count[e] += 1
-                        continue
-                rtn[e].append(data[:, i:j])
-                latest_event_start_time = max(latest_event_start_time, e_time)
-    # convert to numpy arrays
-    rtn = {k: np.array(v) for k, v in rtn.items() if len(v) > 0}
+        data_event_starts = times_to_indices(data_time, this_event_marker_time + tmin)
+        is_complete = data_event_starts + epoch_length < len(data_time)  # if the epoch is not cut off by the end of the data
+        epochs = _gather_epochs(data, data_event_starts[is_complete], epoch_length)
+        this_event_marker_time = this_event_marker_time[is_complete]
+        if reject is not None:
+            is_rejected = _get_rejected(epochs, reject)
+            reject_count[e] += np.sum(is_rejected)
+            epochs, this_event_marker_time = epochs[~is_rejected], this_event_marker_time[~is_rejected]
+        if len(epochs) > 0:
+            rtn[e] = epochs
+            latest_event_start_time = max(latest_event_start_time, np.max(this_event_marker_time))
     if verbose:
         [print(f"Found {len(v)} events for event marker {k}{f', rejected {reject_count[k]}' if reject is not None else ''}") for k, v in rtn.items()]
     if return_last_event_time:
@@ -116,6 +118,26 @@ def _get_event_locked_data(event_marker, event_channel, data, events_of_interest
         return rtn
 
 
+def _gather_epochs(data, starts, epoch_length):
+    """
+    @param data: (n_channels, n_samples)
+    @param starts: the first sample of every epoch, an epoch must end before the data does
+    @return: (n_epochs, n_channels, epoch_length)
+    """
+    if len(starts) == 0:
+        return np.empty((0, data.shape[0], epoch_length), dtype=data.dtype)
+    # the epochs are windows of a strided view of the data, gathered in one copy
+    windows = np.lib.stride_tricks.sliding_window_view(data, epoch_length, axis=1)
+    return windows.transpose(1, 0, 2)[starts]
+
+
+def _get_rejected(epochs, reject):
+    """
+    whether the peak-to-peak amplitude across the channels of an epoch exceeds reject at any of its samples
+    """
+    return np.max(np.ptp(epochs, axis=1), axis=1) > reject if len(epochs) > 0 else np.zeros(0, dtype=bool)
+
+
 def buffer_event_locked_data(event_locked_data: dict, buffer: dict):
     """
     @param event_locked_data: can be either single-modal or multi-modal:
@@ -123,6 +145,8 @@ def buffer_event_locked_data(event_locked_data: dict, buffer: dict):
         multi-modal
     @param buffer: dictionary of event marker and its corresponding buffer. The keys are the event markers
     @return: dictionary of event marker and its corresponding event locked data. The keys are the event markers
+
+    The buffer is copied on every call, scripts that buffer epochs every loop should use EpochExtractor instead
     """
     # check if is multi-modal
     rtn = copy.deepcopy(buffer)
@@ -156,6 +180,114 @@ def _buffer_event_locked_data(event_locked_data: dict, buffer: dict):
     return rtn
 
 
+class EpochExtractor:
+    """
+    Extracts the event locked data of a stream incrementally, for scripts that epoch their input buffer every loop.
+
+    Unlike calling get_event_locked_data and buffer_event_locked_data every loop, which epoch every marker in the
+    buffer and copy all the epochs found so far, extract only epochs the markers that arrived since the last call.
+    The markers whose epochs are not complete yet are kept and epoched once their data arrive. The new epochs are
+    appended to a preallocated store that doubles when it is full, and epochs gives them all without copying.
+
+    The epochs are the same as get_event_locked_data's: an epoch starts at the sample closest to the marker time +
+    tmin and is int((tmax - tmin) * srate) samples long. For multi-modal data, use one extractor per modality.
+
+    Example, in a script's loop:
+        new_epochs = self.epoch_extractor.extract(self.inputs['EventMarker'], self.inputs['EEG'])
+        if len(new_epochs) > 0:
+            target_epochs = self.epoch_extractor.epochs[2]
+    """
+    def __init__(self, events_of_interest, tmin, tmax, srate, event_channel=0, reject=None, initial_capacity=16):
+        """
+        @param events_of_interest: iterable of the event markers to epoch
+        @param tmin: time before the event marker to include in the epoch, see get_event_locked_data
+        @param tmax: time after the event marker to include in the epoch
+        @param event_channel: the channel of the event marker stream that holds the markers
+        @param reject: reject the epochs with peak-to-peak amplitude greater than this value
+        @param initial_capacity: number of epochs of each event marker to preallocate room for
+        """
+        assert tmin < tmax, 'tmin must be less than tmax'
+        self.events_of_interest = list(events_of_interest)
+        self.tmin = tmin
+        self.srate = srate
+        self.epoch_length = int((tmax - tmin) * srate)
+        self.event_channel = event_channel
+        self.reject = reject
+        self.initial_capacity = initial_capacity
+
+        self.last_marker_time = -np.inf  # markers up to this time are epoched or pending
+        self.pending_markers = np.empty(0)
+        self.pending_marker_times = np.empty(0)
+        self.last_event_time = -1  # the time of the last marker epoched, see get_event_locked_data's return_last_event_time
+        self.reject_count = defaultdict(int)
+        self._epochs = {}  # event marker -> preallocated (capacity, n_channels, epoch_length)
+        self._epoch_counts = {}
+
+    def extract(self, event_marker, data):
+        """
+        @param event_marker: tuple of event marker (n_channels, n_markers) and its timestamps, e.g., self.inputs['EventMarker']
+        @param data: tuple of data (n_channels, n_samples) and its timestamps
+        @return: dictionary of event marker and the epochs found in this call, (n_new_epochs, n_channels, n_times)
+            views of the store, only the event markers with new epochs are included
+        """
+        markers, marker_times = event_marker
+        markers, marker_times = np.asarray(markers)[self.event_channel], np.asarray(marker_times)
+        is_new = marker_times > self.last_marker_time
+        if np.any(is_new):
+            self.last_marker_time = np.max(marker_times[is_new])
+        is_new &= np.isin(markers, self.events_of_interest)
+        self.pending_markers = np.concatenate([self.pending_markers, markers[is_new]])
+        self.pending_marker_times = np.concatenate([self.pending_marker_times, marker_times[is_new]])
+
+        data, data_time = data
+        if len(self.pending_markers) == 0 or len(data_time) == 0:
+            return {}
+        starts = times_to_indices(data_time, self.pending_marker_times + self.tmin)
+        is_complete = starts + self.epoch_length < len(data_time)
+        # the data before the epoch start have been cleared from the buffer, the epoch can no longer be extracted
+        is_missed = self.pending_marker_times + self.tmin < data_time[0] - 1 / self.srate
+        is_extracted = is_complete & ~is_missed
+        epochs = _gather_epochs(data, starts[is_extracted], self.epoch_length)
+        markers, marker_times = self.pending_markers[is_extracted], self.pending_marker_times[is_extracted]
+        self.pending_markers = self.pending_markers[~is_complete & ~is_missed]
+        self.pending_marker_times = self.pending_marker_times[~is_complete & ~is_missed]
+
+        if self.reject is not None:
+            is_rejected = _get_rejected(epochs, self.reject)
+            for e in markers[is_rejected]:
+                self.reject_count[e] += 1
+            epochs, markers, marker_times = epochs[~is_rejected], markers[~is_rejected], marker_times[~is_rejected]
+        if len(marker_times) > 0:
+            self.last_event_time = max(self.last_event_time, np.max(marker_times))
+        return {e: self._append(e, epochs[markers == e]) for e in self.events_of_interest if np.any(markers == e)}
+
+    def _append(self, event, epochs):
+        store, n = self._epochs.get(event), self._epoch_counts.get(event, 0)
+        if store is None or n + len(epochs) > len(store):
+            # the views returned before keep the old store
+            new_store = np.empty((max(2 * (n + len(epochs)), self.initial_capacity),) + epochs.shape[1:], dtype=epochs.dtype)
+            if store is not None:
+                new_store[:n] = store[:n]
+            store = self._epochs[event] = new_store
+        store[n:n + len(epochs)] = epochs
+        self._epoch_counts[event] = n + len(epochs)
+        return store[n:n + len(epochs)]
+
+    @property
+    def epochs(self):
+        """
+        dictionary of event marker and all its epochs extracted so far, (n_epochs, n_channels, n_times), as
+        buffer_event_locked_data returns
+        """
+        return {e: store[:self._epoch_counts[e]] for e, store in self._epochs.items()}
+
+    def clear(self):
+        """
+        drop the epochs extracted so far, the markers already seen are not epoched again
+        """
+        self._epochs, self._epoch_counts = {}, {}
+
+
 def get_baselined_event_locked_data(event_locked_data, baseline_t, srate, pick: int = None):
     """
     @param event_locked_data: dictionary of event marker and its corresponding event locked data. The keys are the event markers
@@ -1,6 +1,6 @@
 import numpy as np
 
-from physiolabxr.scripting.physio.utils import interpolate_array_nan, time_to_index
+from physiolabxr.scripting.physio.utils import interpolate_array_nan, times_to_indices
 
 
 def gap_fill(gaze_xyz, gaze_status, valid_status, gaze_timestamps, max_gap_time=0.075, verbose=True):
@@ -74,6 +74,42 @@ def _compute_dispersion(angles):
     return np.std(angles)
 
 
+def _classify_windows(gaze_angles_degree, timestamps, n_windows, window_size, dispersion_threshold_degree, saccade_min_sample):
+    """
+    classify the windows that start at the first n_windows samples, with the dispersions of all the windows computed
+    from cumulative sums at once
+
+    A window starts at a sample and ends at the sample closest to window_size later, exclusive. The windows with fewer
+    than saccade_min_sample samples are not classified, those with a nan sample are not fixations.
+    @return: the start index of the classified windows, whether each of them is a fixation
+    """
+    starts = np.arange(n_windows)
+    ends = times_to_indices(timestamps, timestamps[:n_windows] + window_size)
+    is_classified = ends - starts >= saccade_min_sample
+    starts, ends = starts[is_classified], ends[is_classified]
+    n_samples = ends - starts
+
+    is_nan = np.isnan(gaze_angles_degree)
+    offset = np.nanmean(gaze_angles_degree) if not np.all(is_nan) else 0.  # keeps the sums small
+    angles = np.where(is_nan, 0., gaze_angles_degree - offset)
+    angle_sums = np.concatenate([[0.], np.cumsum(angles)])
+    squared_angle_sums = np.concatenate([[0.], np.cumsum(angles * angles)])
+    nan_counts = np.concatenate([[0], np.cumsum(is_nan)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = (angle_sums[ends] - angle_sums[starts]) / n_samples
+        variances = (squared_angle_sums[ends] - squared_angle_sums[starts]) / n_samples - means * means
+    is_valid = (n_samples > 0) & (nan_counts[ends] == nan_counts[starts])
+    is_fixation = is_valid & (variances < dispersion_threshold_degree ** 2)
+
+    # the differences of the cumulative sums lose digits np.std keeps, the windows close enough to the threshold for
+    # that to matter are classified with np.std as before
+    absolute_angle_sums = np.concatenate([[0.], np.cumsum(np.abs(angles))])
+    error_bound = 4 * len(angles) * np.finfo(np.float64).eps * (squared_angle_sums[ends] + 2 * np.abs(means) * absolute_angle_sums[ends]) / np.maximum(n_samples, 1)
+    for i in np.flatnonzero(is_valid & (np.abs(variances - dispersion_threshold_degree ** 2) <= error_bound)):
+        is_fixation[i] = _compute_dispersion(gaze_angles_degree[starts[i]:ends[i]]) < dispersion_threshold_degree
+    return starts, is_fixation
+
+
 def fixation_detection_idt(gaze_xyz, timestamps, window_size=0.175, dispersion_threshold_degree=0.5, saccade_min_sample=2, return_last_window_start=False):
     """
 
@@ -82,25 +118,64 @@ def fixation_detection_idt(gaze_xyz, timestamps, window_size=0.175, dispersion_t
     @param window_size:
     @param dispersion_threshold_degree:
     @param saccade_min_sample: the minimal number of samples between consecutive fixations to be considered as a saccade
-    @return:
+    @return: (2, n_windows), whether each window is a fixation (1) or not (0), and the center time of the window
+
+    To detect the fixations of a stream as its gaze samples arrive, use FixationDetectorIDT
     """
     assert window_size > 0, "fixation_detection_idt: window size must be positive"
+    timestamps = np.asarray(timestamps)
     gaze_angles_degree = _calculate_gaze_angles(gaze_xyz)
-    windows = [(i, time_to_index(timestamps, t + window_size)) for i, t in enumerate(timestamps)]
-    last_window_start = 0
-    fixations = []
-    for start, end in windows:
-        if end >= len(timestamps):
-            break
-        if end - start < saccade_min_sample:
-            continue
-        center_time = timestamps[start] + window_size / 2
-        if _compute_dispersion(gaze_angles_degree[start:end]) < dispersion_threshold_degree:
-            fixations.append([1, center_time])  # 1 for fixation
-        else:
-            fixations.append([0, center_time])
-        last_window_start = start
+    starts, is_fixation = _classify_windows(gaze_angles_degree, timestamps, len(timestamps), window_size, dispersion_threshold_degree, saccade_min_sample)
+    fixations = np.stack([is_fixation.astype(np.float64), timestamps[starts] + window_size / 2]) if len(starts) > 0 else np.array([])  # 1 for fixation
+    last_window_start = starts[-1] if len(starts) > 0 else 0
     if return_last_window_start:
-        return np.array(fixations).T, last_window_start
+        return fixations, last_window_start
     else:
-        return np.array(fixations).T
\ No newline at end of file
+        return fixations
+
+
+class FixationDetectorIDT:
+    """
+    Detects the fixations of a gaze stream as its samples arrive, with the I-DT of fixation_detection_idt.
+
+    A window is classified once the samples up to its end have arrived, so process returns only the windows that the
+    new samples complete, the samples of the classified windows are dropped. The windows returned by process and then
+    flush are the same as fixation_detection_idt returns for all the samples at once.
+    """
+    def __init__(self, window_size=0.175, dispersion_threshold_degree=0.5, saccade_min_sample=2):
+        """
+        @param window_size: see fixation_detection_idt
+        """
+        assert window_size > 0, "FixationDetectorIDT: window size must be positive"
+        self.window_size = window_size
+        self.dispersion_threshold_degree = dispersion_threshold_degree
+        self.saccade_min_sample = saccade_min_sample
+        self.gaze_angles_degree = np.empty(0)  # of the samples from the start of the first window not classified yet
+        self.timestamps = np.empty(0)
+
+    def process(self, gaze_xyz, timestamps):
+        """
+        @param gaze_xyz: (3, n_new_samples)
+        @return: (2, n_windows) of the windows completed by the new samples, as fixation_detection_idt
+        """
+        self.gaze_angles_degree = np.concatenate([self.gaze_angles_degree, _calculate_gaze_angles(gaze_xyz)])
+        self.timestamps = np.concatenate([self.timestamps, timestamps])
+        if len(self.timestamps) == 0:
+            return np.empty((2, 0))
+        # the end of a window is the sample closest to its end time, no sample to come can be closer once the last
+        # sample is past the end time
+        n_complete_windows = np.count_nonzero(self.timestamps + self.window_size <= self.timestamps[-1])
+        return self._classify(n_complete_windows)
+
+    def flush(self):
+        """
+        classify the windows left, those at the end of the samples are cut short as in fixation_detection_idt
+        @return: (2, n_windows)
+        """
+        return self._classify(len(self.timestamps))
+
+    def _classify(self, n_windows):
+        starts, is_fixation = _classify_windows(self.gaze_angles_degree, self.timestamps, n_windows, self.window_size, self.dispersion_threshold_degree, self.saccade_min_sample)
+        fixations = np.stack([is_fixation.astype(np.float64), self.timestamps[starts] + self.window_size / 2])
+        self.gaze_angles_degree, self.timestamps = self.gaze_angles_degree[n_windows:], self.timestamps[n_windows:]
+        return fixations
@@ -21,6 +21,19 @@ def interpolate_array_nan(data_array):
 def time_to_index(timestamps, time):
     return np.argmin(np.abs(timestamps - time))
 
+
+def times_to_indices(timestamps, times):
+    """
+    the index of the timestamp closest to each of times, the earlier one on a tie, as time_to_index for every time but
+    in O(log(n_timestamps)) per time. The timestamps must be sorted
+    """
+    times = np.asarray(times)
+    if len(timestamps) < 2:
+        return np.zeros(len(times), dtype=int)
+    after = np.clip(np.searchsorted(timestamps, times), 1, len(timestamps) - 1)
+    before = after - 1
+    return np.where(np.abs(timestamps[before] - times) <= np.abs(timestamps[after] - times), before, after)
+
 def string_to_enum(enum_type, string_value):
     try:
         return enum_type[string_value]
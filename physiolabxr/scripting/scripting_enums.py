@@ -17,3 +17,14 @@ class ParamChange(Enum):
     ADD = 'a'
     REMOVE = 'r'
     CHANGE = 'c'
+
+
+class LoopScheduling(Enum):
+    """
+    When RenaScript calls loop(), see RenaScript.set_loop_scheduling
+    """
+    RUN_SIGNAL = 'run signal'  # once every time the main app forwards the inputs, at the run frequency of the GUI
+    FIXED_RATE_CATCH_UP = 'fixed rate, catch up'  # at the run frequency, late loops are run back to back until caught up
+    FIXED_RATE_SKIP = 'fixed rate, skip'  # at the run frequency, loops that are a full period late are skipped
+    DATA_TRIGGERED = 'data triggered'  # every time a number of new samples arrive on the trigger input
+    FREE_RUNNING = 'free running'  # as fast as possible
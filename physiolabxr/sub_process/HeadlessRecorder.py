@@ -0,0 +1,336 @@
+import json
+import os
+import threading
+import time
+import traceback
+import warnings
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import zmq
+
+from physiolabxr.interfaces.ZMQInterface import ZMQInterface
+from physiolabxr.presets.PresetEnums import PresetType
+from physiolabxr.threadings.RecordingWriter import RecordingWriter
+from physiolabxr.utils.RNStream import RNStream
+from physiolabxr.utils.buffers import DataBuffer
+from physiolabxr.utils.stream_telemetry import StreamTelemetry
+
+headless_recorder_commands = ('start', 'stop', 'status', 'exit')
+
+
+def create_stream_interface(stream_preset):
+    """
+    create the interface of a stream from its preset, as the stream widgets do through their workers
+
+    Only the LSL, ZMQ and custom device streams can be acquired without the GUI. The arguments that the options of a
+    custom device give to its start_stream in the GUI are given to HeadlessRecorder as start_stream_args.
+    @return: an interface with start_stream, process_frames and stop_stream
+    """
+    if stream_preset.preset_type == PresetType.LSL:
+        from physiolabxr.interfaces.LSLInletInterface import create_lsl_interface
+        return create_lsl_interface(stream_preset.stream_name, stream_preset.num_channels, stream_preset.lsl_time_correction, stream_preset.lsl_dejitter)
+    elif stream_preset.preset_type == PresetType.ZMQ:
+        return ZMQInterface(stream_preset.port_number, stream_preset.stream_name, stream_preset.data_type)
+    elif stream_preset.preset_type == PresetType.CUSTOM:
+        from physiolabxr.interfaces.DeviceInterface.utils import create_custom_device_classes
+        return create_custom_device_classes(stream_preset.stream_name)[0]
+    raise ValueError(f'create_stream_interface: stream {stream_preset.stream_name} of type {stream_preset.preset_type} cannot be recorded headless')
+
+
+class StreamAcquisitionThread(threading.Thread):
+    """
+    Pulls the samples of a stream from its interface on a plain thread, in place of the worker and the QTimer of a
+    stream widget, and hands them to on_samples.
+
+    An exception raised by the interface stops the thread, it is kept in self.error, as DeviceWorker stops the stream
+    when its device faults.
+    """
+    def __init__(self, stream_name, interface, on_samples, pull_interval=0.002):
+        """
+        :param interface: started by the caller, process_frames returns (frames, timestamps) or (frames, timestamps, messages)
+        :param on_samples: called on this thread with the stream name, the frames (n_channels, n_samples) and the timestamps
+        :param pull_interval: in seconds, the time between two pulls
+        """
+        super().__init__(daemon=True)
+        self.stream_name = stream_name
+        self.interface = interface
+        self.on_samples = on_samples
+        self.pull_interval = pull_interval
+        self.running = True
+        self.error = None
+
+        self.sample_count = 0
+        self.messages = deque(maxlen=64)  # the latest messages of a device interface
+
+    def run(self):
+        try:
+            while self.running:
+                frames, timestamps, *messages = self.interface.process_frames()
+                if len(messages) > 0:
+                    self.messages.extend(messages[0])
+                if len(timestamps) > 0:
+                    self.on_samples(self.stream_name, np.asarray(frames), np.asarray(timestamps))
+                    self.sample_count += len(timestamps)
+                time.sleep(self.pull_interval)
+        except Exception as e:
+            traceback.print_exc()
+            self.error = e
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+
+class HeadlessRecorder(threading.Thread):
+    """
+    Acquires streams and records them to .dats without the GUI, for recording rigs, lab servers and CI.
+
+    Every stream is pulled from its interface on a StreamAcquisitionThread, the samples go to a recording buffer that
+    is evicted to a RecordingWriter every eviction_interval, as RecordingsTab does. The streams are acquired from
+    start() until exit, the recording can be started and stopped any number of times in between, each recording is a
+    new file in out_dir.
+
+    The recorder is controlled over a REP socket bound to localhost. The requests are json objects with a 'command':
+        * {'command': 'start', 'subject': <optional>, 'session': <optional>}: starts a recording, replies its file_path
+        * {'command': 'stop'}: stops the recording after its buffers are written, replies its file_path
+        * {'command': 'status'}: replies the state of the recording, the streams and the writer, see get_status
+        * {'command': 'exit'}: stops the recording and the streams, and ends the thread
+    Every reply is a json object with 'ok', and 'error' when the command failed. See send_headless_recorder_command.
+    """
+    def __init__(self, stream_interfaces: dict, out_dir, experiment_name='', control_port=0, eviction_interval=1.,
+                 pull_interval=0.002, max_queue_size=8, jpeg_quality=90, nominal_sampling_rates: dict = None,
+                 start_stream_args: dict = None):
+        """
+        :param stream_interfaces: dict of stream name to its interface, see create_stream_interface
+        :param start_stream_args: dict of stream name to the keyword arguments of its interface's start_stream, for the
+            custom devices that take them, e.g., {'DSI24': {'bluetooth_port': 'COM5'}}, see
+            BaseDeviceOptions.start_stream_args
+        :param nominal_sampling_rates: dict of stream name to its nominal sampling rate, the gaps in the streams that
+            have one are counted, see StreamTelemetry
+        :param control_port: the port of the control socket, 0 for a free port, which is then in self.control_port
+        :param eviction_interval: in seconds, how often the recording buffer is handed to the writer
+        :param pull_interval: in seconds, how often the streams are pulled
+        :param max_queue_size: see RecordingWriter
+        """
+        super().__init__(daemon=True)
+        self.stream_interfaces = stream_interfaces
+        self.out_dir = out_dir
+        self.experiment_name = experiment_name
+        self.eviction_interval = eviction_interval
+        self.pull_interval = pull_interval
+        self.max_queue_size = max_queue_size
+        self.jpeg_quality = jpeg_quality
+        self.nominal_sampling_rates = nominal_sampling_rates if nominal_sampling_rates is not None else {}
+        self.start_stream_args = start_stream_args if start_stream_args is not None else {}
+
+        self.acquisition_threads = {}
+        self.running = True
+        self.error = None  # the last error of the writer, the recording stops when it fails
+
+        self.recording_buffer = DataBuffer()
+        self.recording_writer = None
+        self.file_path = None
+        self._buffer_lock = threading.Lock()  # the buffer is filled by the acquisition threads
+        self._recording_lock = threading.RLock()
+        self._last_eviction_time = None
+
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.REP)
+        if control_port == 0:
+            self.control_port = self.socket.bind_to_random_port('tcp://127.0.0.1')
+        else:
+            self.socket.bind(f'tcp://127.0.0.1:{control_port}')
+            self.control_port = control_port
+
+    @property
+    def is_recording(self):
+        return self.recording_writer is not None
+
+    def start(self):
+        """
+        starts the streams before starting the thread, so that errors such as LSLStreamNotFoundError are raised to the
+        caller. The streams started before the error are stopped
+        """
+        try:
+            for stream_name, interface in self.stream_interfaces.items():
+                StreamTelemetry().reset(stream_name)
+                interface.start_stream(**self.start_stream_args.get(stream_name, {}))
+                self.acquisition_threads[stream_name] = StreamAcquisitionThread(stream_name, interface, self._on_samples, self.pull_interval)
+                self.acquisition_threads[stream_name].start()
+        except Exception:
+            self._stop_streams()
+            self._close_socket()
+            raise
+        super().start()
+
+    def run(self):
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        try:
+            while self.running:
+                if len(dict(poller.poll(timeout=self.eviction_interval * 1e3 / 4))) > 0:
+                    self.socket.send_json(self.process_request(self.socket.recv()))
+                with self._recording_lock:
+                    if self.is_recording and time.perf_counter() - self._last_eviction_time >= self.eviction_interval:
+                        self.evict_buffer()
+        finally:
+            self.stop_recording()
+            self._stop_streams()
+            self._close_socket()
+
+    def process_request(self, message):
+        """
+        a request that is not json is replied to with an error, so that the REP socket can take the next one
+        @return: the reply to a request message, see process_command
+        """
+        try:
+            request = json.loads(message)
+        except ValueError as e:
+            return {'ok': False, 'error': f'request is not json: {e}'}
+        return self.process_command(request)
+
+    def process_command(self, request):
+        """
+        @return: the reply to a request, see the class docstring
+        """
+        command = request.get('command') if isinstance(request, dict) else None
+        try:
+            if command == 'start':
+                return {'ok': True, 'file_path': self.start_recording(request.get('subject', ''), request.get('session', ''))}
+            elif command == 'stop':
+                file_path = self.stop_recording()
+                if self.error is not None:
+                    return {'ok': False, 'error': str(self.error), 'file_path': file_path}
+                return {'ok': True, 'file_path': file_path}
+            elif command == 'status':
+                return {'ok': True, **self.get_status()}
+            elif command == 'exit':
+                self.running = False
+                return {'ok': True}
+            return {'ok': False, 'error': f'unknown command {command}, must be one of {headless_recorder_commands}'}
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+
+    def generate_save_path(self, subject='', session=''):
+        dt_string = datetime.now().strftime("%m_%d_%Y_%H_%M_%S")
+        return os.path.join(self.out_dir, f'{dt_string}-Exp_{self.experiment_name}-Sbj_{subject}-Ssn_{session}.dats')
+
+    def start_recording(self, subject='', session=''):
+        """
+        @return: the path of the new recording
+        """
+        with self._recording_lock:
+            if self.is_recording:
+                raise RuntimeError(f'already recording to {self.file_path}')
+            os.makedirs(self.out_dir, exist_ok=True)
+            file_path = self.generate_save_path(subject, session)
+            recording_writer = RecordingWriter(RNStream(file_path, jpeg_quality=self.jpeg_quality), max_queue_size=self.max_queue_size)
+            recording_writer.start()
+            with self._buffer_lock:
+                self.recording_buffer = DataBuffer()
+                self.recording_writer = recording_writer
+            self.file_path = file_path
+            self.error = None
+            self._last_eviction_time = time.perf_counter()
+            print(f'HeadlessRecorder: recording to {file_path}')
+            return file_path
+
+    def stop_recording(self):
+        """
+        evict the last buffer and wait for the writer to write the queued buffers
+        @return: the path of the stopped recording, None if not recording
+        """
+        with self._recording_lock:
+            if not self.is_recording:
+                return None
+            self.evict_buffer()
+            with self._buffer_lock:
+                recording_writer, self.recording_writer = self.recording_writer, None
+            if recording_writer is not None:  # None if the eviction failed
+                try:
+                    recording_writer.close()
+                except Exception as e:
+                    self.error = e
+            print(f'HeadlessRecorder: recording stopped, saved to {self.file_path}')
+            return self.file_path
+
+    def evict_buffer(self):
+        """
+        hand the filled recording buffer to the writer. The recording stops if the writer has failed
+        """
+        with self._buffer_lock:
+            evicted_buffer, self.recording_buffer = self.recording_buffer, DataBuffer()
+        self._last_eviction_time = time.perf_counter()
+        try:
+            self.recording_writer.write(evicted_buffer.buffer)
+        except Exception as e:
+            warnings.warn(f'HeadlessRecorder: recording to {self.file_path} stopped because of error: {e}')
+            self.error = e
+            with self._buffer_lock:
+                recording_writer, self.recording_writer = self.recording_writer, None
+            recording_writer.abort()
+
+    def get_status(self):
+        """
+        @return: dict with
+            is_recording, file_path: the current or the last recording
+            error: the error that stopped the last recording, None if there is none
+            streams: dict of stream name to its sample_count, error, latest messages and health, see
+                StreamTelemetry.get_metrics, the latency to 'disk' is measured when a recording writes the stream
+            writer: the metrics of the RecordingWriter, see RecordingWriter.get_metrics, None if not recording
+        """
+        with self._recording_lock:
+            writer_metrics = self.recording_writer.get_metrics() if self.is_recording else None
+            return {'is_recording': self.is_recording,
+                    'file_path': self.file_path,
+                    'error': None if self.error is None else str(self.error),
+                    'streams': {stream_name: {'sample_count': thread.sample_count,
+                                              'error': None if thread.error is None else str(thread.error),
+                                              'messages': list(thread.messages),
+                                              'health': StreamTelemetry().get_metrics(stream_name)}
+                                for stream_name, thread in self.acquisition_threads.items()},
+                    'writer': None if writer_metrics is None else {k: v.item() if isinstance(v, np.generic) else v for k, v in writer_metrics.items()}}
+
+    def _on_samples(self, stream_name, frames, timestamps):
+        StreamTelemetry().update(stream_name, timestamps, self.nominal_sampling_rates.get(stream_name))
+        with self._buffer_lock:
+            if self.recording_writer is not None:
+                self.recording_buffer.update_buffer({'stream_name': stream_name, 'frames': frames, 'timestamps': timestamps})
+
+    def _stop_streams(self):
+        for stream_name, thread in self.acquisition_threads.items():
+            thread.stop()
+        for stream_name, interface in self.stream_interfaces.items():
+            try:
+                interface.stop_stream()
+            except Exception as e:
+                warnings.warn(f'HeadlessRecorder: error stopping stream {stream_name}: {e}')
+            if hasattr(interface, 'close'):
+                interface.close()
+        self.acquisition_threads = {}
+
+    def _close_socket(self):
+        self.socket.close()
+        self.context.term()
+
+
+def send_headless_recorder_command(command, control_port, timeout=5., **kwargs):
+    """
+    send a command to a HeadlessRecorder, e.g., send_headless_recorder_command('start', port, subject='S01')
+    @param timeout: in seconds, raises TimeoutError if the recorder does not reply within
+    @return: the reply, see HeadlessRecorder
+    """
+    context = zmq.Context()
+    socket = context.socket(zmq.REQ)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.connect(f'tcp://127.0.0.1:{control_port}')
+    try:
+        socket.send_json({'command': command, **kwargs})
+        if socket.poll(timeout * 1e3) == 0:
+            raise TimeoutError(f'HeadlessRecorder at port {control_port} did not reply to {command} in {timeout} seconds')
+        return socket.recv_json()
+    finally:
+        socket.close()
+        context.term()
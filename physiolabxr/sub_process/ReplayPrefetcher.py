@@ -0,0 +1,115 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class ReplayPrefetcher(threading.Thread):
+    """
+    Reads the samples a replay is about to send ahead of time, on its own thread.
+
+    The data of a replayed stream can be lazy (e.g., the ChunkedMemmapArray from RNStream.stream_in_memmap or
+    load_xdf_lazy), in which case slicing it reads from disk. The prefetcher keeps, for each such stream, the samples
+    from the replay position up to look_ahead_duration seconds (in the recording's time) after it in memory, as a
+    queue of blocks. The replay thread takes its chunks from the blocks with get_data and only reads from disk itself
+    when the prefetcher has fallen behind. Memory is bounded by the look-ahead, whatever the size of the recording.
+
+    Streams whose data are already in memory (ndarray) are sliced directly.
+    """
+    def __init__(self, stream_data, look_ahead_duration=5., n_blocks_per_look_ahead=4):
+        """
+        :param stream_data: dict of stream name to [data, timestamps], the time axis of the data last
+        :param look_ahead_duration: in seconds, how far ahead of the replay position the samples are read
+        :param n_blocks_per_look_ahead: the look-ahead is read in blocks of look_ahead_duration / n_blocks_per_look_ahead
+            seconds, a block is freed once the replay has sent all its samples
+        """
+        super().__init__(daemon=True)
+        self.stream_data = stream_data
+        self.look_ahead_duration = look_ahead_duration
+        self.block_duration = look_ahead_duration / n_blocks_per_look_ahead
+        self.lazy_stream_names = [stream_name for stream_name, (data, _) in stream_data.items() if not isinstance(data, np.ndarray)]
+
+        self.blocks = {stream_name: deque() for stream_name in self.lazy_stream_names}  # (start index, end index, data)
+        self.next_sample_index = {stream_name: 0 for stream_name in self.lazy_stream_names}  # where the replay is
+        self.seek_count = 0  # blocks read before a seek are discarded
+
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.running = True
+
+    def run(self):
+        while self.running:
+            with self.condition:
+                work = self._get_next_read()
+                if work is None:
+                    self.condition.wait()
+                    continue
+            stream_name, start_index, end_index, seek_count = work
+            block = np.asarray(self.stream_data[stream_name][0][..., start_index:end_index])  # read outside the lock
+            with self.condition:
+                blocks = self.blocks[stream_name]
+                expected_start = blocks[-1][1] if len(blocks) > 0 else self.next_sample_index[stream_name]
+                if seek_count == self.seek_count and start_index == expected_start:
+                    blocks.append((start_index, end_index, block))
+
+    def _get_next_read(self):
+        """
+        find the stream that is the shortest ahead of the replay, and the block to read for it.
+        Must be called with the lock held.
+        """
+        next_read, shortest_look_ahead = None, np.inf
+        for stream_name in self.lazy_stream_names:
+            timestamps = self.stream_data[stream_name][1]
+            next_sample_index = self.next_sample_index[stream_name]
+            blocks = self.blocks[stream_name]
+            start_index = blocks[-1][1] if len(blocks) > 0 else next_sample_index
+            if start_index >= len(timestamps):
+                continue
+            replay_position = timestamps[min(next_sample_index, len(timestamps) - 1)]
+            look_ahead = timestamps[start_index] - replay_position
+            if look_ahead >= self.look_ahead_duration or look_ahead >= shortest_look_ahead:
+                continue
+            end_index = start_index + max(1, np.searchsorted(timestamps[start_index:], timestamps[start_index] + self.block_duration, side='right'))
+            next_read, shortest_look_ahead = (stream_name, start_index, end_index, self.seek_count), look_ahead
+        return next_read
+
+    def get_data(self, stream_name, start_index, end_index):
+        """
+        the samples from start_index to end_index of a stream, the replay has sent everything before start_index
+        """
+        data = self.stream_data[stream_name][0]
+        if stream_name not in self.blocks:
+            return data[..., start_index:end_index]
+        with self.condition:
+            blocks = self.blocks[stream_name]
+            while len(blocks) > 0 and blocks[0][1] <= start_index:  # free the blocks that have been sent
+                blocks.popleft()
+            pieces, position = [], start_index
+            for block_start, block_end, block in blocks:
+                if block_start > position or position >= end_index:
+                    break
+                pieces.append(block[..., position - block_start:min(end_index, block_end) - block_start])
+                position = min(end_index, block_end)
+            self.next_sample_index[stream_name] = end_index
+            self.condition.notify()
+        if position < end_index:  # the prefetcher is behind
+            pieces.append(data[..., position:end_index])
+        return pieces[0] if len(pieces) == 1 else np.concatenate(pieces, axis=-1)
+
+    def seek(self, next_sample_index):
+        """
+        move the replay position without reloading, the blocks before a seek are discarded
+        :param next_sample_index: dict of stream name to the index of the next sample to be replayed
+        """
+        with self.condition:
+            self.seek_count += 1
+            for stream_name in self.lazy_stream_names:
+                self.blocks[stream_name].clear()
+                self.next_sample_index[stream_name] = next_sample_index.get(stream_name, 0)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.join()
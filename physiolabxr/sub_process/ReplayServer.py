@@ -1,4 +1,5 @@
 import copy
+import heapq
 import json
 import math
 import os.path
@@ -20,15 +21,48 @@ except:
 
 from physiolabxr.configs import shared
 from physiolabxr.presets.PresetEnums import PresetType
+from physiolabxr.sub_process.ReplayPrefetcher import ReplayPrefetcher
 from physiolabxr.sub_process.TCPInterface import RenaTCPInterface
 from physiolabxr.utils.RNStream import RNStream
+from physiolabxr.utils.lsl_utils import push_lsl_chunk
+from physiolabxr.utils.networking_utils import send_zmq_samples
 from physiolabxr.utils.time_utils import get_clock_time
-from physiolabxr.utils.xdf_utils import load_xdf
+from physiolabxr.utils.xdf_utils import load_xdf, load_xdf_lazy
 
 
 class ReplayServer(threading.Thread):
-    def __init__(self, command_info_interface):
+    """
+    Replays the streams of a recording in real time.
+
+    Samples are sent in chunks: the replay time is divided into buckets of chunk_duration seconds, and each stream sends
+    the samples that fall in a bucket together, as one push_chunk for LSL or one multi-sample frame for ZMQ
+    (see send_zmq_samples). A chunk is sent when the virtual clock reaches the timestamp of its last sample. The
+    streams are merged by a heap keyed on the time their next chunk is due, so picking the next chunk does not loop
+    over the streams. If the replay falls behind, a stream sends all its samples that are due in one chunk to catch up.
+
+    The replay runs at playback_rate times real time, the replayed timestamps are rescaled accordingly, i.e., they are
+    the local clock times the samples are due at. With shared.UNTHROTTLED_PLAYBACK_RATE, the chunks are sent as fast as
+    the outlets take them: ZMQ outlets do not drop frames when a subscriber's queue is full, so the replay waits for the
+    slowest subscriber. LSL outlets buffer the samples instead, they have no such backpressure. The timestamps of an
+    unthrottled replay are spaced as in real time.
+
+    .dats and .xdf recordings are not loaded into memory, their samples are read from disk as they are replayed.
+    A ReplayPrefetcher reads look_ahead_duration seconds ahead of the replay on its own thread, so the replay does not
+    wait on the disk and the memory used stays bounded.
+    """
+    def __init__(self, command_info_interface, chunk_duration=0.01, max_sleep_duration=0.05, look_ahead_duration=5.):
+        """
+        :param chunk_duration: in seconds, the length of the time buckets the samples are chunked by
+        :param max_sleep_duration: in seconds, the longest the replay loop sleeps before it checks for commands again
+        :param look_ahead_duration: in seconds of the recording, how far ahead of the replay the samples are read from disk
+        """
         super().__init__()
+        self.chunk_duration = chunk_duration
+        self.max_sleep_duration = max_sleep_duration
+        self.look_ahead_duration = look_ahead_duration
+        self.prefetcher = None
+        self.playback_rate = 1.
+        self.backpressure_wait_duration = 1e-3  # in seconds, how long to wait before retrying a send to a full outlet
         self.original_stream_data = None
         self.command_info_interface = command_info_interface
         self.is_replaying = False
@@ -49,7 +83,8 @@ class ReplayServer(threading.Thread):
         self.outlet_infos = []
         self.outlets = {}
         self.next_sample_index_of_stream = {}  # index of the next sample of each stream that will be sent, this list contains the same number of items as the number of streams in the replay
-        self.chunk_sizes = {}  # how many samples should be published at once, this list contains the same number of items as the number of streams in the replay
+        self.chunk_boundaries = {}  # for each stream, the sample indices where its chunks start, followed by the number of samples
+        self.replay_schedule = []  # heap of (timestamp at which the next chunk of a stream is due, stream index, stream name)
 
         self.running = True
         self.main_program_routing_id = None
@@ -58,6 +93,7 @@ class ReplayServer(threading.Thread):
         # fps counter
         self.tick_times = deque(maxlen=2 ** 16)
         self.push_data_times = deque(maxlen=2 ** 16)
+        self.replay_work = deque(maxlen=2 ** 12)  # (number of samples sent, time spent outside sleep) of each chunk
 
         self.c = 0  # use for counting in the pause session
         self.pause_time_offset_total = 0  # use for tracking the total paused time for this replay
@@ -72,6 +108,9 @@ class ReplayServer(threading.Thread):
                 print('ReplayServer: pending on start replay command')
                 command = self.recv_string(is_block=True)
                 if command.startswith(shared.LOAD_COMMAND):
+                    command, playback_rate = shared.parse_playback_rate(command)
+                    if playback_rate is not None:
+                        self.playback_rate = playback_rate
                     file_location = command.split("!")[1]
                     if file_location != self.previous_file_loc:
                         if not os.path.exists(file_location):
@@ -83,13 +122,17 @@ class ReplayServer(threading.Thread):
                             if file_location.endswith('.dats'):
                                 rns_stream = RNStream(file_location)
                                 # self.stream_data = rns_stream.stream_in(ignore_stream=['0', 'monitor1'])  # TODO ignore replaying image data for now
-                                self.original_stream_data = rns_stream.stream_in(jitter_removal=False)
+                                self.original_stream_data = rns_stream.stream_in_memmap(jitter_removal=False)  # data are paged in from disk as they are replayed
                             elif file_location.endswith('.p'):
                                 self.original_stream_data = pickle.load(open(file_location, 'rb'))
                                 # if '0' in self.stream_data.keys(): self.stream_data.pop('0')
                                 # if 'monitor1' in self.stream_data.keys(): self.stream_data.pop('monitor1')
                             elif file_location.endswith('.xdf'):
-                                self.original_stream_data = load_xdf(file_location)
+                                try:
+                                    self.original_stream_data = load_xdf_lazy(file_location)
+                                except ValueError as e:  # e.g., string samples, which cannot be mapped
+                                    print(f'ReplayServer: loading the whole xdf into memory: {e}')
+                                    self.original_stream_data = load_xdf(file_location)
                             else:
                                 raise ValueError('Unsupported file type')
                         except Exception as e:
@@ -104,7 +147,7 @@ class ReplayServer(threading.Thread):
 
                     self.previous_file_loc = file_location
                     self.send_string(shared.LOAD_SUCCESS_INFO + str(self.total_time))
-                    self.stream_data = copy.deepcopy(self.original_stream_data)
+                    self.stream_data = {k: list(v) for k, v in self.original_stream_data.items()}  # setup_stream replaces the data with reshaped views, the original is not copied
                     self.setup_stream()
                     self.send(np.array([self.start_time, self.end_time, self.total_time, self.virtual_clock_offset]))  # send the timing info
                     self.send_string('|'.join(self.original_stream_data.keys()))  # send the stream names
@@ -122,7 +165,7 @@ class ReplayServer(threading.Thread):
                     # main process need to check if there're duplicate stream names with the streams being replayed
                     # check if the stream has been setup, becuase if we come back here from a finished replay, the stream would have been reset
                     replay_stream_info = json.loads(self.recv_string(is_block=True))
-                    self.stream_data = {k: v for k, v in self.original_stream_data.items() if k in replay_stream_info.keys()}
+                    self.stream_data = {k: list(v) for k, v in self.original_stream_data.items() if k in replay_stream_info.keys()}
 
                     # for stream_name, (interface, port) in replay_stream_info.items():
                     #     self.stream_data
@@ -133,6 +176,7 @@ class ReplayServer(threading.Thread):
                             if replay_stream_info[outlet_info["name"]]['preset_type'] == PresetType.ZMQ.value:
                                 port = replay_stream_info[outlet_info["name"]]['port_number']
                                 socket = self.command_info_interface.context.socket(zmq.PUB)
+                                socket.setsockopt(zmq.XPUB_NODROP, 1)  # a full subscriber makes the send fail instead of dropping the frame, see replay
                                 socket.bind("tcp://*:%s" % port)
                                 self.outlets[outlet_info["name"]] = socket
                             else:
@@ -147,16 +191,21 @@ class ReplayServer(threading.Thread):
                     # hold on for the start replay command
                     # replay tab needs to tell MainWindow to add the stream widgets, it may take a while
                     wait_start_time = time.time()
-                    command = self.recv_string(is_block=True)
+                    command, playback_rate = shared.parse_playback_rate(self.recv_string(is_block=True))
                     if command == shared.START_REPLAY_COMMAND:
                         print(f"After waiting main process for {time.time() - wait_start_time} seconds, replay started for streams: {list(self.stream_data)}")
+                        if playback_rate is not None:
+                            self.playback_rate = playback_rate
+                        self.virtual_clock_offset = get_clock_time() - self.start_time  # the replay starts now
+                        self.pause_time_offset_total = 0
+                        self.start_prefetcher()
                         self.is_replaying = True  # this is the only entry point of the replay loop
                     else:
                         print(f"ReplayServer: unexpected command received: {command}, resetting replay")
                         self.reset_replay()
                         continue
                 elif command == shared.PERFORMANCE_REQUEST_COMMAND:
-                    self.send(self.get_average_loop_time())
+                    self.send(self.get_performance())
                 elif command == shared.TERMINATE_COMMAND:
                     self.running = False
                     break
@@ -178,6 +227,11 @@ class ReplayServer(threading.Thread):
                     command = self.recv_string(is_block=False)
                     if command == shared.VIRTUAL_CLOCK_REQUEST:
                         self.send(self.virtual_clock)
+                    elif command == shared.PERFORMANCE_REQUEST_COMMAND:
+                        self.send(self.get_performance())
+                    elif type(command) is str and command.startswith(shared.PLAYBACK_RATE_COMMAND):
+                        self.set_playback_rate(shared.parse_playback_rate(command)[1])
+                        self.send_string(shared.PLAYBACK_RATE_SUCCESS_INFO)
                     elif command == shared.PLAY_PAUSE_COMMAND:  # handle play_pause command
                         print("command received from replay server: ", command)
                         if not self.is_paused:
@@ -219,8 +273,12 @@ class ReplayServer(threading.Thread):
         # return here
 
     def reset_replay(self):
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
         self.next_sample_index_of_stream = {}
-        self.chunk_sizes = {}  # chunk sizes are initialized to 1 in setup stream
+        self.chunk_boundaries = {}
+        self.replay_schedule = []
         self.virtual_clock_offset = None
         self.start_time = None
         self.end_time = None
@@ -250,91 +308,71 @@ class ReplayServer(threading.Thread):
         print("Replay Server: Reset replay: removed all outlets")
 
     def replay(self):
-        this_stream_name = None
-        this_stream_next_timestamp = None
-
-        # determine which stream to send next
-        for i, stream_name in enumerate(self.remaining_stream_names):  # iterate over the remaining data streams in the replay file
-            stream = self.stream_data[stream_name]
-            # when a chunk can be sent depends on its last sample's timestamp
-            next_sample_index_of_stream = self.next_sample_index_of_stream[stream_name] + self.chunk_sizes[stream_name] - 1  # at the first call to replay next_sample_of_stream is all zeros, and chunk_sizes is all ones
-            try:
-                next_timestamp_of_stream = stream[1][next_sample_index_of_stream]
-            except Exception as e:
-                raise (e)
-            if this_stream_next_timestamp is None or next_timestamp_of_stream <= this_stream_next_timestamp:  # find the stream with the smallest timestamp for their next chunk of data
-                this_stream_name = stream_name
-                this_stream_next_timestamp = next_timestamp_of_stream
-        del stream_name
-
-        # retrieve the data and timestamps to be sent
-        this_stream_data = self.stream_data[this_stream_name]
-        this_chunk_size = self.chunk_sizes[this_stream_name]
-
-        this_next_sample_start_index = self.next_sample_index_of_stream[this_stream_name]
-        this_next_sample_end_index = this_next_sample_start_index + this_chunk_size
-
-        this_chunk_timestamps = this_stream_data[1][this_next_sample_start_index: this_next_sample_end_index]
-        this_chunk_data = (this_stream_data[0][..., this_next_sample_start_index: this_next_sample_end_index]).transpose()
-
-        # prepare the data (if necessary)
-        # if isinstance(this_chunk_data, np.ndarray):
-            # load_xdf loads numbers into numpy arrays (strings will be put into lists). however, LSL doesn't seem to
-            # handle them properly as providing data in numpy arrays leads to falsified data being sent. therefore the data
-            # are converted to lists
-            # this_chunk_data = this_chunk_data.tolist()
-        self.next_sample_index_of_stream[this_stream_name] += this_chunk_size  # index of the next sample yet to be sent of this stream
-
-        stream_total_num_samples = this_stream_data[0].shape[-1]
-        # calculates a lower chunk_size if there are not enough samples left for a "complete" chunk, this will only happen when a stream is running out of samples
-        if stream_total_num_samples < self.next_sample_index_of_stream[this_stream_name] + this_chunk_size:
-            # print("CHUNK UPDATE")
-            self.chunk_sizes[this_stream_name] = stream_total_num_samples - self.next_sample_index_of_stream[this_stream_name]
-
-        # virtual clock is in sync with the replayed stream timestamps, it equals to (replay time) + (original data's first timestamp)
+        """
+        send the chunk that is due next, sleeping until it is due.
+        Returns without sending if the chunk is due in more than max_sleep_duration, so that commands are still checked
+        """
+        if len(self.replay_schedule) == 0:
+            return
         self.update_virtual_clock()  # time since replay start + first stream timestamps
-        sleep_duration = this_stream_next_timestamp - self.virtual_clock
+        sleep_duration = (self.replay_schedule[0][0] - self.virtual_clock) / self.playback_rate
+        if sleep_duration > self.max_sleep_duration:
+            time.sleep(self.max_sleep_duration)
+            return
         if sleep_duration > 0:
             time.sleep(sleep_duration)
+        work_start_time = time.perf_counter()
+
+        _, stream_index, this_stream_name = heapq.heappop(self.replay_schedule)
+        this_stream_data, this_stream_timestamps = self.stream_data[this_stream_name]
+        start_index = self.next_sample_index_of_stream[this_stream_name]
+        end_index = self.get_chunk_end_index(this_stream_name, start_index)
+
+        # virtual clock is in sync with the replayed stream timestamps, it equals to (replay time) + (original data's first timestamp)
+        self.update_virtual_clock()
+        if this_stream_timestamps[end_index - 1] < self.virtual_clock:  # behind, send everything that is due
+            end_index = max(end_index, start_index + np.searchsorted(this_stream_timestamps[start_index:], self.virtual_clock, side='right'))
+
+        timestamps = self.get_replay_timestamps(this_stream_timestamps[start_index:end_index])
+        data = this_stream_data[..., start_index:end_index] if self.prefetcher is None else self.prefetcher.get_data(this_stream_name, start_index, end_index)
 
         outlet = self.outlets[this_stream_name]
-        # print("outlet for this replay is: ", outlet)
         push_call_start_time = time.perf_counter()
-        if this_chunk_size == 1:
-            # the data sample's timestamp is equal to (this sample's timestamp minus the first timestamp of the original data) + time since replay start
-            timestamp = this_chunk_timestamps[0] + self.virtual_clock_offset + self.slider_offset_time
-            data = this_chunk_data[0]
-
-            if is_pylsl_imported and isinstance(outlet, pylsl.stream_outlet):
-                outlet.push_sample(data.tolist(), timestamp)
-            else:  # zmq
-                outlet.send_multipart([bytes(this_stream_name, "utf-8"), np.array(timestamp), data.copy()])  # copy to make data contiguous
-            # print("pushed, chunk size 1")
-            # print(nextChunkValues)
-        else:
-            # according to the documentation push_chunk can only be invoked with exactly one (the last) time stamp
-            timestamps = this_chunk_timestamps + self.virtual_clock_offset + self.slider_offset_time
-            data = this_chunk_data
-            if is_pylsl_imported and isinstance(outlet, pylsl.stream_outlet):
-                outlet.push_chunk(data.tolist(), timestamps[-1])
-            else:  # zmq
-                for i in range(len(timestamps)):
-                    outlet.send_multipart([bytes(this_stream_name, "utf-8"), np.array(timestamps[i]), data[i].copy()])  # copy to make data contiguous
-            # print("pushed else")
-            # chunks are not printed to the terminal because they happen hundreds of times per second and therefore
-            # would make the terminal output unreadable
+        if is_pylsl_imported and isinstance(outlet, pylsl.StreamOutlet):
+            push_lsl_chunk(outlet, data, timestamps)
+        else:  # zmq
+            try:
+                send_zmq_samples(outlet, this_stream_name, timestamps, data, flags=zmq.NOBLOCK)
+            except zmq.error.Again:  # a subscriber is full, retry this chunk after the commands are processed
+                heapq.heappush(self.replay_schedule, (this_stream_timestamps[end_index - 1], stream_index, this_stream_name))
+                time.sleep(self.backpressure_wait_duration)
+                return
         self.push_data_times.append(time.perf_counter() - push_call_start_time)
 
-        # remove this stream from the list if there are no remaining samples
-        if self.next_sample_index_of_stream[this_stream_name] >= stream_total_num_samples:
+        self.next_sample_index_of_stream[this_stream_name] = end_index  # index of the next sample yet to be sent of this stream
+        if end_index < len(this_stream_timestamps):
+            self.schedule_next_chunk(this_stream_name, stream_index)
+        else:  # remove this stream from the list if there are no remaining samples
             self.remaining_stream_names.remove(this_stream_name)
-            # self.outlets.remove(self.outlets[nextStreamIndex])
-            # self.next_sample_of_stream.remove(self.next_sample_of_stream[next_stream_index])
-            # self.chunk_sizes.remove(self.chunk_sizes[next_stream_index])
-            # self.stream_names.remove(self.stream_names[next_stream_index])
-
-        # self.replay_progress_signal.emit(playback_position) # TODO add another TCP interface to communicate back
-        # print("virtual clock time: ", self.virtual_clock)
+        self.replay_work.append((end_index - start_index, time.perf_counter() - work_start_time))
+
+    def get_chunk_end_index(self, stream_name, start_index):
+        """
+        the index after the last sample of the chunk that contains the sample at start_index
+        """
+        chunk_boundaries = self.chunk_boundaries[stream_name]
+        return chunk_boundaries[np.searchsorted(chunk_boundaries, start_index, side='right')]
+
+    def schedule_next_chunk(self, stream_name, stream_index):
+        # when a chunk can be sent depends on its last sample's timestamp
+        end_index = self.get_chunk_end_index(stream_name, self.next_sample_index_of_stream[stream_name])
+        heapq.heappush(self.replay_schedule, (self.stream_data[stream_name][1][end_index - 1], stream_index, stream_name))
+
+    def build_replay_schedule(self):
+        self.replay_schedule = []
+        for stream_index, stream_name in enumerate(self.stream_names):
+            if stream_name in self.remaining_stream_names:
+                self.schedule_next_chunk(stream_name, stream_index)
 
     def setup_stream(self):
         self.virtual_clock = math.inf
@@ -344,6 +382,7 @@ class ReplayServer(threading.Thread):
         self.slider_offset_time = 0
         self.tick_times = deque(maxlen=2 ** 16)
         self.push_data_times = deque(maxlen=2 ** 16)
+        self.replay_work = deque(maxlen=2 ** 12)
 
         # flatten any high dim data
         video_keys = []
@@ -361,7 +400,6 @@ class ReplayServer(threading.Thread):
 
         for stream_name in self.stream_names:
             self.next_sample_index_of_stream[stream_name] = 0
-            self.chunk_sizes[stream_name] = 1
 
         print("Creating outlets")
         print("\t[index]\t[name]")
@@ -392,12 +430,45 @@ class ReplayServer(threading.Thread):
 
             self.total_time = self.end_time - self.start_time
 
+        # precompute where the chunks of each stream start, the chunks are aligned to the replay's start time
+        for stream_name in self.stream_names:
+            timestamps = self.stream_data[stream_name][1]
+            bucket_indices = np.floor((timestamps - self.start_time) / self.chunk_duration)
+            self.chunk_boundaries[stream_name] = np.concatenate([[0], np.flatnonzero(np.diff(bucket_indices)) + 1, [len(timestamps)]])
+        self.build_replay_schedule()
+
         self.virtual_clock_offset = get_clock_time() - self.virtual_clock
         print("Offsetting replayed timestamps by " + str(self.virtual_clock_offset))
         print("start time and end time ", self.start_time, self.end_time)
 
+    def is_unthrottled(self):
+        return self.playback_rate == shared.UNTHROTTLED_PLAYBACK_RATE
+
     def update_virtual_clock(self):
-        self.virtual_clock = get_clock_time() - self.virtual_clock_offset + self.slider_offset_time - self.pause_time_offset_total
+        if self.is_unthrottled():  # the replay is wherever the next chunk is
+            self.virtual_clock = self.replay_schedule[0][0] if len(self.replay_schedule) > 0 else self.end_time
+            return
+        replay_time = get_clock_time() - self.virtual_clock_offset - self.start_time - self.pause_time_offset_total
+        self.virtual_clock = self.start_time + self.playback_rate * replay_time + self.slider_offset_time
+
+    def get_replay_timestamps(self, timestamps):
+        """
+        the local clock times at which samples with the given original timestamps are due, the inverse of
+        update_virtual_clock. An unthrottled replay keeps the spacing of the original timestamps
+        """
+        playback_rate = 1. if self.is_unthrottled() else self.playback_rate
+        return (timestamps - self.start_time - self.slider_offset_time) / playback_rate + self.start_time + self.virtual_clock_offset + self.pause_time_offset_total
+
+    def set_playback_rate(self, playback_rate):
+        """
+        change the playback rate without moving the virtual clock
+        """
+        self.update_virtual_clock()
+        virtual_clock = self.virtual_clock
+        self.playback_rate = playback_rate
+        self.update_virtual_clock()
+        self.slider_offset_time += virtual_clock - self.virtual_clock
+        self.virtual_clock = virtual_clock
 
     def set_to_time(self, set_to_time):
         remaining_stream_names_copy = copy.deepcopy(self.remaining_stream_names)
@@ -408,6 +479,14 @@ class ReplayServer(threading.Thread):
                 self.remaining_stream_names.remove(stream_name)
             else:
                 self.next_sample_index_of_stream[stream_name] = np.argwhere(timestamps > (self.start_time + set_to_time))[0][0]
+        self.build_replay_schedule()
+        if self.prefetcher is not None:  # the data stay mapped, only the look-ahead is read again
+            self.prefetcher.seek(self.next_sample_index_of_stream)
+
+    def start_prefetcher(self):
+        self.prefetcher = ReplayPrefetcher(self.stream_data, self.look_ahead_duration)
+        self.prefetcher.seek(self.next_sample_index_of_stream)
+        self.prefetcher.start()
 
     def is_stream_video(self, stream):
         if stream.isdigit():
@@ -477,8 +556,22 @@ class ReplayServer(threading.Thread):
         except ZeroDivisionError:
             return 0
 
+    def get_max_sustained_samples_per_second(self):
+        """
+        the number of samples per second the replay could send if it never slept, measured over the recent chunks
+        """
+        replay_work = np.array(self.replay_work).reshape(-1, 2)
+        work_time = np.sum(replay_work[:, 1])
+        return np.sum(replay_work[:, 0]) / work_time if work_time > 0 else 0.
+
+    def get_performance(self):
+        """
+        @return: array of the average push time of a chunk and the max sustained samples per second
+        """
+        return np.array([self.get_average_loop_time(), self.get_max_sustained_samples_per_second()])
+
 
-def start_replay_server(conn=None):
+def start_replay_server(conn=None, look_ahead_duration=5.):
     print("Replay Server Started")
     # TODO connect to a different port if this port is already in use
     # try:
@@ -496,7 +589,7 @@ def start_replay_server(conn=None):
                                               pattern='router-dealer')
     conn.send(command_info_interface.binded_port)
     conn.close()
-    replay_server_thread = ReplayServer(command_info_interface)
+    replay_server_thread = ReplayServer(command_info_interface, look_ahead_duration=look_ahead_duration)
     replay_server_thread.start()
 
 
@@ -5,7 +5,8 @@ import numpy as np
 from PyQt6 import QtCore
 from PyQt6.QtCore import QObject, pyqtSignal, QMutex, QThread
 
-from physiolabxr.interfaces.AudioInputInterface import AudioInputInterface, create_audio_input_interface
+from physiolabxr.interfaces.AudioInputInterface import AudioInputInterface, get_audio_input_interface_args
+from physiolabxr.interfaces.SubprocessInterface import create_worker_interface, SubprocessInterface
 from physiolabxr.threadings.workers import RenaWorker
 
 
@@ -18,7 +19,7 @@ class AudioInputDeviceWorker(QObject, RenaWorker):
         self.signal_data_tick.connect(self.process_on_tick)
         self.signal_stream_availability_tick.connect(self.process_stream_availability)
 
-        self._audio_device_interface: AudioInputInterface = create_audio_input_interface(stream_name)
+        self._audio_device_interface: AudioInputInterface = create_worker_interface(AudioInputInterface, *get_audio_input_interface_args(stream_name))
         # self._lslInlet_interface = create_lsl_interface(stream_name, num_channels)
         self.is_streaming = False
         self.timestamp_queue = deque(maxlen=1024)
@@ -74,7 +75,9 @@ class AudioInputDeviceWorker(QObject, RenaWorker):
 
     def reset_interface(self, stream_name, num_channels):
         self.interface_mutex.lock()
-        self._audio_device_interface = create_audio_input_interface(stream_name)
+        if isinstance(self._audio_device_interface, SubprocessInterface):
+            self._audio_device_interface.close()
+        self._audio_device_interface = create_worker_interface(AudioInputInterface, *get_audio_input_interface_args(stream_name))
         self.interface_mutex.unlock()
 
     def start_stream(self):
@@ -0,0 +1,98 @@
+import threading
+import traceback
+import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from physiolabxr.utils.Singleton import Singleton
+from physiolabxr.utils.dsp_utils.dsp_modules import run_data_processors
+
+
+class DataProcessorPool(metaclass=Singleton):
+    """
+    Runs the data processors of the streams off the GUI thread, on a pool of threads shared by all the streams.
+
+    The data processors are vectorized with numpy and scipy (see DataProcessor.process_chunk), which release the GIL,
+    so the channel groups of a stream and different streams are processed in parallel.
+
+    The data processors carry state from one chunk to the next, so the chunks of a stream are processed one at a time
+    and in the order they are submitted: a chunk that arrives while the previous one of the same stream is still being
+    processed waits in a queue. The channel groups of a chunk are processed in parallel, each group writes its
+    channels of the frames in place. The callback of a chunk is called, from a pool thread, when all its groups are
+    done, so the chunks are delivered in order with their timestamps. A data processor evoked by the GUI thread, e.g.,
+    when its parameters change, waits for the chunk it is processing, see DataProcessor.process_buffer.
+    """
+    def __init__(self, max_workers=None):
+        """
+        :param max_workers: the number of threads, None for the default of ThreadPoolExecutor, which scales with the
+            number of cores
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='DataProcessorPool')
+        self.lock = threading.Lock()
+        self.pending_chunks = {}  # stream name -> deque of the chunks waiting for the previous chunk of the stream
+        self.stream_generations = {}  # incremented by cancel, the callbacks of chunks submitted before are not called
+
+    def submit(self, stream_name, data_dict, groups, callback):
+        """
+        process the frames of a data dict in place
+        :param data_dict: dict with 'frames' of shape (channels, samples), as emitted by the data workers
+        :param groups: list of (channel indices, data processors) of the channel groups that have data processors
+        :param callback: called with the data dict once it is processed
+        """
+        with self.lock:
+            chunk = (data_dict, groups, callback, self.stream_generations.setdefault(stream_name, 0))
+            if stream_name in self.pending_chunks:  # the previous chunk is being processed
+                self.pending_chunks[stream_name].append(chunk)
+                return
+            self.pending_chunks[stream_name] = deque()
+        self._process_chunk(stream_name, *chunk)
+
+    def is_processing(self, stream_name):
+        """
+        whether chunks of a stream are being processed or waiting, the chunks that come after them must be submitted
+        too, even if they have nothing to process, to be delivered in order
+        """
+        with self.lock:
+            return stream_name in self.pending_chunks
+
+    def cancel(self, stream_name):
+        """
+        drop the chunks of a stream that are not processed yet, e.g., when its widget is removed
+        """
+        with self.lock:
+            self.stream_generations[stream_name] = self.stream_generations.get(stream_name, 0) + 1
+            if stream_name in self.pending_chunks:
+                self.pending_chunks[stream_name].clear()
+
+    def _process_chunk(self, stream_name, data_dict, groups, callback, generation):
+        frames = data_dict['frames']
+        n_remaining_groups = [len(groups)]
+
+        def process_group(channel_indices, data_processors):
+            try:
+                frames[channel_indices] = run_data_processors(frames[channel_indices], data_processors)
+            except Exception as e:
+                warnings.warn(f'DataProcessorPool: data processors of {stream_name} failed, the data are not processed: {e}\n{traceback.format_exc()}')
+            with self.lock:
+                n_remaining_groups[0] -= 1
+                if n_remaining_groups[0] > 0:
+                    return
+            self._on_chunk_processed(stream_name, data_dict, callback, generation)
+
+        if len(groups) == 0:
+            self._on_chunk_processed(stream_name, data_dict, callback, generation)
+        for channel_indices, data_processors in groups:
+            self.executor.submit(process_group, channel_indices, data_processors)
+
+    def _on_chunk_processed(self, stream_name, data_dict, callback, generation):
+        if generation == self.stream_generations[stream_name]:
+            try:
+                callback(data_dict)
+            except Exception as e:
+                warnings.warn(f'DataProcessorPool: callback of {stream_name} failed: {e}')
+        with self.lock:
+            if len(self.pending_chunks[stream_name]) == 0:
+                self.pending_chunks.pop(stream_name)
+                return
+            next_chunk = self.pending_chunks[stream_name].popleft()
+        self._process_chunk(stream_name, *next_chunk)
@@ -6,7 +6,8 @@ import numpy as np
 from PyQt6 import QtCore
 from PyQt6.QtCore import QObject, pyqtSignal, QMutex, QThread
 
-from physiolabxr.interfaces.DeviceInterface.utils import create_custom_device_classes
+from physiolabxr.interfaces.DeviceInterface.utils import create_custom_device_interface, get_custom_device_options_class
+from physiolabxr.interfaces.SubprocessInterface import create_worker_interface, SubprocessInterface
 from physiolabxr.threadings.workers import RenaWorker
 
 
@@ -21,7 +22,8 @@ class DeviceWorker(QObject, RenaWorker):
         self.signal_data_tick.connect(self.process_on_tick)
         self.signal_stream_availability_tick.connect(self.process_stream_availability)
 
-        self.device_interface, self.device_options_widget_class = create_custom_device_classes(device_name=stream_name)
+        self.device_interface = create_worker_interface(create_custom_device_interface, stream_name, returns_messages=True)
+        self.device_options_widget_class = get_custom_device_options_class(stream_name)
 
         # check if an Options class exists for the custom device
         # first check if a fil
@@ -105,7 +107,9 @@ class DeviceWorker(QObject, RenaWorker):
 
     def reset_interface(self, stream_name, num_channels):
         self.interface_mutex.lock()
-        self.device_interface = create_custom_device_classes(stream_name)
+        if isinstance(self.device_interface, SubprocessInterface):
+            self.device_interface.close()
+        self.device_interface = create_worker_interface(create_custom_device_interface, stream_name, returns_messages=True)
         self.interface_mutex.unlock()
 
     def start_stream(self, *args, **kwargs):
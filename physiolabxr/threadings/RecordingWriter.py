@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from physiolabxr.utils.RNStream import RNStream
+from physiolabxr.utils.stream_telemetry import StreamTelemetry
+from physiolabxr.utils.time_utils import get_clock_time
+
+
+class RecordingWriter(threading.Thread):
+    """
+    Streams evicted recording buffers to a .dats on its own thread, so that serializing and writing a (possibly large,
+    e.g., video) buffer does not block the GUI thread.
+
+    The recording side hands over a detached buffer with write() and carries on filling a fresh one. The buffers are
+    held in a bounded queue: if the disk cannot keep up and the queue is full, write() blocks until the writer frees a
+    slot, so the memory used by pending buffers stays bounded. A recording side that must not block, e.g., the GUI
+    thread, gives write() a timeout and handles queue.Full.
+
+    The .dats stays open for the whole recording, see RNStream.open_stream_out.
+
+    An exception raised while writing stops the writer, it is kept in self.error and reraised by the next write() or
+    by close(), so the recording side can handle it as it did when it called stream_out itself.
+    """
+    def __init__(self, rn_stream: RNStream, max_queue_size=8, metrics_window=32):
+        """
+        :param rn_stream: the RNStream to write to
+        :param max_queue_size: the maximum number of evicted buffers waiting to be written
+        :param metrics_window: the number of recent writes the write latency and throughput are averaged over
+        """
+        super().__init__(daemon=True)
+        self.rn_stream = rn_stream
+        self.buffer_queue = queue.Queue(maxsize=max_queue_size)
+        self.error = None
+        self._aborted = False
+
+        self.written_bytes = 0
+        self._recent_writes = deque(maxlen=metrics_window)  # (write start time, write duration, bytes written)
+        self._metrics_lock = threading.Lock()
+
+    def start(self):
+        """
+        opens the file before starting the thread, so that errors such as FileNotFoundError are raised to the caller
+        """
+        self.rn_stream.open_stream_out()
+        super().start()
+
+    def run(self):
+        try:
+            while True:
+                buffer = self.buffer_queue.get()
+                if buffer is None or self._aborted:  # sentinel put by close
+                    break
+                if self.error is not None:
+                    continue  # drain the queue so write() does not block forever after an error
+                try:
+                    start_time = time.perf_counter()
+                    n_bytes = self.rn_stream.stream_out(buffer)
+                    with self._metrics_lock:
+                        self.written_bytes += n_bytes
+                        self._recent_writes.append((start_time, time.perf_counter() - start_time, n_bytes))
+                    for stream_name, (_, timestamps) in buffer.items():
+                        if len(timestamps) > 0:
+                            StreamTelemetry().record_latency(stream_name, 'disk', get_clock_time() - timestamps[-1])
+                except Exception as e:
+                    self.error = e
+        finally:
+            self.rn_stream.close_stream_out()
+
+    def write(self, buffer, timeout=None):
+        """
+        queue a buffer for writing, the caller must not modify the buffer afterward.
+
+        Blocks when the queue is full.
+        :param buffer: dict of stream name to [data, timestamps], the same as RNStream.stream_out takes
+        :param timeout: raise queue.Full if no slot frees up in this many seconds, None to wait indefinitely
+        """
+        self.raise_error()
+        self.buffer_queue.put(buffer, timeout=timeout)
+
+    def close(self):
+        """
+        write the buffers that are still queued, close the file and stop the thread. Reraises the error if the writer
+        failed
+        """
+        if self.is_alive():
+            self.buffer_queue.put(None)
+            self.join()
+        self.raise_error()
+
+    def abort(self):
+        """
+        stop the writer without waiting for it, the buffers that are still queued are not written, the recording is
+        abandoned. Does not block, even if the queue is full
+        """
+        self._aborted = True
+        try:
+            self.buffer_queue.put_nowait(None)
+        except queue.Full:
+            pass  # the writer checks _aborted before writing the next buffer
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def get_metrics(self):
+        """
+        @return: dict with
+            queue_depth: number of buffers waiting to be written
+            write_latency: average time in seconds a stream_out took over the recent writes
+            bytes_per_second: throughput over the recent writes, from the start of the first to the end of the last
+            written_bytes: total number of bytes written
+        """
+        with self._metrics_lock:
+            recent_writes = np.array(self._recent_writes).reshape(-1, 3)
+            written_bytes = self.written_bytes
+        write_latency, bytes_per_second = 0., 0.
+        if len(recent_writes) > 0:
+            write_latency = np.mean(recent_writes[:, 1])
+            span = recent_writes[-1, 0] + recent_writes[-1, 1] - recent_writes[0, 0]
+            bytes_per_second = np.sum(recent_writes[:, 2]) / span if span > 0 else 0.
+        return {'queue_depth': self.buffer_queue.qsize(),
+                'write_latency': write_latency,
+                'bytes_per_second': bytes_per_second,
+                'written_bytes': written_bytes}
@@ -5,10 +5,10 @@ import numpy as np
 from PyQt6 import QtCore
 from PyQt6.QtCore import QObject
 
+from physiolabxr.configs.configs import AppConfigs
 from physiolabxr.presets.PresetEnums import VideoDeviceChannelOrder
+from physiolabxr.threadings.VideoCaptureThread import VideoCaptureThread
 from physiolabxr.threadings.workers import RenaWorker
-from physiolabxr.utils.image_utils import process_image
-from physiolabxr.utils.time_utils import get_clock_time
 
 def get_screen_capture_size():
     img = pyscreeze.screenshot()
@@ -21,25 +21,44 @@ class ScreenCaptureWorker(QObject, RenaWorker):
         super().__init__()
         self.signal_data_tick.connect(self.process_on_tick)
         self.screen_label = screen_label
-        self.is_streaming = True
+        self.capture_thread = None
 
         self.video_scale = video_scale
         self.channel_order = channel_order
+        self.start_stream()
+
+    @staticmethod
+    def capture():
+        return np.asarray(pyscreeze.screenshot())
 
     def stop_stream(self):
         self.is_streaming = False
+        if self.capture_thread is not None:
+            self.capture_thread.stop()
+            self.capture_thread = None
 
     def start_stream(self):
+        if self.capture_thread is not None:  # already capturing
+            return
         self.is_streaming = True
+        # a screenshot does not wait for the screen to change, capture at the refresh rate of the video widgets
+        self.capture_thread = VideoCaptureThread(self.capture, lambda: (self.channel_order, self.video_scale),
+                                                 min_capture_interval=AppConfigs().video_device_refresh_interval / 1e3, name=f'Screen {self.screen_label} capture')
+        self.capture_thread.start()
+
+    def release_frame(self, frame):
+        """
+        give back a frame emitted in signal_data once it is no longer used, see VideoCaptureThread
+        """
+        if self.capture_thread is not None:
+            self.capture_thread.release_frame(frame)
 
     @QtCore.pyqtSlot()
     def process_on_tick(self):
         if self.is_streaming:
             pull_data_start_time = time.perf_counter()
-            img = pyscreeze.screenshot()
-            frame = np.array(img)
-            frame = frame.astype(np.uint8)
-            frame = process_image(frame, self.channel_order, self.video_scale)
-            frame = np.flip(frame, axis=0)
-            self.pull_data_times.append(time.perf_counter() - pull_data_start_time)
-            self.signal_data.emit({"frame": frame, "timestamp": get_clock_time()})  # uses lsl local clock for syncing
+            latest_frame = self.capture_thread.get_latest_frame()
+            if latest_frame is not None:
+                frame, timestamp = latest_frame  # (width, height, RGB), scaled and flipped on the capture thread
+                self.pull_data_times.append(time.perf_counter() - pull_data_start_time)
+                self.signal_data.emit({"frame": frame, "timestamp": timestamp})
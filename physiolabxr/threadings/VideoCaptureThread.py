@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from physiolabxr.utils.image_utils import FramePreprocessor
+from physiolabxr.utils.time_utils import get_clock_time
+
+
+class VideoCaptureThread(threading.Thread):
+    """
+    Captures the frames of a video device on its own thread, as fast as the device gives them, and keeps only the latest.
+
+    A blocking capture (e.g., cv2.VideoCapture.read waits for the camera's next frame) no longer holds up the worker
+    thread, and the frame taken on a tick is the newest the device has, not the one queued in its driver. When the
+    frames are not taken as fast as they are captured, the older one is dropped.
+
+    Every frame is preprocessed on this thread with a FramePreprocessor into a frame from a pool. Whoever takes a frame
+    with get_latest_frame gives it back with release_frame once nothing references it, so the frames are reused.
+    """
+    def __init__(self, capture: callable, get_preprocess_args: callable, min_capture_interval=0., pool_size=4, name=None):
+        """
+        :param capture: takes a frame (height, width, channels) from the device, None if it failed to
+        :param get_preprocess_args: returns the rgb_channel_order and scale of FramePreprocessor.process, called for
+            every frame so they can be changed while capturing
+        :param min_capture_interval: in seconds, for devices whose capture does not wait for a new frame (e.g., screen
+            capture), so they are not captured faster than the frames are taken
+        :param pool_size: the most frames kept for reuse
+        """
+        super().__init__(daemon=True, name=name)
+        self.capture = capture
+        self.get_preprocess_args = get_preprocess_args
+        self.min_capture_interval = min_capture_interval
+        self.preprocessor = FramePreprocessor()
+        self.free_frames = deque(maxlen=pool_size)
+
+        self.lock = threading.Lock()
+        self.latest_frame = None  # (frame, timestamp), None if taken
+        self.running = True
+        self.capture_count = 0
+        self.dropped_frame_count = 0
+        self.preprocess_times = deque(maxlen=100)
+
+    def run(self):
+        last_capture_time = -np.inf
+        while self.running:
+            wait_time = last_capture_time + self.min_capture_interval - time.perf_counter()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            last_capture_time = time.perf_counter()
+            frame = self.capture()
+            timestamp = get_clock_time()  # uses lsl local clock for syncing
+            if frame is None:
+                time.sleep(1e-3)  # the device is not ready, don't spin
+                continue
+            preprocess_start_time = time.perf_counter()
+            rgb_channel_order, scale = self.get_preprocess_args()
+            output_shape = FramePreprocessor.get_output_shape(frame.shape, scale)
+            out = self._get_free_frame(output_shape)
+            self.preprocessor.process(frame, rgb_channel_order, scale, out=out)
+            self.preprocess_times.append(time.perf_counter() - preprocess_start_time)
+            with self.lock:
+                if self.latest_frame is not None:  # not taken, drop it
+                    self.dropped_frame_count += 1
+                    self.free_frames.append(self.latest_frame[0])
+                self.latest_frame = out, timestamp
+                self.capture_count += 1
+
+    def _get_free_frame(self, shape):
+        with self.lock:
+            while len(self.free_frames) > 0:
+                frame = self.free_frames.popleft()
+                if frame.shape == shape:
+                    return frame
+        return np.empty(shape, dtype=np.uint8)  # the pool is empty or the frame size has changed
+
+    def get_latest_frame(self):
+        """
+        :return: the latest preprocessed frame (width, height, channels) and its timestamp, None if no frame has been
+            captured since the last call
+        """
+        with self.lock:
+            latest_frame, self.latest_frame = self.latest_frame, None
+        return latest_frame
+
+    def release_frame(self, frame):
+        """
+        give back a frame taken with get_latest_frame, it may be overwritten after this
+        """
+        with self.lock:
+            self.free_frames.append(frame)
+
+    def stop(self):
+        self.running = False
+        self.join()
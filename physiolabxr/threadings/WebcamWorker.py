@@ -1,13 +1,11 @@
 import time
 
 import cv2
-import numpy as np
 from PyQt6 import QtCore
 from PyQt6.QtCore import QObject
 from physiolabxr.presets.PresetEnums import VideoDeviceChannelOrder
+from physiolabxr.threadings.VideoCaptureThread import VideoCaptureThread
 from physiolabxr.threadings.workers import RenaWorker
-from physiolabxr.utils.image_utils import process_image
-from physiolabxr.utils.time_utils import get_clock_time
 
 
 class WebcamWorker(QObject, RenaWorker):
@@ -16,30 +14,46 @@ class WebcamWorker(QObject, RenaWorker):
         super().__init__()
         self.cap = None
         self.cam_id = cam_id
-        self.cap = cv2.VideoCapture(self.cam_id)
+        self.capture_thread = None
         self.signal_data_tick.connect(self.process_on_tick)
-        self.is_streaming = True
 
         self.video_scale = video_scale
         self.channel_order = channel_order
+        self.start_stream()
+
+    def capture(self):
+        ret, cv_img = self.cap.read()  # blocks until the camera has a new frame
+        return cv_img if ret else None
 
     def stop_stream(self):
         self.is_streaming = False
+        if self.capture_thread is not None:
+            self.capture_thread.stop()
+            self.capture_thread = None
         if self.cap is not None:
             self.cap.release()
 
     def start_stream(self):
+        if self.capture_thread is not None:  # already capturing
+            return
         self.is_streaming = True
         self.cap = cv2.VideoCapture(self.cam_id)
+        self.capture_thread = VideoCaptureThread(self.capture, lambda: (self.channel_order, self.video_scale), name=f'Webcam {self.cam_id} capture')
+        self.capture_thread.start()
+
+    def release_frame(self, frame):
+        """
+        give back a frame emitted in signal_data once it is no longer used, see VideoCaptureThread
+        """
+        if self.capture_thread is not None:
+            self.capture_thread.release_frame(frame)
 
     @QtCore.pyqtSlot()
     def process_on_tick(self):
         if self.is_streaming:
             pull_data_start_time = time.perf_counter()
-            ret, cv_img = self.cap.read()
-            if ret:
-                cv_img = cv_img.astype(np.uint8)
-                cv_img = process_image(cv_img, self.channel_order, self.video_scale)
-                cv_img = np.flip(cv_img, axis=0)
+            latest_frame = self.capture_thread.get_latest_frame()
+            if latest_frame is not None:
+                cv_img, timestamp = latest_frame  # (width, height, RGB), scaled and flipped on the capture thread
                 self.pull_data_times.append(time.perf_counter() - pull_data_start_time)
-                self.signal_data.emit({"camera id": self.cam_id, "frame": cv_img, "timestamp": get_clock_time()})  # uses lsl local clock for syncing
+                self.signal_data.emit({"camera id": self.cam_id, "frame": cv_img, "timestamp": timestamp})
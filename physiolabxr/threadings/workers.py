@@ -17,14 +17,17 @@ from physiolabxr.configs.configs import AppConfigs
 from physiolabxr.configs.shared import SCRIPT_INFO_PREFIX, SCRIPT_INFO_REQUEST, \
     STOP_COMMAND, STOP_SUCCESS_INFO, TERMINATE_COMMAND, TERMINATE_SUCCESS_COMMAND, PLAY_PAUSE_SUCCESS_INFO, \
     SCRIPT_ERR_PREFIX, SCRIPT_WARNING_PREFIX, \
-    SCRIPT_FATAL_PREFIX, PLAY_PAUSE_COMMAND, SLIDER_MOVED_COMMAND, SLIDER_MOVED_SUCCESS_INFO
+    SCRIPT_FATAL_PREFIX, PLAY_PAUSE_COMMAND, SLIDER_MOVED_COMMAND, SLIDER_MOVED_SUCCESS_INFO, PLAYBACK_RATE_COMMAND, \
+    PLAYBACK_RATE_SUCCESS_INFO, add_playback_rate
 from physiolabxr.sub_process.TCPInterface import RenaTCPInterface
 # from physiolabxr.utils.buffers import process_preset_create_openBCI_interface_startsensor
 # from physiolabxr.utils.buffers import process_preset_create_UnicornHybridBlack_interface_startsensor
 from physiolabxr.interfaces.LSLInletInterface import create_lsl_interface
+from physiolabxr.interfaces.SubprocessInterface import create_worker_interface, SubprocessInterface
+from physiolabxr.interfaces.ZMQInterface import decode_zmq_frame, ZMQInterface
+from physiolabxr.presets.presets_utils import get_stream_lsl_postprocessing
 from physiolabxr.utils.networking_utils import recv_string_router
 from physiolabxr.utils.sim import sim_imp, sim_heatmap, sim_detected_points
-from physiolabxr.utils.time_utils import get_clock_time
 from physiolabxr.threadings.Interfaces import QWorker
 
 
@@ -61,7 +64,7 @@ class LSLInletWorker(QObject, RenaWorker):
         self.signal_data_tick.connect(self.process_on_tick)
         self.signal_stream_availability_tick.connect(self.process_stream_availability)
 
-        self._lslInlet_interface = create_lsl_interface(stream_name, num_channels)
+        self._lslInlet_interface = create_worker_interface(create_lsl_interface, stream_name, num_channels, *get_stream_lsl_postprocessing(stream_name))
         self._rena_tcp_interface = RenaTCPInterface
         self.is_streaming = False
         self.timestamp_queue = deque(maxlen=1024)
@@ -117,7 +120,9 @@ class LSLInletWorker(QObject, RenaWorker):
 
     def reset_interface(self, stream_name, num_channels):
         self.interface_mutex.lock()
-        self._lslInlet_interface = create_lsl_interface(stream_name, num_channels)
+        if isinstance(self._lslInlet_interface, SubprocessInterface):
+            self._lslInlet_interface.close()
+        self._lslInlet_interface = create_worker_interface(create_lsl_interface, stream_name, num_channels, *get_stream_lsl_postprocessing(stream_name))
         self.interface_mutex.unlock()
 
     def start_stream(self):
@@ -445,7 +450,7 @@ class PlaybackWorker(QObject):
                     self.is_paused = not self.is_paused
                     self.send_command_mutex.unlock()
                     return
-                elif reply == SLIDER_MOVED_SUCCESS_INFO:
+                elif reply == SLIDER_MOVED_SUCCESS_INFO or reply == PLAYBACK_RATE_SUCCESS_INFO:
                     self.send_command_mutex.unlock()
                     return
                 elif reply == TERMINATE_SUCCESS_COMMAND:
@@ -488,6 +493,11 @@ class PlaybackWorker(QObject):
         self.command_queue.append([SLIDER_MOVED_COMMAND, command])
         self.send_command_mutex.unlock()
 
+    def queue_playback_rate_command(self, playback_rate):
+        self.send_command_mutex.lock()
+        self.command_queue.append(add_playback_rate(PLAYBACK_RATE_COMMAND, playback_rate))
+        self.send_command_mutex.unlock()
+
     def queue_stop_command(self):
         self.send_command_mutex.lock()
         self.command_queue.append(STOP_COMMAND)
@@ -628,15 +638,8 @@ class ZMQWorker(QObject, RenaWorker):
             self.signal_stream_availability_tick.connect(self.process_stream_availability)
 
         self.data_type = data_type if isinstance(data_type, str) else data_type.value
-        # networking parameters
-        self.sub_address = "tcp://localhost:%s" % port_number
         self.subtopic = subtopic
-        self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.SUB)
-        self.socket.connect(self.sub_address)
-        self.socket.setsockopt_string(zmq.SUBSCRIBE, self.subtopic)
-        self.poller = zmq.Poller()
-        self.poller.register(self.socket, zmq.POLLIN)
+        self._zmq_interface = create_worker_interface(ZMQInterface, port_number, subtopic, self.data_type)
 
         self.ZQMSocket = RenaTCPInterface
         self.is_streaming = False
@@ -648,8 +651,7 @@ class ZMQWorker(QObject, RenaWorker):
         self.is_stream_available()
 
     def __del__(self):
-        self.socket.close()
-        self.context.term()
+        self._zmq_interface.close()
         print('In ZMQWorker.__del__(): Socket closed and context terminated')
 
     @QtCore.pyqtSlot()
@@ -658,30 +660,21 @@ class ZMQWorker(QObject, RenaWorker):
             return
         if self.is_streaming and not self.interrupted:
             pull_data_start_time = time.perf_counter()
-            timestamp_list, data_list = [], []
             error_message = None
-            while True:
-                try:
-                    message = self.socket.recv_multipart(flags=zmq.NOBLOCK)
-                    topic, timestamp, data = self.decode_zmq_frame(message)
-                    # timestamp can be 64-bit float or 32-bit float
-                    timestamp_list.append(timestamp)
-                    data_list.append(data)
-                    self.timestamp_queue.append(timestamp)
-                except zmq.error.Again:
-                    break
-                except InvalidZMQMessageError as e:
-                    error_message = str(e)
-                    self.interrupted = True
-                    break
+            try:
+                frames, timestamps = self._zmq_interface.process_frames()
+            except InvalidZMQMessageError as e:
+                error_message = str(e)
+                self.interrupted = True
 
             if error_message is None:
-                if len(timestamp_list) > 0:
-                    if len(self.timestamp_queue) > 1:
-                        sampling_rate = len(self.timestamp_queue) / (np.max(self.timestamp_queue) - np.min(self.timestamp_queue))
+                if len(timestamps) > 0:
+                    self.timestamp_queue.extend(timestamps)
+                    if len(self.timestamp_queue) > 1:  # the timestamps of a stream increase, the first and last are its min and max
+                        sampling_rate = len(self.timestamp_queue) / (self.timestamp_queue[-1] - self.timestamp_queue[0])
                     else:
                         sampling_rate = np.nan
-                    data_dict = {'stream_name': self.subtopic, 'frames': np.concatenate(data_list, axis=1), 'timestamps': np.array(timestamp_list), 'sampling_rate': sampling_rate}
+                    data_dict = {'stream_name': self.subtopic, 'frames': frames, 'timestamps': timestamps, 'sampling_rate': sampling_rate}
                     self.signal_data.emit(data_dict)
                     self.pull_data_times.append(time.perf_counter() - pull_data_start_time)
             else:
@@ -702,33 +695,24 @@ class ZMQWorker(QObject, RenaWorker):
                 self.signal_stream_availability.emit(is_stream_availability)
 
     def start_stream(self):
+        self._zmq_interface.start_stream()
         self.is_streaming = True
         self.interrupted = False
         self.signal_stream_availability.emit(True)  # extra emit because the signal availability does not change on this call, but stream widget needs update
 
     def stop_stream(self):
+        self._zmq_interface.stop_stream()
         self.is_streaming = False
 
     def is_stream_available(self):
-        poll_results = dict(self.poller.poll(timeout=AppConfigs().zmq_lost_connection_timeout))
-        # print(f"pulled stream availability: {len(poll_results)}, at {time.time()}" )
-        return len(poll_results) > 0
+        return self._zmq_interface.is_stream_available(timeout=AppConfigs().zmq_lost_connection_timeout)
 
     def reset_interface(self, stream_name, channel_names):
         pass
 
     def decode_zmq_frame(self, message):
-        try:
-            if len(message) == 2:
-                topic_name = message[0].decode('utf-8')
-                timestamp = get_clock_time()
-                data = np.expand_dims(np.frombuffer(message[1], dtype=self.data_type), axis=-1)
-            elif len(message) == 3:
-                topic_name = message[0].decode('utf-8')
-                timestamp = np.frombuffer(message[1], dtype=(np.float64 if len(message[1]) == 8 else np.float32))[0]
-                data = np.expand_dims(np.frombuffer(message[2], dtype=self.data_type), axis=-1)
-            else:
-                raise InvalidZMQMessageError(f'ZMQ message has invalid length: {len(message)} != 1, 2, or 3')
-        except Exception as e:
-            raise InvalidZMQMessageError(f'ZMQ message cannot be decoded: {e}')
-        return topic_name, timestamp, data
\ No newline at end of file
+        """
+        see physiolabxr.interfaces.ZMQInterface.decode_zmq_frame
+        @return: topic name, timestamps, n_channels x n_samples data
+        """
+        return decode_zmq_frame(message, self.data_type)
@@ -13,6 +13,7 @@ from physiolabxr.configs import config_ui
 from physiolabxr.configs.GlobalSignals import GlobalSignals
 from physiolabxr.configs.configs import AppConfigs, LinechartVizMode
 from physiolabxr.presets.load_user_preset import create_default_group_entry
+from physiolabxr.threadings.DataProcessorPool import DataProcessorPool
 from physiolabxr.presets.presets_utils import get_stream_preset_info, set_stream_preset_info, get_stream_group_info, \
     get_is_group_shown, pop_group_from_stream_preset, add_group_entry_to_stream, change_stream_group_order, \
     change_stream_group_name, pop_stream_preset_from_settings, change_group_channels, reset_all_group_data_processors, \
@@ -22,14 +23,16 @@ from physiolabxr.ui.PoppableWidget import Poppable
 from physiolabxr.ui.StreamOptionsWindow import StreamOptionsWindow
 from physiolabxr.ui.VizComponents import VizComponents
 from physiolabxr.utils.buffers import DataBufferSingleStream
-from physiolabxr.utils.dsp_utils.dsp_modules import run_data_processors
 from physiolabxr.utils.performance_utils import timeit
+from physiolabxr.utils.stream_telemetry import StreamTelemetry
+from physiolabxr.utils.time_utils import get_clock_time
 from physiolabxr.utils.ui_utils import clear_widget, show_label_movie
 from physiolabxr.ui.dialogs import dialog_popup
 
 
 class BaseStreamWidget(Poppable, QtWidgets.QWidget):
     plot_format_changed_signal = QtCore.pyqtSignal(dict)
+    data_processed_signal = QtCore.pyqtSignal(dict, bool)  # data dict, whether it has been recorded and forwarded to scripting
     channel_mismatch_buttons = buttons=QDialogButtonBox.StandardButton.Yes | QDialogButtonBox.StandardButton.No
 
     def __init__(self, parent_widget, parent_layout, preset_type, stream_name, data_timer_interval, use_viz_buffer, insert_position=None, option_widget_call: callable=None):
@@ -120,6 +123,7 @@ class BaseStreamWidget(Poppable, QtWidgets.QWidget):
         self.create_visualization_component()
 
         self._has_new_viz_data = False
+        self._n_new_viz_samples = None  # the samples added to the viz buffer since the last plot, None if unknown, e.g., the buffer is recreated
         self.viz_data_head = 0
 
         # create option window
@@ -137,6 +141,7 @@ class BaseStreamWidget(Poppable, QtWidgets.QWidget):
 
         # mutex for not update the settings while plotting
         self.setting_update_viz_mutex = QMutex()
+        self.data_processed_signal.connect(self.on_data_processed)
         self.set_pop_button_icons()
 
     def start_timers(self):
@@ -201,6 +206,7 @@ class BaseStreamWidget(Poppable, QtWidgets.QWidget):
             if not self.data_worker.is_streaming and self.add_stream_availability:
                 self.update_stream_availability(self.data_worker.is_stream_available())
         else:
+            StreamTelemetry().reset(self.stream_name)  # the time the stream was stopped is not a gap
             self.data_worker.start_stream()
         self.set_button_icons()
         self.main_parent.update_active_streams()
@@ -298,6 +304,7 @@ class BaseStreamWidget(Poppable, QtWidgets.QWidget):
         display_duration = get_stream_preset_info(self.stream_name, 'display_duration')
         buffer_size = 1 if num_channels > AppConfigs.max_timeseries_num_channels_per_group else int(sr * display_duration)
         self.viz_data_buffer = DataBufferSingleStream(num_channels=num_channels, buffer_sizes=buffer_size, append_zeros=True)
+        self._n_new_viz_samples = None
 
     def remove_stream(self):
         """ Called when the remove stream button is clicked, or when the app is closing
@@ -307,6 +314,8 @@ class BaseStreamWidget(Poppable, QtWidgets.QWidget):
             return False
         self.data_timer.stop()
         self.v_timer.stop()
+        DataProcessorPool().cancel(self.stream_name)
+        StreamTelemetry().reset(self.stream_name)
         if self.data_worker.is_streaming:
             self.data_worker.stop_stream()
         self.worker_thread.requestInterruption()
@@ -361,20 +370,36 @@ class BaseStreamWidget(Poppable, QtWidgets.QWidget):
 
     def process_stream_data(self, data_dict):
         ''' update the visualization buffer, recording buffer, and scripting buffer
+
+        The data processors run on the DataProcessorPool, off the GUI thread. The buffers are updated in
+        on_data_processed once they are done.
         '''
         if data_dict['frames'].shape[-1] > 0 and not self.in_error_state:  # if there are data in the emitted data dict
-            # if only applied to visualization, then only update the visualization buffer
-            if get_stream_data_processor_only_apply_to_visualization(self.stream_name):
+            StreamTelemetry().update(self.stream_name, data_dict['timestamps'], get_stream_preset_info(self.stream_name, 'nominal_sampling_rate'))
+            groups = [(group_info.channel_indices, group_info.data_processors) for group_info in get_stream_group_info(self.stream_name).values() if len(group_info.data_processors) != 0]
+            if len(groups) == 0 and not DataProcessorPool().is_processing(self.stream_name):
+                self.on_data_processed(data_dict, False)
+                return
+            # if only applied to visualization, the raw data are recorded and forwarded now, and only the processed copy is visualized
+            raw_data_recorded = get_stream_data_processor_only_apply_to_visualization(self.stream_name)
+            if raw_data_recorded:
                 self.main_parent.recording_tab.update_recording_buffer(data_dict)
                 self.main_parent.scripting_tab.forward_data(data_dict)
-                self.run_data_processor(data_dict) # run data processor after updating recording buffer and scripting buffer
-                self.viz_data_head = self.viz_data_head + len(data_dict['timestamps'])
-            else:
-                # run data processor first
-                self.run_data_processor(data_dict)
+                data_dict = {**data_dict, 'frames': data_dict['frames'].copy()}
+            DataProcessorPool().submit(self.stream_name, data_dict, groups, lambda processed_data_dict: self.data_processed_signal.emit(processed_data_dict, raw_data_recorded))
+
+    def on_data_processed(self, data_dict, raw_data_recorded):
+        """
+        :param raw_data_recorded: if the raw data were already recorded and forwarded to the scripts, the processed data
+            are then only visualized
+        """
+        if not self.in_error_state:
+            if not raw_data_recorded:
                 self.main_parent.recording_tab.update_recording_buffer(data_dict)
                 self.main_parent.scripting_tab.forward_data(data_dict)
-                self.viz_data_head = self.viz_data_head + len(data_dict['timestamps'])
+            self.viz_data_head = self.viz_data_head + len(data_dict['timestamps'])
+            if self._n_new_viz_samples is not None:
+                self._n_new_viz_samples += len(data_dict['timestamps'])
 
             self.update_buffer_times.append(timeit(self.viz_data_buffer.update_buffer, (data_dict, ))[1])  # NOTE performance test scripts, don't include in production code
             self._has_new_viz_data = True
@@ -400,19 +425,34 @@ class BaseStreamWidget(Poppable, QtWidgets.QWidget):
         elif AppConfigs().linechart_viz_mode == LinechartVizMode.CONTINUOUS:
             data_to_plot = self.viz_data_buffer.buffer[0][:, -self.num_points_to_plot:]
         for plot_group_index, (group_name) in enumerate(get_stream_group_info(self.stream_name).keys()):
-            self.plot_data_times.append(timeit(self.viz_components.group_plots[group_name].plot_data, (data_to_plot, ))[1])  # NOTE performance test scripts, don't include in production code
+            self.plot_data_times.append(timeit(self.viz_components.group_plots[group_name].plot_data, (data_to_plot, self._n_new_viz_samples))[1])  # NOTE performance test scripts, don't include in production code
 
         self.viz_components.fs_label.setText(
             'fps: {:.3f}'.format(round(actual_sampling_rate, config_ui.sampling_rate_decimal_places)))
         self.viz_components.ts_label.setText('timestamp: {:.3f}'.format(self.current_timestamp))
+        StreamTelemetry().record_latency(self.stream_name, 'display', get_clock_time() - self.current_timestamp)
 
         self._has_new_viz_data = False
+        self._n_new_viz_samples = 0
         if self.viz_data_head > get_stream_preset_info(self.stream_name, 'display_duration') * get_stream_preset_info(self.stream_name, 'nominal_sampling_rate'):  # reset the head if it is out of bound
             self.viz_data_head = 0
 
     def pull_data_tick(self):
         self.data_worker.signal_data_tick.emit()
 
+    def update_health(self):
+        """
+        show the health of the stream, see StreamTelemetry, in the tooltip of the fps label
+        """
+        metrics = StreamTelemetry().get_metrics(self.stream_name)
+        if metrics is None:
+            return
+        latency = ', '.join(f"{stage} {stats['mean'] * 1e3:.1f} ms" for stage, stats in metrics['latency'].items())
+        self.fs_label.setToolTip(f"received {metrics['effective_sampling_rate']:.1f} Hz of {metrics['nominal_sampling_rate']:.1f} Hz nominal\n"
+                                 f"{metrics['sample_count']} samples, {metrics['dropped_sample_count']} dropped in {metrics['gap_count']} gaps, "
+                                 f"{metrics['out_of_order_count']} out of order\n"
+                                 f"mean latency: {latency}")
+
     def get_fps(self):
         try:
             return len(self.viz_times) / (self.viz_times[-1] - self.viz_times[0])
@@ -505,15 +545,5 @@ class BaseStreamWidget(Poppable, QtWidgets.QWidget):
     def try_close(self):
         return self.remove_stream()
 
-    def run_data_processor(self, data_dict):
-        data = data_dict['frames']
-        group_info = get_stream_group_info(self.stream_name)
-
-        for this_group_info in group_info.values():  # TODO: potentially optimize using pool
-            if len(this_group_info.data_processors) != 0:
-                processed_data = run_data_processors(data[this_group_info.channel_indices], this_group_info.data_processors)
-                data[this_group_info.channel_indices] = processed_data
-
-
     def get_viz_components(self):
         return self.viz_components
\ No newline at end of file
@@ -1,7 +1,6 @@
 import numpy as np
 import pyqtgraph as pg
 from PyQt6 import QtWidgets, uic, QtCore
-from scipy import signal
 
 from physiolabxr.configs import config
 from physiolabxr.configs.configs import AppConfigs
@@ -16,6 +15,7 @@ from physiolabxr.presets.presets_utils import get_stream_preset_info, get_is_gro
     get_group_channel_indices_start_end, get_is_channels_show, get_group_linechart_config
 from physiolabxr.utils.image_utils import process_image, rotate_image
 from physiolabxr.utils.ui_utils import get_distinct_colors
+from physiolabxr.utils.viz_utils import LinechartDecimator, StreamingSpectrogram
 
 
 class GroupPlotWidget(QtWidgets.QWidget):
@@ -37,6 +37,7 @@ class GroupPlotWidget(QtWidgets.QWidget):
         self.channel_plot_item_dict = dict()
 
         self.linechart_widget = None
+        self.linechart_decimator = None
         # self.image_label = None
         self.image_item = None
         self.plot_widget = None
@@ -45,6 +46,7 @@ class GroupPlotWidget(QtWidgets.QWidget):
         self.legends = None
         self.spectrogram_widget = None
         self.spectrogram_img = None
+        self.streaming_spectrogram = None
 
         self.is_auto_level_image = False
 
@@ -116,8 +118,7 @@ class GroupPlotWidget(QtWidgets.QWidget):
             # channel_plot_item.setSkipFiniteCheck(True)
             # self.channel_plot_item_dict[channel_name] = channel_plot_item
         group_plot_item = self.linechart_widget.plot([], [], pen=pens, name=names)
-        downsample_method = 'mean' if self.sampling_rate > AppConfigs().downsample_method_mean_sr_threshold else 'subsample'
-        group_plot_item.setDownsampling(auto=True, method=downsample_method)
+        # the data are decimated to the width of the plot in plot_data, see LinechartDecimator
         # channel_plot_item.setClipToView(True)
         group_plot_item.setSkipFiniteCheck(True)
         # self.channel_plot_item_dict[channel_name] = channel_plot_item
@@ -191,20 +192,66 @@ class GroupPlotWidget(QtWidgets.QWidget):
         num_points_to_plot = int(display_duration * get_stream_preset_info(self.stream_name, 'nominal_sampling_rate'))
         return np.linspace(0., get_stream_preset_info(self.stream_name, 'display_duration'), num_points_to_plot)
 
-    def plot_data(self, data):
+    def update_linechart_decimator(self, data, channel_indices, n_new_samples):
+        """
+        decimate the new samples of the line chart, see LinechartDecimator. The line chart is not decimated if the plot
+        has enough pixels to draw every sample. The whole data are decimated anew when the number of samples per pixel
+        changes, or when the samples new since the last call are not known
+        """
+        num_points_to_plot = len(self.viz_time_vector)
+        method = 'mean' if self.sampling_rate > AppConfigs().downsample_method_mean_sr_threshold else 'minmax'
+        points_per_bucket = 2 if method == 'minmax' else 1
+        bucket_size = int(num_points_to_plot * points_per_bucket // (2 * max(self.linechart_widget.plotItem.vb.width(), 1)))  # about two points per pixel
+        if bucket_size < 2:
+            self.linechart_decimator = None
+        elif n_new_samples is None or n_new_samples > data.shape[1] or self.linechart_decimator is None or self.linechart_decimator.bucket_size != bucket_size \
+                or self.linechart_decimator.method != method or self.linechart_decimator.n_channels != len(channel_indices):
+            self.linechart_decimator = LinechartDecimator(len(channel_indices), bucket_size, method, max_window_size=num_points_to_plot)
+            self.linechart_decimator.update(data[channel_indices])
+        elif n_new_samples > 0:
+            self.linechart_decimator.update(data[channel_indices, -n_new_samples:])
+
+    def update_streaming_spectrogram(self, data, channel_indices, n_new_samples, fs, nperseg, noverlap):
+        """
+        transform the segments the new samples complete, see StreamingSpectrogram. The whole data are transformed anew
+        when the segments change, or when the samples new since the last call are not known
+        """
+        num_points_to_plot = len(self.viz_time_vector)
+        if n_new_samples is None or n_new_samples > data.shape[1] or self.streaming_spectrogram is None or self.streaming_spectrogram.sampling_rate != fs \
+                or self.streaming_spectrogram.nperseg != nperseg or self.streaming_spectrogram.noverlap != noverlap \
+                or self.streaming_spectrogram.n_channels != len(channel_indices) or self.streaming_spectrogram.max_window_size != num_points_to_plot:
+            self.streaming_spectrogram = StreamingSpectrogram(len(channel_indices), fs, nperseg, noverlap, max_window_size=num_points_to_plot)
+            self.streaming_spectrogram.update(data[channel_indices])
+        elif n_new_samples > 0:
+            self.streaming_spectrogram.update(data[channel_indices, -n_new_samples:])
+
+    def plot_data(self, data, n_new_samples=None):
+        """
+        :param data: (channels, samples) to plot, the latest sample last
+        :param n_new_samples: the number of samples at the end of data that are new since the last call, the line chart is
+            decimated and the spectrogram transformed anew if None
+        """
         channel_indices = get_group_channel_indices(self.stream_name, self.group_name)
         duration = data.shape[1] / get_stream_preset_info(self.stream_name, 'nominal_sampling_rate')
         selected_plot_format = self.get_selected_format()
         if data.shape[1] != len(self.viz_time_vector):  # num_points_to_plot has been updated
             self.viz_time_vector = self.get_viz_time_vector()
+        if selected_plot_format != 0:
+            self.linechart_decimator = None  # it misses the samples that come while the line chart is not shown
+        if selected_plot_format != 3:
+            self.streaming_spectrogram = None
         if selected_plot_format == 0:  # linechart
             linechart_config = get_group_linechart_config(self.stream_name, self.group_name)
             # if line_chat_config.channels_constant_offset!=0:
             #     data = data +
 
-            time_vector = np.linspace(0., duration, data.shape[1])
-
-            y_vals = data[channel_indices]
+            self.update_linechart_decimator(data, channel_indices, n_new_samples)
+            if self.linechart_decimator is not None:
+                sample_indices, y_vals = self.linechart_decimator.get(data, channel_indices)
+                time_vector = sample_indices * duration / max(data.shape[1] - 1, 1)
+            else:
+                time_vector = np.linspace(0., duration, data.shape[1])
+                y_vals = data[channel_indices]
             channel_offsets = np.arange(y_vals.shape[0]) * linechart_config.channels_constant_offset
             y_vals = y_vals + channel_offsets.reshape(-1, 1)
             self.linechart_widget.plotItem.curves[0].setData(time_vector, y_vals)
@@ -257,23 +304,24 @@ class GroupPlotWidget(QtWidgets.QWidget):
             bar_chart_plot_data = data[channel_indices, -1]  # only visualize the last frame
             self.barchart_widget.plotItem.curves[0].setOpts(x=np.arange(len(bar_chart_plot_data)), height=bar_chart_plot_data, width=1, brush='r')
         elif selected_plot_format == 3:
-            spectrogram_plot_data = data[channel_indices, :]
-            # self.spectrogram_widget.setImage(spectrogram_plot_data, autoLevels=True, autoRange=True, autoHistogramRange=True)
             fs = get_stream_preset_info(self.stream_name, 'nominal_sampling_rate')
             nperseg = int(fs * spectrogram_time_second_per_segment(self.stream_name, self.group_name))
             noverlap = int(fs * spectrogram_time_second_overlap(self.stream_name, self.group_name))
-            if nperseg == 0 or noverlap == 0 or nperseg < noverlap or nperseg > spectrogram_plot_data.shape[1]:
+            if nperseg == 0 or noverlap == 0 or nperseg < noverlap or nperseg > data.shape[1]:
+                self.streaming_spectrogram = None
+                return
+            self.update_streaming_spectrogram(data, channel_indices, n_new_samples, fs, nperseg, noverlap)
+            segment_start, Sxx = self.streaming_spectrogram.get(data.shape[1])  # averaged across channels
+            if Sxx.shape[1] == 0:
                 return
-            f, t, Sxx = signal.spectrogram(spectrogram_plot_data, fs, window=signal.get_window('hann', nperseg),
-                                           noverlap=noverlap,
-                                           detrend=False, scaling='spectrum')
             percentile_level_min = get_spectrogram_percentile_level_min(self.stream_name, self.group_name)
             percentile_level_max = get_spectrogram_percentile_level_max(self.stream_name, self.group_name)
-            self.spectrogram_img.setLevels([np.percentile(Sxx, percentile_level_min), np.percentile(Sxx, percentile_level_max)])
-            Sxx = np.mean(Sxx, axis=0)  # average across channels
-            # Sxx = resize(Sxx, (fs/2, Sxx.shape[-1]))
-            self.spectrogram_img.setImage(Sxx.T, autoLevels=False)  # average across channels
-            self.spectrogram_img.setRect((0, 0, duration, fs/2))
+            levels = self.streaming_spectrogram.get_levels(data.shape[1], percentile_level_min, percentile_level_max)
+            if levels is not None:  # None if the data are all nan
+                self.spectrogram_img.setLevels(levels)
+            self.spectrogram_img.setImage(Sxx.T, autoLevels=False)
+            spectrogram_duration = ((Sxx.shape[1] - 1) * (nperseg - noverlap) + nperseg) / fs
+            self.spectrogram_img.setRect((segment_start / fs, 0, spectrogram_duration, fs/2))
 
     def update_bar_chart_range(self):
         if not is_group_image_only(self.stream_name, self.group_name):  # if barplot exists for this group
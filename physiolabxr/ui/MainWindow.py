@@ -38,6 +38,7 @@ from physiolabxr.ui.RecordingsTab import RecordingsTab
 from physiolabxr.ui.SettingsWidget import SettingsWidget
 from physiolabxr.ui.ReplayTab import ReplayTab
 from physiolabxr.utils.buffers import DataBuffer
+from physiolabxr.utils.stream_telemetry import TelemetryServer
 from physiolabxr.utils.ui_utils import another_window
 from physiolabxr.ui.dialogs import dialog_popup
 from physiolabxr.ui.DeviceWidget import DeviceWidget
@@ -95,6 +96,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.meta_data_update_timer.timeout.connect(self.update_meta_data)
         self.meta_data_update_timer.start()
 
+        # serve the health of the streams for monitoring, see StreamTelemetry
+        self.telemetry_server = None
+        if AppConfigs().stream_telemetry_port > 0:
+            self.telemetry_server = TelemetryServer(AppConfigs().stream_telemetry_port)
+            self.telemetry_server.start()
+            print(f'MainWindow: serving the stream telemetry at http://127.0.0.1:{self.telemetry_server.port}/metrics')
+
         self.addStreamWidget = AddStreamWidget(self)
         self.MainTabVerticalLayout.insertWidget(0, self.addStreamWidget)  # add the add widget to visualization tab's
         self.addStreamWidget.add_btn.clicked.connect(self.add_btn_clicked)
@@ -354,6 +362,8 @@ class MainWindow(QtWidgets.QMainWindow):
         return stream_widget
 
     def update_meta_data(self):
+        for stream_widget in self.stream_widgets.values():
+            stream_widget.update_health()
         # get the stream viz fps
         fps_list = np.array([[s.get_fps() for s in self.stream_widgets.values()]])
         pull_data_delay_list = np.array([[s.get_pull_data_delay() for s in self.stream_widgets.values()]])
@@ -442,6 +452,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.replay_tab.try_close()
         print('MainWindow: closing replay')
         self.settings_widget.try_close()
+        if self.telemetry_server is not None:
+            self.telemetry_server.stop()
 
         Presets().__del__()
         AppConfigs().__del__()
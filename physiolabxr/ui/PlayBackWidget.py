@@ -2,6 +2,7 @@ import numpy as np
 from PyQt6 import QtWidgets, uic
 from PyQt6.QtCore import QTimer, QThread
 
+from physiolabxr.configs import shared
 from physiolabxr.configs.configs import AppConfigs
 from physiolabxr.threadings.workers import PlaybackWorker
 
@@ -19,6 +20,7 @@ class PlayBackWidget(QtWidgets.QWidget):
         # self.horizontalSlider.valueChanged.connect(self.emit_playback_position)
         self.playPauseButton.clicked.connect(self.issue_play_pause_command)
         self.stopButton.clicked.connect(self.start_stop_replay)
+        self.playbackRateComboBox.currentTextChanged.connect(self.issue_playback_rate_command)
 
         self.slider_is_dragging = False
         self.horizontalSlider.sliderPressed.connect(self.slider_pressed)
@@ -164,6 +166,21 @@ class PlayBackWidget(QtWidgets.QWidget):
         if self.parent.is_replaying:
             self.playback_worker.queue_play_pause_command()
 
+    def get_playback_rate(self):
+        """
+        @return: the playback rate selected in playbackRateComboBox, a multiple of real time, or
+        shared.UNTHROTTLED_PLAYBACK_RATE
+        """
+        playback_rate = self.playbackRateComboBox.currentText()
+        if playback_rate == 'Unthrottled':
+            return shared.UNTHROTTLED_PLAYBACK_RATE
+        return float(playback_rate.strip('x'))
+
+    def issue_playback_rate_command(self):
+        # the rate is sent with the start replay command when the replay is not running
+        if self.parent.is_replaying:
+            self.playback_worker.queue_playback_rate_command(self.get_playback_rate())
+
     def issue_stop_command(self):
         self.playback_worker.queue_stop_command()
 
@@ -97,12 +97,13 @@ class RecordingConversionWorker(QObject):
 
     def run(self):
         print("RecordingConversionWorker started running")
-        file, buffer, read_bytes_count = None, None, None
-        while True:
-            file, buffer, read_bytes_count, total_bytes, finished = self.stream.stream_in_stepwise(file, buffer, read_bytes_count, jitter_removal=False)
-            if finished:
-                break
-            self.progress.emit([read_bytes_count, total_bytes])
+        buffer = self.stream.stream_in_memmap(jitter_removal=False)  # the data arrays are read from disk as they are converted
+        if self.file_format != RecordingFileFormat.xdf:  # these formats are written from in-memory arrays, read them a stream at a time
+            total_bytes, read_bytes = sum(data.nbytes for data, _ in buffer.values()), 0
+            for s_name, (data, timestamps) in buffer.items():
+                buffer[s_name] = [np.asarray(data), timestamps]
+                read_bytes += data.nbytes
+                self.progress.emit([read_bytes, max(total_bytes, 1)])
         self.finished_streamin.emit()
 
         newfile_path = self.file_path
@@ -1,5 +1,6 @@
 # This Python file uses the following encoding: utf-8
 import os
+import queue
 import sys
 import time
 
@@ -14,7 +15,8 @@ from PyQt6.QtWidgets import QDialogButtonBox
 from physiolabxr.exceptions.exceptions import RenaError, TrySerializeObjectError
 from physiolabxr.ui import ui_shared
 from physiolabxr.configs.config import settings
-from physiolabxr.configs.configs import AppConfigs, RecordingFileFormat
+from physiolabxr.configs.configs import AppConfigs, RecordingFileFormat, VideoRecordingCodec
+from physiolabxr.threadings.RecordingWriter import RecordingWriter
 from physiolabxr.ui.RecordingConversionDialog import RecordingPostProcessDialog
 from physiolabxr.ui.ui_shared import stop_recording_text, start_recording_text
 from physiolabxr.utils.RNStream import RNStream
@@ -44,6 +46,7 @@ class RecordingsTab(QtWidgets.QWidget):
         self.parent = parent
 
         self.save_stream = None
+        self.recording_writer = None
 
         self.save_path = ''
 
@@ -82,8 +85,15 @@ class RecordingsTab(QtWidgets.QWidget):
             else:
                 return
 
-        self.save_stream = RNStream(self.save_path)
-        self.recording_buffer.clear_buffer()  # clear buffer
+        self.save_stream = RNStream(self.save_path, jpeg_quality=AppConfigs().video_recording_jpeg_quality)
+        self.recording_writer = RecordingWriter(self.save_stream, max_queue_size=AppConfigs.recording_writer_max_queue_size)
+        try:
+            self.recording_writer.start()
+        except FileNotFoundError:
+            self.parent.current_dialog = dialog_popup(msg=f"Recording directory {self.save_path} does not exist. "
+                             "Recording stopped.", title="Error", main_parent=self.parent, buttons=QDialogButtonBox.StandardButton.Ok)
+            return
+        self.recording_buffer = DataBuffer()
         self.is_recording = True
         self.recording_byte_count = 0
         self.StartStopRecordingBtn.setText(stop_recording_text)
@@ -101,8 +111,11 @@ class RecordingsTab(QtWidgets.QWidget):
     def stop_recording_btn_pressed(self):
         self.is_recording = False
 
-        self.evict_buffer()
         self.timer.stop()
+        if not self.evict_buffer():  # the recording is interrupted by on_failed_evict
+            return
+        if not self.close_recording_writer():  # wait for the queued buffers to be written before post-processing the file
+            return
 
         self.recording_byte_count = 0
         self.update_file_size_label()
@@ -129,6 +142,8 @@ class RecordingsTab(QtWidgets.QWidget):
 
     def update_camera_screen_buffer(self, cam_id, new_frame, timestamp):
         if self.is_recording:
+            if AppConfigs().video_recording_codec != VideoRecordingCodec.raw and cam_id not in self.save_stream.video_codecs:
+                self.save_stream.video_codecs[cam_id] = AppConfigs().video_recording_codec.name  # the frames are compressed when they are written
             self.recording_buffer.update_buffer({'stream_name': cam_id, 'frames': np.expand_dims(new_frame, axis=-1), 'timestamps': [timestamp]})
 
     def update_ui_save_file(self):
@@ -153,22 +168,56 @@ class RecordingsTab(QtWidgets.QWidget):
                                                                     RecordingFileFormat.get_default_file_extension()))
 
     def evict_buffer(self):
-        # print(self.recording_buffer)
+        """
+        swap the recording buffer for an empty one and hand the filled one to the recording writer, which writes it to
+        disk on its own thread. If the writer is too far behind, waits up to an eviction interval for it before the
+        recording is stopped, so that the GUI thread is not blocked, see RecordingWriter.write
+        @return: True if the buffer is handed to the writer, False if the recording is interrupted
+        """
+        if self.recording_writer is None:
+            return False
+        evicted_buffer, self.recording_buffer = self.recording_buffer, DataBuffer()
         try:
-            self.recording_byte_count += self.save_stream.stream_out(self.recording_buffer.buffer)
-        except FileNotFoundError:
-            self.parent.current_dialog = dialog_popup(msg=f"Recording directory {self.save_path} does not exist. "
-                             "Recording stopped.", title="Error", main_parent=self.parent, buttons=QDialogButtonBox.StandardButton.Ok)
-            self.interrupt_recordings_on_failed_evict()
-            return
-        except TrySerializeObjectError as e:
-            self.parent.current_dialog = dialog_popup(msg=str(e), title="Error", main_parent=self.parent, buttons=QDialogButtonBox.StandardButton.Ok)
-            self.interrupt_recordings_on_failed_evict()
-
-        self.recording_buffer.clear_buffer()
+            self.recording_writer.write(evicted_buffer.buffer, timeout=AppConfigs().eviction_interval / 1e3)
+        except Exception as e:
+            self.on_failed_evict(e)
+            return False
+        self.recording_byte_count = self.recording_writer.written_bytes
         self.update_file_size_label()
+        return True
+
+    def close_recording_writer(self):
+        """
+        @return: True if all the evicted buffers are written, False if the writer failed or the recording is interrupted
+        """
+        if self.recording_writer is None:
+            return False
+        try:
+            self.recording_writer.close()
+        except Exception as e:
+            self.recording_writer = None
+            self.on_failed_evict(e)
+            return False
+        self.recording_writer = None
+        return True
+
+    def on_failed_evict(self, e):
+        if isinstance(e, FileNotFoundError):
+            msg = f"Recording directory {self.save_path} does not exist. Recording stopped."
+        elif isinstance(e, TrySerializeObjectError):
+            msg = str(e)
+        elif isinstance(e, queue.Full):
+            msg = f"Writing to {self.save_path} cannot keep up with the recording. Recording stopped, the data written until now are kept."
+        else:
+            self.interrupt_recordings_on_failed_evict()  # stop the writer and the timer before the error propagates
+            raise e
+        self.parent.current_dialog = dialog_popup(msg=msg, title="Error", main_parent=self.parent, buttons=QDialogButtonBox.StandardButton.Ok)
+        self.interrupt_recordings_on_failed_evict()
 
     def interrupt_recordings_on_failed_evict(self):
+        if self.recording_writer is not None:
+            self.recording_writer.abort()
+            self.recording_writer = None
         self.is_recording = False
         self.StartStopRecordingBtn.setText(start_recording_text)
         self.StartStopRecordingBtn.setIcon(AppConfigs()._icon_start)
@@ -176,9 +225,18 @@ class RecordingsTab(QtWidgets.QWidget):
         self.recording_byte_count = 0
         self.update_file_size_label()
 
+        self.experimentNameTextEdit.setEnabled(True)
+        self.subjectTagTextEdit.setEnabled(True)
+        self.sessionTagTextEdit.setEnabled(True)
+
     def update_file_size_label(self):
-        self.parent.recording_file_size_label. \
-            setText('    Recording file size: {0} Mb'.format(str(round(self.recording_byte_count / 10 ** 6, 2))))
+        text = '    Recording file size: {0} Mb'.format(str(round(self.recording_byte_count / 10 ** 6, 2)))
+        if self.recording_writer is not None:
+            metrics = self.recording_writer.get_metrics()
+            text += '    Write queue: {0}, latency: {1} ms, {2} Mb/s'.format(metrics['queue_depth'],
+                                                                         round(metrics['write_latency'] * 1e3, 1),
+                                                                         round(metrics['bytes_per_second'] / 10 ** 6, 2))
+        self.parent.recording_file_size_label.setText(text)
 
     def open_recording_directory(self):
         try:
@@ -119,7 +119,7 @@ class ReplayTab(QtWidgets.QWidget):
         #     dialog_popup(f'No available port for replay server in range: {AppConfigs().replay_port_range}, No replay will be available for this session', title='Error')
         #     return
         parent_conn, child_conn = Pipe()
-        self.replay_server_process = Process(target=start_replay_server, kwargs={'conn': child_conn})
+        self.replay_server_process = Process(target=start_replay_server, kwargs={'conn': child_conn, 'look_ahead_duration': AppConfigs().replay_look_ahead_duration})
         self.replay_server_process.start()
         self.replay_port = parent_conn.recv()
 
@@ -169,7 +169,7 @@ class ReplayTab(QtWidgets.QWidget):
         self.StartStopReplayBtn.setVisible(False)
         self.playback_window.hide()
 
-        self.command_info_interface.send_string(shared.LOAD_COMMAND + selected_file)
+        self.command_info_interface.send_string(shared.add_playback_rate(shared.LOAD_COMMAND + selected_file, self.playback_widget.get_playback_rate()))
         self.wait_worker, self.wait_thread = start_wait_for_response(socket=self.command_info_interface.socket)
         self.wait_worker.result_available.connect(self.process_reply_from_load_command)
 
@@ -283,7 +283,7 @@ class ReplayTab(QtWidgets.QWidget):
             self.playback_widget.start_replay(self.start_time, self.end_time, self.total_time, self.virtual_clock_offset)
 
             # send START REPLAY COMMAND to replay server
-            self.command_info_interface.send_string(shared.START_REPLAY_COMMAND)
+            self.command_info_interface.send_string(shared.add_playback_rate(shared.START_REPLAY_COMMAND, self.playback_widget.get_playback_rate()))
 
             # self.loading_canceled = False  # TODO implement canceling loading of replay file
             # self.loading_replay_dialog = dialog_popup('Loading replay file...', title='Starting Replay', mode='modeless', main_parent=self.parent, buttons=QDialogButtonBox.StandardButton.Cancel)
@@ -337,11 +337,15 @@ class ReplayTab(QtWidgets.QWidget):
         return len(self.stream_info)
 
     def _request_replay_performance(self):
+        """
+        @return: the average time the replay server takes to push a chunk, and the max number of samples per second it
+        can sustain
+        """
         print('Sending performance request command ReplayClient')  # TODO change the send to a progress bar
         self.command_info_interface.send_string(shared.PERFORMANCE_REQUEST_COMMAND)
-        average_loop_time = self.command_info_interface.socket.recv()  # this is blocking, but replay should respond fast
-        average_loop_time = np.frombuffer(average_loop_time)[0]
-        return average_loop_time
+        performance = self.command_info_interface.socket.recv()  # this is blocking, but replay should respond fast
+        average_loop_time, max_sustained_samples_per_second = np.frombuffer(performance)
+        return average_loop_time, max_sustained_samples_per_second
 
     def update_port_numbers(self):
         for i, (s_name, list_item) in enumerate(self.stream_list_items.items()):
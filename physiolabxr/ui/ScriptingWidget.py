@@ -21,6 +21,7 @@ from physiolabxr.configs.config import SCRIPTING_UPDATE_REFRESH_INTERVAL
 from physiolabxr.presets.PresetEnums import DataType, PresetType
 from physiolabxr.presets.Presets import Presets
 from physiolabxr.presets.ScriptPresets import ScriptPreset, ScriptOutput
+from physiolabxr.scripting.LoopScheduler import jitter_histogram_bin_edges
 from physiolabxr.scripting.RenaScript import RenaScript
 from physiolabxr.scripting.script_utils import get_script_class_name
 from physiolabxr.scripting.script_process import start_rena_script
@@ -36,10 +37,11 @@ from physiolabxr.ui.ScriptConsoleLog import ScriptConsoleLog
 from physiolabxr.ui.ScriptingInputWidget import ScriptingInputWidget
 from physiolabxr.ui.ScriptingOutputWidget import ScriptingOutputWidget
 from physiolabxr.ui.ParamWidget import ParamWidget
-from physiolabxr.ui.ui_shared import script_realtime_info_text
+from physiolabxr.ui.ui_shared import script_realtime_info_text, script_scheduling_info_text, script_jitter_histogram_tooltip
 from physiolabxr.utils.Validators import NoCommaIntValidator
 from physiolabxr.utils.buffers import DataBuffer, click_on_file
-from physiolabxr.utils.networking_utils import send_data_dict, recv_string_router
+from physiolabxr.utils.networking_utils import send_data_dict, recv_string_router, send_shared_memory_info
+from physiolabxr.utils.shared_memory_utils import SharedMemoryRing
 from physiolabxr.presets.presets_utils import get_stream_preset_names, get_experiment_preset_streams, \
     get_experiment_preset_names, get_stream_preset_info, is_stream_name_in_presets, remove_script_from_settings
 
@@ -175,6 +177,9 @@ class ScriptingWidget(Poppable, QtWidgets.QWidget):
             self.export_script_args_to_settings()
 
         self.internal_data_buffer = None
+        self.internal_buffer_sizes = None
+        self.use_shared_memory_input = False
+        self.input_rings = {}  # stream name -> SharedMemoryRing, the inputs are written to these when use_shared_memory_input is True
 
         # global signals
         GlobalSignals().stream_preset_nominal_srate_changed.connect(self.on_stream_nominal_sampling_rate_change)
@@ -211,6 +216,8 @@ class ScriptingWidget(Poppable, QtWidgets.QWidget):
     def setup_forward_input(self, forward_interval, internal_buffer_sizes, port):
         self.run_signal_timer.setInterval(int(forward_interval))
         self.internal_data_buffer = DataBuffer(stream_buffer_sizes=internal_buffer_sizes)  # buffer that keeps data between run signals
+        self.internal_buffer_sizes = internal_buffer_sizes
+        self.use_shared_memory_input = AppConfigs().scripting_shared_memory_input
         self.forward_input_socket_interface = RenaTCPInterface(stream_name='RENA_SCRIPTING_INPUT',
                                                                port_id=port,
                                                                identity='client',
@@ -222,6 +229,12 @@ class ScriptingWidget(Poppable, QtWidgets.QWidget):
         self.run_signal_timer.stop()
         self.internal_data_buffer = None
         self.forward_input_socket_interface = None
+        self.close_input_rings()
+
+    def close_input_rings(self):
+        for ring in self.input_rings.values():
+            ring.close()
+        self.input_rings = {}
 
     def setup_command_interface(self, port):
         self.command_socket_interface = RenaTCPInterface(stream_name='RENA_SCRIPTING_COMMAND',
@@ -235,7 +248,17 @@ class ScriptingWidget(Poppable, QtWidgets.QWidget):
         self.command_socket_interface = None
 
     def show_realtime_info(self, realtime_info: list):
-        self.realtimeInfoLabel.setText(script_realtime_info_text.format(*realtime_info))
+        """
+        @param realtime_info: see RenaScript._process_info_request, the timing of the loop scheduler comes after the
+        loop rate and durations
+        """
+        self.realtimeInfoLabel.setText(script_realtime_info_text.format(*realtime_info[:3]))
+        if len(realtime_info) > 3:
+            loop_count, deadline_miss_count, skipped_loop_count, mean_jitter, max_jitter, mean_latency, max_latency = realtime_info[3:10]
+            self.realtimeInfoLabel.setText(self.realtimeInfoLabel.text() + '\n' + script_scheduling_info_text.format(
+                deadline_miss_count, loop_count, skipped_loop_count, mean_jitter * 1e3, max_jitter * 1e3, mean_latency * 1e3, max_latency * 1e3))
+            bin_names = [f'{edge * 1e3:g}ms+' for edge in jitter_histogram_bin_edges]
+            self.realtimeInfoLabel.setToolTip(script_jitter_histogram_tooltip + '\n'.join(f'{bin_name:>8}: {count:.0f}' for bin_name, count in zip(bin_names, realtime_info[10:])))
 
     def create_stdout_worker(self):
         """
@@ -745,14 +768,35 @@ class ScriptingWidget(Poppable, QtWidgets.QWidget):
     def send_input(self, data_dict):
         if np.any(np.array(data_dict["timestamps"]) < 100):
             print('skipping input with timestamp < 100')
+        if self.use_shared_memory_input:
+            try:
+                self.write_input_ring(data_dict)
+                return
+            except OSError as e:  # shared memory is not available, fall back to sending the data over the socket
+                print(f'MainApp: failed to write the input {data_dict["stream_name"]} to shared memory, sending the inputs over TCP instead: {e}')
+                self.use_shared_memory_input = False
+                self.close_input_rings()
         self.internal_data_buffer.update_buffer(data_dict)
         # send_data_dict(data_dict, self.forward_input_socket_interface)
 
+    def write_input_ring(self, data_dict):
+        stream_name, frames, timestamps = data_dict['stream_name'], data_dict['frames'], data_dict['timestamps']
+        ring = self.input_rings.get(stream_name)
+        if ring is None or ring.frame_shape != frames.shape[:-1] or ring.dtype != frames.dtype:
+            if ring is not None:  # the script opens the new ring when it is told its name on the next run signal
+                ring.close()
+            capacity = max(self.internal_buffer_sizes.get(stream_name, 0), 2 * len(timestamps))
+            ring = self.input_rings[stream_name] = SharedMemoryRing(frames.shape[:-1], frames.dtype, capacity)
+        ring.write(frames, timestamps)
+
     def run_signal(self):
         # if self.is_simulating:
         #     buffer = dict([(input_name, (np.random.rand(*input_shape), np.random.rand(input_shape[1]))) for
         #                    input_name, input_shape in self.input_shape_dict.items()])
         # else:
+        if self.use_shared_memory_input:  # only how far the rings are written is sent, the script reads the data from shared memory
+            send_shared_memory_info({stream_name: ring.get_info() for stream_name, ring in self.input_rings.items()}, self.forward_input_socket_interface)
+            return
         buffer = self.internal_data_buffer.buffer
         send_data_dict(buffer, self.forward_input_socket_interface)
         self.internal_data_buffer.clear_buffer()
@@ -11,6 +11,7 @@ from physiolabxr.ui.BaseStreamWidget import BaseStreamWidget
 from physiolabxr.ui.VideoDeviceOptions import VideoDeviceOptions
 from physiolabxr.threadings.ScreenCaptureWorker import ScreenCaptureWorker
 from physiolabxr.threadings.WebcamWorker import WebcamWorker
+from physiolabxr.utils.stream_telemetry import StreamTelemetry
 
 
 class VideoWidget(BaseStreamWidget):
@@ -39,6 +40,7 @@ class VideoWidget(BaseStreamWidget):
             self.worker = ScreenCaptureWorker(video_device_name, video_scale, channel_order)
         self.connect_worker(self.worker, False)
         self.is_image_fitted_to_frame = False
+        self.displayed_frame = None
         self.data_timer.start()
 
     def create_visualization_component(self):
@@ -50,15 +52,19 @@ class VideoWidget(BaseStreamWidget):
 
     def process_stream_data(self, cam_id_cv_img_timestamp):
         self.viz_times.append(time.time())
-        image, timestamp = cam_id_cv_img_timestamp["frame"], cam_id_cv_img_timestamp["timestamp"]
-        image = np.swapaxes(image, 0, 1)
+        image, timestamp = cam_id_cv_img_timestamp["frame"], cam_id_cv_img_timestamp["timestamp"]  # already (width, height, channels), see FramePreprocessor
+        StreamTelemetry().update(self.stream_name, [timestamp])  # frames are dropped for the latest by design, the rate is not nominal
         self.image_item.setImage(image)
+        if self.displayed_frame is not None:  # the image item no longer references it
+            self.worker.release_frame(self.displayed_frame)
+        self.displayed_frame = image
 
         if not self.is_image_fitted_to_frame:
             self.plot_widget.setXRange(0, image.shape[0])
             self.plot_widget.setYRange(0, image.shape[1])
             self.is_image_fitted_to_frame = True
 
+        # the frame is C contiguous, the reshape is a view. The scripting and recording tabs copy it before it is released
         data_dict = {"stream_name": self.stream_name, "frames": np.expand_dims(image.reshape(-1), -1), "timestamps": np.array([timestamp])}
         self.main_parent.scripting_tab.forward_data(data_dict)
         self.main_parent.recording_tab.update_camera_screen_buffer(self.stream_name, image, timestamp)
@@ -40,6 +40,8 @@ stop_recording_text = 'Stop Recording'
 
 # Scripting Widget
 script_realtime_info_text = 'Loop (with overheads) per second {:.3f}    Average loop call running time {:.3f}    Max loop call running time {:.3f}'
+script_scheduling_info_text = 'Deadline misses {:.0f}/{:.0f}    Skipped loops {:.0f}    Jitter average {:.2f}ms, max {:.2f}ms    Input to output latency average {:.2f}ms, max {:.2f}ms'
+script_jitter_histogram_tooltip = 'Loop start jitter histogram\n'
 
 # Scripting Widget Tooltips
 scripting_input_widget_shape_label_tooltip = 'The expected shape of this input data at every loop. \n' \
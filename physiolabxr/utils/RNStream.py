@@ -16,10 +16,121 @@ endianness = 'little'
 encoding = 'utf-8'
 ts_dtype = 'float64'
 
+# chunk index, kept in a sidecar file next to the .dats (<file>.dats.idx) so the .dats itself stays readable by older
+# versions. The sidecar starts with index_magic and the index version, followed by one chunk_index_dtype record for each
+# chunk appended to the .dats
+index_magic = b'DATSIDX\x00'
+index_version = 1
+index_version_bytes_len = 8
+index_file_extension = '.idx'
+chunk_index_dtype = np.dtype([('stream_label', f'S{max_label_len}'),
+                              ('offset', '<u8'),  # byte offset of the chunk's magic in the .dats
+                              ('nbytes', '<u8'),  # byte length of the chunk, header included
+                              ('n_samples', '<u8'),
+                              ('first_timestamp', '<f8'),
+                              ('last_timestamp', '<f8')])
+
+
+# compressed video chunks, the dtype field of their header holds the codec instead of a numpy dtype. The frames are
+# uint8 and the shape in the header is that of the decoded frames. The header is followed by the byte length of every
+# encoded frame as frame_nbytes_dtype, then the encoded frames, then the timestamps as in the other chunks
+video_codecs = {'jpeg': '.jpg', 'png': '.png'}  # codec name to the extension cv2.imencode takes
+video_codec_dtype = 'uint8'
+frame_nbytes_dtype = '<u8'
+
+
+def get_chunk_header_len(dims):
+    return len(magic) + max_label_len + max_dtype_len + dim_bytes_len + dims * shape_bytes_len
+
+
+def can_encode_frames(data_array, codec):
+    """
+    whether the frames of data_array (time axis last) are images the codec can encode: uint8, (height, width) or
+    (height, width, channels) with channels 1 or 3, or 4 for png
+    """
+    frame_shape = data_array.shape[:-1]
+    if codec not in video_codecs or data_array.dtype != np.uint8 or len(frame_shape) not in (2, 3):
+        return False
+    return len(frame_shape) == 2 or frame_shape[2] in ((1, 3) if codec == 'jpeg' else (1, 3, 4))
+
+
+def encode_frames(data_array, codec, jpeg_quality=90):
+    """
+    :return: the byte length of every encoded frame, and the encoded frames concatenated
+    """
+    params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality] if codec == 'jpeg' else [cv2.IMWRITE_PNG_COMPRESSION, 1]
+    encoded_frames = []
+    for i in range(data_array.shape[-1]):
+        is_success, encoded_frame = cv2.imencode(video_codecs[codec], np.ascontiguousarray(data_array[..., i]), params)
+        if not is_success:
+            raise Exception(f'RNStream: failed to encode a frame with {codec}')
+        encoded_frames.append(encoded_frame)
+    return np.array([len(f) for f in encoded_frames], dtype=frame_nbytes_dtype), b''.join(f.tobytes() for f in encoded_frames)
+
+
+def decode_frame(encoded_frame, frame_shape):
+    return cv2.imdecode(np.frombuffer(encoded_frame, dtype=np.uint8), cv2.IMREAD_UNCHANGED).reshape(frame_shape)
+
+
+def decode_frames(frame_nbytes, encoded_frames, frame_shape, out=None):
+    """
+    :param frame_nbytes: the byte length of every encoded frame
+    :param encoded_frames: the encoded frames concatenated
+    :param out: the array (*frame_shape, n_frames) to decode into, allocated if None
+    """
+    out = np.empty(tuple(frame_shape) + (len(frame_nbytes),), dtype=video_codec_dtype) if out is None else out
+    frame_ends = np.cumsum(frame_nbytes, dtype=np.int64)
+    for i, (start, end) in enumerate(zip(frame_ends - frame_nbytes.astype(np.int64), frame_ends)):
+        out[..., i] = decode_frame(encoded_frames[start:end], frame_shape)
+    return out
+
 
 class RNStream:
-    def __init__(self, file_path):
+    def __init__(self, file_path, write_index=True, video_codecs=None, jpeg_quality=90):
+        """
+        :param file_path: path to the .dats file
+        :param write_index: whether stream_out should maintain the chunk index sidecar (<file_path>.idx) that
+                            read_range and the indexed stream_in use to jump directly to the chunks they need
+        :param video_codecs: dict of stream name to the codec stream_out compresses its frames with, one of
+                            video_codecs ('jpeg' or 'png'). The streams whose frames are not images the codec can encode
+                            are written uncompressed. Can be added to while streaming out. The compressed streams are
+                            decoded transparently when read
+        :param jpeg_quality: 0 to 100, the quality of the jpeg codec
+        """
         self.fn = file_path
+        self.index_fn = file_path + index_file_extension
+        self.write_index = write_index
+        self.video_codecs = {} if video_codecs is None else video_codecs
+        self.jpeg_quality = jpeg_quality
+        self._chunk_index = None
+        self._out_file = None  # kept open between stream_out calls by open_stream_out
+        self._index_out_file = None
+
+    def open_stream_out(self):
+        """
+        keep the .dats (and its index sidecar) open for appending, so that the repeated stream_out calls of a recording
+        don't reopen the file on every eviction. Call close_stream_out when the recording is done.
+        """
+        if self._out_file is not None:
+            return
+        self._index_existing_chunks()
+        self._out_file = open(self.fn, "ab")
+        if self.write_index:
+            self._index_out_file = open(self.index_fn, "ab")
+
+    def close_stream_out(self):
+        for file in (self._out_file, self._index_out_file):
+            if file is not None:
+                file.close()
+        self._out_file, self._index_out_file = None, None
+
+    def _index_existing_chunks(self):
+        if not self.write_index or not os.path.exists(self.fn) or os.path.getsize(self.fn) == 0:
+            return
+        # appending to an unindexed file, or to one whose sidecar ends in a partially written record that the new
+        # records would be misaligned after, index what is already there
+        if not os.path.exists(self.index_fn) or (os.path.getsize(self.index_fn) - len(index_magic) - index_version_bytes_len) % chunk_index_dtype.itemsize != 0:
+            self._write_index_file(self._scan_chunk_index())
 
     def stream_out(self, buffer):
         """
@@ -32,10 +143,15 @@ class RNStream:
                         The timestamps array must also in a increasing order, otherwise a warning will be raised
         :return: the total number of byptes that has been streamed out
         """
-        out_file = open(self.fn, "ab")
+        if self._out_file is None:
+            self._index_existing_chunks()
+            out_file = open(self.fn, "ab")
+        else:
+            out_file = self._out_file
         stream_label_bytes, dtype_bytes, dim_bytes, shape_bytes, data_bytes, ts_bytes = \
             b'', b'', b'', b'', b'', b''
         total_bytes = 0
+        index_records = []
         for stream_label, data_ts_array in buffer.items():
             data_array, ts_array = data_ts_array[0], data_ts_array[1]
 
@@ -57,8 +173,12 @@ class RNStream:
             stream_label_bytes = \
                 bytes(stream_label[:max_label_len] + "".join(
                     " " for x in range(max_label_len - len(stream_label))), encoding)
+            codec = self.video_codecs.get(stream_label)
+            if codec is not None and not can_encode_frames(data_array, codec):
+                warnings.warn(f'RNStream: [{stream_label}] frames of shape {data_array.shape[:-1]} and dtype {data_array.dtype} cannot be encoded with {codec}, writing them uncompressed.', UserWarning)
+                codec = None
             try:
-                dtype_str = str(data_array.dtype)
+                dtype_str = str(data_array.dtype) if codec is None else codec
                 if dtype_str == 'object': raise TrySerializeObjectError(stream_label)  # object dtype is not supported because it cannot be deserialized
                 assert len(dtype_str) < max_dtype_len
             except AssertionError:
@@ -72,8 +192,13 @@ class RNStream:
             except OverflowError:
                 raise Exception('RN requires its stream to have number of dimensions less than 2^40, '
                                 'and the size of any dimension to be less than the same number ')
-            data_bytes = data_array.tobytes()
+            if codec is None:
+                data_bytes = data_array.tobytes()
+            else:
+                frame_nbytes, encoded_frames = encode_frames(data_array, codec, self.jpeg_quality)
+                data_bytes = frame_nbytes.tobytes() + encoded_frames
             ts_bytes = ts_array.tobytes()
+            chunk_offset = out_file.tell()
             out_file.write(magic)
             out_file.write(stream_label_bytes)
             out_file.write(dtype_bytes)
@@ -81,8 +206,17 @@ class RNStream:
             out_file.write(shape_bytes)
             out_file.write(data_bytes)
             out_file.write(ts_bytes)
-            total_bytes += len(magic) + len(stream_label_bytes) + len(dtype_bytes) + len(dim_bytes) + len(shape_bytes) + len(data_bytes) + len(ts_bytes)
-        out_file.close()
+            chunk_bytes = len(magic) + len(stream_label_bytes) + len(dtype_bytes) + len(dim_bytes) + len(shape_bytes) + len(data_bytes) + len(ts_bytes)
+            total_bytes += chunk_bytes
+            if self.write_index:
+                index_records.append((stream_label_bytes, chunk_offset, chunk_bytes, len(ts_array),
+                                      ts_array[0] if len(ts_array) else np.nan, ts_array[-1] if len(ts_array) else np.nan))
+        if self._out_file is None:
+            out_file.close()
+        else:
+            out_file.flush()  # the data must be on disk before the index points to it
+        if self.write_index:
+            self._append_index_file(np.array(index_records, dtype=chunk_index_dtype))
         return total_bytes
 
     def stream_in(self, ignore_stream=None, only_stream=None, jitter_removal=True, reshape_stream_dict=None):
@@ -94,78 +228,71 @@ class RNStream:
         :param reshape_stream_dict:
         :return:
         """
-        total_bytes = float(os.path.getsize(self.fn))  # use floats to avoid scalar type overflow
-        buffer = {}
-        read_bytes_count = 0.
-        with open(self.fn, "rb") as file:
-            while True:
-                if total_bytes:
-                    print('Streaming in progress {0}%'.format(str(round(100 * read_bytes_count/total_bytes, 2))), sep=' ', end='\r', flush=True)
-                # read magic
-                read_bytes = file.read(len(magic))
-                read_bytes_count += len(read_bytes)
-                if len(read_bytes) == 0:
-                    break
-                try:
-                    assert read_bytes == magic
-                except AssertionError:
-                    raise Exception('Data invalid, magic sequence not found')
-                # read stream_label
-                read_bytes = file.read(max_label_len)
-                read_bytes_count += len(read_bytes)
-                stream_name = str(read_bytes, encoding).strip(' ')
-                # read read_bytes
-                read_bytes = file.read(max_dtype_len)
-                read_bytes_count += len(read_bytes)
-                stream_dtype = str(read_bytes, encoding).strip(' ')
-                # read number of dimensions
-                read_bytes = file.read(dim_bytes_len)
-                read_bytes_count += len(read_bytes)
-                dims = int.from_bytes(read_bytes, 'little')
-                # read number of np shape
-                shape = []
-                for i in range(dims):
-                    read_bytes = file.read(shape_bytes_len)
+        chunk_index = self._load_index_file()
+        if chunk_index is not None:  # indexed file, preallocate each stream and read its chunks directly
+            buffer = self._stream_in_indexed(chunk_index, ignore_stream=ignore_stream, only_stream=only_stream)
+        else:
+            total_bytes = float(os.path.getsize(self.fn))  # use floats to avoid scalar type overflow
+            buffer = {}
+            read_bytes_count = 0.
+            with open(self.fn, "rb") as file:
+                while True:
+                    if total_bytes:
+                        print('Streaming in progress {0}%'.format(str(round(100 * read_bytes_count/total_bytes, 2))), sep=' ', end='\r', flush=True)
+                    # read magic
+                    read_bytes = file.read(len(magic))
                     read_bytes_count += len(read_bytes)
-                    shape.append(int.from_bytes(read_bytes, 'little'))
-
-                data_array_num_bytes = np.prod(shape) * np.dtype(stream_dtype).itemsize
-                timestamp_array_num_bytes = shape[-1] * np.dtype(ts_dtype).itemsize
-
-                this_in_only_stream = (stream_name in only_stream) if only_stream else True
-                not_ignore_this_stream = (stream_name not in ignore_stream) if ignore_stream else True
-                if not_ignore_this_stream and this_in_only_stream:
-                    # read data array
-                    read_bytes = file.read(data_array_num_bytes)
+                    if len(read_bytes) == 0:
+                        break
+                    try:
+                        assert read_bytes == magic
+                    except AssertionError:
+                        raise Exception('Data invalid, magic sequence not found')
+                    # read stream_label
+                    read_bytes = file.read(max_label_len)
                     read_bytes_count += len(read_bytes)
-                    # stream_dtype = np.float64 if stream_name == 'TobiiProFusion' else stream_dtype
-                    data_array = np.frombuffer(read_bytes, dtype=stream_dtype)
-                    data_array = np.reshape(data_array, newshape=shape)
-                    # read timestamp array
-                    read_bytes = file.read(timestamp_array_num_bytes)
-                    ts_array = np.frombuffer(read_bytes, dtype=ts_dtype)
-
-                    if stream_name not in buffer.keys():
-                        buffer[stream_name] = [np.empty(shape=tuple(shape[:-1]) + (0,), dtype=stream_dtype),
-                                               np.empty(shape=(0,))]  # data first, timestamps second
-                    buffer[stream_name][0] = np.concatenate([buffer[stream_name][0], data_array], axis=-1)
-                    buffer[stream_name][1] = np.concatenate([buffer[stream_name][1], ts_array])
-                else:
-                    file.read(data_array_num_bytes + timestamp_array_num_bytes)
-                    read_bytes_count += data_array_num_bytes + timestamp_array_num_bytes
+                    stream_name = str(read_bytes, encoding).strip(' ')
+                    # read read_bytes
+                    read_bytes = file.read(max_dtype_len)
+                    read_bytes_count += len(read_bytes)
+                    stream_dtype = str(read_bytes, encoding).strip(' ')
+                    # read number of dimensions
+                    read_bytes = file.read(dim_bytes_len)
+                    read_bytes_count += len(read_bytes)
+                    dims = int.from_bytes(read_bytes, 'little')
+                    # read number of np shape
+                    shape = []
+                    for i in range(dims):
+                        read_bytes = file.read(shape_bytes_len)
+                        read_bytes_count += len(read_bytes)
+                        shape.append(int.from_bytes(read_bytes, 'little'))
+
+                    frame_nbytes = self._read_frame_nbytes(file, stream_dtype, shape)
+                    data_array_num_bytes = self._get_data_num_bytes(stream_dtype, shape, frame_nbytes)
+                    timestamp_array_num_bytes = shape[-1] * np.dtype(ts_dtype).itemsize
+
+                    this_in_only_stream = (stream_name in only_stream) if only_stream else True
+                    not_ignore_this_stream = (stream_name not in ignore_stream) if ignore_stream else True
+                    if not_ignore_this_stream and this_in_only_stream:
+                        # read data array
+                        read_bytes = file.read(data_array_num_bytes)
+                        read_bytes_count += len(read_bytes)
+                        # stream_dtype = np.float64 if stream_name == 'TobiiProFusion' else stream_dtype
+                        data_array, stream_dtype = self._decode_data_array(read_bytes, stream_dtype, shape, frame_nbytes)
+                        # read timestamp array
+                        read_bytes = file.read(timestamp_array_num_bytes)
+                        ts_array = np.frombuffer(read_bytes, dtype=ts_dtype)
+
+                        if stream_name not in buffer.keys():
+                            buffer[stream_name] = [np.empty(shape=tuple(shape[:-1]) + (0,), dtype=stream_dtype),
+                                                   np.empty(shape=(0,))]  # data first, timestamps second
+                        buffer[stream_name][0] = np.concatenate([buffer[stream_name][0], data_array], axis=-1)
+                        buffer[stream_name][1] = np.concatenate([buffer[stream_name][1], ts_array])
+                    else:
+                        file.read(data_array_num_bytes + timestamp_array_num_bytes)
+                        read_bytes_count += data_array_num_bytes + timestamp_array_num_bytes
         if jitter_removal:
-            i = 1
-            for stream_name, (d_array, ts_array) in buffer.items():
-                if len(ts_array) < 2:
-                    print("Ignore jitter remove for stream {0}, because it has fewer than two samples".format(stream_name))
-                    continue
-                if np.std(ts_array) > 0.1:
-                    warnings.warn(f"Stream {stream_name} may have a irregular sampling rate with its timestamp's std {np.std(ts_array)}. Jitter removal should not be applied to irregularly sampled streams.", RuntimeWarning)
-                print('Removing jitter for streams {0}/{1}'.format(i, len(buffer)), sep=' ',
-                      end='\r', flush=True)
-                coefs = np.polyfit(list(range(len(ts_array))), ts_array, 1)
-                smoothed_ts_array = np.array([i * coefs[0] + coefs[1] for i in range(len(ts_array))])
-                buffer[stream_name][1] = smoothed_ts_array
+            self._remove_jitter(buffer)
 
         # reshape img, time series, time frames data
         if reshape_stream_dict is not None:
@@ -206,6 +333,293 @@ class RNStream:
         print("Stream-in completed: {0}".format(self.fn))
         return buffer
 
+    def read_range(self, stream_name, start_time, end_time):
+        """
+        read the samples of a stream whose timestamps fall in [start_time, end_time], only the chunks that overlap the
+        time range are read from the file. The chunk index is loaded from the index sidecar, or built by scanning the
+        chunk headers if the file has no index
+
+        :param stream_name: name of the stream to read
+        :param start_time: inclusive start timestamp
+        :param end_time: inclusive end timestamp
+        :return: [data, timestamps], data's time axis is the last
+        """
+        # start time must be smaller than end time
+        if start_time > end_time:
+            raise ValueError('start_time must be smaller than end_time')
+        chunk_index = self.get_chunk_index()
+        if stream_name not in chunk_index:
+            raise ValueError(f'RNStream: stream {stream_name} is not found in {self.fn}')
+        records = chunk_index[stream_name]
+        records = records[(records['last_timestamp'] >= start_time) & (records['first_timestamp'] <= end_time)]
+        with open(self.fn, "rb") as file:
+            data_array, ts_array = self._read_stream_chunks(file, stream_name, chunk_index[stream_name][0], records)
+        start_index = np.searchsorted(ts_array, start_time, side='left')
+        end_index = np.searchsorted(ts_array, end_time, side='right')
+        return [data_array[..., start_index:end_index], ts_array[start_index:end_index]]
+
+    def stream_in_memmap(self, ignore_stream=None, only_stream=None, jitter_removal=True):
+        """
+        open the file without reading the data arrays. The returned buffer has the same
+        buffer[stream_name] = [data, timestamps] layout as stream_in, but each data is a read-only ChunkedMemmapArray
+        whose chunks are views into a single memory map of the file, so pages are only read from disk when indexed.
+        The frames of compressed video streams are decoded when indexed, see EncodedFrames.
+        The timestamps are copied into regular arrays, they are needed in full for seeking anyway.
+
+        Use np.asarray on a data array to materialize it.
+        :param ignore_stream:
+        :param only_stream:
+        :param jitter_removal:
+        :return:
+        """
+        buffer = {}
+        if os.path.getsize(self.fn) == 0:
+            return buffer
+        chunk_index = self.get_chunk_index()
+        file_map = np.memmap(self.fn, dtype=np.uint8, mode='r')
+        with open(self.fn, "rb") as file:
+            for stream_name, records in chunk_index.items():
+                this_in_only_stream = (stream_name in only_stream) if only_stream else True
+                not_ignore_this_stream = (stream_name not in ignore_stream) if ignore_stream else True
+                if not (not_ignore_this_stream and this_in_only_stream):
+                    continue
+                stream_dtype, frame_shape, header_len, frame_num_bytes, codec = self._get_stream_layout(file, records[0])
+                segments, ts_segments = [], []
+                for offset, nbytes, n_samples in zip(records['offset'], records['nbytes'], records['n_samples']):
+                    offset, n_samples = int(offset), int(n_samples)
+                    if codec is None:
+                        self._check_chunk_layout(stream_name, offset, nbytes, n_samples, header_len, frame_num_bytes)
+                    else:
+                        frame_nbytes = self._read_encoded_chunk_layout(file, stream_name, offset, codec, frame_shape)
+                    if n_samples == 0:
+                        continue
+                    data_start = offset + header_len
+                    if codec is None:
+                        ts_start = data_start + n_samples * frame_num_bytes
+                        segments.append(file_map[data_start:ts_start].view(stream_dtype).reshape(frame_shape + (n_samples,)))
+                    else:
+                        data_start += len(frame_nbytes) * np.dtype(frame_nbytes_dtype).itemsize
+                        ts_start = data_start + int(np.sum(frame_nbytes))
+                        segments.append(EncodedFrames(file_map[data_start:ts_start], frame_nbytes, frame_shape))
+                    ts_segments.append(file_map[ts_start:ts_start + n_samples * np.dtype(ts_dtype).itemsize].view(ts_dtype))
+                buffer[stream_name] = [ChunkedMemmapArray(segments, stream_dtype, frame_shape),
+                                       np.concatenate(ts_segments) if len(ts_segments) else np.empty(shape=(0,))]
+        if jitter_removal:
+            self._remove_jitter(buffer)
+        return buffer
+
+    def get_chunk_index(self):
+        """
+        get the chunk index of this file. The index is read from the sidecar if there is a valid one, otherwise the
+        chunk headers are scanned to build it, which only seeks over the data arrays without reading them.
+
+        :return: dict, key is the stream name, value is a structured array of chunk_index_dtype, in file order
+        """
+        if self._chunk_index is None:
+            chunk_index = self._load_index_file()
+            self._chunk_index = chunk_index if chunk_index is not None else self._group_chunk_index(self._scan_chunk_index())
+        return self._chunk_index
+
+    @staticmethod
+    def _remove_jitter(buffer):
+        i = 1
+        for stream_name, (d_array, ts_array) in buffer.items():
+            if len(ts_array) < 2:
+                print("Ignore jitter remove for stream {0}, because it has fewer than two samples".format(stream_name))
+                continue
+            if np.std(ts_array) > 0.1:
+                warnings.warn(f"Stream {stream_name} may have a irregular sampling rate with its timestamp's std {np.std(ts_array)}. Jitter removal should not be applied to irregularly sampled streams.", RuntimeWarning)
+            print('Removing jitter for streams {0}/{1}'.format(i, len(buffer)), sep=' ',
+                  end='\r', flush=True)
+            coefs = np.polyfit(list(range(len(ts_array))), ts_array, 1)
+            smoothed_ts_array = np.array([i * coefs[0] + coefs[1] for i in range(len(ts_array))])
+            buffer[stream_name][1] = smoothed_ts_array
+
+    def _stream_in_indexed(self, chunk_index, ignore_stream=None, only_stream=None):
+        buffer = {}
+        with open(self.fn, "rb") as file:
+            for i, (stream_name, records) in enumerate(chunk_index.items()):
+                this_in_only_stream = (stream_name in only_stream) if only_stream else True
+                not_ignore_this_stream = (stream_name not in ignore_stream) if ignore_stream else True
+                if not_ignore_this_stream and this_in_only_stream:
+                    print('Streaming in progress {0}/{1} streams'.format(i + 1, len(chunk_index)), sep=' ', end='\r', flush=True)
+                    buffer[stream_name] = list(self._read_stream_chunks(file, stream_name, records[0], records))
+        return buffer
+
+    def _read_stream_chunks(self, file, stream_name, first_record, records):
+        """
+        read the given chunks of a stream into preallocated arrays. The dtype and the non-time dimensions of the
+        stream are taken from the header of its first chunk.
+        """
+        stream_dtype, frame_shape, header_len, frame_num_bytes, codec = self._get_stream_layout(file, first_record)
+
+        total_samples = int(np.sum(records['n_samples']))
+        data_array = np.empty(shape=frame_shape + (total_samples,), dtype=stream_dtype)
+        ts_array = np.empty(shape=(total_samples,), dtype=ts_dtype)
+        samples_read = 0
+        for offset, nbytes, n_samples in zip(records['offset'], records['nbytes'], records['n_samples']):
+            offset, n_samples = int(offset), int(n_samples)
+            if codec is None:
+                self._check_chunk_layout(stream_name, offset, nbytes, n_samples, header_len, frame_num_bytes)
+                file.seek(offset + header_len)
+                chunk_data = np.frombuffer(file.read(n_samples * frame_num_bytes), dtype=stream_dtype)
+                data_array[..., samples_read:samples_read + n_samples] = chunk_data.reshape(frame_shape + (n_samples,))
+            else:
+                frame_nbytes = self._read_encoded_chunk_layout(file, stream_name, offset, codec, frame_shape)
+                decode_frames(frame_nbytes, file.read(int(np.sum(frame_nbytes))), frame_shape, out=data_array[..., samples_read:samples_read + n_samples])
+            file.readinto(ts_array[samples_read:samples_read + n_samples])
+            samples_read += n_samples
+        return data_array, ts_array
+
+    def _get_stream_layout(self, file, first_record):
+        """
+        :return: dtype, shape of a single frame (all but the time dimension), chunk header length, number of bytes
+        of a single frame and the codec (None if not compressed) for the stream whose first chunk is given
+        """
+        file.seek(int(first_record['offset']))
+        _, stream_dtype, shape = self._read_chunk_header(file)
+        codec = stream_dtype if stream_dtype in video_codecs else None
+        stream_dtype = np.dtype(stream_dtype if codec is None else video_codec_dtype)
+        frame_shape = tuple(shape[:-1])
+        return stream_dtype, frame_shape, get_chunk_header_len(len(shape)), int(np.prod(frame_shape)) * stream_dtype.itemsize, codec
+
+    def _read_encoded_chunk_layout(self, file, stream_name, offset, codec, frame_shape):
+        """
+        read the header of a compressed chunk and the byte lengths of its encoded frames, the file is left at the start
+        of the encoded frames
+        """
+        file.seek(offset)
+        _, chunk_codec, shape = self._read_chunk_header(file)
+        if chunk_codec != codec or tuple(shape[:-1]) != frame_shape:
+            raise Exception(f'RNStream: stream {stream_name} changed its shape or codec at byte {offset}, '
+                            f'it cannot be read as a single array')
+        return self._read_frame_nbytes(file, chunk_codec, shape)
+
+    @staticmethod
+    def _read_frame_nbytes(file, stream_dtype, shape):
+        """
+        :return: the byte lengths of the encoded frames of a compressed chunk whose header was just read, None if the
+        chunk is not compressed
+        """
+        if stream_dtype not in video_codecs:
+            return None
+        return np.frombuffer(file.read(shape[-1] * np.dtype(frame_nbytes_dtype).itemsize), dtype=frame_nbytes_dtype)
+
+    @staticmethod
+    def _get_data_num_bytes(stream_dtype, shape, frame_nbytes):
+        """
+        :return: the number of bytes of a chunk's data array after its header, or, if compressed, after the byte
+        lengths of its frames
+        """
+        if frame_nbytes is not None:
+            return int(np.sum(frame_nbytes))
+        return int(np.prod(shape)) * np.dtype(stream_dtype).itemsize
+
+    @staticmethod
+    def _decode_data_array(read_bytes, stream_dtype, shape, frame_nbytes):
+        """
+        :return: the data array of a chunk and its dtype, decoded if the chunk is compressed
+        """
+        if frame_nbytes is not None:
+            return decode_frames(frame_nbytes, read_bytes, shape[:-1]), video_codec_dtype
+        return np.reshape(np.frombuffer(read_bytes, dtype=stream_dtype), newshape=shape), stream_dtype
+
+    @staticmethod
+    def _check_chunk_layout(stream_name, offset, nbytes, n_samples, header_len, frame_num_bytes):
+        if int(nbytes) != header_len + n_samples * (frame_num_bytes + np.dtype(ts_dtype).itemsize):
+            raise Exception(f'RNStream: stream {stream_name} changed its shape or dtype at byte {offset}, '
+                            f'it cannot be read as a single array')
+
+    @staticmethod
+    def _read_chunk_header(file):
+        """
+        read the header of the chunk starting at the current position of the file
+        :return: stream name, dtype string and shape of the chunk, None if the end of the file is reached
+        """
+        read_bytes = file.read(len(magic))
+        if len(read_bytes) == 0:
+            return None
+        try:
+            assert read_bytes == magic
+        except AssertionError:
+            raise Exception('Data invalid, magic sequence not found')
+        stream_name = str(file.read(max_label_len), encoding).strip(' ')
+        stream_dtype = str(file.read(max_dtype_len), encoding).strip(' ')
+        dims = int.from_bytes(file.read(dim_bytes_len), 'little')
+        shape = [int.from_bytes(file.read(shape_bytes_len), 'little') for _ in range(dims)]
+        return stream_name, stream_dtype, shape
+
+    def _scan_chunk_index(self):
+        """
+        build the chunk index of a file by reading only the chunk headers and the first and last timestamp of each chunk
+        """
+        records = []
+        ts_itemsize = np.dtype(ts_dtype).itemsize
+        with open(self.fn, "rb") as file:
+            while True:
+                chunk_offset = file.tell()
+                header = self._read_chunk_header(file)
+                if header is None:
+                    break
+                stream_name, stream_dtype, shape = header
+                data_array_num_bytes = self._get_data_num_bytes(stream_dtype, shape, self._read_frame_nbytes(file, stream_dtype, shape))
+                n_samples = shape[-1]
+                file.seek(data_array_num_bytes, os.SEEK_CUR)
+                first_timestamp, last_timestamp = np.nan, np.nan
+                if n_samples > 0:
+                    first_timestamp = last_timestamp = np.frombuffer(file.read(ts_itemsize), dtype=ts_dtype)[0]
+                if n_samples > 1:
+                    file.seek((n_samples - 2) * ts_itemsize, os.SEEK_CUR)
+                    last_timestamp = np.frombuffer(file.read(ts_itemsize), dtype=ts_dtype)[0]
+                chunk_bytes = file.tell() - chunk_offset
+                records.append((bytes(stream_name, encoding), chunk_offset, chunk_bytes, n_samples, first_timestamp, last_timestamp))
+        return np.array(records, dtype=chunk_index_dtype)
+
+    @staticmethod
+    def _group_chunk_index(records):
+        stream_labels = [str(label, encoding).strip(' ') for label in records['stream_label']]
+        return {stream_name: records[[label == stream_name for label in stream_labels]] for stream_name in dict.fromkeys(stream_labels)}
+
+    def _load_index_file(self):
+        """
+        :return: the grouped chunk index from the sidecar, None if there is no sidecar or it does not match the .dats
+        """
+        if not os.path.exists(self.index_fn):
+            return None
+        with open(self.index_fn, "rb") as index_file:
+            header = index_file.read(len(index_magic) + index_version_bytes_len)
+            records_bytes = index_file.read()
+        # a record partially written when the recording crashed is ignored
+        records = np.frombuffer(records_bytes[:len(records_bytes) // chunk_index_dtype.itemsize * chunk_index_dtype.itemsize], dtype=chunk_index_dtype)
+        if header[:len(index_magic)] != index_magic or int.from_bytes(header[len(index_magic):], 'little') != index_version:
+            warnings.warn(f'RNStream: ignoring {self.index_fn}, it is not a version {index_version} index file', UserWarning)
+            return None
+        indexed_bytes = int(np.max(records['offset'] + records['nbytes'])) if len(records) else 0
+        if indexed_bytes != os.path.getsize(self.fn):
+            warnings.warn(f'RNStream: ignoring {self.index_fn}, it does not cover {self.fn}', UserWarning)
+            return None
+        return self._group_chunk_index(records)
+
+    def _write_index_file(self, records):
+        if os.path.exists(self.index_fn):
+            os.remove(self.index_fn)
+        self._append_index_file(records)
+
+    def _append_index_file(self, records):
+        if self._index_out_file is not None:
+            self._write_index_records(self._index_out_file, records)
+            self._index_out_file.flush()
+        else:
+            with open(self.index_fn, "ab") as index_file:
+                self._write_index_records(index_file, records)
+        self._chunk_index = None
+
+    @staticmethod
+    def _write_index_records(index_file, records):
+        if index_file.tell() == 0:
+            index_file.write(index_magic + index_version.to_bytes(index_version_bytes_len, endianness))
+        index_file.write(records.tobytes())
+
     def stream_in_stepwise(self, file, buffer, read_bytes_count, ignore_stream=None, only_stream=None, jitter_removal=True, reshape_stream_dict=None):
         total_bytes = float(os.path.getsize(self.fn))  # use floats to avoid scalar type overflow
         buffer = {} if buffer is None else buffer
@@ -244,7 +658,8 @@ class RNStream:
                 read_bytes_count += len(read_bytes)
                 shape.append(int.from_bytes(read_bytes, 'little'))
 
-            data_array_num_bytes = np.prod(shape) * np.dtype(stream_dytpe).itemsize
+            frame_nbytes = self._read_frame_nbytes(file, stream_dytpe, shape)
+            data_array_num_bytes = self._get_data_num_bytes(stream_dytpe, shape, frame_nbytes)
             timestamp_array_num_bytes = shape[-1] * np.dtype(ts_dtype).itemsize
 
             this_in_only_stream = (stream_name in only_stream) if only_stream else True
@@ -253,8 +668,7 @@ class RNStream:
                 # read data array
                 read_bytes = file.read(data_array_num_bytes)
                 read_bytes_count += len(read_bytes)
-                data_array = np.frombuffer(read_bytes, dtype=stream_dytpe)
-                data_array = np.reshape(data_array, newshape=shape)
+                data_array, stream_dytpe = self._decode_data_array(read_bytes, stream_dytpe, shape, frame_nbytes)
                 # read timestamp array
                 read_bytes = file.read(timestamp_array_num_bytes)
                 ts_array = np.frombuffer(read_bytes, dtype=ts_dtype)
@@ -356,7 +770,7 @@ class RNStream:
                     read_bytes_count += len(read_bytes)
                     shape.append(int.from_bytes(read_bytes, 'little'))
 
-                data_array_num_bytes = np.prod(shape) * np.dtype(stream_dytpe).itemsize
+                data_array_num_bytes = self._get_data_num_bytes(stream_dytpe, shape, self._read_frame_nbytes(file, stream_dytpe, shape))
                 timestamp_array_num_bytes = shape[-1] * np.dtype(ts_dtype).itemsize
 
                 file.read(data_array_num_bytes + timestamp_array_num_bytes)
@@ -376,7 +790,7 @@ class RNStream:
         print('Load video stream...')
         data_fn = self.fn.split('/')[-1]
         data_root = Path(self.fn).parent.absolute()
-        data = self.stream_in(only_stream=(video_stream_name,))
+        data = self.stream_in_memmap(only_stream=(video_stream_name,))  # frames are read from disk one at a time as they are written
 
         video_frame_stream = data[video_stream_name][0]
         frame_count = video_frame_stream.shape[-1]
@@ -401,3 +815,145 @@ class RNStream:
             out.write(img)
 
         out.release()
+
+
+class ChunkedMemmapArray:
+    """
+    Read-only array over the chunks of a stream in a .dats file, returned by RNStream.stream_in_memmap.
+
+    Each chunk is a view into a memory map of the file, so nothing is read until the array is indexed. Like the arrays
+    from stream_in, the time axis is the last. Indexing a single time point, or a range of time points that lies in one
+    chunk, returns a view of the memory map without copying. Ranges and index arrays spanning several chunks are
+    gathered into a new array. np.asarray(array) materializes the whole stream.
+
+    The chunks of compressed video streams are EncodedFrames instead of views, indexing them decodes the frames.
+    """
+    def __init__(self, segments, dtype, frame_shape):
+        self.segments = segments
+        self.dtype = np.dtype(dtype)
+        self.frame_shape = tuple(frame_shape)
+        self._segment_starts = np.cumsum([0] + [segment.shape[-1] for segment in segments])
+        self.shape = self.frame_shape + (int(self._segment_starts[-1]),)
+        self.ndim = len(self.shape)
+        self.size = int(np.prod(self.shape))
+        self.nbytes = self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f'ChunkedMemmapArray(shape={self.shape}, dtype={self.dtype}, chunks={len(self.segments)})'
+
+    def __array__(self, dtype=None, copy=None):
+        array = np.empty(self.shape, dtype=self.dtype)
+        for segment, start in zip(self.segments, self._segment_starts):
+            array[..., start:start + segment.shape[-1]] = segment
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self  # read-only, nothing to copy
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        ellipsis_index = next((i for i, k in enumerate(key) if k is Ellipsis), None)
+        if ellipsis_index is not None:
+            key = key[:ellipsis_index] + (slice(None),) * (self.ndim - len(key) + 1) + key[ellipsis_index + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        frame_key, time_key = key[:-1], key[-1]
+        if len(key) != self.ndim or not all(isinstance(k, (int, np.integer, slice)) for k in frame_key):
+            return np.asarray(self)[key]  # new axes and advanced indexing on the frame axes are not mapped to chunks
+
+        if isinstance(time_key, (int, np.integer)):
+            time_index = int(time_key) + (self.shape[-1] if time_key < 0 else 0)
+            if not 0 <= time_index < self.shape[-1]:
+                raise IndexError(f'index {time_key} is out of bounds for the time axis with size {self.shape[-1]}')
+            segment_index = np.searchsorted(self._segment_starts, time_index, side='right') - 1
+            return self.segments[segment_index][frame_key + (time_index - self._segment_starts[segment_index],)]
+        if isinstance(time_key, slice):
+            start, stop, step = time_key.indices(self.shape[-1])
+            if step == 1 and stop > start:
+                first_segment, last_segment = np.searchsorted(self._segment_starts, [start, stop - 1], side='right') - 1
+                if first_segment == last_segment:
+                    segment_start = self._segment_starts[first_segment]
+                    return self.segments[first_segment][frame_key + (slice(start - segment_start, stop - segment_start),)]
+            time_indices = np.arange(start, stop, step)
+        else:
+            time_indices = np.arange(self.shape[-1])[time_key]  # integer arrays and boolean masks
+            if time_indices.ndim != 1:
+                return np.asarray(self)[key]
+        return self._gather(frame_key, time_indices)
+
+    def _gather(self, frame_key, time_indices):
+        frame_result_shape = np.empty(self.frame_shape + (0,), dtype=self.dtype)[frame_key + (slice(None),)].shape[:-1]
+        array = np.empty(frame_result_shape + (len(time_indices),), dtype=self.dtype)
+        if len(time_indices) == 0:
+            return array
+        segment_indices = np.searchsorted(self._segment_starts, time_indices, side='right') - 1
+        order = np.argsort(segment_indices, kind='stable')
+        for positions in np.split(order, np.flatnonzero(np.diff(segment_indices[order])) + 1):
+            segment_index = segment_indices[positions[0]]
+            local_indices = time_indices[positions] - self._segment_starts[segment_index]
+            array[..., positions] = self.segments[segment_index][frame_key + (local_indices,)]
+        return array
+
+    def reshape(self, *shape):
+        """
+        reshape the frame dimensions, the time axis must stay the last, for example array.reshape((-1, n_timepoints))
+        """
+        shape = tuple(shape[0]) if len(shape) == 1 and isinstance(shape[0], (tuple, list)) else shape
+        if shape[-1] != self.shape[-1]:
+            raise ValueError(f'ChunkedMemmapArray can only be reshaped with its time axis ({self.shape[-1]}) kept last')
+        frame_shape = np.empty(self.frame_shape, dtype=np.uint8).reshape(shape[:-1]).shape
+        return ChunkedMemmapArray([segment.reshape(frame_shape + (segment.shape[-1],)) for segment in self.segments],
+                                  self.dtype, frame_shape)
+
+
+class EncodedFrames:
+    """
+    Read-only array over the encoded frames of a compressed video chunk, a segment of the ChunkedMemmapArray of a
+    compressed stream. The frames are decoded when indexed, only those indexed are decoded.
+    """
+    def __init__(self, encoded_frames, frame_nbytes, frame_shape, decoded_frame_shape=None):
+        """
+        :param encoded_frames: the encoded frames concatenated, e.g., a slice of the memory map of the file
+        :param frame_nbytes: the byte length of every encoded frame
+        :param decoded_frame_shape: the shape of a frame as encoded, if the frames have been reshaped since
+        """
+        self.encoded_frames = encoded_frames
+        self.frame_nbytes = frame_nbytes
+        self.frame_ends = np.cumsum(frame_nbytes, dtype=np.int64)
+        self.frame_shape = tuple(frame_shape)
+        self.decoded_frame_shape = self.frame_shape if decoded_frame_shape is None else tuple(decoded_frame_shape)
+        self.dtype = np.dtype(video_codec_dtype)
+        self.shape = self.frame_shape + (len(frame_nbytes),)
+        self.ndim = len(self.shape)
+
+    def _decode(self, time_index):
+        start = self.frame_ends[time_index] - int(self.frame_nbytes[time_index])
+        return decode_frame(self.encoded_frames[start:self.frame_ends[time_index]], self.decoded_frame_shape).reshape(self.frame_shape)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[..., :]
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if any(k is Ellipsis for k in key):
+            ellipsis_index = next(i for i, k in enumerate(key) if k is Ellipsis)
+            key = key[:ellipsis_index] + (slice(None),) * (self.ndim - len(key) + 1) + key[ellipsis_index + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        frame_key, time_key = key[:-1], key[-1]
+        if isinstance(time_key, (int, np.integer)):
+            return self._decode(int(time_key) + (self.shape[-1] if time_key < 0 else 0))[frame_key]
+        time_indices = np.arange(self.shape[-1])[time_key]
+        array = np.empty(self.frame_shape + (len(time_indices),), dtype=self.dtype)
+        for i, time_index in enumerate(time_indices):
+            array[..., i] = self._decode(time_index)
+        return array[frame_key + (slice(None),)]
+
+    def reshape(self, *shape):
+        shape = tuple(shape[0]) if len(shape) == 1 and isinstance(shape[0], (tuple, list)) else shape
+        return EncodedFrames(self.encoded_frames, self.frame_nbytes, shape[:-1], self.decoded_frame_shape)
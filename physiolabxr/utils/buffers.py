@@ -75,10 +75,99 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+class SlidingWindowBuffer:
+    """
+    Preallocated storage of a single stream, appended to along its last (time) axis.
+
+    The buffered samples are exposed as views (data[..., start:end] and timestamps[start:end]) of one preallocated
+    array, so reading them never copies. Appending writes after the end of the current window. When the array runs
+    out of room, the samples that are kept are moved into a new array with twice the room they need, so appending
+    is amortized O(1) per sample regardless of the buffer size. Samples are never overwritten once they are exposed,
+    so views returned earlier stay valid after later appends.
+    """
+    def __init__(self, frame_shape, dtype, max_size=None, initial_capacity=0):
+        """
+        :param frame_shape: shape of a single sample, i.e., all but the time dimension
+        :param dtype: dtype of the data, appended frames are cast to it
+        :param max_size: number of latest samples to keep, None keeps every sample
+        :param initial_capacity: number of samples to preallocate room for
+        """
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.max_size = max_size
+        self._data = np.empty(shape=self.frame_shape + (initial_capacity,), dtype=self.dtype)
+        self._timestamps = np.empty(shape=(initial_capacity,))
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def data(self):
+        return self._data[..., self.start:self.end]
+
+    @property
+    def timestamps(self):
+        return self._timestamps[self.start:self.end]
+
+    def append(self, frames, timestamps):
+        n_new = frames.shape[-1]
+        if self.max_size is not None and n_new > self.max_size:
+            frames, timestamps, n_new = frames[..., -self.max_size:], timestamps[-self.max_size:], self.max_size
+        if self.end + n_new > self._data.shape[-1]:
+            self._reallocate(n_new)
+        self._data[..., self.end:self.end + n_new] = frames
+        self._timestamps[self.end:self.end + n_new] = timestamps
+        self.end += n_new
+        if self.max_size is not None and len(self) > self.max_size:
+            self.start = self.end - self.max_size
+
+    def _reallocate(self, n_new):
+        n_keep = len(self) if self.max_size is None else min(len(self), self.max_size - n_new)
+        capacity = 2 * max(n_keep + n_new, self.max_size or 0, 1)
+        data = np.empty(shape=self.frame_shape + (capacity,), dtype=self.dtype)
+        timestamps = np.empty(shape=(capacity,))
+        data[..., :n_keep] = self._data[..., self.end - n_keep:self.end]
+        timestamps[:n_keep] = self._timestamps[self.end - n_keep:self.end]
+        self._data, self._timestamps = data, timestamps
+        self.start, self.end = 0, n_keep
+
+    def set_max_size(self, max_size):
+        self.max_size = max_size
+        if max_size is not None and len(self) > max_size:
+            self.start = self.end - max_size
+
+    def discard(self, n):
+        """
+        discard the n oldest samples
+        """
+        self.start += min(n, len(self))
+
+    def clear(self):
+        self.start = self.end
+
+    def reset(self):
+        """
+        empty the buffer and append from the start of its storage again. Unlike clear, the views returned earlier are
+        overwritten by later appends, use it when they are no longer needed
+        """
+        self.start = self.end = 0
+
+
 class DataBuffer():
+    """
+    Buffers the data of multiple streams. The buffered data of each stream are in self.buffer[stream_name], as
+    [data, timestamps] where the time axis of data is the last.
+
+    Each stream is backed by a SlidingWindowBuffer, the arrays in self.buffer are views of it and are replaced after
+    every update. Arrays assigned to self.buffer from outside are picked up on the next update.
+    """
     def __init__(self, stream_buffer_sizes: dict = None):
         self.buffer = dict()
         self.stream_name_buffer_sizes = stream_buffer_sizes if stream_buffer_sizes else dict()
+        self._storages = dict()
+        self._exposed = dict()  # the arrays last put in self.buffer, to tell if they were replaced from outside
 
     def update_buffer(self, data_dict: dict):
         if len(data_dict) > 0:
@@ -90,39 +179,69 @@ class DataBuffer():
 
     def update_buffer_size(self, stream_name, size):
         self.stream_name_buffer_sizes[stream_name] = size
+        if stream_name in self.buffer.keys():
+            self._get_storage(stream_name).set_max_size(size)
+            self._expose(stream_name)
 
     def _update_buffer(self, stream_name, frames, timestamps):
         """
         frames: channels x time
         """
+        timestamps = np.asarray(timestamps)
         if stream_name not in self.buffer.keys():
-            self.buffer[stream_name] = [np.empty(shape=(*frames.shape[:-1], 0), dtype=frames.dtype),
-                                      np.empty(shape=(0,))]  # data first, timestamps second
+            self._storages[stream_name] = SlidingWindowBuffer(frames.shape[:-1], frames.dtype, self.stream_name_buffer_sizes.get(stream_name))
+            self._expose(stream_name)
+        storage = self._get_storage(stream_name)
 
         # check if the new frame's number of channels matches that of the buffered data
-        if frames.shape[0] != self.buffer[stream_name][0].shape[0]:
+        if frames.shape[:-1] != storage.frame_shape:
             # reset the buffer with the new frame channels
-            self.buffer[stream_name] = [np.empty(shape=(frames.shape[0], 0), dtype=frames.dtype),
-                                        np.empty(shape=(0,))]
+            storage = self._storages[stream_name] = SlidingWindowBuffer(frames.shape[:-1], frames.dtype, self.stream_name_buffer_sizes.get(stream_name))
+        elif np.result_type(storage.dtype, frames.dtype) != storage.dtype:  # promote the buffered data like concatenating would
+            storage = self._reset_storage(stream_name, storage.data, storage.timestamps, np.result_type(storage.dtype, frames.dtype))
 
-        buffered_data = self.buffer[stream_name][0]
-        buffered_timestamps = self.buffer[stream_name][1]
+        storage.append(frames, timestamps)
+        self._expose(stream_name)
 
-        self.buffer[stream_name][0] = np.concatenate([buffered_data, frames], axis=-1)
-        self.buffer[stream_name][1] = np.concatenate([buffered_timestamps, timestamps])
-
-        if stream_name in self.stream_name_buffer_sizes.keys():  # keep only the latest data according to the buffer size
-            buffer_time_points = self.buffer[stream_name][0].shape[-1]
-            cut_to = int(-np.min([buffer_time_points, self.stream_name_buffer_sizes[stream_name]]))
-            self.buffer[stream_name][0] = self.buffer[stream_name][0][:, cut_to:]
-            self.buffer[stream_name][1] = self.buffer[stream_name][1][cut_to:]
+    def _get_storage(self, stream_name):
+        """
+        get the storage of a stream, rebuilding it if the arrays in self.buffer were replaced from outside
+        """
+        storage = self._storages.get(stream_name)
+        exposed = self._exposed.get(stream_name)
+        data, timestamps = self.buffer[stream_name]
+        if storage is None or exposed is None or data is not exposed[0] or timestamps is not exposed[1]:
+            data = np.asarray(data)
+            storage = self._reset_storage(stream_name, data, np.asarray(timestamps), data.dtype)
+            self._expose(stream_name)
+        return storage
+
+    def _reset_storage(self, stream_name, data, timestamps, dtype):
+        storage = self._storages[stream_name] = SlidingWindowBuffer(data.shape[:-1], dtype, self.stream_name_buffer_sizes.get(stream_name))
+        storage.append(data, timestamps)
+        return storage
+
+    def _expose(self, stream_name):
+        storage = self._storages[stream_name]
+        data, timestamps = storage.data, storage.timestamps
+        self._exposed[stream_name] = data, timestamps
+        if stream_name in self.buffer.keys():
+            # update the list in place, so references to it see the new arrays, as they did when the arrays were concatenated
+            self.buffer[stream_name][0] = data
+            self.buffer[stream_name][1] = timestamps
+        else:
+            self.buffer[stream_name] = [data, timestamps]  # data first, timestamps second
 
     def clear_buffer(self) -> None:
         self.buffer = dict()
+        self._storages = dict()
+        self._exposed = dict()
 
     def clear_stream_buffer(self, stream_name: str) -> None:
         try:
             self.buffer.pop(stream_name)
+            self._storages.pop(stream_name, None)
+            self._exposed.pop(stream_name, None)
         except KeyError:
             warnings.warn(f'Unable to clear the buffer for stream name {stream_name}, key not found')
 
@@ -132,8 +251,8 @@ class DataBuffer():
         The data and timestamps array will instead become empty arraries
         """
         try:
-            self.buffer[stream_name][0] = np.empty([self.buffer[stream_name][0].shape[0], 0]) # event marker
-            self.buffer[stream_name][1] = np.array([]) # timestamp
+            self._get_storage(stream_name).clear()
+            self._expose(stream_name)
         except KeyError:
             warnings.warn(f'Unable to clear the buffer for stream name {stream_name}, key not found')
 
@@ -160,17 +279,16 @@ class DataBuffer():
         elif timestamp >= np.max(self.buffer[stream_name][1]):
             self.clear_stream_buffer_data(stream_name)
         else:
-            cut_to_index = np.argmax([self.buffer[stream_name][1] > timestamp])
-            self.buffer[stream_name][1] = self.buffer[stream_name][1][cut_to_index:]
-            self.buffer[stream_name][0] = self.buffer[stream_name][0][:, cut_to_index:]
+            cut_to_index = np.argmax(self.buffer[stream_name][1] > timestamp)
+            self.clear_stream_up_to_index(stream_name, cut_to_index)
 
     def clear_stream_up_to_index(self, stream_name, cut_to_index):
         if stream_name not in self.buffer.keys():
             return
         if len(self.buffer[stream_name][1]) == 0:
             return
-        self.buffer[stream_name][1] = self.buffer[stream_name][1][cut_to_index:]
-        self.buffer[stream_name][0] = self.buffer[stream_name][0][:, cut_to_index:]
+        self._get_storage(stream_name).discard(cut_to_index)
+        self._expose(stream_name)
 
     def clear_up_to(self, timestamp, ignores=()):
         """
@@ -190,9 +308,8 @@ class DataBuffer():
             elif timestamp >= np.max(self.buffer[stream_name][1]):
                 self.clear_stream_buffer_data(stream_name)
             else:
-                cut_to_index = np.argmax([self.buffer[stream_name][1] > timestamp])
-                self.buffer[stream_name][1] = self.buffer[stream_name][1][cut_to_index:]
-                self.buffer[stream_name][0] = self.buffer[stream_name][0][:, cut_to_index:]
+                cut_to_index = np.argmax(self.buffer[stream_name][1] > timestamp)
+                self.clear_stream_up_to_index(stream_name, cut_to_index)
         if skip_count == len(self.buffer):
             warnings.warn('DataBuffer: nothing is cleared, given cut-to time is smaller than smallest stream timestamp')
 
@@ -217,7 +334,7 @@ class DataBuffer():
         start_index = np.searchsorted(stream_timestamps, [start_time], side='left')[0]
         end_index = np.searchsorted(stream_timestamps, [end_time], side='right')[0]
 
-        return [stream_data[:, start_index:end_index], stream_timestamps[start_index:end_index]]
+        return [stream_data[..., start_index:end_index], stream_timestamps[start_index:end_index]]
 
     def get_stream_in_index_range(self, stream_name, start_index, end_index):
 
@@ -230,7 +347,7 @@ class DataBuffer():
         stream_data = self.buffer[stream_name][0]
         stream_timestamps = self.buffer[stream_name][1]
 
-        return [stream_data[:, start_index:end_index], stream_timestamps[start_index:end_index]]
+        return [stream_data[..., start_index:end_index], stream_timestamps[start_index:end_index]]
 
 
 
@@ -247,6 +364,7 @@ class DataBufferSingleStream():
         self.append_zeros = append_zeros
         self.samples_received = 0
         self.num_channels = num_channels
+        self._storage = None
         self.reset_buffer()
 
     def update_buffer(self, data_dict: dict):
@@ -266,24 +384,17 @@ class DataBufferSingleStream():
             print(f"DataBufferSingleStream: Channel mismatch. Expected {self.num_channels}, got {frames.shape[0]}. Maybe you need to reshape the data.")
             raise ChannelMismatchError(frames.shape[0])
 
-        self.buffer[0] = np.roll(self.buffer[0], -frames.shape[-1], axis=-1)
-        self.buffer[1] = np.roll(self.buffer[1], -frames.shape[-1])
-
-        # self.buffer[0] = np.concatenate([self.buffer[0], data_dict['frames']], axis=-1)
-        # self.buffer[1] = np.concatenate([self.buffer[1], data_dict['timestamps']])
-        self.buffer[0][:, -frames.shape[-1]:] = frames[:, -self.buffer_size:]
-        self.buffer[1][-frames.shape[-1]:] = timestamps[-self.buffer_size:]
-
-        # buffer_time_points = self.buffer[0].shape[-1]
-        # cut_to = -np.min([buffer_time_points, self.buffer_size])
-        # self.buffer[0] = self.buffer[0][:, cut_to:]
-        # self.buffer[1] = self.buffer[1][cut_to:]
+        # the storage always holds the latest buffer_size samples, the buffer are views of them
+        self._storage.append(frames, timestamps)
+        self.buffer[0] = self._storage.data
+        self.buffer[1] = self._storage.timestamps
 
         self.samples_received += frames.shape[1]
 
     def init_buffer(self, num_channels):
-        self.buffer.append(np.zeros(shape=(num_channels, self.buffer_size)))
-        self.buffer.append(np.zeros(shape=(self.buffer_size,)))  # data first, timestamps second
+        self._storage = SlidingWindowBuffer((num_channels,), np.float64, max_size=self.buffer_size)
+        self._storage.append(np.zeros(shape=(num_channels, self.buffer_size)), np.zeros(shape=(self.buffer_size,)))
+        self.buffer = [self._storage.data, self._storage.timestamps]  # data first, timestamps second
         self.samples_received = 0
 
     def reset_buffer(self):
@@ -1,5 +1,7 @@
+import threading
+
 import numpy as np
-from scipy.signal import butter, freqz, iirnotch, filtfilt
+from scipy.signal import butter, freqz, iirnotch, filtfilt, lfilter
 from enum import Enum
 
 from physiolabxr.exceptions.exceptions import UnsupportedErrorTypeError, DataProcessorEvokeFailedError, \
@@ -28,18 +30,29 @@ class DataProcessor:  # (QObject):
         self.data_processor_activated = False
         self.data_processor_valid = False
         self.channel_num = 0
+        # held while a chunk is processed on the DataProcessorPool and while the GUI thread evokes the data processor,
+        # so that a chunk never sees the parameters of the new evoke with the state of the old one, e.g., the taps
+        self._lock = threading.RLock()
 
     def process_sample(self, data):
         return data
 
     def process_buffer(self, data):
-        if self.data_processor_valid and self.data_processor_activated:
-            output_buffer = np.empty(shape=data.shape)
-            for index in range(0, data.shape[1]):
-                output_buffer[:, index] = self.process_sample(data[:, index])
-            return output_buffer
-        else:
-            return data
+        with self._lock:
+            if self.data_processor_valid and self.data_processor_activated:
+                return self.process_chunk(data)
+            else:
+                return data
+
+    def process_chunk(self, data):
+        """
+        process a (channels, samples) chunk, the state carries over to the next chunk.
+        Data processors override this with a vectorized version that gives the same result as this per-sample loop
+        """
+        output_buffer = np.empty(shape=data.shape)
+        for index in range(0, data.shape[1]):
+            output_buffer[:, index] = self.process_sample(data[:, index])
+        return output_buffer
 
     def reset_data_processor(self):
         pass
@@ -57,15 +70,16 @@ class DataProcessor:  # (QObject):
         pass
 
     def evoke_data_processor(self):
-        try:
-            self.param_check()
-            self.evoke_function()
-            self.set_data_processor_valid(True)
-            self.reset_data_processor()
-        except Exception as e:
-            self.set_data_processor_valid(False)
-            print('Data Processor Evoke Failed Error: ' + str(e))
-            raise DataProcessorEvokeFailedError(str(e))
+        with self._lock:
+            try:
+                self.param_check()
+                self.evoke_function()
+                self.set_data_processor_valid(True)
+                self.reset_data_processor()
+            except Exception as e:
+                self.set_data_processor_valid(False)
+                print('Data Processor Evoke Failed Error: ' + str(e))
+                raise DataProcessorEvokeFailedError(str(e))
 
     def set_data_processor_params(self, **params):
         pass
@@ -109,6 +123,29 @@ class IIRFilter(DataProcessor):
         data = self._y_tap[:, 0]
         return data
 
+    def process_chunk(self, data):
+        # filter the whole chunk with lfilter, the taps are turned into its initial conditions and updated from the
+        # end of the chunk, so process_sample and process_chunk can be used interchangeably
+        y, _ = lfilter(self._b, self._a, data, axis=1, zi=self.get_zi())
+        self._x_tap = np.concatenate([data[:, ::-1], self._x_tap], axis=1)[:, :self._x_tap.shape[1]]
+        self._y_tap = np.concatenate([y[:, ::-1], self._y_tap], axis=1)[:, :self._y_tap.shape[1]]
+        return y
+
+    def get_zi(self):
+        """
+        the state of lfilter's transposed direct form II given the past inputs and outputs in the taps, the vectorized
+        equivalent of scipy.signal.lfiltic for every channel
+        """
+        order = max(len(self._a), len(self._b)) - 1
+        b = np.pad(self._b, (0, order + 1 - len(self._b))) / self._a[0]
+        a = np.pad(self._a, (0, order + 1 - len(self._a))) / self._a[0]
+        x_tap = np.pad(self._x_tap, ((0, 0), (0, order + 1 - self._x_tap.shape[1])))
+        y_tap = np.pad(self._y_tap, ((0, 0), (0, order + 1 - self._y_tap.shape[1])))
+        zi = np.zeros((x_tap.shape[0], order))
+        for m in range(order):
+            zi[:, m] = x_tap[:, :order - m] @ b[m + 1:] - y_tap[:, :order - m] @ a[m + 1:]
+        return zi
+
     # def evoke_data_processor(self):
     #     try:
     #         self.evoke_function()
@@ -301,6 +338,15 @@ class RootMeanSquare(DataProcessor):
         # print(vrms)
         return data
 
+    def process_chunk(self, data):
+        # a moving sum over the squares of the buffered samples (oldest first) followed by the chunk
+        squares = np.square(np.concatenate([self._data_buffer[:, ::-1], data], axis=1))
+        cumulative_sum = np.cumsum(squares, axis=1)
+        window_sum = cumulative_sum[:, self._data_buffer_size - 1:].copy()
+        window_sum[:, 1:] -= cumulative_sum[:, :-self._data_buffer_size]
+        self._data_buffer = np.concatenate([data[:, ::-1], self._data_buffer], axis=1)[:, :self._data_buffer_size]
+        return np.sqrt(np.maximum(window_sum[:, 1:], 0) / self._data_buffer_size)
+
     def reset_data_processor(self):
         self._data_buffer.fill(0)
 
@@ -327,6 +373,17 @@ class ClutterRemoval(DataProcessor):
         data = data - self._clutter
         return data
 
+    def process_chunk(self, data):
+        # the clutter is an exponential moving average, i.e., a first order IIR filter
+        if data.shape[1] == 0:
+            return np.empty(shape=data.shape)
+        if self._clutter is None:
+            self._clutter = data[:, 0]  # so that the first clutter is the first sample
+        clutter, _ = lfilter([1 - self.signal_clutter_ratio], [1, -self.signal_clutter_ratio], data, axis=1,
+                             zi=self.signal_clutter_ratio * self._clutter[:, np.newaxis])
+        self._clutter = clutter[:, -1]
+        return data - clutter
+
     def reset_data_processor(self):
         self._clutter = None
 
@@ -30,3 +30,40 @@ def rotate_image(image, rotation_clockwise_degree: int=0):
         return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
 
 
+
+
+class FramePreprocessor:
+    """
+    Scales a video frame, reorders its channels to RGB, flips it vertically and swaps its width and height in one
+    pass per operation into preallocated arrays. The result is what process_image, np.flip(image, axis=0) and
+    np.swapaxes(image, 0, 1) give, but C contiguous, so the (width, height, channels) frame the video widgets plot,
+    record and send to scripts is reshaped without a copy.
+
+    Flipping vertically then swapping the axes is a clockwise rotation, cv2.rotate does it.
+    """
+    def __init__(self):
+        self._scaled = None  # the scaled frame, reused while the frame size and scale stay the same
+
+    @staticmethod
+    def get_output_shape(frame_shape, scale: float=1.0):
+        height, width = frame_shape[:2]
+        return (max(1, int(width * scale)), max(1, int(height * scale))) + tuple(frame_shape[2:])
+
+    def process(self, frame, rgb_channel_order: VideoDeviceChannelOrder=None, scale: float=1.0, out=None):
+        """
+        :param frame: (height, width, channels)
+        :param out: the (width, height, channels) array to write the result to, of get_output_shape, allocated if None
+        :return: out
+        """
+        frame = numpy.asarray(frame, dtype=numpy.uint8)
+        output_shape = self.get_output_shape(frame.shape, scale)
+        if out is None:
+            out = numpy.empty(output_shape, dtype=numpy.uint8)
+        if output_shape[:2] != frame.shape[1::-1]:
+            if self._scaled is None or self._scaled.shape[:2] != output_shape[1::-1] or self._scaled.shape[2:] != frame.shape[2:]:
+                self._scaled = numpy.empty(output_shape[1::-1] + tuple(frame.shape[2:]), dtype=numpy.uint8)
+            frame = cv2.resize(frame, output_shape[:2], dst=self._scaled, interpolation=cv2.INTER_NEAREST)
+        cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE, dst=out)
+        if rgb_channel_order == VideoDeviceChannelOrder.BGR:
+            cv2.cvtColor(out, cv2.COLOR_BGR2RGB, dst=out)
+        return out
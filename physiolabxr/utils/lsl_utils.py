@@ -1,5 +1,7 @@
 import warnings
 
+import numpy as np
+
 try:
     from pylsl import StreamInfo, StreamOutlet
 except:
@@ -14,6 +16,21 @@ def create_lsl_outlet(stream_name: str, n_channels, srate, data_type):
     return outlet
 
 
+def push_lsl_chunk(outlet, data, timestamps):
+    """
+    push a chunk keeping the timestamp of every sample
+    @param data: n_channels x n_samples
+    """
+    # LSL doesn't seem to handle numpy arrays properly as providing data in numpy arrays leads to falsified data being
+    # sent. therefore the data are converted to lists
+    data = np.transpose(data).tolist()
+    try:
+        outlet.push_chunk(data, timestamps.tolist())  # pylsl 1.16 and later take one timestamp per sample
+    except TypeError:
+        for sample, timestamp in zip(data, timestamps):
+            outlet.push_sample(sample, timestamp)
+
+
 def get_available_lsl_streams(wait_time=.1):
     available_streams = [x.name() for x in lsl_continuous_resolver.results()] + [x.type() for x in lsl_continuous_resolver.results()]
     return [x for x in available_streams]
\ No newline at end of file
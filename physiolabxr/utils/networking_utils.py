@@ -1,10 +1,11 @@
+import json
 import multiprocessing
 import socket
 
 import numpy as np
 import zmq
 
-from physiolabxr.configs.shared import DATA_BUFFER_PREFIX
+from physiolabxr.configs.shared import DATA_BUFFER_PREFIX, SHARED_MEMORY_PREFIX
 from physiolabxr.utils.RNStream import max_dtype_len
 from physiolabxr.utils.buffers import flatten
 
@@ -60,8 +61,23 @@ def get_dtype_bypes(dtype):
     return bytes(dtype_str + "".join(" " for x in range(max_dtype_len - len(dtype_str))), 'utf-8')
 
 
-def recv_data_dict(socket_interface):
+def send_shared_memory_info(ring_infos: dict, socket_interface):
+    """
+    tell the receiver how far the shared memory rings of the streams are written, the counterpart of send_data_dict
+    when the data are in shared memory
+    @param ring_infos: dict of stream name to SharedMemoryRing.get_info
+    """
+    socket_interface.socket.send_multipart([SHARED_MEMORY_PREFIX, json.dumps(ring_infos).encode('utf-8')])
+
+
+def recv_data_dict(socket_interface, shared_memory_reader=None):
+    """
+    receive the data sent by send_data_dict, or read those announced by send_shared_memory_info
+    @param shared_memory_reader: SharedMemoryRingReader that keeps the rings open between calls
+    """
     data_dict = socket_interface.socket.recv_multipart()[1:]  # remove the routing ID
+    if data_dict[0] == SHARED_MEMORY_PREFIX:
+        return shared_memory_reader.read(json.loads(data_dict[1].decode('utf-8')))
     assert data_dict[0] == DATA_BUFFER_PREFIX
     if len(data_dict) == 1:
         return {}
@@ -78,6 +94,32 @@ def recv_data_dict(socket_interface):
         return rtn
 
 
+def send_zmq_samples(socket, stream_name, timestamps, data, flags=0):
+    """
+    send samples to a ZMQ data stream as one multi-sample frame: [stream name, timestamps, samples].
+    The timestamps are float64, the samples are sent sample-major, i.e., the bytes of an n_samples x n_channels array.
+    A frame with one sample is the same as the single-sample frames [stream name, timestamp, sample].
+    @param data: n_channels x n_samples, the time axis last as in the rest of the app
+    """
+    socket.send_multipart([bytes(stream_name, "utf-8"),
+                           np.ascontiguousarray(timestamps, dtype=np.float64),
+                           np.ascontiguousarray(np.reshape(data, (-1, len(timestamps))).T)], flags=flags)
+
+
+def decode_zmq_samples(timestamp_frame, data_frame, dtype):
+    """
+    decode the timestamps and data frames of a ZMQ data frame, see send_zmq_samples.
+    A four-byte timestamp frame is a single float32 timestamp, otherwise the frame holds one float64 per sample.
+    @return: timestamps, n_channels x n_samples data
+    """
+    if memoryview(timestamp_frame).nbytes == 4:
+        timestamps = np.frombuffer(timestamp_frame, dtype=np.float32).astype(np.float64)
+    else:
+        timestamps = np.frombuffer(timestamp_frame, dtype=np.float64)
+    data = np.frombuffer(data_frame, dtype=dtype).reshape((len(timestamps), -1)).T
+    return timestamps, data
+
+
 def find_available_ports(start_port, num_ports=100):
     """
     Find a range of available ports.
@@ -0,0 +1,136 @@
+import uuid
+import warnings
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedMemoryRing:
+    """
+    A ring of frames and their timestamps in shared memory, with a single writer process and a single reader process.
+
+    The block holds the number of frames written so far (an int64 that only grows), the float64 timestamps and the
+    frames, time axis last as in the rest of the app. The writer writes the frames before updating the count, and tells
+    the reader the count over a socket (see networking_utils.send_shared_memory_info), so the frames are not sent
+    through the socket. The reader reads the frames between the count it has read up to and the count it is told,
+    the frames are views of the shared memory unless they wrap around the end of the ring.
+
+    The writer can overwrite frames the reader has not read if it writes more than capacity frames between two reads.
+    The reader then gets the most recent frames only and a warning.
+    """
+    def __init__(self, frame_shape, dtype, capacity, name=None):
+        """
+        :param frame_shape: shape of a frame, e.g., (n_channels,)
+        :param capacity: the number of frames the ring holds
+        :param name: name of an existing ring to open, a new one is created if None
+        """
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+
+        timestamps_offset = 8
+        data_offset = timestamps_offset + 8 * capacity
+        size = data_offset + int(np.prod(self.frame_shape)) * self.dtype.itemsize * capacity
+        self.is_owner = name is None
+        if self.is_owner:
+            self.shared_memory = shared_memory.SharedMemory(name=f'physiolabxr_{uuid.uuid4().hex[:16]}', create=True, size=size)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+        self.name = self.shared_memory.name
+        self._write_count = np.ndarray((1,), dtype=np.int64, buffer=self.shared_memory.buf)
+        self.timestamps = np.ndarray((capacity,), dtype=np.float64, buffer=self.shared_memory.buf, offset=timestamps_offset)
+        self.data = np.ndarray(self.frame_shape + (capacity,), dtype=self.dtype, buffer=self.shared_memory.buf, offset=data_offset)
+        if self.is_owner:
+            self._write_count[0] = 0
+
+    @classmethod
+    def open(cls, info):
+        """
+        open the ring described by get_info, in the reader process
+        """
+        return cls(info['frame_shape'], info['dtype'], info['capacity'], name=info['name'])
+
+    def get_info(self):
+        return {'name': self.name, 'frame_shape': self.frame_shape, 'dtype': str(self.dtype), 'capacity': self.capacity,
+                'write_count': self.write_count}
+
+    @property
+    def write_count(self):
+        return int(self._write_count[0])
+
+    def write(self, frames, timestamps):
+        """
+        :param frames: frame_shape + (n,)
+        """
+        n = len(timestamps)
+        if n > self.capacity:  # only the most recent frames fit
+            frames, timestamps = frames[..., -self.capacity:], timestamps[-self.capacity:]
+            self._write_count[0] += n - self.capacity
+            n = self.capacity
+        start = self.write_count % self.capacity
+        n_before_wrap = min(n, self.capacity - start)
+        self.data[..., start:start + n_before_wrap] = frames[..., :n_before_wrap]
+        self.timestamps[start:start + n_before_wrap] = timestamps[:n_before_wrap]
+        self.data[..., :n - n_before_wrap] = frames[..., n_before_wrap:]
+        self.timestamps[:n - n_before_wrap] = timestamps[n_before_wrap:]
+        self._write_count[0] += n  # the frames are visible to the reader once they are written
+
+    def read(self, start_count, end_count):
+        """
+        the frames written from the start_count-th to the end_count-th
+        :return: frames, timestamps
+        """
+        oldest_count = self.write_count - self.capacity
+        if start_count < oldest_count:
+            warnings.warn(f'SharedMemoryRing: {min(oldest_count, end_count) - start_count} frames were overwritten before they were read, '
+                          f'the reader is too slow for a ring of {self.capacity} frames')
+            start_count = min(oldest_count, end_count)
+        start, end = start_count % self.capacity, end_count % self.capacity
+        if end_count - start_count == 0:
+            return self.data[..., :0], self.timestamps[:0]
+        if start < end:
+            return self.data[..., start:end], self.timestamps[start:end]
+        return (np.concatenate([self.data[..., start:], self.data[..., :end]], axis=-1),
+                np.concatenate([self.timestamps[start:], self.timestamps[:end]]))
+
+    def close(self):
+        # the arrays must not outlive the mapping
+        del self._write_count, self.timestamps, self.data
+        self.shared_memory.close()
+        if self.is_owner:
+            try:
+                self.shared_memory.unlink()
+            except FileNotFoundError:  # already removed, e.g., by the resource tracker of the reader process
+                pass
+
+
+class SharedMemoryRingReader:
+    """
+    The reader side of the shared memory input of a script, keeps the rings it has opened and how far each is read
+    """
+    def __init__(self):
+        self.rings = {}  # stream name -> SharedMemoryRing
+        self.read_counts = {}
+
+    def read(self, ring_infos):
+        """
+        :param ring_infos: dict of stream name to the info of its ring, see SharedMemoryRing.get_info
+        :return: dict of stream name to (frames, timestamps) written since the last read
+        """
+        data_dict = {}
+        for stream_name, info in ring_infos.items():
+            ring = self.rings.get(stream_name)
+            if ring is None or ring.name != info['name']:  # a new ring, e.g., the writer changed the frame shape
+                if ring is not None:
+                    ring.close()
+                ring = self.rings[stream_name] = SharedMemoryRing.open(info)
+                self.read_counts[stream_name] = 0
+            if info['write_count'] > self.read_counts[stream_name]:
+                data_dict[stream_name] = ring.read(self.read_counts[stream_name], info['write_count'])
+                self.read_counts[stream_name] = info['write_count']
+        return data_dict
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
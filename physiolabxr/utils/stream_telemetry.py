@@ -0,0 +1,251 @@
+import json
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from physiolabxr.utils.Singleton import Singleton
+from physiolabxr.utils.time_utils import get_clock_time
+
+
+class StreamHealth:
+    """
+    The health of a stream, updated incrementally with the timestamps of every chunk the stream receives, see update.
+
+    Gaps are intervals between consecutive timestamps longer than gap_tolerance sample periods of the nominal sampling
+    rate, the samples that would fill a gap are counted as dropped. Streams with no nominal sampling rate, i.e., 0, are
+    not checked for gaps. A sample whose timestamp is before the one of the sample before it is out of order.
+
+    The latency of a stage, e.g., 'receive', 'display' or 'disk', is the clock time at the stage minus the timestamp of
+    the last sample that reached it. It is only meaningful when the source timestamps its samples with the same clock,
+    see get_clock_time, as LSL outlets and ZMQ frames timestamped on arrival do.
+    """
+    def __init__(self, nominal_sampling_rate=0., rate_window=5., gap_tolerance=2., n_latencies=256):
+        """
+        :param rate_window: in seconds, the effective sampling rate is the number of samples received in this window
+        :param n_latencies: the number of recent latencies of a stage its mean and max are computed over
+        """
+        self.nominal_sampling_rate = nominal_sampling_rate
+        self.rate_window = rate_window
+        self.gap_tolerance = gap_tolerance
+        self.n_latencies = n_latencies
+
+        self.sample_count = 0
+        self.chunk_count = 0
+        self.gap_count = 0
+        self.dropped_sample_count = 0
+        self.out_of_order_count = 0
+        self.max_gap = 0.
+        self.last_timestamp = None
+        self.first_arrival_time = None
+        self.last_arrival_time = None
+        self.latencies = {}  # stage -> the recent latencies
+
+        self._recent_chunks = deque()  # (arrival time, n_samples) of the chunks in the rate window
+        self._n_recent_samples = 0
+
+    def update(self, timestamps, arrival_time=None):
+        """
+        :param timestamps: of the samples of a chunk
+        :param arrival_time: the clock time the chunk is received, now if None
+        """
+        if len(timestamps) == 0:
+            return
+        arrival_time = get_clock_time() if arrival_time is None else arrival_time
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        intervals = np.diff(timestamps, prepend=timestamps[0] if self.last_timestamp is None else self.last_timestamp)
+        self.out_of_order_count += int(np.count_nonzero(intervals < 0))
+        if self.nominal_sampling_rate > 0:
+            gaps = intervals[intervals > self.gap_tolerance / self.nominal_sampling_rate]
+            if len(gaps) > 0:
+                self.gap_count += len(gaps)
+                self.dropped_sample_count += int(np.sum(np.round(gaps * self.nominal_sampling_rate) - 1))
+                self.max_gap = max(self.max_gap, float(np.max(gaps)))
+        self.last_timestamp = timestamps[-1]
+        self.sample_count += len(timestamps)
+        self.chunk_count += 1
+
+        if self.first_arrival_time is None:
+            self.first_arrival_time = arrival_time
+        self.last_arrival_time = arrival_time
+        self._recent_chunks.append((arrival_time, len(timestamps)))
+        self._n_recent_samples += len(timestamps)
+        self._evict_chunks(arrival_time)
+        self.record_latency('receive', arrival_time - timestamps[-1])
+
+    def record_latency(self, stage, latency):
+        if stage not in self.latencies:
+            self.latencies[stage] = deque(maxlen=self.n_latencies)
+        self.latencies[stage].append(latency)
+
+    def _evict_chunks(self, now):
+        while len(self._recent_chunks) > 0 and self._recent_chunks[0][0] < now - self.rate_window:
+            self._n_recent_samples -= self._recent_chunks.popleft()[1]
+
+    def get_effective_sampling_rate(self, now=None):
+        """
+        @return: the samples received per second in the rate window before now, or since the first chunk if it is
+        more recent
+        """
+        if self.first_arrival_time is None:
+            return 0.
+        now = get_clock_time() if now is None else now
+        self._evict_chunks(now)
+        span = min(self.rate_window, now - self.first_arrival_time)
+        return self._n_recent_samples / span if span > 0 else 0.
+
+    def get_metrics(self, now=None):
+        """
+        @return: dict with
+            sample_count, chunk_count: received since the stream is tracked
+            effective_sampling_rate, nominal_sampling_rate: in Hz
+            gap_count, dropped_sample_count, max_gap: the gaps between the timestamps, max_gap in seconds
+            out_of_order_count: the samples timestamped before the sample before them
+            seconds_since_last_chunk: None if no chunk is received
+            latency: dict of stage to the last, mean and max of its recent latencies, in seconds
+        """
+        now = get_clock_time() if now is None else now
+        latency = {}
+        for stage, latencies in self.latencies.items():
+            latencies = np.array(latencies)
+            latency[stage] = {'last': float(latencies[-1]), 'mean': float(np.mean(latencies)), 'max': float(np.max(latencies))}
+        return {'sample_count': self.sample_count,
+                'chunk_count': self.chunk_count,
+                'effective_sampling_rate': self.get_effective_sampling_rate(now),
+                'nominal_sampling_rate': float(self.nominal_sampling_rate),
+                'gap_count': self.gap_count,
+                'dropped_sample_count': self.dropped_sample_count,
+                'max_gap': self.max_gap,
+                'out_of_order_count': self.out_of_order_count,
+                'seconds_since_last_chunk': None if self.last_arrival_time is None else now - self.last_arrival_time,
+                'latency': latency}
+
+
+# name, type, help and key in StreamHealth.get_metrics of the metrics exposed to Prometheus
+prometheus_metrics = [('physiolabxr_stream_samples_total', 'counter', 'samples received', 'sample_count'),
+                      ('physiolabxr_stream_chunks_total', 'counter', 'chunks received', 'chunk_count'),
+                      ('physiolabxr_stream_gaps_total', 'counter', 'gaps between the timestamps longer than the gap tolerance', 'gap_count'),
+                      ('physiolabxr_stream_dropped_samples_total', 'counter', 'samples missing from the gaps at the nominal sampling rate', 'dropped_sample_count'),
+                      ('physiolabxr_stream_out_of_order_samples_total', 'counter', 'samples timestamped before the sample before them', 'out_of_order_count'),
+                      ('physiolabxr_stream_max_gap_seconds', 'gauge', 'the longest gap between the timestamps', 'max_gap'),
+                      ('physiolabxr_stream_effective_sampling_rate_hertz', 'gauge', 'samples received per second', 'effective_sampling_rate'),
+                      ('physiolabxr_stream_nominal_sampling_rate_hertz', 'gauge', 'the nominal sampling rate of the stream', 'nominal_sampling_rate'),
+                      ('physiolabxr_stream_seconds_since_last_chunk', 'gauge', 'seconds since the last chunk was received', 'seconds_since_last_chunk')]
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class StreamTelemetry(metaclass=Singleton):
+    """
+    The health of every stream of the app, see StreamHealth. The stream widgets update it with the data their workers
+    emit, the recording writer with the latency to disk. The metrics can be pulled over HTTP, see TelemetryServer.
+
+    All methods are thread-safe.
+    """
+    def __init__(self, rate_window=5., gap_tolerance=2.):
+        self.rate_window = rate_window
+        self.gap_tolerance = gap_tolerance
+        self.streams = {}  # stream name -> StreamHealth
+        self._lock = threading.Lock()
+
+    def _get_stream(self, stream_name, nominal_sampling_rate=None):
+        if stream_name not in self.streams:
+            self.streams[stream_name] = StreamHealth(nominal_sampling_rate or 0., self.rate_window, self.gap_tolerance)
+        elif nominal_sampling_rate is not None:
+            self.streams[stream_name].nominal_sampling_rate = nominal_sampling_rate
+        return self.streams[stream_name]
+
+    def update(self, stream_name, timestamps, nominal_sampling_rate=None, arrival_time=None):
+        """
+        :param nominal_sampling_rate: of the stream, the last one given is kept if None
+        """
+        with self._lock:
+            self._get_stream(stream_name, nominal_sampling_rate).update(timestamps, arrival_time)
+
+    def record_latency(self, stream_name, stage, latency):
+        with self._lock:
+            self._get_stream(stream_name).record_latency(stage, latency)
+
+    def reset(self, stream_name):
+        """
+        forget the health of a stream, e.g., when it is restarted, so the time it was stopped is not a gap
+        """
+        with self._lock:
+            self.streams.pop(stream_name, None)
+
+    def get_metrics(self, stream_name=None):
+        """
+        @return: dict of stream name to its metrics, see StreamHealth.get_metrics, or the metrics of stream_name if it
+        is given, None if it is not tracked
+        """
+        now = get_clock_time()
+        with self._lock:
+            if stream_name is not None:
+                return self.streams[stream_name].get_metrics(now) if stream_name in self.streams else None
+            return {name: health.get_metrics(now) for name, health in self.streams.items()}
+
+    def get_prometheus_text(self):
+        """
+        @return: the metrics of every stream in the Prometheus text exposition format
+        """
+        metrics = self.get_metrics()
+        lines = []
+        for name, metric_type, help_text, key in prometheus_metrics:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+            lines += [f'{name}{{stream="{_escape_label(stream_name)}"}} {stream_metrics[key]}'
+                      for stream_name, stream_metrics in metrics.items() if stream_metrics[key] is not None]
+        lines += ['# HELP physiolabxr_stream_latency_seconds clock time at a stage minus the timestamp of the last sample that reached it',
+                  '# TYPE physiolabxr_stream_latency_seconds gauge']
+        for stream_name, stream_metrics in metrics.items():
+            for stage, stats in stream_metrics['latency'].items():
+                lines += [f'physiolabxr_stream_latency_seconds{{stream="{_escape_label(stream_name)}",stage="{stage}",stat="{stat}"}} {value}'
+                          for stat, value in stats.items()]
+        return '\n'.join(lines) + '\n'
+
+
+class _TelemetryRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = self.server.telemetry.get_prometheus_text(), 'text/plain; version=0.0.4'
+        elif self.path in ('/', '/metrics.json'):
+            body, content_type = json.dumps(self.server.telemetry.get_metrics()), 'application/json'
+        else:
+            self.send_error(404, 'the telemetry is at /metrics (Prometheus) and /metrics.json')
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # a scraper would print a line every few seconds
+
+
+class TelemetryServer(threading.Thread):
+    """
+    Serves the StreamTelemetry over HTTP on localhost, for monitoring and alarming on long sessions:
+        * /metrics: in the Prometheus text format, to be scraped by Prometheus
+        * /metrics.json or /: the metrics of every stream as json, see StreamTelemetry.get_metrics
+    """
+    def __init__(self, port=0, telemetry=None):
+        """
+        :param port: 0 for a free port, which is then in self.port
+        """
+        super().__init__(daemon=True)
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), _TelemetryRequestHandler)
+        self.server.daemon_threads = True
+        self.server.telemetry = StreamTelemetry() if telemetry is None else telemetry
+        self.port = self.server.server_address[1]
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.join()
@@ -0,0 +1,192 @@
+import numpy as np
+from scipy import signal
+
+from physiolabxr.utils.buffers import SlidingWindowBuffer
+
+
+class LinechartDecimator:
+    """
+    Reduces the channels of a line chart to a few points per bucket of samples, so a window of samples is drawn with
+    about as many points as the plot has pixels, no matter its duration and sampling rate.
+
+    The buckets are aligned to the count of samples given to update, so a bucket never changes once it is full. The
+    reduced full buckets are kept, update only reduces the new samples. get reduces the partial buckets at the two ends
+    of the window from the window itself, so what is drawn is the same as reducing the whole window.
+
+    The methods are
+        * 'minmax': the min and max of every bucket, which keeps the peaks of the signal
+        * 'mean': the mean of every bucket
+    """
+    methods = ('minmax', 'mean')
+
+    def __init__(self, n_channels, bucket_size, method='minmax', max_window_size=None):
+        """
+        :param bucket_size: the number of samples reduced to a point, or a min max pair of points
+        :param max_window_size: the number of samples of the largest window given to get, the buckets before it are dropped
+        """
+        assert method in self.methods, f'LinechartDecimator: unknown method {method}, must be one of {self.methods}'
+        self.n_channels = n_channels
+        self.bucket_size = bucket_size
+        self.method = method
+        self.n_samples = 0  # the samples given to update so far
+        self._partial_bucket = np.empty((n_channels, 0))
+        max_n_buckets = None if max_window_size is None else max_window_size // bucket_size + 2
+        self._buckets = SlidingWindowBuffer((n_channels, 2 if method == 'minmax' else 1), np.float64, max_size=max_n_buckets)  # timestamps are the first sample of each bucket
+
+    def _reduce(self, samples):
+        """
+        :param samples: (n_channels, n_buckets, bucket_size)
+        :return: (n_channels, points per bucket, n_buckets)
+        """
+        if self.method == 'minmax':
+            return np.stack([np.min(samples, axis=2), np.max(samples, axis=2)], axis=1)
+        return np.mean(samples, axis=2)[:, None, :]
+
+    def update(self, new_samples):
+        """
+        :param new_samples: (n_channels, n_new_samples), the samples that came after those given before
+        """
+        samples = np.concatenate([self._partial_bucket, new_samples], axis=1) if self._partial_bucket.shape[1] > 0 else new_samples
+        first_bucket_start = self.n_samples - self._partial_bucket.shape[1]
+        n_buckets = samples.shape[1] // self.bucket_size
+        if n_buckets > 0:
+            self._buckets.append(self._reduce(samples[:, :n_buckets * self.bucket_size].reshape(self.n_channels, n_buckets, self.bucket_size)),
+                                 first_bucket_start + np.arange(n_buckets) * self.bucket_size)
+        self._partial_bucket = np.array(samples[:, n_buckets * self.bucket_size:], dtype=np.float64)
+        self.n_samples += new_samples.shape[1]
+
+    def get(self, window, channel_indices=None):
+        """
+        :param window: (channels, window_size), the latest window_size samples given to update. Only the samples of
+            the partial buckets at its ends are read
+        :param channel_indices: the channels of window given to update, all of them if None
+        :return: the points as sample indices from the start of the window, shared by the channels, and their values,
+            (n_channels, n_points)
+        """
+        window_size = window.shape[1]
+        window_start = self.n_samples - window_size
+        full_buckets_start = -(-window_start // self.bucket_size) * self.bucket_size  # the first bucket start in the window
+        full_buckets_end = max(self.n_samples // self.bucket_size * self.bucket_size, full_buckets_start)
+
+        indices, values = [], []
+        for i, (start, end) in enumerate(((window_start, min(full_buckets_start, self.n_samples)), (full_buckets_start, full_buckets_end), (full_buckets_end, self.n_samples))):
+            if end <= start:
+                continue
+            if i == 1:  # the full buckets are kept
+                first, last = np.searchsorted(self._buckets.timestamps, [start, end])
+                indices.append(self._buckets.timestamps[first:last] + (self.bucket_size - 1) / 2)
+                values.append(self._buckets.data[..., first:last])
+            else:  # a partial bucket at an end of the window
+                samples = window[:, start - window_start:end - window_start] if channel_indices is None else window[channel_indices, start - window_start:end - window_start]
+                indices.append(np.array([(start + end - 1) / 2]))
+                values.append(self._reduce(samples[:, None, :]))
+        if len(indices) == 0:
+            return np.empty(0), np.empty((self.n_channels, 0))
+        indices = np.concatenate(indices) - window_start
+        values = np.concatenate(values, axis=-1)  # (n_channels, points per bucket, n_buckets)
+        if self.method == 'minmax':  # min then max at the center of each bucket
+            indices = np.repeat(indices, 2)
+        return indices, values.transpose(0, 2, 1).reshape(self.n_channels, -1)
+
+
+class StreamingSpectrogram:
+    """
+    The spectrogram of a window that slides over a stream, the same as scipy.signal.spectrogram with a hann window,
+    scaling='spectrum' and no detrend, averaged across channels.
+
+    The segments are aligned to the count of samples given to update, so a column of the spectrogram never changes once
+    its segment is complete. update only transforms the segments the new samples complete, the columns of the segments
+    before the largest window are dropped.
+
+    The levels of the image are percentiles of the power of every channel, as estimated from a histogram of the log
+    power. The histogram of every column is added to a running total when the column is computed, a window's histogram
+    is the total minus what it was before the window's first column.
+    """
+    level_log_range = (-30, 30)  # the decades of power the histogram covers, the power outside is counted in the end bins
+
+    def __init__(self, n_channels, sampling_rate, nperseg, noverlap, max_window_size, level_bins_per_decade=20):
+        """
+        :param max_window_size: the number of samples of the largest window given to get, the columns before it are dropped
+        :param level_bins_per_decade: the resolution of the level estimates
+        """
+        assert 0 <= noverlap < nperseg, f'StreamingSpectrogram: noverlap must be less than nperseg, got {noverlap} and {nperseg}'
+        self.n_channels = n_channels
+        self.sampling_rate = sampling_rate
+        self.nperseg = nperseg
+        self.noverlap = noverlap
+        self.hop = nperseg - noverlap
+        self.max_window_size = max_window_size
+        self.n_samples = 0  # the samples given to update so far
+        self.frequencies = np.fft.rfftfreq(nperseg, 1 / sampling_rate)
+
+        window = signal.get_window('hann', nperseg)
+        self._window = window
+        self._scale = np.full(len(self.frequencies), 1 / window.sum() ** 2)  # the one-sided spectrum doubles all but DC and Nyquist
+        self._scale[1:-1 if nperseg % 2 == 0 else None] *= 2
+
+        self._pending_samples = np.empty((n_channels, 0))  # from the start of the next segment
+        max_n_columns = max_window_size // self.hop + 2
+        self._columns = SlidingWindowBuffer((len(self.frequencies),), np.float64, max_size=max_n_columns)  # timestamps are the first sample of each segment
+
+        self.level_bins_per_decade = level_bins_per_decade
+        self._n_level_bins = (self.level_log_range[1] - self.level_log_range[0]) * level_bins_per_decade
+        self._level_histogram_total = np.zeros(self._n_level_bins, dtype=np.int64)
+        self._level_histograms_before = SlidingWindowBuffer((self._n_level_bins,), np.int64, max_size=max_n_columns)  # the total before each column
+
+    def update(self, new_samples):
+        """
+        :param new_samples: (n_channels, n_new_samples), the samples that came after those given before
+        """
+        samples = np.concatenate([self._pending_samples, new_samples], axis=1) if self._pending_samples.shape[1] > 0 else new_samples
+        first_segment_start = self.n_samples - self._pending_samples.shape[1]
+        self.n_samples += new_samples.shape[1]
+        n_segments = (samples.shape[1] - self.nperseg) // self.hop + 1 if samples.shape[1] >= self.nperseg else 0
+        if n_segments > 0:
+            segments = np.lib.stride_tricks.sliding_window_view(samples, self.nperseg, axis=1)[:, :n_segments * self.hop:self.hop]  # (n_channels, n_segments, nperseg)
+            power = np.abs(np.fft.rfft(segments * self._window, axis=-1)) ** 2 * self._scale  # (n_channels, n_segments, n_frequencies)
+            segment_starts = first_segment_start + np.arange(n_segments) * self.hop
+            self._columns.append(np.mean(power, axis=0).T, segment_starts)
+            self._update_level_histogram(power, segment_starts)
+        self._pending_samples = np.array(samples[:, n_segments * self.hop:], dtype=np.float64)
+
+    def _update_level_histogram(self, power, segment_starts):
+        n_segments = power.shape[1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bins = np.floor((np.log10(power) - self.level_log_range[0]) * self.level_bins_per_decade)
+        bins = np.clip(np.nan_to_num(bins, nan=-1, neginf=0), -1, self._n_level_bins - 1).astype(np.int64).transpose(1, 0, 2).reshape(n_segments, -1)
+        bins = np.where(bins < 0, n_segments * self._n_level_bins, bins + np.arange(n_segments)[:, None] * self._n_level_bins)  # nan goes past the last bin
+        histograms = np.bincount(bins.ravel(), minlength=n_segments * self._n_level_bins + 1)[:-1].reshape(n_segments, self._n_level_bins)
+        totals_before = self._level_histogram_total + np.cumsum(histograms, axis=0) - histograms
+        self._level_histogram_total = totals_before[-1] + histograms[-1]
+        self._level_histograms_before.append(totals_before.T, segment_starts)
+
+    def _get_first_column(self, window_size):
+        return np.searchsorted(self._columns.timestamps, self.n_samples - window_size)
+
+    def get(self, window_size):
+        """
+        :param window_size: the number of latest samples the spectrogram covers, up to max_window_size
+        :return: the start of the first segment in samples from the start of the window, and the spectrogram
+            (n_frequencies, n_segments) of the segments in the window
+        """
+        first = self._get_first_column(window_size)
+        columns = self._columns.data[:, first:]
+        if columns.shape[1] == 0:
+            return 0, columns
+        return int(self._columns.timestamps[first] - (self.n_samples - window_size)), columns
+
+    def get_levels(self, window_size, percentile_min, percentile_max):
+        """
+        :return: the percentiles of the power of every channel in the segments of the window, within a bin of the
+            histogram of the log power. None if there is no segment in the window
+        """
+        first = self._get_first_column(window_size)
+        if first == len(self._columns.timestamps):
+            return None
+        histogram = self._level_histogram_total - self._level_histograms_before.data[:, first]
+        cumulative = np.cumsum(histogram)
+        if cumulative[-1] == 0:
+            return None
+        ranks = np.array([percentile_min, percentile_max]) / 100 * (cumulative[-1] - 1)
+        bins = np.searchsorted(cumulative, ranks, side='right')
+        return list(10 ** (self.level_log_range[0] + (bins + 0.5) / self.level_bins_per_decade))
@@ -1,4 +1,4 @@
-import struct
+import ast
 import warnings
 import xml.etree.ElementTree as ET
 from enum import Enum
@@ -7,6 +7,7 @@ import numpy as np
 import pyxdf
 
 from physiolabxr.presets.presets_utils import get_stream_data_type, get_stream_nominal_sampling_rate
+from physiolabxr.utils.RNStream import ChunkedMemmapArray
 
 
 def create_xml_string(child_dict: dict):
@@ -34,7 +35,83 @@ class XdfTag(Enum):
 
 
 
+def get_num_length_bytes(n):
+    """
+    the number of bytes xdf uses to encode the length n, either 1, 4 or 8
+    """
+    return 1 if (n.bit_length() + 7) // 8 <= 1 else 4 if (n.bit_length() + 7) // 8 <= 4 else 8
+
+
+def get_samples_chunk_dtype(sample_dtype, num_samples):
+    """
+    the structured dtype of a Samples chunk holding num_samples samples, from the chunk length to the last sample.
+    Each sample is the timestamp byte length (always 8), the timestamp and the values of all the channels.
+
+    @param sample_dtype: the dtype of one sample, see get_sample_dtype
+    """
+    num_sample_bytes = get_num_length_bytes(num_samples)
+    content_tag_byte_len = 2 + 4 + 1 + num_sample_bytes + num_samples * sample_dtype.itemsize  # 2 for tag, 4 for stream id, 1 for NumSampleBytes
+    num_chunk_byte_len = get_num_length_bytes(content_tag_byte_len)
+    return np.dtype([('num_chunk_byte_len', 'u1'),
+                     ('content_tag_byte_len', f'<u{num_chunk_byte_len}'),
+                     ('tag', '<u2'),
+                     ('stream_id', '<u4'),
+                     ('num_sample_bytes', 'u1'),
+                     ('num_samples', f'<u{num_sample_bytes}'),
+                     ('samples', sample_dtype, (num_samples,))]), content_tag_byte_len
+
+
+def get_sample_dtype(stream_data_type, nchannels):
+    return np.dtype([('timestamp_bytes', 'u1'), ('timestamp', '<f8'), ('values', np.dtype(stream_data_type).newbyteorder('<'), (nchannels,))])
+
+
+def write_samples_chunks(out_file, data_array, ts_array, stream_id, sample_chunk_max_size=50, write_buffer_size=2 ** 20):
+    """
+    write the samples of a stream as Samples chunks of sample_chunk_max_size samples.
+
+    Consecutive chunks are encoded together in one structured array of about write_buffer_size bytes and written with
+    one call, so the memory used does not depend on the length of the stream. data_array only needs to support slicing
+    along its last (time) axis, so the lazy arrays from RNStream.stream_in_memmap are read a few chunks at a time.
+
+    @param data_array: the samples, time axis last
+    @param ts_array: one dimensional timestamps
+    """
+    total_samples = len(ts_array)
+    nchannels = int(np.prod(data_array.shape[:-1]))
+    sample_dtype = get_sample_dtype(data_array.dtype, nchannels)
+    chunk_dtype, content_tag_byte_len = get_samples_chunk_dtype(sample_dtype, sample_chunk_max_size)
+    chunks_per_write = max(1, write_buffer_size // chunk_dtype.itemsize)
+
+    samples_stored = 0
+    chunk_size = sample_chunk_max_size
+    while samples_stored < total_samples:
+        n_chunks = min(chunks_per_write, (total_samples - samples_stored) // chunk_size)
+        if n_chunks == 0:  # the last chunk holds the remaining samples
+            chunk_size = total_samples - samples_stored
+            chunk_dtype, content_tag_byte_len = get_samples_chunk_dtype(sample_dtype, chunk_size)
+            n_chunks = 1
+        num_samples = n_chunks * chunk_size
+        chunks = np.empty(n_chunks, dtype=chunk_dtype)
+        chunks['num_chunk_byte_len'] = chunk_dtype['content_tag_byte_len'].itemsize
+        chunks['content_tag_byte_len'] = content_tag_byte_len
+        chunks['tag'] = XdfTag.Samples.value
+        chunks['stream_id'] = stream_id
+        chunks['num_sample_bytes'] = chunk_dtype['num_samples'].itemsize
+        chunks['num_samples'] = chunk_size
+        samples = chunks['samples']  # n_chunks x chunk_size, not contiguous as the chunk headers are in between
+        samples['timestamp_bytes'] = 8
+        samples['timestamp'] = np.reshape(ts_array[samples_stored:samples_stored + num_samples], (n_chunks, chunk_size))
+        values = np.reshape(data_array[..., samples_stored:samples_stored + num_samples], (nchannels, num_samples))
+        samples['values'] = values.T.reshape(n_chunks, chunk_size, nchannels)
+        out_file.write(chunks)
+        samples_stored += num_samples
+
+
 def save_xdf(file_path, buffer, sample_chunk_max_size=50):
+    """
+    @param buffer: dict of stream name to [data, timestamps], the data can be the lazy arrays from
+    RNStream.stream_in_memmap, they are read a few chunks at a time
+    """
     file_header_info = {'name': 'Test', 'user': 'ixi'}
     file_header = create_xml_string(file_header_info)
     stream_headers = {}
@@ -73,9 +150,8 @@ def save_xdf(file_path, buffer, sample_chunk_max_size=50):
     out_file = open(file_path, "ab")
     # write magic
     out_file.write(magic)
-    NumLenByte_decoder = lambda bytes: 1 if (bytes.bit_length() + 7) // 8 <= 1 else 4 if (bytes.bit_length() + 7) // 8 <= 4 else 8
     file_header_len = len(file_header) + 2
-    file_header_len_bytes = NumLenByte_decoder(file_header_len)
+    file_header_len_bytes = get_num_length_bytes(file_header_len)
     file_header = file_header_len_bytes.to_bytes(1, byteorder='little') + file_header_len.to_bytes(
         file_header_len_bytes, byteorder='little') + XdfTag.FileHeader.value.to_bytes(2, byteorder='little') + file_header.encode('utf-8')
     # write file header
@@ -84,7 +160,7 @@ def save_xdf(file_path, buffer, sample_chunk_max_size=50):
     for stream_label, _ in buffer.items():
         stream_header_len = len(stream_headers[stream_label]) + 2 + 4
 
-        stream_header_len_bytes = NumLenByte_decoder(stream_header_len)
+        stream_header_len_bytes = get_num_length_bytes(stream_header_len)
 
         stream_header = stream_header_len_bytes.to_bytes(1, byteorder='little') + \
                         stream_header_len.to_bytes(stream_header_len_bytes, byteorder='little') + \
@@ -97,11 +173,10 @@ def save_xdf(file_path, buffer, sample_chunk_max_size=50):
     # write stream data
     for stream_label, (data_array, ts_array) in buffer.items():
 
-        # cast the arrays in
-        if type(data_array) != np.ndarray:
+        # cast the arrays in, arrays that are not ndarray but sliceable like one (e.g., from stream_in_memmap) are kept lazy
+        if not hasattr(data_array, 'shape'):
             data_array = np.array(data_array)
-        if type(ts_array) != np.ndarray:
-            ts_array = np.array(ts_array)
+        ts_array = np.asarray(ts_array)
 
         try:
             assert len(ts_array.shape) == 1
@@ -109,43 +184,17 @@ def save_xdf(file_path, buffer, sample_chunk_max_size=50):
             raise Exception('timestamps must have exactly one dimension.')
 
         try:
-            assert all(i < j for i, j in zip(ts_array, ts_array[1:]))
+            assert np.all(ts_array[1:] > ts_array[:-1])
         except AssertionError:
             warnings.warn(f'Stream: [{stream_label}] timestamps must be in increasing order.', UserWarning)
 
-        total_samples = len(ts_array)
-        stream_id = stream_footers[stream_label]['stream_id']
-        nchannels = np.prod(data_array.shape[:-1])  # the number of channels in the stream, the last dimension is the sample/time dimension
-
-        stream_data_type = data_array.dtype
-        n_sample_chunks = total_samples // 50 + 1
-        samples_stored = 0
-        for i in range(n_sample_chunks):
-            num_samples = total_samples - samples_stored if i == n_sample_chunks - 1 else sample_chunk_max_size
-            num_sample_bytes = NumLenByte_decoder(num_samples)  # compute the total sample chunk length
-            samples_byte_len = 9 * num_samples + nchannels * num_samples * stream_data_type.itemsize
-            content_tag_byte_len = int(2 + 4 + 1 + num_sample_bytes + samples_byte_len)  # the length of the content plus tag in bytes, 2 for tag, 4 for stream id, 1 for NumSampleBytes
-            num_chunk_byte_len = NumLenByte_decoder(content_tag_byte_len)  # the byte length of the total chunk
-            stream_content_head = num_chunk_byte_len.to_bytes(1, byteorder='little') + \
-                                  content_tag_byte_len.to_bytes(num_chunk_byte_len, byteorder='little') + \
-                                  XdfTag.Samples.value.to_bytes(2, byteorder='little') + \
-                                  stream_id.to_bytes(4, byteorder='little') + \
-                                  num_sample_bytes.to_bytes(1, byteorder='little') + \
-                                  num_samples.to_bytes(num_sample_bytes, byteorder='little')
-            out_file.write(stream_content_head)
-            for j in range(num_samples):
-                timestampbytes = int(8).to_bytes(1, byteorder='little')
-                timestamp = struct.pack('<d', ts_array[i * sample_chunk_max_size + j])  # timestamp is a double
-                values = data_array[..., i * sample_chunk_max_size + j].tobytes()
-
-                out_file.write(timestampbytes + timestamp + values)
-            samples_stored += num_samples
+        write_samples_chunks(out_file, data_array, ts_array, stream_footers[stream_label]['stream_id'], sample_chunk_max_size)
 
     # write stream footers
     for stream_label, _ in buffer.items():
         footer = create_xml_string(stream_footers[stream_label])
         stream_footer_len = len(footer) + 2 + 4
-        stream_footer_len_bytes = NumLenByte_decoder(stream_footer_len)
+        stream_footer_len_bytes = get_num_length_bytes(stream_footer_len)
         stream_footer = stream_footer_len_bytes.to_bytes(1, byteorder='little') + \
                         stream_footer_len.to_bytes(stream_footer_len_bytes, byteorder='little') + \
                         XdfTag.StreamFooter.value.to_bytes(2, byteorder='little') + \
@@ -169,5 +218,65 @@ def load_xdf(filename):
     return dats_data
 
 
-
-
+xdf_channel_formats = {'float32': 'float32', 'double64': 'float64', 'int8': 'int8', 'int16': 'int16', 'int32': 'int32', 'int64': 'int64'}
+
+
+def load_xdf_lazy(filename):
+    """
+    open an xdf without reading the samples, the counterpart of RNStream.stream_in_memmap for xdf.
+
+    Returns the same {stream_name: [data, timestamps]} as load_xdf, but each data is a ChunkedMemmapArray whose chunks
+    are views of the Samples chunks in a memory map of the file, so samples are only read from disk when indexed.
+    The timestamps are read into memory. They are the timestamps as recorded: unlike pyxdf, no clock synchronization
+    or dejittering is applied.
+
+    Raises ValueError if a stream has string samples or samples without timestamps, which do not have a fixed size
+    and cannot be mapped. load_xdf can load those files.
+    """
+    file_map = np.memmap(filename, dtype=np.uint8, mode='r')
+    if bytes(file_map[:4]) != b'XDF:':
+        raise ValueError(f'{filename} is not an xdf file')
+    headers, footers, samples_chunks = {}, {}, {}
+    position = 4
+    while position < len(file_map):
+        num_length_bytes = int(file_map[position])
+        chunk_length = int.from_bytes(bytes(file_map[position + 1:position + 1 + num_length_bytes]), 'little')
+        content_start = position + 1 + num_length_bytes
+        tag = int.from_bytes(bytes(file_map[content_start:content_start + 2]), 'little')
+        content_end = content_start + chunk_length
+        if content_end > len(file_map):
+            warnings.warn(f'load_xdf_lazy: ignoring the truncated chunk at the end of {filename}')
+            break
+        if tag in (XdfTag.StreamHeader.value, XdfTag.StreamFooter.value, XdfTag.Samples.value):
+            stream_id = int.from_bytes(bytes(file_map[content_start + 2:content_start + 6]), 'little')
+            if tag == XdfTag.Samples.value:
+                num_sample_bytes = int(file_map[content_start + 6])
+                num_samples = int.from_bytes(bytes(file_map[content_start + 7:content_start + 7 + num_sample_bytes]), 'little')
+                samples_chunks.setdefault(stream_id, []).append((content_start + 7 + num_sample_bytes, content_end, num_samples))
+            else:
+                info = ET.fromstring(bytes(file_map[content_start + 6:content_end]).decode('utf-8'))
+                (headers if tag == XdfTag.StreamHeader.value else footers)[stream_id] = {child.tag: child.text for child in info}
+        position = content_end
+
+    buffer = {}
+    for stream_id, header in headers.items():
+        footer = footers.get(stream_id, {})
+        if header['channel_format'] not in xdf_channel_formats:
+            raise ValueError(f'load_xdf_lazy: stream {header["name"]} has {header["channel_format"]} samples, which cannot be mapped')
+        stream_dtype = np.dtype(footer.get('real_data_type', xdf_channel_formats[header['channel_format']]))
+        nchannels = int(header['channel_count'])
+        frame_shape = tuple(ast.literal_eval(footer['frame_dimension'])[:-1]) if 'frame_dimension' in footer else (nchannels,)
+        sample_dtype = get_sample_dtype(stream_dtype, nchannels)
+
+        segments, ts_segments = [], []
+        for samples_start, samples_end, num_samples in samples_chunks.get(stream_id, []):
+            if samples_end - samples_start != num_samples * sample_dtype.itemsize:
+                raise ValueError(f'load_xdf_lazy: stream {header["name"]} has samples without timestamps, which cannot be mapped')
+            if num_samples == 0:
+                continue
+            samples = np.ndarray(shape=(num_samples,), dtype=sample_dtype, buffer=file_map, offset=samples_start)
+            segments.append(samples['values'].T.reshape(frame_shape + (num_samples,)))
+            ts_segments.append(samples['timestamp'])
+        buffer[footer.get('stream_name', header['name'])] = [ChunkedMemmapArray(segments, stream_dtype, frame_shape),
+                                                            np.concatenate(ts_segments) if len(ts_segments) else np.empty(shape=(0,))]
+    return buffer
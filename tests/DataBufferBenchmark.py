@@ -0,0 +1,69 @@
+"""
+Micro-benchmark of DataBuffer.update_buffer. The update cost of the preallocated buffer should not depend on the buffer
+length, while concatenating the whole buffer on every update grows linearly with it.
+
+Run with pytest -s to see the results.
+"""
+import time
+
+import numpy as np
+
+from physiolabxr.utils.buffers import DataBuffer, DataBufferSingleStream
+
+
+def concatenate_update(buffer, buffer_size, frames, timestamps):
+    """
+    the update DataBuffer did before it was backed by SlidingWindowBuffer
+    """
+    buffer[0] = np.concatenate([buffer[0], frames], axis=-1)[:, -buffer_size:]
+    buffer[1] = np.concatenate([buffer[1], timestamps])[-buffer_size:]
+
+
+def roll_update(buffer, frames, timestamps):
+    """
+    the update DataBufferSingleStream did before it was backed by SlidingWindowBuffer
+    """
+    buffer[0] = np.roll(buffer[0], -frames.shape[-1], axis=-1)
+    buffer[1] = np.roll(buffer[1], -frames.shape[-1])
+    buffer[0][:, -frames.shape[-1]:] = frames
+    buffer[1][-frames.shape[-1]:] = timestamps
+
+
+def time_updates(update, n_updates):
+    start_time = time.perf_counter()
+    for _ in range(n_updates):
+        update()
+    return (time.perf_counter() - start_time) / n_updates
+
+
+def test_update_cost_is_independent_of_buffer_length():
+    n_channels = 128
+    chunk_size = 20  # 2 kHz stream pulled every 10 ms
+    n_baseline_updates = 50
+    buffer_lengths = [2 ** 12, 2 ** 14, 2 ** 16, 2 ** 18]
+    frames = np.random.random((n_channels, chunk_size))
+    timestamps = np.arange(chunk_size, dtype=float)
+
+    results = {}
+    for buffer_length in buffer_lengths:
+        data_buffer = DataBuffer(stream_buffer_sizes={'EEG': buffer_length})
+        data_buffer.update_buffers({'EEG': (np.random.random((n_channels, buffer_length)), np.arange(buffer_length, dtype=float))})
+        single_stream_buffer = DataBufferSingleStream(num_channels=n_channels, buffer_sizes=buffer_length)
+        concatenated = [np.random.random((n_channels, buffer_length)), np.arange(buffer_length, dtype=float)]
+        rolled = [np.random.random((n_channels, buffer_length)), np.arange(buffer_length, dtype=float)]
+
+        n_updates = 2 * buffer_length // chunk_size  # long enough for the preallocated buffers to reallocate, so the cost is amortized
+        results[buffer_length] = (
+            time_updates(lambda: data_buffer.update_buffers({'EEG': (frames, timestamps)}), n_updates),
+            time_updates(lambda: concatenate_update(concatenated, buffer_length, frames, timestamps), n_baseline_updates),
+            time_updates(lambda: single_stream_buffer.update_buffer({'frames': frames, 'timestamps': timestamps}), n_updates),
+            time_updates(lambda: roll_update(rolled, frames, timestamps), n_baseline_updates))
+
+    print(f"\nupdate time per {n_channels} x {chunk_size} chunk (us)")
+    print(f"{'buffer length':>14}{'DataBuffer':>14}{'concatenate':>14}{'SingleStream':>14}{'np.roll':>14}")
+    for buffer_length, times in results.items():
+        print(f"{buffer_length:>14}" + ''.join(f"{t * 1e6:>14.1f}" for t in times))
+
+    # at the largest buffer the preallocated buffers should be far cheaper than copying the whole buffer
+    assert results[buffer_lengths[-1]][0] < results[buffer_lengths[-1]][1]
+    assert results[buffer_lengths[-1]][2] < results[buffer_lengths[-1]][3]
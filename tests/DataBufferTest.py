@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from physiolabxr.utils.buffers import DataBuffer, DataBufferSingleStream
+
+
+def concatenate_reference(chunks, buffer_size=None):
+    """
+    what DataBuffer held when it concatenated the chunks and sliced them to the buffer size
+    """
+    data = np.concatenate([frames for frames, _ in chunks], axis=-1)
+    timestamps = np.concatenate([timestamps for _, timestamps in chunks])
+    if buffer_size is not None:
+        data, timestamps = data[..., -buffer_size:], timestamps[-buffer_size:]
+    return data, timestamps
+
+
+def random_chunks(n_chunks, frame_shape=(4,), dtype=np.float32, max_chunk_size=300, seed=0):
+    rng = np.random.default_rng(seed)
+    chunks, t = [], 0
+    for _ in range(n_chunks):
+        n = int(rng.integers(0, max_chunk_size))
+        chunks.append((rng.random(frame_shape + (n,)).astype(dtype), np.arange(t, t + n) / 100.))
+        t += n
+    return chunks
+
+
+@pytest.mark.parametrize('buffer_size', [None, 1, 64, 500])
+def test_update_buffer_matches_concatenate(buffer_size):
+    chunks = random_chunks(50)
+    data_buffer = DataBuffer(stream_buffer_sizes={'EEG': buffer_size} if buffer_size else None)
+    for i, (frames, timestamps) in enumerate(chunks):
+        data_buffer.update_buffer({'stream_name': 'EEG', 'frames': frames, 'timestamps': timestamps})
+        data, timestamps = concatenate_reference(chunks[:i + 1], buffer_size)
+        assert data_buffer['EEG'][0].dtype == np.float32
+        assert np.array_equal(data_buffer['EEG'][0], data)
+        assert np.array_equal(data_buffer['EEG'][1], timestamps)
+
+
+def test_views_stay_valid_after_updates():
+    chunks = random_chunks(100)
+    data_buffer = DataBuffer(stream_buffer_sizes={'EEG': 256})
+    data_buffer.update_buffers({'EEG': chunks[0]})
+    held_data, held_timestamps = [x.copy() for x in data_buffer['EEG']], data_buffer['EEG']
+    held_views = list(held_timestamps)
+    for frames, timestamps in chunks[1:]:
+        data_buffer.update_buffers({'EEG': (frames, timestamps)})
+    assert np.array_equal(held_views[0], held_data[0])
+    assert np.array_equal(held_views[1], held_data[1])
+    assert held_timestamps is data_buffer['EEG']  # the list is updated in place
+
+
+def test_clear_and_time_range():
+    chunks = random_chunks(20, frame_shape=(2, 3))
+    data_buffer = DataBuffer()
+    for frames, timestamps in chunks:
+        data_buffer.update_buffers({'Camera': (frames, timestamps)})
+    data, timestamps = concatenate_reference(chunks)
+
+    in_range = data_buffer.get_stream_in_time_range('Camera', 5., 10.)
+    mask = (timestamps >= 5.) & (timestamps <= 10.)
+    assert np.array_equal(in_range[0], data[..., mask]) and np.array_equal(in_range[1], timestamps[mask])
+
+    data_buffer.clear_stream_up_to('Camera', 12.345)
+    assert np.array_equal(data_buffer['Camera'][1], timestamps[timestamps > 12.345])
+    assert np.array_equal(data_buffer['Camera'][0], data[..., timestamps > 12.345])
+
+    data_buffer.clear_stream_buffer_data('Camera')
+    assert data_buffer['Camera'][0].shape == (2, 3, 0) and len(data_buffer['Camera'][1]) == 0
+    data_buffer.update_buffers({'Camera': chunks[-1]})
+    assert np.array_equal(data_buffer['Camera'][0], chunks[-1][0])
+
+
+def test_dtype_promotion_channel_reset_and_outside_assignment():
+    data_buffer = DataBuffer()
+    data_buffer.update_buffers({'EEG': (np.ones((2, 3), dtype=np.int16), np.arange(3.))})
+    data_buffer.update_buffers({'EEG': (np.full((2, 2), 0.5), np.arange(3., 5.))})
+    assert data_buffer['EEG'][0].dtype == np.float64
+    assert np.array_equal(data_buffer['EEG'][0], np.array([[1, 1, 1, .5, .5]] * 2))
+
+    data_buffer.update_buffers({'EEG': (np.zeros((3, 1)), np.array([5.]))})  # channel change resets the stream
+    assert data_buffer['EEG'][0].shape == (3, 1)
+
+    data_buffer.buffer['EEG'][0] = np.ones((3, 4))  # arrays assigned from outside are kept
+    data_buffer.buffer['EEG'][1] = np.arange(4.)
+    data_buffer.update_buffers({'EEG': (np.zeros((3, 1)), np.array([4.]))})
+    assert np.array_equal(data_buffer['EEG'][0], np.array([[1, 1, 1, 1, 0]] * 3))
+    assert np.array_equal(data_buffer['EEG'][1], np.arange(5.))
+
+
+def test_single_stream_buffer_matches_roll():
+    buffer_size = 100
+    chunks = random_chunks(60, max_chunk_size=150)
+    single_stream_buffer = DataBufferSingleStream(num_channels=4, buffer_sizes=buffer_size, append_zeros=True)
+    rolled = [np.zeros((4, buffer_size)), np.zeros(buffer_size)]
+    for frames, timestamps in chunks:
+        single_stream_buffer.update_buffer({'frames': frames, 'timestamps': timestamps})
+        n = min(frames.shape[-1], buffer_size)
+        rolled[0] = np.roll(rolled[0], -n, axis=-1)
+        rolled[1] = np.roll(rolled[1], -n)
+        if n:
+            rolled[0][:, -n:] = frames[:, -n:]
+            rolled[1][-n:] = timestamps[-n:]
+        assert single_stream_buffer.buffer[0].shape == (4, buffer_size)
+        assert np.array_equal(single_stream_buffer.buffer[0], rolled[0])
+        assert np.array_equal(single_stream_buffer.buffer[1], rolled[1])
@@ -0,0 +1,131 @@
+"""
+Tests the DataProcessorPool without the stream widgets.
+
+Run with pytest -s to see how the processing scales with the number of streams.
+"""
+import threading
+import time
+
+import numpy as np
+
+from physiolabxr.threadings.DataProcessorPool import DataProcessorPool
+from physiolabxr.utils.dsp_utils.dsp_modules import ButterworthLowpassFilter, NotchFilter, run_data_processors
+
+srate = 1000
+
+
+def create_groups(channel_num, n_groups):
+    groups = []
+    channel_indices = np.array_split(np.arange(channel_num), n_groups)
+    for group_channel_indices in channel_indices:
+        data_processors = [NotchFilter(w0=60, Q=20, fs=srate), ButterworthLowpassFilter(cutoff=40, fs=srate, order=4)]
+        for data_processor in data_processors:
+            data_processor.set_channel_num(len(group_channel_indices))
+            data_processor.evoke_data_processor()
+            data_processor.activate_data_processor()
+        groups.append((group_channel_indices, data_processors))
+    return groups
+
+
+def process_streams(pool, stream_chunks, groups):
+    """
+    submit the chunks of the streams interleaved, as the stream widgets would, and wait until all are delivered
+    """
+    delivered = {stream_name: [] for stream_name in stream_chunks}
+    all_delivered = threading.Event()
+    n_chunks = sum(len(chunks) for chunks in stream_chunks.values())
+
+    def on_processed(stream_name, data_dict):
+        delivered[stream_name].append(data_dict)
+        if sum(len(data_dicts) for data_dicts in delivered.values()) == n_chunks:
+            all_delivered.set()
+
+    for chunk_index in range(max(len(chunks) for chunks in stream_chunks.values())):
+        for stream_name, chunks in stream_chunks.items():
+            if chunk_index < len(chunks):
+                pool.submit(stream_name, chunks[chunk_index], groups[stream_name], lambda data_dict, stream_name=stream_name: on_processed(stream_name, data_dict))
+    all_delivered.wait()
+    return delivered
+
+
+def create_chunks(channel_num, n_chunks, chunk_size):
+    data = np.random.normal(0, 1, (channel_num, n_chunks * chunk_size))
+    timestamps = np.arange(n_chunks * chunk_size) / srate
+    return data, [{'frames': data[:, i * chunk_size:(i + 1) * chunk_size].copy(), 'timestamps': timestamps[i * chunk_size:(i + 1) * chunk_size]} for i in range(n_chunks)]
+
+
+def test_chunks_are_delivered_in_order():
+    pool = DataProcessorPool()
+    stream_names = [f'stream{i}' for i in range(4)]
+    stream_data, stream_chunks = {}, {}
+    for stream_name in stream_names:
+        stream_data[stream_name], stream_chunks[stream_name] = create_chunks(16, 50, 20)
+    delivered = process_streams(pool, stream_chunks, {stream_name: create_groups(16, 4) for stream_name in stream_names})
+
+    for stream_name in stream_names:
+        expected = stream_data[stream_name].copy()
+        for channel_indices, data_processors in create_groups(16, 4):  # processed in one go, without the pool
+            expected[channel_indices] = run_data_processors(expected[channel_indices], data_processors)
+        assert np.allclose(np.concatenate([data_dict['frames'] for data_dict in delivered[stream_name]], axis=1), expected)
+        assert np.array_equal(np.concatenate([data_dict['timestamps'] for data_dict in delivered[stream_name]]), np.arange(50 * 20) / srate)
+        assert not pool.is_processing(stream_name)
+
+
+def test_cancel_drops_pending_chunks():
+    pool = DataProcessorPool()
+    release = threading.Event()
+    delivered = []
+    _, chunks = create_chunks(2, 5, 10)
+    blocking_groups = [(np.arange(2), [type('Blocking', (), {'process_buffer': lambda self, data: release.wait() and data})()])]
+    for data_dict in chunks:
+        pool.submit('cancelled', data_dict, blocking_groups, delivered.append)
+    pool.cancel('cancelled')
+    release.set()
+    while pool.is_processing('cancelled'):
+        time.sleep(1e-3)
+    assert len(delivered) == 0
+
+
+def test_evoke_while_processing():
+    data_processor = ButterworthLowpassFilter(cutoff=40, fs=srate, order=2)
+    data_processor.set_channel_num(16)
+    data_processor.evoke_data_processor()
+    data_processor.activate_data_processor()
+    chunk = np.random.normal(0, 1, (16, 20))
+    errors, done = [], threading.Event()
+
+    def process():  # as the pool threads do
+        while not done.is_set():
+            try:
+                data_processor.process_buffer(chunk)
+            except Exception as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=process)
+    thread.start()
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < 0.5:  # as the GUI thread does when the order is changed
+        data_processor.set_data_processor_params(cutoff=40, fs=srate, order=8 if data_processor.order == 2 else 2)
+        data_processor.evoke_data_processor()
+    done.set()
+    thread.join()
+    assert errors == []
+
+
+def test_processing_scales_with_streams():
+    pool = DataProcessorPool()
+    n_streams, channel_num = 8, 64
+    stream_chunks = {f'stream{i}': create_chunks(channel_num, 20, 500)[1] for i in range(n_streams)}
+    groups = {stream_name: create_groups(channel_num, 4) for stream_name in stream_chunks}
+
+    start_time = time.perf_counter()
+    for stream_name, chunks in stream_chunks.items():  # serially, as the GUI thread did
+        for data_dict in chunks:
+            for channel_indices, data_processors in groups[stream_name]:
+                run_data_processors(data_dict['frames'][channel_indices].copy(), data_processors)
+    serial_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    process_streams(pool, stream_chunks, groups)
+    pool_time = time.perf_counter() - start_time
+    print(f"\n{n_streams} streams of {channel_num} channels: serial {serial_time:.3f}s, pool {pool_time:.3f}s on {pool.executor._max_workers} threads")
@@ -0,0 +1,113 @@
+"""
+Tests the binary transport between a device process and its DeviceInterface, against the json message per sample the
+DSI-24 process used to send.
+
+Run with pytest -s to see the time to send and receive the samples of a DSI-24.
+"""
+import time
+
+import numpy as np
+import pytest
+import zmq
+
+from physiolabxr.interfaces.DeviceInterface.DeviceProcessTransport import DeviceProcessSender, DeviceProcessReceiver
+
+n_channels, srate = 24, 300
+
+
+def receive_all(receiver, n_samples, timeout=5):
+    frames, timestamps, messages = [], [], []
+    start_time = time.perf_counter()
+    while sum(len(t) for t in timestamps) < n_samples and time.perf_counter() - start_time < timeout:
+        new_frames, new_timestamps, new_messages = receiver.process_frames()
+        messages += new_messages
+        if len(new_timestamps) > 0:
+            frames.append(new_frames)
+            timestamps.append(new_timestamps)
+    return np.concatenate(frames, axis=1), np.concatenate(timestamps), messages
+
+
+def test_samples_and_messages():
+    receiver = DeviceProcessReceiver(error_type=ConnectionError)
+    sender = DeviceProcessSender(receiver.port, n_channels, max_batch_size=16, max_batch_interval=10)
+    samples = np.random.normal(0, 100, (n_channels, 100))
+    timestamps = 1e6 + np.arange(100) / srate  # needs float64
+    for i in range(50):
+        sender.send_sample(samples[:, i], timestamps[i])
+    sender.send_message('impedance check')  # flushes the samples before it
+    for i in range(50, 100):
+        sender.send_sample(samples[:, i], timestamps[i])
+    sender.flush()
+
+    frames, received_timestamps, messages = receive_all(receiver, 100)
+    assert frames.shape == (n_channels, 100) and frames.dtype == np.float32
+    assert np.array_equal(frames, samples.astype(np.float32))
+    assert np.array_equal(received_timestamps, timestamps)
+    assert messages == ['impedance check']
+
+    sender.send_error('headset disconnected')
+    time.sleep(0.1)
+    with pytest.raises(ConnectionError, match='headset disconnected'):
+        receiver.process_frames()
+    assert receiver.process_frames() == ([], [], [])
+
+    sender.send_sample(samples[:, 0], timestamps[0])
+    sender.close()  # sends the last batch
+    time.sleep(0.1)
+    receiver.drain()
+    assert receiver.process_frames() == ([], [], [])
+    receiver.close()
+
+
+def test_batch_interval():
+    receiver = DeviceProcessReceiver()
+    sender = DeviceProcessSender(receiver.port, n_channels, max_batch_size=1000, max_batch_interval=0.01)
+    sender.send_sample(np.zeros(n_channels), 0)
+    time.sleep(0.02)
+    sender.send_sample(np.zeros(n_channels), 1)  # the batch is due
+    frames, timestamps, _ = receive_all(receiver, 2)
+    assert np.array_equal(timestamps, [0, 1])
+    sender.close()
+    receiver.close()
+
+
+def test_transport_speed():
+    duration = 10
+    samples = np.random.normal(0, 100, (n_channels, srate * duration))
+    timestamps = 1e6 + np.arange(srate * duration) / srate
+    context = zmq.Context()
+    pull_socket = context.socket(zmq.PULL)
+    pull_socket.bind("tcp://*:0")
+    push_socket = context.socket(zmq.PUSH)
+    push_socket.connect(f"tcp://localhost:{pull_socket.getsockopt(zmq.LAST_ENDPOINT).decode('utf-8').split(':')[-1]}")
+
+    start_time = time.perf_counter()  # what DSI24_Process and DSI24_Interface did
+    for i in range(samples.shape[1]):
+        new_data = np.array(['%+08.2f' % value for value in samples[:, i]]).reshape(n_channels, 1)
+        push_socket.send_json({'t': 'd', 'frame': new_data.tolist(), 'timestamp': [timestamps[i]]})
+    frames, json_timestamps = [], []
+    while len(frames) < samples.shape[1]:
+        data = pull_socket.recv_json()
+        frames.append(data['frame'])
+        json_timestamps.append(data['timestamp'])
+    json_frames, json_timestamps = np.array(frames).transpose(2, 1, 0)[0], np.array(json_timestamps)[:, 0]
+    json_time = time.perf_counter() - start_time
+    push_socket.close()
+    pull_socket.close()
+    context.term()
+
+    receiver = DeviceProcessReceiver()
+    sender = DeviceProcessSender(receiver.port, n_channels)
+    start_time = time.perf_counter()
+    for i in range(samples.shape[1]):
+        sender.send_sample(samples[:, i], timestamps[i])
+    sender.flush()
+    binary_frames, binary_timestamps, _ = receive_all(receiver, samples.shape[1])
+    binary_time = time.perf_counter() - start_time
+    sender.close()
+    receiver.close()
+
+    print(f"\n{duration}s of {n_channels} channels at {srate} Hz: json per sample {json_time:.3f}s, binary batches {binary_time:.3f}s, "
+          f"max error json {np.max(np.abs(json_frames.astype(float) - samples)):.2e}, binary {np.max(np.abs(binary_frames - samples)):.2e}")
+    assert np.array_equal(binary_timestamps, timestamps)
+    assert binary_time < json_time
@@ -0,0 +1,114 @@
+"""
+Tests the epoching in scripting.physio.epochs against the per-marker argmin search it replaced, and the incremental
+EpochExtractor against epoching the whole buffer every loop, as the ERP example scripts did.
+
+Run with pytest -s to see the time to epoch a growing buffer.
+"""
+import time
+
+import numpy as np
+import pytest
+
+from physiolabxr.scripting.physio.epochs import get_event_locked_data, buffer_event_locked_data, EpochExtractor
+
+srate, tmin, tmax = 128, -0.1, 0.8
+events = (1, 2, 3)
+
+
+def create_recording(duration, n_channels=8, marker_interval=0.5):
+    data_time = 1000 + np.arange(int(duration * srate)) / srate + np.random.uniform(0, 1e-4, int(duration * srate))
+    data = np.random.normal(0, 1, (n_channels, len(data_time)))
+    marker_time = 1000 + np.arange(0.3, duration, marker_interval) + np.random.uniform(0, 0.1, len(np.arange(0.3, duration, marker_interval)))
+    markers = np.random.choice([1, 2, 3, 4], size=(1, len(marker_time)))  # 4 is not of interest
+    return (markers, marker_time), (data, data_time)
+
+
+def get_event_locked_data_argmin(event_marker, data, reject=None):
+    """
+    the per-marker search and list of slices get_event_locked_data used before
+    """
+    (event_marker, event_marker_time), (data, data_time) = event_marker, data
+    event_marker = event_marker[0]
+    rtn = {e: [] for e in events if e in event_marker}
+    epoch_length = int((tmax - tmin) * srate)
+    for e in rtn:
+        this_event_marker_time = event_marker_time[event_marker == e]
+        data_event_starts = [np.argmin(abs(data_time - (s + tmin))) for s in this_event_marker_time]
+        for i in data_event_starts:
+            if i + epoch_length < len(data_time):
+                if reject is not None and np.max(np.max(data[:, i:i + epoch_length], axis=0) - np.min(data[:, i:i + epoch_length], axis=0)) > reject:
+                    continue
+                rtn[e].append(data[:, i:i + epoch_length])
+    return {k: np.array(v) for k, v in rtn.items() if len(v) > 0}
+
+
+@pytest.mark.parametrize('reject', [None, 6])
+def test_epochs_match_argmin(reject):
+    event_marker, data = create_recording(60)
+    event_marker[1][:3] = data[1][[0, 10, -1]] - tmin  # epochs that start exactly on a sample, the last is cut off
+    event_marker[1][3] = (data[1][20] + data[1][21]) / 2 - tmin  # a tie between two samples
+    event_marker[1].sort()
+    expected = get_event_locked_data_argmin(event_marker, data, reject)
+    locked_data, _ = get_event_locked_data(event_marker, data, events, tmin, tmax, srate, reject=reject)
+    assert locked_data.keys() == expected.keys()
+    for e in expected:
+        assert np.array_equal(locked_data[e], expected[e])
+
+
+def test_extractor_matches_whole_buffer():
+    (markers, marker_time), (data, data_time) = create_recording(60)
+    extractor = EpochExtractor(events, tmin, tmax, srate, initial_capacity=2)
+    n_returned = {e: 0 for e in events}
+    first_epochs = None
+    for end_time in np.arange(1000.2, 1061, 0.05):  # a loop at 20 Hz, the markers arrive before their epochs are complete
+        data_end, marker_end = np.searchsorted(data_time, end_time), np.searchsorted(marker_time, end_time)
+        new_epochs = extractor.extract((markers[:, :marker_end], marker_time[:marker_end]), (data[:, :data_end], data_time[:data_end]))
+        for e, epochs in new_epochs.items():
+            n_returned[e] += len(epochs)
+            if first_epochs is None:
+                first_epochs = (e, epochs, epochs.copy())
+    expected, last_event_time = get_event_locked_data((markers, marker_time), (data, data_time), events, tmin, tmax, srate)
+    assert extractor.epochs.keys() == expected.keys()
+    for e in expected:
+        assert np.array_equal(extractor.epochs[e], expected[e])
+        assert n_returned[e] == len(expected[e])
+    assert np.array_equal(first_epochs[1], first_epochs[2])  # the store grew, the views returned earlier still hold their epochs
+    assert extractor.last_event_time == last_event_time
+
+    extractor.clear()
+    assert extractor.epochs == {} and np.array_equal(first_epochs[1], first_epochs[2])
+
+    # the buffer is cleared past a pending marker
+    extractor = EpochExtractor(events, tmin, tmax, srate)
+    extractor.extract((np.array([[1]]), np.array([2000.])), (data, data_time))
+    assert len(extractor.pending_markers) == 1
+    extractor.extract((np.array([[1]]), np.array([2000.])), (data[:, :10], data_time[:10] + 900))
+    assert len(extractor.pending_markers) == 1  # the data have not reached the epoch yet
+    extractor.extract((np.array([[1]]), np.array([2000.])), (data[:, :10], data_time[:10] + 1500))
+    assert len(extractor.pending_markers) == 0 and extractor.epochs == {}
+
+
+def test_incremental_epoching_speed():
+    (markers, marker_time), (data, data_time) = create_recording(120, n_channels=64, marker_interval=0.25)
+    loop_end_times = np.arange(1000.2, 1121, 0.1)
+
+    start_time = time.perf_counter()
+    buffer = {}
+    for end_time in loop_end_times:  # what the ERP examples did every loop, on a buffer that is not cleared
+        data_end, marker_end = np.searchsorted(data_time, end_time), np.searchsorted(marker_time, end_time)
+        locked_data, last_event_time = get_event_locked_data((markers[:, :marker_end], marker_time[:marker_end]), (data[:, :data_end], data_time[:data_end]),
+                                                             events, tmin, tmax, srate, return_last_event_time=True)
+        buffer = buffer_event_locked_data(locked_data, {}) if len(locked_data) > 0 else buffer
+    whole_buffer_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    extractor = EpochExtractor(events, tmin, tmax, srate)
+    for end_time in loop_end_times:
+        data_end, marker_end = np.searchsorted(data_time, end_time), np.searchsorted(marker_time, end_time)
+        extractor.extract((markers[:, :marker_end], marker_time[:marker_end]), (data[:, :data_end], data_time[:data_end]))
+    incremental_time = time.perf_counter() - start_time
+
+    for e in events:
+        assert np.array_equal(extractor.epochs[e], buffer[e])
+    print(f"\nepoching a 120s, 64 channel buffer in {len(loop_end_times)} loops: whole buffer {whole_buffer_time:.3f}s, incremental {incremental_time:.3f}s")
+    assert incremental_time < whole_buffer_time
@@ -0,0 +1,120 @@
+"""
+Benchmark of the vectorized I-DT fixation detection in scripting.physio.eyetracking against the per-window loop it
+replaced, and of the streaming FixationDetectorIDT against running the detection over the whole buffer every loop.
+All must give the same fixations.
+
+Run with pytest -s to see the results.
+"""
+import time
+
+import numpy as np
+import pytest
+
+from physiolabxr.scripting.physio.eyetracking import fixation_detection_idt, FixationDetectorIDT, _calculate_gaze_angles
+from physiolabxr.scripting.physio.utils import time_to_index
+
+srate = 250
+
+
+def create_gaze(duration, gap_ratio=0.02):
+    """
+    fixations of 0.2 to 0.6s with 0.1 degree noise, the saccades between them jump up to 10 degrees, with gaps of nan
+    """
+    n_samples = int(duration * srate)
+    timestamps = 1000 + np.arange(n_samples) / srate + np.random.uniform(0, 2e-4, n_samples)
+    fixation_lengths = np.random.randint(int(0.2 * srate), int(0.6 * srate), n_samples // int(0.2 * srate) + 1)
+    fixation_targets = np.random.uniform(-10, 10, (len(fixation_lengths), 2))
+    gaze_xy_degree = np.repeat(fixation_targets, fixation_lengths, axis=0)[:n_samples] + np.random.normal(0, 0.1, (n_samples, 2))
+    gaze_xyz = np.stack([np.tan(np.radians(gaze_xy_degree[:, 0])), np.tan(np.radians(gaze_xy_degree[:, 1])), np.ones(n_samples)])
+    gap_starts = np.random.choice(n_samples - 10, int(n_samples * gap_ratio / 5), replace=False)
+    for gap_start in gap_starts:
+        gaze_xyz[:, gap_start:gap_start + np.random.randint(1, 10)] = np.nan
+    return gaze_xyz, timestamps
+
+
+def fixation_detection_idt_loop(gaze_xyz, timestamps, window_size=0.175, dispersion_threshold_degree=0.5, saccade_min_sample=2):
+    """
+    the per-window loop fixation_detection_idt used before
+    """
+    gaze_angles_degree = _calculate_gaze_angles(gaze_xyz)
+    windows = [(i, time_to_index(timestamps, t + window_size)) for i, t in enumerate(timestamps)]
+    fixations = []
+    for start, end in windows:
+        if end >= len(timestamps):
+            break
+        if end - start < saccade_min_sample:
+            continue
+        center_time = timestamps[start] + window_size / 2
+        if np.std(gaze_angles_degree[start:end]) < dispersion_threshold_degree:
+            fixations.append([1, center_time])
+        else:
+            fixations.append([0, center_time])
+    return np.array(fixations).T
+
+
+@pytest.mark.parametrize('dispersion_threshold_degree', [0.1, 0.5, 2])
+def test_vectorized_matches_loop(dispersion_threshold_degree):
+    gaze_xyz, timestamps = create_gaze(30)
+    gaze_xyz[:, 100:130] = gaze_xyz[:, 100:101]  # a still gaze, zero dispersion
+    expected = fixation_detection_idt_loop(gaze_xyz, timestamps, dispersion_threshold_degree=dispersion_threshold_degree)
+    fixations, last_window_start = fixation_detection_idt(gaze_xyz, timestamps, dispersion_threshold_degree=dispersion_threshold_degree, return_last_window_start=True)
+    assert np.array_equal(fixations, expected)
+    assert 0 < np.mean(fixations[0]) < 1
+    assert timestamps[last_window_start] + 0.175 / 2 == fixations[1, -1]
+    assert fixation_detection_idt(gaze_xyz[:, :1], timestamps[:1]).shape == fixation_detection_idt_loop(gaze_xyz[:, :1], timestamps[:1]).shape
+
+
+def test_streaming_matches_batch():
+    gaze_xyz, timestamps = create_gaze(30)
+    detector = FixationDetectorIDT()
+    chunks, start = [], 0
+    for chunk_size in np.random.randint(0, 40, 1000):  # chunks shorter and longer than a window, some empty
+        chunks.append(detector.process(gaze_xyz[:, start:start + chunk_size], timestamps[start:start + chunk_size]))
+        if len(chunks[-1][1]) > 0:  # only the windows whose samples have all arrived
+            assert chunks[-1][1, -1] - 0.175 / 2 + 0.175 <= timestamps[min(start + chunk_size, len(timestamps)) - 1]
+        start += chunk_size
+    assert len(detector.timestamps) < 0.175 * srate + 2  # keeps only the samples of the windows not classified
+    chunks.append(detector.flush())
+    assert np.array_equal(np.concatenate(chunks, axis=1), fixation_detection_idt(gaze_xyz, timestamps))
+
+
+def test_detection_speed():
+    results = {}
+    for duration in [10, 30, 120]:
+        gaze_xyz, timestamps = create_gaze(duration)
+        start_time = time.perf_counter()
+        fixation_detection_idt_loop(gaze_xyz, timestamps)
+        loop_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        fixation_detection_idt(gaze_xyz, timestamps)
+        results[duration] = loop_time, time.perf_counter() - start_time
+    gaze_xyz, timestamps = create_gaze(3600)
+    start_time = time.perf_counter()
+    fixation_detection_idt(gaze_xyz, timestamps)
+    results[3600] = np.nan, time.perf_counter() - start_time
+
+    print(f"\nI-DT fixation detection on {srate} Hz gaze (s)")
+    print(f"{'duration':>10}{'loop':>10}{'vectorized':>12}{'speedup':>10}")
+    for duration, (loop_time, vectorized_time) in results.items():
+        print(f"{duration:>10}{loop_time:>10.3f}{vectorized_time:>12.3f}{loop_time / vectorized_time:>10.1f}")
+    assert all(vectorized_time < loop_time for loop_time, vectorized_time in list(results.values())[:-1])
+
+
+def test_streaming_speed():
+    gaze_xyz, timestamps = create_gaze(60)
+    chunk_size = srate // 20  # a script loop at 20 Hz
+    buffer_size = 10 * srate  # the input buffer of the script
+
+    start_time = time.perf_counter()
+    for end in range(chunk_size, len(timestamps), chunk_size):  # the whole buffer every loop
+        fixation_detection_idt(gaze_xyz[:, max(0, end - buffer_size):end], timestamps[max(0, end - buffer_size):end])
+    whole_buffer_time = time.perf_counter() - start_time
+
+    detector = FixationDetectorIDT()
+    start_time = time.perf_counter()
+    for end in range(chunk_size, len(timestamps), chunk_size):
+        detector.process(gaze_xyz[:, end - chunk_size:end], timestamps[end - chunk_size:end])
+    streaming_time = time.perf_counter() - start_time
+
+    print(f"\n{len(timestamps) // chunk_size} loops over a {buffer_size / srate:.0f}s buffer: whole buffer {whole_buffer_time:.3f}s, streaming {streaming_time:.3f}s")
+    assert streaming_time < whole_buffer_time
@@ -0,0 +1,133 @@
+"""
+Tests the headless recorder: streams are acquired on plain threads, recorded to .dats and controlled over its socket.
+
+Run with pytest -s to see the samples recorded.
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+import zmq
+
+from physiolabxr.interfaces.ZMQInterface import ZMQInterface
+from physiolabxr.presets.PresetEnums import DataType
+from physiolabxr.sub_process.HeadlessRecorder import HeadlessRecorder, send_headless_recorder_command
+from physiolabxr.utils.RNStream import RNStream
+from physiolabxr.utils.networking_utils import send_zmq_samples
+
+
+class Publisher(threading.Thread):
+    """
+    publishes chunks of 10 samples of a counter to a ZMQ stream at about 1000 Hz
+    """
+    def __init__(self, stream_name, n_channels=4):
+        super().__init__(daemon=True)
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.PUB)
+        self.port = self.socket.bind_to_random_port('tcp://127.0.0.1')
+        self.stream_name = stream_name
+        self.n_channels = n_channels
+        self.running = True
+        self.sample_count = 0
+
+    def run(self):
+        while self.running:
+            sample_indices = np.arange(self.sample_count, self.sample_count + 10)
+            send_zmq_samples(self.socket, self.stream_name, sample_indices / 1000., np.tile(sample_indices, (self.n_channels, 1)).astype(np.float32))
+            self.sample_count += 10
+            time.sleep(0.01)
+        self.socket.close()
+        self.context.term()
+
+
+class FaultyInterface:
+    """
+    a device that disconnects after sending a few samples
+    """
+    def __init__(self):
+        self.n_pulls = 0
+
+    def start_stream(self):
+        pass
+
+    def process_frames(self):
+        self.n_pulls += 1
+        if self.n_pulls > 5:
+            raise ConnectionError('device disconnected')
+        return np.zeros((2, 1)), [time.perf_counter()], [f'pull {self.n_pulls}']
+
+    def stop_stream(self):
+        pass
+
+
+def test_record_over_control_socket(tmp_path):
+    publisher = Publisher('EEG')
+    publisher.start()
+    recorder = HeadlessRecorder({'EEG': ZMQInterface(publisher.port, 'EEG', DataType.float32), 'Device': FaultyInterface()},
+                                str(tmp_path), experiment_name='Test', eviction_interval=0.1, nominal_sampling_rates={'EEG': 0})
+    recorder.start()
+    time.sleep(0.2)
+
+    reply = send_headless_recorder_command('start', recorder.control_port, subject='S01')
+    assert reply['ok'] and reply['file_path'].startswith(str(tmp_path)) and 'Exp_Test-Sbj_S01' in reply['file_path']
+    assert not send_headless_recorder_command('start', recorder.control_port)['ok']  # already recording
+    time.sleep(1.)
+    status = send_headless_recorder_command('status', recorder.control_port)
+    assert status['is_recording'] and status['writer']['written_bytes'] > 0
+    assert status['streams']['EEG']['sample_count'] > 0 and status['streams']['EEG']['error'] is None
+    assert status['streams']['EEG']['health']['sample_count'] > 0 and 'disk' in status['streams']['EEG']['health']['latency']
+    assert status['streams']['Device']['error'] == 'device disconnected' and status['streams']['Device']['messages'][-1] == 'pull 5'
+    reply = send_headless_recorder_command('stop', recorder.control_port)
+    assert reply['ok'] and not send_headless_recorder_command('status', recorder.control_port)['is_recording']
+    assert not send_headless_recorder_command('pause', recorder.control_port)['ok']
+
+    assert send_headless_recorder_command('exit', recorder.control_port)['ok']
+    recorder.join(timeout=5)
+    publisher.running = False
+    assert not recorder.is_alive()
+
+    data, timestamps = RNStream(reply['file_path']).stream_in(jitter_removal=False)['EEG']
+    print(f"\nrecorded {data.shape[1]} of the {publisher.sample_count} samples published")
+    assert data.shape == (4, len(timestamps)) and 500 < len(timestamps) < publisher.sample_count
+    sample_indices = np.round(timestamps * 1000)
+    assert np.array_equal(sample_indices, np.arange(sample_indices[0], sample_indices[0] + len(sample_indices)))  # no sample is lost
+    assert np.array_equal(data, np.tile(sample_indices, (4, 1)))
+
+
+def test_stream_fails_to_start(tmp_path):
+    class UnavailableInterface(FaultyInterface):
+        def start_stream(self):
+            raise ConnectionError('device not found')
+
+    interface = FaultyInterface()
+    recorder = HeadlessRecorder({'Device': interface, 'Unavailable': UnavailableInterface()}, str(tmp_path))
+    with pytest.raises(ConnectionError):
+        recorder.start()
+    assert recorder.acquisition_threads == {} and not recorder.is_alive()
+    n_pulls = interface.n_pulls
+    time.sleep(0.05)
+    assert interface.n_pulls == n_pulls  # the stream started before the error is stopped
+
+
+def test_invalid_request_and_start_stream_args(tmp_path):
+    class DeviceWithPort(FaultyInterface):
+        def start_stream(self, bluetooth_port):
+            self.bluetooth_port = bluetooth_port
+
+    interface = DeviceWithPort()
+    recorder = HeadlessRecorder({'Device': interface}, str(tmp_path), start_stream_args={'Device': {'bluetooth_port': 'COM5'}})
+    recorder.start()
+    assert interface.bluetooth_port == 'COM5'
+
+    context = zmq.Context()
+    socket = context.socket(zmq.REQ)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.connect(f'tcp://127.0.0.1:{recorder.control_port}')
+    socket.send(b'not json')
+    assert socket.poll(5000) and not socket.recv_json()['ok']
+    socket.close()
+    context.term()
+    assert recorder.is_alive() and send_headless_recorder_command('status', recorder.control_port)['ok']
+    send_headless_recorder_command('exit', recorder.control_port)
+    recorder.join(timeout=5)
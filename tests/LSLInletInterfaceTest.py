@@ -0,0 +1,102 @@
+"""
+Tests the numpy pull of LSLInletInterface against pulling the chunks as lists, as it did before, and benchmarks the two.
+
+Run with pytest -s to see the time of the pulls.
+"""
+import time
+import uuid
+
+import numpy as np
+import pytest
+from pylsl import StreamInfo, StreamOutlet, local_clock, proc_clocksync, proc_dejitter
+
+from physiolabxr.interfaces.LSLInletInterface import LSLInletInterface
+
+
+def create_outlet(stream_name, n_channels, channel_format='float32', srate=2000):
+    return StreamOutlet(StreamInfo(stream_name, 'EEG', n_channels, srate, channel_format, str(uuid.uuid4())))
+
+
+def push_counter(outlet, n_channels, n_samples, start=0, dtype=np.float32):
+    sample_indices = np.arange(start, start + n_samples)
+    outlet.push_chunk(np.ascontiguousarray(np.tile(sample_indices, (n_channels, 1)).T.astype(dtype)), sample_indices / 1000.)
+    time.sleep(0.1)  # let the samples arrive
+
+
+def start(interface):
+    interface.start_stream()
+    time.sleep(0.5)  # let the inlet connect
+
+
+@pytest.mark.parametrize('channel_format, dtype', [('float32', np.float32), ('double64', np.float64), ('int16', np.int16), ('int64', np.int64)])
+def test_numpy_pull_matches_list_pull(channel_format, dtype):
+    stream_name = f'LSLInletInterfaceTest_{channel_format}'
+    outlet = create_outlet(stream_name, 8, channel_format)
+    interface, reference = LSLInletInterface(stream_name, 8), LSLInletInterface(stream_name, 8)
+    start(interface)
+    start(reference)
+    push_counter(outlet, 8, 500, dtype=dtype)
+    frames, timestamps = interface.process_frames()
+    expected_frames, expected_timestamps = reference._process_frames_as_lists()
+    assert frames.dtype == dtype and frames.shape == (8, 500) and timestamps.dtype == np.float64
+    assert np.array_equal(frames, expected_frames) and np.allclose(timestamps, expected_timestamps)
+    assert np.array_equal(frames, np.tile(np.arange(500), (8, 1)))
+
+    # more samples than max_samples are pulled by the next calls, the frames returned before are left as they were
+    push_counter(outlet, 8, 1500, start=500, dtype=dtype)
+    new_frames = np.concatenate([interface.process_frames()[0] for _ in range(2)], axis=1)
+    assert np.array_equal(new_frames, np.tile(np.arange(500, 2000), (8, 1))) and np.array_equal(frames, expected_frames)
+    assert interface.process_frames()[0].shape == (8, 0)
+    interface.stop_stream()
+    reference.stop_stream()
+
+
+def test_string_stream():
+    stream_name = 'LSLInletInterfaceTest_string'
+    outlet = create_outlet(stream_name, 2, 'string', srate=0)
+    interface = LSLInletInterface(stream_name, 2)
+    start(interface)
+    outlet.push_sample(['a', 'b'])
+    time.sleep(0.1)
+    frames, timestamps = interface.process_frames()
+    assert np.array_equal(frames, [['a'], ['b']]) and len(timestamps) == 1
+    interface.stop_stream()
+
+
+def test_postprocessing_flags():
+    stream_name = 'LSLInletInterfaceTest_flags'
+    outlet = create_outlet(stream_name, 4)
+    interface = LSLInletInterface(stream_name, 4, time_correction=True, dejitter=True)
+    assert interface.get_processing_flags() == proc_clocksync | proc_dejitter
+    assert LSLInletInterface(stream_name, 4).get_processing_flags() == 0
+    start(interface)
+    for i in range(100):  # timestamped by the outlet at the local clock
+        outlet.push_sample(np.full(4, i, dtype=np.float32))
+        time.sleep(0.002)
+    time.sleep(0.1)
+    frames, timestamps = interface.process_frames()
+    assert frames.shape == (4, 100) and np.all(np.diff(timestamps) > 0)
+    assert abs(timestamps[-1] - local_clock()) < 1.  # mapped to the local clock
+    interface.stop_stream()
+
+
+def test_pull_speed():
+    stream_name, n_channels, n_samples, n_repeats = 'LSLInletInterfaceTest_speed', 64, 1000, 10
+    outlet = create_outlet(stream_name, n_channels)
+    interfaces = {'lists': LSLInletInterface(stream_name, n_channels), 'numpy': LSLInletInterface(stream_name, n_channels)}
+    for interface in interfaces.values():
+        start(interface)
+    times = {name: [] for name in interfaces}
+    for i in range(n_repeats):
+        push_counter(outlet, n_channels, n_samples, start=i * n_samples)
+        for name, interface in interfaces.items():
+            start_time = time.perf_counter()
+            frames, _ = interface._process_frames_as_lists() if name == 'lists' else interface.process_frames()
+            times[name].append(time.perf_counter() - start_time)
+            assert np.shape(frames) == (n_channels, n_samples)
+    for interface in interfaces.values():
+        interface.stop_stream()
+    print(f"\nbest of {n_repeats} pulls of {n_samples} samples of {n_channels} channels")
+    for name, pull_times in times.items():
+        print(f"{name:>8}: {min(pull_times) * 1e3:.3f} ms")
+    assert min(times['numpy']) < min(times['lists'])
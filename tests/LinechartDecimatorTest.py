@@ -0,0 +1,95 @@
+"""
+Tests the LinechartDecimator the line charts reduce their windows with against reducing the whole window every frame,
+for the continuous windows that slide and the in-place windows that grow from the left of the plot.
+
+Run with pytest -s to see the time to decimate a frame.
+"""
+import time
+
+import numpy as np
+import pytest
+
+from physiolabxr.utils.viz_utils import LinechartDecimator
+
+
+def decimate_window(window, window_start, bucket_size, method):
+    """
+    reduces every bucket of the window, the buckets aligned to the samples before the window
+    """
+    window_end = window_start + window.shape[1]
+    edges = sorted({window_start, window_end} | set(range(-(-window_start // bucket_size) * bucket_size, window_end, bucket_size)))
+    indices, values = [], []
+    for start, end in zip(edges[:-1], edges[1:]):
+        samples = window[:, start - window_start:end - window_start]
+        if method == 'minmax':
+            indices += [(start + end - 1) / 2 - window_start] * 2
+            values += [samples.min(axis=1), samples.max(axis=1)]
+        else:
+            indices.append((start + end - 1) / 2 - window_start)
+            values.append(samples.mean(axis=1))
+    return np.array(indices), np.array(values).T.reshape(window.shape[0], -1)
+
+
+@pytest.mark.parametrize('method', LinechartDecimator.methods)
+def test_continuous_matches_whole_window(method):
+    data = np.random.normal(0, 1, (5, 5000))
+    channel_indices = [0, 2, 4]
+    max_window_size = 100
+    decimator = LinechartDecimator(len(channel_indices), 7, method, max_window_size=max_window_size)
+    n_samples = 0
+    for chunk_size in np.random.randint(0, 30, 150):  # some chunks are empty, some longer than a bucket
+        decimator.update(data[channel_indices, n_samples:n_samples + chunk_size])
+        n_samples += chunk_size
+        for window_size in {min(n_samples, size) for size in (max_window_size, max_window_size - 1, 50, 5, 0)}:
+            window = data[:, n_samples - window_size:n_samples]
+            indices, values = decimator.get(window, channel_indices)
+            expected_indices, expected_values = decimate_window(window[channel_indices], n_samples - window_size, 7, method)
+            assert np.allclose(indices, expected_indices) and np.allclose(values, expected_values)
+    assert len(decimator._buckets.timestamps) <= max_window_size // 7 + 2
+
+
+@pytest.mark.parametrize('method', LinechartDecimator.methods)
+def test_inplace_matches_whole_window(method):
+    """
+    the in-place line chart draws the samples since the head was last reset, a window that grows until the buffer is full
+    """
+    buffer_size = 300
+    data = np.random.normal(0, 1, (4, 6000))
+    decimator = LinechartDecimator(4, 10, method, max_window_size=buffer_size)
+    n_samples, head = 0, 0
+    for chunk_size in np.random.randint(1, 40, 150):
+        decimator.update(data[:, n_samples:n_samples + chunk_size])
+        n_samples += chunk_size
+        head += chunk_size
+        window = data[:, n_samples - min(head, buffer_size):n_samples]
+        indices, values = decimator.get(window)
+        expected_indices, expected_values = decimate_window(window, n_samples - window.shape[1], 10, method)
+        assert np.allclose(indices, expected_indices) and np.allclose(values, expected_values)
+        if head > buffer_size:
+            head = 0
+
+
+def test_decimation_speed():
+    n_channels, srate, duration, frame_rate = 128, 2048, 10, 30
+    window_size, plot_width = srate * duration, 1000
+    bucket_size = window_size // plot_width
+    data = np.random.normal(0, 1, (n_channels, window_size + srate * 5))
+    frame_ends = np.arange(window_size, data.shape[1], srate // frame_rate)
+
+    start_time = time.perf_counter()
+    for end in frame_ends:  # reduce the whole window every frame
+        buckets = data[:, end - window_size:end].reshape(n_channels, -1, bucket_size)
+        np.stack([buckets.min(axis=2), buckets.max(axis=2)])
+    whole_window_time = time.perf_counter() - start_time
+
+    decimator = LinechartDecimator(n_channels, bucket_size, max_window_size=window_size)
+    decimator.update(data[:, :frame_ends[0]])
+    start_time = time.perf_counter()
+    for last_end, end in zip(frame_ends[:-1], frame_ends[1:]):
+        decimator.update(data[:, last_end:end])
+        decimator.get(data[:, end - window_size:end])
+    incremental_time = time.perf_counter() - start_time
+
+    print(f"\nmin max decimation of a {duration}s window of {n_channels} channels at {srate} Hz to {plot_width} buckets, {len(frame_ends) - 1} frames: "
+          f"whole window {whole_window_time / len(frame_ends) * 1e3:.3f}ms per frame, incremental {incremental_time / (len(frame_ends) - 1) * 1e3:.3f}ms per frame")
+    assert incremental_time < whole_window_time
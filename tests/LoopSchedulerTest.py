@@ -0,0 +1,123 @@
+"""
+Tests the scheduling of the script loop, with a clock the test advances and on a zmq poller as RenaScript runs it.
+
+Run with pytest -s to see the timing of a fixed rate loop.
+"""
+import time
+
+import numpy as np
+import zmq
+
+from physiolabxr.scripting.LoopScheduler import LoopScheduler, jitter_histogram_bin_edges
+from physiolabxr.scripting.scripting_enums import LoopScheduling
+
+
+class Clock:
+    def __init__(self):
+        self.time = 100.
+
+    def __call__(self):
+        return self.time
+
+
+def run_loop(scheduler, clock, duration, has_output=False):
+    scheduler.on_loop_start()
+    clock.time += duration
+    scheduler.on_loop_end(has_output)
+
+
+def test_fixed_rate_catch_up_and_skip():
+    for scheduling in (LoopScheduling.FIXED_RATE_CATCH_UP, LoopScheduling.FIXED_RATE_SKIP):
+        clock = Clock()
+        scheduler = LoopScheduler(scheduling, run_frequency=10, clock=clock)
+        scheduler.start()
+        assert scheduler.is_due()
+        run_loop(scheduler, clock, 0.35)  # runs over three and a half periods
+        assert scheduler.deadline_miss_count == 1
+        assert scheduler.get_poll_timeout() == 0 and scheduler.is_due()
+        n_loops = 1
+        while scheduler.is_due():
+            run_loop(scheduler, clock, 0.01)
+            n_loops += 1
+        assert np.isclose(scheduler.get_poll_timeout(), (scheduler.due_time - clock.time) * 1e3)
+        if scheduling == LoopScheduling.FIXED_RATE_CATCH_UP:
+            assert n_loops == 4  # the loops due at the 0.1, 0.2 and 0.3s marks run back to back
+            assert scheduler.skipped_loop_count == 0
+        else:
+            assert n_loops == 2  # the loop due at the 0.1s mark runs, those of the 0.2 and 0.3s marks are skipped
+            assert scheduler.skipped_loop_count == 2
+        assert np.isclose(scheduler.due_time, 100.4)  # back on the schedule
+        assert scheduler.jitter_histogram.sum() == n_loops and np.isclose(scheduler.max_jitter, 0.25)
+
+
+def test_data_triggered():
+    clock = Clock()
+    scheduler = LoopScheduler(LoopScheduling.DATA_TRIGGERED, run_frequency=10, trigger_input='EEG', trigger_sample_count=8, clock=clock)
+    scheduler.start()
+    assert scheduler.get_poll_timeout() is None  # waits for the inputs
+    scheduler.on_input({'EEG': (np.zeros((4, 5)), np.zeros(5)), 'Video': (np.zeros((3, 1)), np.zeros(1))})
+    assert not scheduler.is_due()
+    clock.time += 0.01
+    scheduler.on_input({'Video': (np.zeros((3, 1)), np.zeros(1))})
+    assert not scheduler.is_due()
+    clock.time += 0.01
+    scheduler.on_input({'EEG': (np.zeros((4, 12)), np.zeros(12))})
+    assert scheduler.is_due()
+    clock.time += 0.002
+    run_loop(scheduler, clock, 0.005, has_output=True)
+    assert np.isclose(scheduler.max_jitter, 0.002)  # from the trigger
+    assert np.isclose(scheduler.max_latency, 0.027)  # from the first input the loop consumed
+    assert scheduler.new_trigger_samples == 1 and not scheduler.is_due()  # 17 samples, one left toward the next loop
+    scheduler.on_input({'EEG': (np.zeros((4, 7)), np.zeros(7))})
+    assert scheduler.is_due()
+    run_loop(scheduler, clock, 0.2, has_output=False)  # longer than a period
+    assert scheduler.deadline_miss_count == 1 and len(scheduler.latencies) == 1
+
+
+def test_run_signal_and_free_running():
+    clock = Clock()
+    scheduler = LoopScheduler(LoopScheduling.RUN_SIGNAL, run_frequency=10, clock=clock)
+    scheduler.start()
+    assert not scheduler.is_due()
+    scheduler.on_input({})  # every forward of the inputs runs the loop, even without new data
+    assert scheduler.is_due()
+    run_loop(scheduler, clock, 0.01)
+    assert not scheduler.is_due()
+
+    scheduler = LoopScheduler(LoopScheduling.FREE_RUNNING, run_frequency=10, clock=clock)
+    scheduler.start()
+    for i in range(3):
+        assert scheduler.is_due() and scheduler.get_poll_timeout() == 0
+        run_loop(scheduler, clock, 0.01)
+    info = scheduler.get_info()
+    assert info[0] == 3 and len(info) == 7 + len(jitter_histogram_bin_edges)
+
+
+def test_fixed_rate_on_poller():
+    run_frequency, duration = 200, 1.
+    context = zmq.Context()
+    socket = context.socket(zmq.ROUTER)  # nothing arrives, the poller only times the loops
+    socket.bind('tcp://127.0.0.1:*')
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+
+    scheduler = LoopScheduler(LoopScheduling.FIXED_RATE_SKIP, run_frequency)
+    loop_start_times = []
+    scheduler.start()
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < duration:
+        poller.poll(scheduler.get_poll_timeout())
+        if scheduler.is_due():
+            scheduler.on_loop_start()
+            loop_start_times.append(time.perf_counter())
+            scheduler.on_loop_end(has_output=False)
+    socket.close()
+    context.term()
+
+    intervals = np.diff(loop_start_times)
+    print(f"\nfixed rate of {run_frequency} Hz for {duration}s: {len(loop_start_times)} loops, {scheduler.skipped_loop_count} skipped, "
+          f"{scheduler.deadline_miss_count} deadline misses, interval {intervals.mean() * 1e3:.3f}±{intervals.std() * 1e3:.3f}ms, "
+          f"jitter average {np.mean(scheduler.jitters) * 1e3:.3f}ms, max {scheduler.max_jitter * 1e3:.3f}ms")
+    print('jitter histogram ' + '  '.join(f'{edge * 1e3:g}ms+: {count}' for edge, count in zip(jitter_histogram_bin_edges, scheduler.jitter_histogram)))
+    assert len(loop_start_times) + scheduler.skipped_loop_count in range(int(run_frequency * duration) - 1, int(run_frequency * duration) + 2)
+    assert np.isclose(intervals.mean(), 1 / run_frequency, rtol=0.1)
@@ -0,0 +1,223 @@
+import os
+
+import numpy as np
+import pytest
+
+from physiolabxr.utils.RNStream import RNStream
+
+
+@pytest.fixture
+def recorded_stream(tmp_path):
+    """
+    write a .dats the same way RecordingsTab does, one stream_out call per eviction, and return the RNStream with the
+    concatenated data that were written
+    """
+    stream = RNStream(str(tmp_path / 'test.dats'))
+    n_evictions = 10
+    srate = 100
+    written = {'EEG': ([], []), 'Camera': ([], [])}
+    for i in range(n_evictions):
+        eeg_timestamps = (np.arange(srate) + i * srate) / srate
+        eeg = np.random.random((8, srate)).astype(np.float32)
+        camera_timestamps = eeg_timestamps[::srate // 4]
+        camera = np.random.randint(0, 255, (6, 4, 3, len(camera_timestamps)), dtype=np.uint8)
+        stream.stream_out({'EEG': [eeg, eeg_timestamps], 'Camera': [camera, camera_timestamps]})
+        for stream_name, (data, timestamps) in (('EEG', (eeg, eeg_timestamps)), ('Camera', (camera, camera_timestamps))):
+            written[stream_name][0].append(data)
+            written[stream_name][1].append(timestamps)
+    written = {s: [np.concatenate(d, axis=-1), np.concatenate(t)] for s, (d, t) in written.items()}
+    return stream, written
+
+
+def test_stream_in_indexed_matches_written(recorded_stream):
+    stream, written = recorded_stream
+    assert os.path.exists(stream.index_fn)
+    buffer = RNStream(stream.fn).stream_in(jitter_removal=False)
+    for stream_name, (data, timestamps) in written.items():
+        assert buffer[stream_name][0].dtype == data.dtype
+        assert np.array_equal(buffer[stream_name][0], data)
+        assert np.array_equal(buffer[stream_name][1], timestamps)
+
+
+def test_stream_in_without_index_matches_indexed(recorded_stream):
+    stream, written = recorded_stream
+    indexed = RNStream(stream.fn).stream_in(jitter_removal=False, only_stream=('EEG',))
+    os.remove(stream.index_fn)
+    unindexed = RNStream(stream.fn).stream_in(jitter_removal=False, only_stream=('EEG',))
+    assert list(indexed) == list(unindexed) == ['EEG']
+    assert np.array_equal(indexed['EEG'][0], unindexed['EEG'][0])
+    assert np.array_equal(indexed['EEG'][1], unindexed['EEG'][1])
+
+
+@pytest.mark.parametrize('remove_index', [False, True])
+def test_read_range(recorded_stream, remove_index):
+    stream, written = recorded_stream
+    if remove_index:  # legacy files have their chunk index built by scanning the chunk headers
+        os.remove(stream.index_fn)
+    start_time, end_time = 2.555, 6.01
+    data, timestamps = RNStream(stream.fn).read_range('Camera', start_time, end_time)
+    in_range = (written['Camera'][1] >= start_time) & (written['Camera'][1] <= end_time)
+    assert np.array_equal(timestamps, written['Camera'][1][in_range])
+    assert np.array_equal(data, written['Camera'][0][..., in_range])
+
+    with pytest.raises(ValueError):
+        RNStream(stream.fn).read_range('Camera', end_time, start_time)
+    with pytest.raises(ValueError):
+        RNStream(stream.fn).read_range('NotAStream', start_time, end_time)
+
+
+def test_append_to_unindexed_file_builds_index(recorded_stream):
+    stream, written = recorded_stream
+    os.remove(stream.index_fn)
+    RNStream(stream.fn).stream_out({'EEG': [np.zeros((8, 5), dtype=np.float32), np.arange(5) + 100.]})
+    reloaded = RNStream(stream.fn)
+    assert reloaded._load_index_file() is not None
+    data, timestamps = reloaded.read_range('EEG', 0, 200)
+    assert np.array_equal(timestamps, np.concatenate([written['EEG'][1], np.arange(5) + 100.]))
+    assert data.shape == (8, len(timestamps))
+
+
+def test_stale_index_is_ignored(recorded_stream):
+    stream, written = recorded_stream
+    RNStream(stream.fn, write_index=False).stream_out({'EEG': [np.zeros((8, 5), dtype=np.float32), np.arange(5) + 100.]})
+    with pytest.warns(UserWarning, match='does not cover'):
+        buffer = RNStream(stream.fn).stream_in(jitter_removal=False)
+    assert buffer['EEG'][0].shape[-1] == written['EEG'][0].shape[-1] + 5
+
+
+def test_truncated_index_is_ignored(recorded_stream):
+    stream, written = recorded_stream
+    with open(stream.index_fn, 'ab') as index_file:  # a record partially written when the recording crashed
+        index_file.write(b'\x00' * 3)
+    buffer = RNStream(stream.fn).stream_in(jitter_removal=False)
+    assert np.array_equal(buffer['EEG'][0], written['EEG'][0]) and np.array_equal(buffer['EEG'][1], written['EEG'][1])
+    data, timestamps = RNStream(stream.fn).read_range('EEG', 0, 200)
+    assert np.array_equal(timestamps, written['EEG'][1])
+    assert np.array_equal(np.asarray(RNStream(stream.fn).stream_in_memmap(jitter_removal=False)['EEG'][0]), written['EEG'][0])
+
+    # the chunk written before the crash has no record, appending rebuilds the sidecar instead of appending after the
+    # partial record
+    RNStream(stream.fn, write_index=False).stream_out({'EEG': [np.zeros((8, 5), dtype=np.float32), np.arange(5) + 100.]})
+    with open(stream.index_fn, 'ab') as index_file:
+        index_file.write(b'\x00' * 3)
+    with pytest.warns(UserWarning, match='does not cover'):
+        assert RNStream(stream.fn).stream_in(jitter_removal=False)['EEG'][0].shape[-1] == written['EEG'][0].shape[-1] + 5
+    RNStream(stream.fn).stream_out({'EEG': [np.zeros((8, 5), dtype=np.float32), np.arange(5) + 200.]})
+    reloaded = RNStream(stream.fn)
+    assert reloaded._load_index_file() is not None
+    assert len(reloaded.read_range('EEG', 0, 300)[1]) == len(written['EEG'][1]) + 10
+
+
+def test_stream_in_memmap_matches_stream_in(recorded_stream):
+    stream, written = recorded_stream
+    buffer = RNStream(stream.fn).stream_in_memmap(jitter_removal=False)
+    for stream_name, (data, timestamps) in written.items():
+        assert buffer[stream_name][0].shape == data.shape
+        assert buffer[stream_name][0].dtype == data.dtype
+        assert np.array_equal(np.asarray(buffer[stream_name][0]), data)
+        assert np.array_equal(buffer[stream_name][1], timestamps)
+
+
+def test_memmap_array_indexing(recorded_stream):
+    stream, written = recorded_stream
+    lazy_eeg = RNStream(stream.fn).stream_in_memmap(jitter_removal=False)['EEG'][0]
+    eeg = written['EEG'][0]
+    # within a single chunk, these are views of the memory map
+    assert np.array_equal(lazy_eeg[..., 10:20], eeg[..., 10:20])
+    assert np.array_equal(lazy_eeg[:, -1], eeg[:, -1])
+    assert np.array_equal(lazy_eeg[3, 150], eeg[3, 150])
+    # spanning chunks
+    assert np.array_equal(lazy_eeg[..., 50:750], eeg[..., 50:750])
+    assert np.array_equal(lazy_eeg[2:5, 950:40:-7], eeg[2:5, 950:40:-7])
+    assert np.array_equal(lazy_eeg[:, [999, 0, 150, 151, 150]], eeg[:, [999, 0, 150, 151, 150]])
+    assert np.array_equal(lazy_eeg[1], eeg[1])
+    assert lazy_eeg[..., 5:5].shape == (8, 0)
+    with pytest.raises(IndexError):
+        lazy_eeg[0, 1000]
+
+    lazy_camera = RNStream(stream.fn).stream_in_memmap(jitter_removal=False)['Camera'][0]
+    flattened = lazy_camera.reshape((-1, lazy_camera.shape[-1]))
+    assert np.array_equal(np.asarray(flattened), written['Camera'][0].reshape((-1, written['Camera'][0].shape[-1])))
+    assert np.array_equal(lazy_camera[:, :, :, 7], written['Camera'][0][:, :, :, 7])
+
+
+def create_video(n_frames, shape=(48, 64, 3)):
+    """
+    a gradient that moves, smooth like a camera frame so the codecs compress it
+    """
+    rows, columns = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing='ij')
+    frames = [np.stack([(rows + i) % 256, (columns * 2 + i) % 256, (rows + columns + 3 * i) % 256][:shape[2] if len(shape) == 3 else 1], axis=-1).reshape(shape)
+              for i in range(n_frames)]
+    return np.stack(frames, axis=-1).astype(np.uint8)
+
+
+@pytest.fixture
+def compressed_stream(tmp_path):
+    stream = RNStream(str(tmp_path / 'compressed.dats'), video_codecs={'Camera': 'png', 'Screen': 'jpeg', 'Gray': 'png'})
+    written = {'Camera': ([], []), 'Screen': ([], []), 'Gray': ([], []), 'EEG': ([], [])}
+    for i in range(6):
+        timestamps = 1000 + np.sort(np.random.uniform(0, 1, 5)) + i  # irregular, they must be kept exactly
+        chunk = {'Camera': [create_video(5)[..., ::-1], timestamps], 'Screen': [create_video(5, (32, 40, 3)), timestamps],
+                 'Gray': [create_video(5, (16, 20)), timestamps], 'EEG': [np.random.random((4, 5)), timestamps]}
+        stream.stream_out(chunk)
+        for stream_name, (data, chunk_timestamps) in chunk.items():
+            written[stream_name][0].append(data)
+            written[stream_name][1].append(chunk_timestamps)
+    written = {s: [np.concatenate(d, axis=-1), np.concatenate(t)] for s, (d, t) in written.items()}
+    return stream, written
+
+
+def check_decoded(buffer, written):
+    for stream_name, (data, timestamps) in written.items():
+        decoded = np.asarray(buffer[stream_name][0])
+        assert decoded.shape == data.shape and decoded.dtype == data.dtype
+        assert np.array_equal(buffer[stream_name][1], timestamps)
+        if stream_name == 'Screen':  # jpeg is lossy
+            assert np.mean(np.abs(decoded.astype(float) - data)) < 4
+        else:
+            assert np.array_equal(decoded, data)
+
+
+@pytest.mark.parametrize('remove_index', [False, True])
+def test_compressed_video_stream_in(compressed_stream, remove_index):
+    stream, written = compressed_stream
+    if remove_index:
+        os.remove(stream.index_fn)
+    check_decoded(RNStream(stream.fn).stream_in(jitter_removal=False), written)
+    check_decoded(RNStream(stream.fn).stream_in_memmap(jitter_removal=False), written)
+    assert RNStream(stream.fn).get_stream_names() == list(written) * 6
+
+    file, buffer, finished = None, None, False
+    while not finished:
+        file, buffer, _, _, finished = RNStream(stream.fn).stream_in_stepwise(file, buffer, None, jitter_removal=False)
+    check_decoded(buffer, written)
+
+    data, timestamps = RNStream(stream.fn).read_range('Camera', written['Camera'][1][7], written['Camera'][1][21])
+    assert np.array_equal(data, written['Camera'][0][..., 7:22]) and np.array_equal(timestamps, written['Camera'][1][7:22])
+
+
+def test_compressed_video_indexing(compressed_stream, tmp_path):
+    stream, written = compressed_stream
+    lazy_camera = RNStream(stream.fn).stream_in_memmap(jitter_removal=False)['Camera'][0]
+    camera = written['Camera'][0]
+    assert np.array_equal(lazy_camera[..., 3], camera[..., 3])
+    assert np.array_equal(lazy_camera[2:5, :, 1, 6:9], camera[2:5, :, 1, 6:9])
+    assert np.array_equal(lazy_camera[..., 2:23:4], camera[..., 2:23:4])
+    assert np.array_equal(lazy_camera[:, 1:3, :, [29, 0, 12]], camera[:, 1:3, :, [29, 0, 12]])
+    assert np.array_equal(np.asarray(lazy_camera.reshape((-1, 30))), camera.reshape((-1, 30)))
+
+    video_path = str(tmp_path / 'camera.avi')
+    RNStream(stream.fn).generate_video('Camera', video_path)
+    assert os.path.getsize(video_path) > 0
+
+    raw_stream = RNStream(str(tmp_path / 'raw.dats'))
+    raw_stream.stream_out({'Camera': written['Camera']})
+    assert os.path.getsize(stream.fn) < os.path.getsize(raw_stream.fn)
+
+
+def test_frames_that_cannot_be_encoded_are_written_raw(tmp_path):
+    stream = RNStream(str(tmp_path / 'test.dats'), video_codecs={'Camera': 'jpeg'})
+    frames = np.random.random((4, 4, 3, 2))  # not uint8
+    with pytest.warns(UserWarning, match='cannot be encoded'):
+        stream.stream_out({'Camera': [frames, np.arange(2.)]})
+    assert np.array_equal(RNStream(stream.fn).stream_in(jitter_removal=False)['Camera'][0], frames)
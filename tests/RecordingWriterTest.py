@@ -0,0 +1,85 @@
+import queue
+import threading
+
+import numpy as np
+import pytest
+
+from physiolabxr.exceptions.exceptions import TrySerializeObjectError
+from physiolabxr.threadings.RecordingWriter import RecordingWriter
+from physiolabxr.utils.RNStream import RNStream
+
+
+def test_writer_matches_stream_out(tmp_path):
+    buffers = []
+    for i in range(20):
+        timestamps = np.arange(i * 50, (i + 1) * 50) / 50.
+        buffers.append({'EEG': [np.random.random((8, 50)), timestamps],
+                        'Camera': [np.random.randint(0, 255, (4, 3, 2), dtype=np.uint8), timestamps[::25]]})
+
+    reference = RNStream(str(tmp_path / 'reference.dats'))
+    for buffer in buffers:
+        reference.stream_out(buffer)
+
+    writer = RecordingWriter(RNStream(str(tmp_path / 'written.dats')), max_queue_size=2)
+    writer.start()
+    for buffer in buffers:
+        writer.write(buffer)
+    writer.close()
+
+    assert (tmp_path / 'written.dats').read_bytes() == (tmp_path / 'reference.dats').read_bytes()
+    assert (tmp_path / 'written.dats.idx').read_bytes() == (tmp_path / 'reference.dats.idx').read_bytes()
+    metrics = writer.get_metrics()
+    assert metrics['written_bytes'] == (tmp_path / 'written.dats').stat().st_size
+    assert metrics['queue_depth'] == 0 and metrics['write_latency'] > 0 and metrics['bytes_per_second'] > 0
+
+
+def test_write_blocks_when_queue_is_full(tmp_path):
+    rn_stream = RNStream(str(tmp_path / 'test.dats'))
+    unblock_disk = threading.Event()
+    stream_out = rn_stream.stream_out
+    rn_stream.stream_out = lambda buffer: unblock_disk.wait() and stream_out(buffer)  # a disk that does not keep up
+
+    writer = RecordingWriter(rn_stream, max_queue_size=1)
+    writer.start()
+    buffer = {'EEG': [np.zeros((2, 3)), np.arange(3.)]}
+    writer.write(buffer)  # taken by the writer, which is stuck writing it
+    while writer.buffer_queue.qsize() > 0:
+        pass
+    writer.write(buffer)  # fills the queue
+    with pytest.raises(queue.Full):
+        writer.write(buffer, timeout=0.1)
+
+    unblock_disk.set()
+    writer.close()
+    assert RNStream(str(tmp_path / 'test.dats')).stream_in(jitter_removal=False)['EEG'][0].shape == (2, 6)
+
+
+def test_abort_does_not_block_when_queue_is_full(tmp_path):
+    rn_stream = RNStream(str(tmp_path / 'test.dats'))
+    unblock_disk = threading.Event()
+    stream_out = rn_stream.stream_out
+    rn_stream.stream_out = lambda buffer: unblock_disk.wait() and stream_out(buffer)
+
+    writer = RecordingWriter(rn_stream, max_queue_size=1)
+    writer.start()
+    buffer = {'EEG': [np.zeros((2, 3)), np.arange(3.)]}
+    writer.write(buffer)
+    while writer.buffer_queue.qsize() > 0:
+        pass
+    writer.write(buffer)
+    writer.abort()  # returns though the queue is full
+    unblock_disk.set()
+    writer.join(timeout=5)
+    assert not writer.is_alive()
+    assert RNStream(str(tmp_path / 'test.dats')).stream_in(jitter_removal=False)['EEG'][0].shape == (2, 3)  # the queued buffer is not written
+
+
+def test_error_is_raised_to_the_recording_side(tmp_path):
+    writer = RecordingWriter(RNStream(str(tmp_path / 'test.dats')))
+    writer.start()
+    writer.write({'Objects': [np.array([[object()]]), np.array([0.])]})
+    with pytest.raises(TrySerializeObjectError):
+        writer.close()
+
+    with pytest.raises(FileNotFoundError):
+        RecordingWriter(RNStream(str(tmp_path / 'not_a_directory' / 'test.dats'))).start()
@@ -0,0 +1,110 @@
+"""
+Tests the batched output of RenaScript without starting a script process, the outlets are replaced by sockets that
+keep the frames they are sent.
+
+Run with pytest -s to see the time to send the output.
+"""
+import time
+
+import numpy as np
+import pytest
+import zmq
+
+from physiolabxr.exceptions.exceptions import BadOutputError
+from physiolabxr.presets.PresetEnums import DataType, PresetType
+from physiolabxr.presets.ScriptPresets import ScriptOutput
+from physiolabxr.scripting.RenaScript import RenaScript
+from physiolabxr.utils.buffers import SlidingWindowBuffer
+from physiolabxr.utils.networking_utils import decode_zmq_samples
+
+
+class FrameCollector:
+    def __init__(self):
+        self.frames = []
+
+    def send_multipart(self, frame, flags=0):
+        self.frames.append([bytes(part) for part in frame])
+
+
+class FeatureScript(RenaScript):
+    def init(self):
+        pass
+
+    def loop(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+    def __del__(self):
+        pass  # no sockets to close
+
+
+def create_script_outputs(n_channels, data_type=DataType.float32):
+    """
+    a script with only what its outputs need, the sockets and the script process are not set up
+    """
+    script = FeatureScript.__new__(FeatureScript)
+    output = ScriptOutput(stream_name='Features', num_channels=n_channels, interface_type=PresetType.ZMQ, data_type=data_type, port_number=0)
+    script.output_num_channels = {output.stream_name: n_channels}
+    script._output_staging = {output.stream_name: SlidingWindowBuffer((n_channels,), data_type.get_data_type(), initial_capacity=16)}
+    return script
+
+
+def send_staged(script, outlet):
+    staging = script._output_staging['Features']
+    script._send_output_chunk('Features', outlet, staging.data, staging.timestamps)
+    staging.reset()
+
+
+def test_appended_frames_are_sent_as_one_chunk():
+    script, outlet = create_script_outputs(4), FrameCollector()
+    features = np.random.random((100, 4))
+    timestamps = np.arange(100) / 1000.
+    storage = script._output_staging['Features']._data
+    for loop in range(3):
+        for i in range(0, 100, 10):
+            script.append_output('Features', features[i:i + 10], timestamps[i:i + 10])  # frames x channels
+        script.append_output('Features', features[0].tolist(), 5.)  # a single frame given as a list
+        send_staged(script, outlet)
+    assert script._output_staging['Features']._data is not storage  # grown once to fit a loop's frames
+    storage = script._output_staging['Features']._data
+    script.append_output('Features', features.T)  # channels x frames, timestamped with the local clock
+    send_staged(script, outlet)
+    assert script._output_staging['Features']._data is storage  # then reused
+
+    assert len(outlet.frames) == 4
+    for topic, timestamp_frame, data_frame in outlet.frames[:3]:
+        received_timestamps, received_data = decode_zmq_samples(timestamp_frame, data_frame, np.float32)
+        assert topic == b'Features'
+        assert np.array_equal(received_timestamps, np.append(timestamps, 5.))
+        assert np.allclose(received_data, np.concatenate([features, features[:1]]).T.astype(np.float32))
+    received_timestamps, _ = decode_zmq_samples(outlet.frames[3][1], outlet.frames[3][2], np.float32)
+    assert np.all(received_timestamps == received_timestamps[0])
+
+    with pytest.raises(BadOutputError):
+        script.append_output('Features', np.zeros(3))
+
+
+def test_batched_output_speed():
+    n_frames, n_channels = 1000, 64
+    context = zmq.Context()
+    socket = context.socket(zmq.PUB)
+    socket.bind('tcp://127.0.0.1:*')
+    features, timestamps = np.random.random((n_frames, n_channels)).astype(np.float32), np.arange(n_frames) / 1000.
+
+    start_time = time.perf_counter()
+    for i in range(n_frames):  # how a chunk with timestamps was sent before
+        socket.send_multipart([b'Features', np.array(timestamps[i]), np.ascontiguousarray(features[i])])
+    per_frame_time = time.perf_counter() - start_time
+
+    script = create_script_outputs(n_channels)
+    start_time = time.perf_counter()
+    script.append_output('Features', features, timestamps)
+    send_staged(script, socket)
+    batched_time = time.perf_counter() - start_time
+    socket.close()
+    context.term()
+
+    print(f"\nsending {n_frames} frames of {n_channels} channels: per frame {per_frame_time * 1e3:.2f}ms, batched {batched_time * 1e3:.2f}ms")
+    assert batched_time < per_frame_time
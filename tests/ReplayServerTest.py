@@ -0,0 +1,204 @@
+"""
+Tests the chunk scheduling of the ReplayServer without the replay tab, the outlets are replaced by sockets that keep
+the frames they are sent.
+
+Run with pytest -s to see the replay performance.
+"""
+import time
+
+import numpy as np
+import zmq
+
+from physiolabxr.configs import shared
+from physiolabxr.sub_process.ReplayPrefetcher import ReplayPrefetcher
+from physiolabxr.sub_process.ReplayServer import ReplayServer
+from physiolabxr.utils.RNStream import RNStream
+from physiolabxr.utils.networking_utils import decode_zmq_samples
+from physiolabxr.utils.xdf_utils import save_xdf, load_xdf, load_xdf_lazy
+
+
+class FrameCollector:
+    def __init__(self, replay_server, full_every=None):
+        """
+        @param full_every: if given, every this many sends fail as if a subscriber were full
+        """
+        self.replay_server = replay_server
+        self.frames = []
+        self.full_every = full_every
+        self.n_sends = 0
+
+    def send_multipart(self, frame, flags=0):
+        self.n_sends += 1
+        if self.full_every is not None and self.n_sends % self.full_every == 0:
+            raise zmq.error.Again()
+        self.replay_server.update_virtual_clock()
+        self.frames.append((self.replay_server.virtual_clock, [bytes(f) for f in frame]))  # as a subscriber receives them
+
+
+def replay_streams(stream_data, chunk_duration=0.01, playback_rate=1., full_every=None, look_ahead_duration=None):
+    """
+    @param look_ahead_duration: if given, the data are read through a ReplayPrefetcher with this look-ahead
+    """
+    replay_server = ReplayServer(None, chunk_duration=chunk_duration, look_ahead_duration=look_ahead_duration)
+    replay_server.stream_data = {stream_name: list(data_timestamps) for stream_name, data_timestamps in stream_data.items()}
+    replay_server.setup_stream()
+    replay_server.outlets = {stream_name: FrameCollector(replay_server, full_every) for stream_name in replay_server.stream_names}
+    replay_server.playback_rate = playback_rate
+    if look_ahead_duration is not None:
+        replay_server.start_prefetcher()
+
+    start_time = time.perf_counter()
+    while len(replay_server.remaining_stream_names) > 0:
+        replay_server.replay()
+    replay_time = time.perf_counter() - start_time
+    if look_ahead_duration is not None:
+        replay_server.prefetcher.stop()
+    return replay_server, replay_time
+
+
+def test_replay_sends_all_samples_in_chunks_when_due():
+    srate, duration = 1000, 1.
+    eeg_timestamps = np.arange(0, duration, 1 / srate) + 100.
+    video_timestamps = np.arange(0, duration, 1 / 30) + 100.
+    stream_data = {'EEG': (np.random.random((256, len(eeg_timestamps))), eeg_timestamps)}
+    for i in range(3):
+        stream_data[f'Camera{i}'] = (np.random.randint(0, 255, (240, 320, 3, len(video_timestamps)), dtype=np.uint8), video_timestamps)
+
+    replay_server, replay_time = replay_streams(stream_data)
+    print(f"\nreplayed {duration}s of 1 kHz x 256 channels and 3 videos in {replay_time:.3f}s, "
+          f"max sustained {replay_server.get_max_sustained_samples_per_second():.0f} samples/s")
+    assert replay_server.get_max_sustained_samples_per_second() > srate + 3 * 30
+
+    for stream_name, (data, timestamps) in stream_data.items():
+        outlet_name = 'video' + stream_name if data.ndim > 2 else stream_name
+        frames = replay_server.outlets[outlet_name].frames
+        assert len(frames) < len(timestamps) or data.ndim > 2  # the EEG is sent in chunks
+        received_timestamps, received_data = [], []
+        for virtual_clock, (topic, timestamp_frame, data_frame) in frames:
+            chunk_timestamps, chunk_data = decode_zmq_samples(timestamp_frame, data_frame, data.dtype)
+            assert topic.decode('utf-8') == outlet_name
+            # a chunk is sent when the virtual clock reaches its last sample
+            assert virtual_clock >= chunk_timestamps[-1] - replay_server.virtual_clock_offset - 1e-3
+            received_timestamps.append(chunk_timestamps)
+            received_data.append(chunk_data)
+        assert np.allclose(np.concatenate(received_timestamps) - replay_server.virtual_clock_offset, timestamps)
+        assert np.array_equal(np.concatenate(received_data, axis=-1), data.reshape((-1, len(timestamps))))
+
+
+def test_set_to_time_reschedules():
+    timestamps = np.arange(0, 10, 0.01)
+    replay_server = ReplayServer(None)
+    replay_server.stream_data = {'EEG': [np.random.random((4, len(timestamps))), timestamps]}
+    replay_server.setup_stream()
+    replay_server.outlets = {'EEG': FrameCollector(replay_server)}
+    replay_server.slider_offset_time += 9.5
+    replay_server.set_to_time(9.5)
+    while len(replay_server.remaining_stream_names) > 0:
+        replay_server.replay()
+    _, timestamp_frame, _ = replay_server.outlets['EEG'].frames[0][1]
+    first_timestamp = np.frombuffer(timestamp_frame)[0] - replay_server.virtual_clock_offset + replay_server.slider_offset_time
+    assert np.isclose(first_timestamp, timestamps[timestamps > 9.5][0])
+
+
+def get_received_timestamps(replay_server, stream_name):
+    return np.concatenate([np.frombuffer(timestamp_frame) for _, (_, timestamp_frame, _) in replay_server.outlets[stream_name].frames])
+
+
+def test_playback_rate():
+    timestamps = np.arange(0, 2, 0.001) + 50.
+    stream_data = {'EEG': (np.random.random((8, len(timestamps))), timestamps), 'Markers': (np.ones((1, 4)), timestamps[::500])}
+    replay_server, replay_time = replay_streams(stream_data, playback_rate=4.)
+    assert replay_time > 0.45  # 2 seconds at 4x, it can only take longer when the machine is busy
+    for stream_name, (_, original_timestamps) in stream_data.items():  # the timestamps are rescaled the same way for all streams
+        received_timestamps = get_received_timestamps(replay_server, stream_name)
+        assert np.allclose(received_timestamps - replay_server.virtual_clock_offset, (original_timestamps - 50.) / 4 + 50.)
+
+
+def test_unthrottled_replay_retries_full_outlets():
+    timestamps = np.arange(0, 60, 0.001)
+    stream_data = {'EEG': (np.random.random((8, len(timestamps))), timestamps)}
+    replay_server, _ = replay_streams(stream_data, playback_rate=shared.UNTHROTTLED_PLAYBACK_RATE, full_every=7)
+    received_timestamps = get_received_timestamps(replay_server, 'EEG')
+    assert np.allclose(received_timestamps - replay_server.virtual_clock_offset, timestamps)  # spaced as in real time, nothing dropped
+
+
+def test_set_playback_rate_keeps_virtual_clock():
+    timestamps = np.arange(0, 10, 0.01)
+    replay_server = ReplayServer(None)
+    replay_server.stream_data = {'EEG': [np.random.random((4, len(timestamps))), timestamps]}
+    replay_server.setup_stream()
+    for playback_rate in [3., shared.UNTHROTTLED_PLAYBACK_RATE, 0.5]:
+        replay_server.update_virtual_clock()
+        virtual_clock = replay_server.virtual_clock
+        replay_server.set_playback_rate(playback_rate)
+        replay_server.update_virtual_clock()
+        assert abs(replay_server.virtual_clock - virtual_clock) < 1e-2
+
+    assert shared.parse_playback_rate(shared.add_playback_rate(shared.LOAD_COMMAND + '/a/b.dats', 2)) == (shared.LOAD_COMMAND + '/a/b.dats', 2.)
+    assert shared.parse_playback_rate(shared.add_playback_rate(shared.START_REPLAY_COMMAND, shared.UNTHROTTLED_PLAYBACK_RATE)) == (shared.START_REPLAY_COMMAND, shared.UNTHROTTLED_PLAYBACK_RATE)
+    assert shared.parse_playback_rate(shared.START_REPLAY_COMMAND) == (shared.START_REPLAY_COMMAND, None)
+
+
+def write_recording(file_path, duration=4., srate=500):
+    stream = RNStream(file_path)
+    written = {'EEG': ([], []), 'Camera': ([], [])}
+    for start in np.arange(0, duration, 0.5):  # evicted every half second, like a recording
+        eeg_timestamps = np.arange(start, start + 0.5, 1 / srate) + 100.
+        camera_timestamps = np.arange(start, start + 0.5, 1 / 30) + 100.
+        buffer = {'EEG': [np.random.random((16, len(eeg_timestamps))).astype(np.float32), eeg_timestamps],
+                  'Camera': [np.random.randint(0, 255, (12, 16, 3, len(camera_timestamps)), dtype=np.uint8), camera_timestamps]}
+        stream.stream_out(buffer)
+        for stream_name, (data, timestamps) in buffer.items():
+            written[stream_name][0].append(data)
+            written[stream_name][1].append(timestamps)
+    return {stream_name: (np.concatenate(data, axis=-1), np.concatenate(timestamps)) for stream_name, (data, timestamps) in written.items()}
+
+
+def get_received_data(replay_server, stream_name, dtype):
+    return np.concatenate([decode_zmq_samples(timestamp_frame, data_frame, dtype)[1] for _, (_, timestamp_frame, data_frame) in replay_server.outlets[stream_name].frames], axis=-1)
+
+
+def test_replay_from_disk_with_prefetcher(tmp_path, monkeypatch):
+    monkeypatch.setattr('physiolabxr.utils.xdf_utils.get_stream_nominal_sampling_rate', lambda stream_name: 0)  # no presets
+    written = write_recording(str(tmp_path / 'test.dats'))
+    save_xdf(str(tmp_path / 'test.xdf'), RNStream(str(tmp_path / 'test.dats')).stream_in_memmap(jitter_removal=False))
+
+    lazy_xdf = load_xdf_lazy(str(tmp_path / 'test.xdf'))
+    for stream_name, (data, timestamps) in load_xdf(str(tmp_path / 'test.xdf')).items():
+        assert not isinstance(lazy_xdf[stream_name][0], np.ndarray)
+        assert np.array_equal(np.asarray(lazy_xdf[stream_name][0]), data)
+        assert np.array_equal(lazy_xdf[stream_name][1], written[stream_name][1])
+
+    for stream_data in (RNStream(str(tmp_path / 'test.dats')).stream_in_memmap(jitter_removal=False), lazy_xdf):
+        replay_server, _ = replay_streams(stream_data, playback_rate=shared.UNTHROTTLED_PLAYBACK_RATE, look_ahead_duration=0.5)
+        for stream_name, (data, _) in written.items():
+            outlet_name = 'video' + stream_name if data.ndim > 2 else stream_name
+            assert np.array_equal(get_received_data(replay_server, outlet_name, data.dtype), data.reshape((-1, data.shape[-1])))
+
+
+def test_prefetcher_bounds_look_ahead_and_seeks():
+    timestamps = np.arange(0, 100, 0.01)
+    data = np.arange(4 * len(timestamps)).reshape((4, -1))
+    lazy_data = type('LazyData', (), {'__getitem__': lambda self, key: data[key]})()
+    prefetcher = ReplayPrefetcher({'EEG': [lazy_data, timestamps]}, look_ahead_duration=1.)
+    prefetcher.start()
+
+    def wait_for_look_ahead(next_sample_index):
+        while len(prefetcher.blocks['EEG']) == 0 or prefetcher.blocks['EEG'][-1][1] - next_sample_index < 100:
+            time.sleep(1e-3)
+        time.sleep(0.05)  # the prefetcher would have read beyond the look-ahead by now if it were not bounded
+        with prefetcher.lock:
+            return prefetcher.blocks['EEG'][0][0], prefetcher.blocks['EEG'][-1][1]
+
+    assert np.array_equal(prefetcher.get_data('EEG', 0, 10), data[:, :10])
+    cached_start, cached_end = wait_for_look_ahead(10)
+    # the first block starts where the replay was when the prefetcher read it, before or after the get_data
+    assert cached_start in (0, 10) and cached_end <= 10 + 100 + 25 + 1
+    assert np.array_equal(prefetcher.get_data('EEG', 10, 80), data[:, 10:80])
+
+    prefetcher.seek({'EEG': 5000})  # e.g., the slider moved
+    assert np.array_equal(prefetcher.get_data('EEG', 5000, 5003), data[:, 5000:5003])
+    cached_start, cached_end = wait_for_look_ahead(5003)
+    assert cached_start in (5000, 5003) and cached_end <= 5003 + 100 + 25 + 1
+    assert np.array_equal(prefetcher.get_data('EEG', 5003, 9999), data[:, 5003:9999])  # beyond the look-ahead is read directly
+    prefetcher.stop()
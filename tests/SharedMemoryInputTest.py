@@ -0,0 +1,117 @@
+"""
+Tests the shared memory transport of the script inputs against the TCP transport it falls back to, without the
+scripting widget. The main app side is a dealer socket, the script side a router socket, as in ScriptingWidget and
+RenaScript.
+
+Run with pytest -s to see the transport times.
+"""
+import time
+from multiprocessing import Process, Pipe
+
+import numpy as np
+import pytest
+
+from physiolabxr.sub_process.TCPInterface import RenaTCPInterface
+from physiolabxr.utils.buffers import DataBuffer
+from physiolabxr.utils.networking_utils import send_data_dict, recv_data_dict, send_shared_memory_info
+from physiolabxr.utils.shared_memory_utils import SharedMemoryRing, SharedMemoryRingReader
+
+
+@pytest.fixture
+def socket_interfaces():
+    server = RenaTCPInterface(stream_name='RENA_SCRIPTING_INPUT', port_id=0, identity='server', pattern='router-dealer')
+    client = RenaTCPInterface(stream_name='RENA_SCRIPTING_INPUT', port_id=server.binded_port, identity='client', pattern='router-dealer', disable_linger=True)
+    yield server, client
+    client.socket.close()
+    server.socket.close()
+
+
+def create_chunks(frame_shape, dtype, n_chunks, chunk_size):
+    return [((np.random.random(frame_shape + (chunk_size,)) * 100).astype(dtype), np.arange(i * chunk_size, (i + 1) * chunk_size) / 1000.) for i in range(n_chunks)]
+
+
+def test_ring_wraps_and_drops_overwritten_frames():
+    ring = SharedMemoryRing((3,), np.int16, capacity=10)
+    reader = SharedMemoryRingReader()
+    chunks = create_chunks((3,), np.int16, 6, 4)
+    read_frames, read_timestamps = [], []
+    for frames, timestamps in chunks:  # 4 frames at a time wrap around the 10 frame ring
+        ring.write(frames, timestamps)
+        data_dict = reader.read({'EEG': ring.get_info()})
+        read_frames.append(data_dict['EEG'][0].copy())
+        read_timestamps.append(data_dict['EEG'][1].copy())
+    assert np.array_equal(np.concatenate(read_frames, axis=-1), np.concatenate([frames for frames, _ in chunks], axis=-1))
+    assert np.array_equal(np.concatenate(read_timestamps), np.concatenate([timestamps for _, timestamps in chunks]))
+    assert reader.read({'EEG': ring.get_info()}) == {}  # nothing new
+
+    for frames, timestamps in chunks[:4]:  # the reader falls behind by more than the ring holds
+        ring.write(frames, timestamps)
+    with pytest.warns(UserWarning):
+        frames, timestamps = reader.read({'EEG': ring.get_info()})['EEG']
+    assert np.array_equal(frames, np.concatenate([frames for frames, _ in chunks[:4]], axis=-1)[:, -10:])
+    reader.close()
+    ring.close()
+
+
+def script_process(ring_info, conn):
+    ring = SharedMemoryRing.open(ring_info)
+    frames, timestamps = ring.read(0, ring_info['write_count'])
+    conn.send((frames.copy(), timestamps.copy()))
+    del frames, timestamps
+    ring.close()
+
+
+def test_ring_is_shared_with_another_process():
+    ring = SharedMemoryRing((2, 3), np.float32, capacity=8)
+    frames, timestamps = create_chunks((2, 3), np.float32, 1, 5)[0]
+    ring.write(frames, timestamps)
+    parent_conn, child_conn = Pipe()
+    process = Process(target=script_process, args=(ring.get_info(), child_conn))
+    process.start()
+    received_frames, received_timestamps = parent_conn.recv()
+    process.join()
+    assert np.array_equal(received_frames, frames) and np.array_equal(received_timestamps, timestamps)
+    ring.close()
+
+
+def forward_inputs(socket_interfaces, chunks, use_shared_memory):
+    """
+    forward the chunks as the scripting widget would, one chunk per run signal, into the script's input buffer
+    """
+    server, client = socket_interfaces
+    main_app_buffer = DataBuffer(stream_buffer_sizes={'EEG': 2 * chunks[0][0].shape[-1]})
+    ring = SharedMemoryRing(chunks[0][0].shape[:-1], chunks[0][0].dtype, capacity=2 * chunks[0][0].shape[-1]) if use_shared_memory else None
+    reader, inputs = SharedMemoryRingReader(), DataBuffer(stream_buffer_sizes={'EEG': len(chunks) * chunks[0][0].shape[-1]})
+
+    start_time = time.perf_counter()
+    for frames, timestamps in chunks:
+        if use_shared_memory:
+            ring.write(frames, timestamps)
+            send_shared_memory_info({'EEG': ring.get_info()}, client)
+        else:
+            main_app_buffer.update_buffer({'stream_name': 'EEG', 'frames': frames, 'timestamps': timestamps})
+            send_data_dict(main_app_buffer.buffer, client)
+            main_app_buffer.clear_buffer()
+        inputs.update_buffers(recv_data_dict(server, reader))
+    transport_time = time.perf_counter() - start_time
+
+    reader.close()
+    if ring is not None:
+        ring.close()
+    return inputs, transport_time
+
+
+def test_shared_memory_matches_tcp(socket_interfaces):
+    results = {}
+    for frame_shape in [(256,), (240 * 320 * 3,)]:  # the inputs are two dimensional, video frames are flattened
+        chunks = create_chunks(frame_shape, np.float32 if frame_shape[0] == 256 else np.uint8, 30, 10)
+        tcp_inputs, tcp_time = forward_inputs(socket_interfaces, chunks, use_shared_memory=False)
+        shared_memory_inputs, shared_memory_time = forward_inputs(socket_interfaces, chunks, use_shared_memory=True)
+        for inputs in (tcp_inputs, shared_memory_inputs):
+            assert np.array_equal(inputs['EEG'][0], np.concatenate([frames for frames, _ in chunks], axis=-1))
+            assert np.array_equal(inputs['EEG'][1], np.concatenate([timestamps for _, timestamps in chunks]))
+        results[frame_shape] = tcp_time, shared_memory_time
+
+    print("\ntime to forward 30 chunks of 10 frames to the script's input buffer (ms)")
+    for frame_shape, (tcp_time, shared_memory_time) in results.items():
+        print(f"{str(frame_shape):>16}  tcp {tcp_time * 1e3:8.1f}  shared memory {shared_memory_time * 1e3:8.1f}")
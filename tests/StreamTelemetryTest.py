@@ -0,0 +1,97 @@
+"""
+Tests the stream health computed by StreamTelemetry from the timestamps of the chunks, and the metrics served by
+TelemetryServer.
+
+Run with pytest -s to see the time an update takes.
+"""
+import json
+import time
+import urllib.request
+
+import numpy as np
+import pytest
+
+from physiolabxr.utils.stream_telemetry import StreamHealth, StreamTelemetry, TelemetryServer
+
+
+def test_gaps_drops_and_out_of_order():
+    health = StreamHealth(nominal_sampling_rate=100.)
+    timestamps = np.arange(1000) / 100.
+    timestamps = np.delete(timestamps, np.s_[200:210])  # 10 samples lost within a chunk
+    timestamps = np.delete(timestamps, np.s_[490:495])  # 5 samples lost between two chunks
+    for chunk in np.split(timestamps, [100, 490, 600]):
+        health.update(chunk, arrival_time=0.)
+    metrics = health.get_metrics(now=1.)
+    assert metrics['sample_count'] == len(timestamps) and metrics['chunk_count'] == 4
+    assert metrics['gap_count'] == 2 and metrics['dropped_sample_count'] == 15 and metrics['max_gap'] == pytest.approx(0.11)
+    assert metrics['out_of_order_count'] == 0
+    assert metrics['seconds_since_last_chunk'] == 1.
+
+    timestamps[[700, 701]] = timestamps[[701, 700]]  # a sample timestamped before the one before it
+    irregular = StreamHealth(nominal_sampling_rate=0.)  # a stream without a nominal rate has no gaps
+    irregular.update(timestamps[:650])
+    irregular.update(timestamps[650:])
+    assert irregular.get_metrics()['gap_count'] == 0 and irregular.get_metrics()['out_of_order_count'] == 1
+    irregular.update(timestamps[:1])  # out of order with the last chunk
+    assert irregular.get_metrics()['out_of_order_count'] == 2
+
+
+def test_effective_sampling_rate():
+    health = StreamHealth(nominal_sampling_rate=100., rate_window=5.)
+    assert health.get_effective_sampling_rate(now=0.) == 0.
+    for i in range(100):  # chunks of 10 samples every 0.1 seconds
+        health.update(np.arange(i * 10, (i + 1) * 10) / 100., arrival_time=i * 0.1)
+        if i == 19:
+            assert health.get_effective_sampling_rate(now=2.) == pytest.approx(100., rel=0.05)  # since the first chunk
+    assert health.get_effective_sampling_rate(now=10.) == pytest.approx(100., rel=0.05)  # in the last 5 seconds
+    assert health.get_effective_sampling_rate(now=13.) == pytest.approx(40., rel=0.05)  # the stream stopped at 10 seconds
+    assert health.get_effective_sampling_rate(now=20.) == 0.
+
+
+def test_latency_stages():
+    telemetry = StreamTelemetry()
+    telemetry.reset('LatencyTest')
+    telemetry.update('LatencyTest', [0.9, 1.], nominal_sampling_rate=10., arrival_time=1.5)
+    telemetry.update('LatencyTest', [1.1, 1.2], arrival_time=1.3)
+    telemetry.record_latency('LatencyTest', 'disk', 2.)
+    latency = telemetry.get_metrics('LatencyTest')['latency']
+    assert latency['receive'] == pytest.approx({'last': 0.1, 'mean': 0.3, 'max': 0.5})
+    assert latency['disk'] == {'last': 2., 'mean': 2., 'max': 2.}
+    assert telemetry.get_metrics('LatencyTest')['nominal_sampling_rate'] == 10.  # kept when not given
+    telemetry.reset('LatencyTest')
+    assert telemetry.get_metrics('LatencyTest') is None
+
+
+def test_server():
+    telemetry = StreamTelemetry()
+    telemetry.reset('Server "Test"')
+    telemetry.update('Server "Test"', np.arange(100) / 100., nominal_sampling_rate=100.)
+    server = TelemetryServer(0)
+    server.start()
+    try:
+        metrics = json.loads(urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics.json').read())
+        assert metrics['Server "Test"']['sample_count'] == 100 and metrics['Server "Test"']['gap_count'] == 0
+
+        text = urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics').read().decode('utf-8')
+        assert 'physiolabxr_stream_samples_total{stream="Server \\"Test\\""} 100' in text.splitlines()
+        assert '# TYPE physiolabxr_stream_dropped_samples_total counter' in text.splitlines()
+        assert any(line.startswith('physiolabxr_stream_latency_seconds{stream="Server \\"Test\\"",stage="receive",stat="mean"}') for line in text.splitlines())
+
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://127.0.0.1:{server.port}/unknown')
+    finally:
+        server.stop()
+    telemetry.reset('Server "Test"')
+
+
+def test_update_speed():
+    health = StreamHealth(nominal_sampling_rate=1000.)
+    n_updates = 10000
+    print(f"\n{'chunk size':>12}{'update (us)':>14}")
+    for chunk_size in (1, 10, 100):
+        chunks = [np.arange(i * chunk_size, (i + 1) * chunk_size) / 1000. for i in range(n_updates)]
+        start_time = time.perf_counter()
+        for chunk in chunks:
+            health.update(chunk)
+        print(f"{chunk_size:>12}{(time.perf_counter() - start_time) / n_updates * 1e6:>14.2f}")
+        health = StreamHealth(nominal_sampling_rate=1000.)
@@ -0,0 +1,71 @@
+"""
+Tests the StreamingSpectrogram the spectrogram plots transform their windows with against scipy.signal.spectrogram over
+the whole window every frame, as the spectrogram plots did, and its histogram levels against the percentiles of the
+spectrogram of every channel.
+
+Run with pytest -s to see the time to transform a frame.
+"""
+import time
+
+import numpy as np
+from scipy import signal
+
+from physiolabxr.utils.viz_utils import StreamingSpectrogram
+
+srate, nperseg, noverlap = 128, 64, 48
+
+
+def spectrogram_whole_window(window):
+    return signal.spectrogram(window, srate, window=signal.get_window('hann', nperseg), noverlap=noverlap, detrend=False, scaling='spectrum')[2]
+
+
+def test_matches_whole_window():
+    data = np.random.normal(0, 1, (4, 6000)) * np.array([[1], [10], [0.1], [1e-3]])  # channels of different powers
+    data[1, 1000:1100] = np.nan
+    max_window_size = 640
+    spectrogram = StreamingSpectrogram(4, srate, nperseg, noverlap, max_window_size)
+    assert np.array_equal(spectrogram.frequencies, signal.spectrogram(data[:, :nperseg], srate, nperseg=nperseg)[0])
+    n_samples = 0
+    for chunk_size in np.random.randint(0, 60, 150):  # some chunks are empty, some complete several segments
+        spectrogram.update(data[:, n_samples:n_samples + chunk_size])
+        n_samples += chunk_size
+        for window_size in {min(n_samples, max_window_size), min(n_samples, 300)}:
+            segment_start, columns = spectrogram.get(window_size)
+            window = data[:, n_samples - window_size + segment_start:n_samples]  # the segments are aligned to the stream, not the window
+            if window.shape[1] < nperseg:
+                assert columns.shape[1] == 0 and spectrogram.get_levels(window_size, 5, 95) is None
+                continue
+            assert segment_start < nperseg - noverlap
+            expected = spectrogram_whole_window(window)
+            assert np.allclose(columns, np.mean(expected, axis=0), equal_nan=True)
+
+            levels = spectrogram.get_levels(window_size, 5, 95)
+            expected_levels = np.nanpercentile(expected, [5, 95], method='lower')  # the sample at the rank, not interpolated to the next one, which can be bins away in the tails
+            assert np.all(np.abs(np.log10(levels) - np.log10(expected_levels)) <= 1 / spectrogram.level_bins_per_decade)  # within a bin
+
+
+def test_streaming_speed():
+    n_channels, display_duration, frame_rate = 32, 10, 50  # the spectrogram plot refreshes every 20ms
+    window_size = srate * display_duration
+    data = np.random.normal(0, 1, (n_channels, window_size + srate * 10))
+    frame_ends = np.arange(window_size, data.shape[1], srate // frame_rate)
+
+    start_time = time.perf_counter()
+    for end in frame_ends:  # what the spectrogram plot did every frame
+        Sxx = spectrogram_whole_window(data[:, end - window_size:end])
+        np.percentile(Sxx, [5, 95])
+        np.mean(Sxx, axis=0)
+    whole_window_time = time.perf_counter() - start_time
+
+    spectrogram = StreamingSpectrogram(n_channels, srate, nperseg, noverlap, window_size)
+    spectrogram.update(data[:, :frame_ends[0]])
+    start_time = time.perf_counter()
+    for last_end, end in zip(frame_ends[:-1], frame_ends[1:]):
+        spectrogram.update(data[:, last_end:end])
+        spectrogram.get_levels(window_size, 5, 95)
+        spectrogram.get(window_size)
+    streaming_time = time.perf_counter() - start_time
+
+    print(f"\nspectrogram of a {display_duration}s window of {n_channels} channels at {srate} Hz, {len(frame_ends) - 1} frames: "
+          f"whole window {whole_window_time / len(frame_ends) * 1e3:.3f}ms per frame, streaming {streaming_time / (len(frame_ends) - 1) * 1e3:.3f}ms per frame")
+    assert streaming_time < whole_window_time
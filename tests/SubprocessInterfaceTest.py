@@ -0,0 +1,288 @@
+"""
+Tests the interfaces run in their own process by SubprocessInterface against the same interfaces run in the main
+process, and benchmarks the throughput of many busy streams pulled on threads, as the workers do, in the two modes.
+
+Run with pytest -s to see the throughput and latency of the streams.
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+import zmq
+
+from physiolabxr.interfaces.SubprocessInterface import SubprocessInterface
+from physiolabxr.interfaces.ZMQInterface import ZMQInterface
+from physiolabxr.utils.buffers import DataBuffer
+from physiolabxr.utils.networking_utils import send_zmq_samples
+
+
+class CounterDevice:
+    """
+    a device whose channels count its samples, the frames change shape after shape_change_count samples and the
+    device disconnects after disconnect_count samples
+    """
+    def __init__(self, n_channels, shape_change_count=None, disconnect_count=None):
+        self.n_channels = n_channels
+        self.shape_change_count = shape_change_count
+        self.disconnect_count = disconnect_count
+        self.sample_count = 0
+        self.is_streaming = False
+
+    def start_stream(self, chunk_size=7):
+        self.chunk_size = chunk_size
+        self.is_streaming = True
+
+    def process_frames(self):
+        if self.disconnect_count is not None and self.sample_count >= self.disconnect_count:
+            raise ConnectionError('device disconnected')
+        n_channels = self.n_channels if self.shape_change_count is None or self.sample_count < self.shape_change_count else self.n_channels + 1
+        sample_indices = np.arange(self.sample_count, self.sample_count + self.chunk_size)
+        self.sample_count += self.chunk_size
+        return np.tile(sample_indices, (n_channels, 1)).astype(np.float32), sample_indices / 1000., [f'{self.sample_count} samples']
+
+    def stop_stream(self):
+        self.is_streaming = False
+
+    def is_stream_available(self):
+        return True
+
+
+def count_in_process(sample_queue, n_samples):
+    for i in range(n_samples):
+        sample_queue.put(i)
+
+
+class ProcessDevice:
+    """
+    a device whose samples come from a process it starts, as DSI24_Interface does
+    """
+    def start_stream(self, n_samples=100):
+        self.sample_queue = multiprocessing.Queue()
+        self.device_process = multiprocessing.Process(target=count_in_process, args=(self.sample_queue, n_samples))
+        self.device_process.start()
+
+    def process_frames(self):
+        sample_indices = []
+        while not self.sample_queue.empty():
+            sample_indices.append(self.sample_queue.get())
+        return np.array([sample_indices], dtype=np.float32), np.array(sample_indices) / 1000., []
+
+    def stop_stream(self):
+        self.device_process.join()
+
+
+def pull(interface, duration):
+    frames, timestamps, messages = [], [], []
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < duration:
+        new_frames, new_timestamps, *new_messages = interface.process_frames()
+        if len(new_timestamps) > 0:
+            frames.append(new_frames)
+            timestamps.append(new_timestamps)
+        messages += new_messages[0] if len(new_messages) > 0 else []
+        time.sleep(0.005)
+    return frames, timestamps, messages
+
+
+def test_device_in_process():
+    interface = SubprocessInterface(CounterDevice, 4, 2000, returns_messages=True, pull_interval=0.001)
+    assert interface.n_channels == 4 and not interface.is_streaming  # the plain attributes of the interface
+    assert interface.is_stream_available()
+    interface.start_stream(chunk_size=5)
+    assert interface.is_streaming and interface.chunk_size == 5
+    frames, timestamps, messages = pull(interface, 1.)
+    interface.stop_stream()
+    assert not interface.is_streaming
+
+    # the frames change shape after 2000 samples, the frames of the first ring are read before the second is
+    assert [f.shape[0] for f in frames] == sorted(f.shape[0] for f in frames) and frames[-1].shape[0] == 5
+    timestamps = np.concatenate(timestamps)
+    assert np.array_equal(timestamps, np.arange(len(timestamps)) / 1000.) and len(timestamps) > 2000
+    assert np.array_equal(np.concatenate([f[:4] for f in frames], axis=1), np.tile(np.arange(len(timestamps)), (4, 1)))
+    assert messages[-1] == f'{len(timestamps)} samples'
+    interface.close()
+
+    with pytest.raises(TypeError):
+        interface = SubprocessInterface(CounterDevice, 4, 2000, 0, 'too many arguments')
+
+
+def test_error_stops_the_stream():
+    interface = SubprocessInterface(CounterDevice, 4, None, 100, returns_messages=True)
+    interface.start_stream()
+    with pytest.raises(ConnectionError):
+        pull(interface, 0.5)
+    interface.is_stream_available()  # updates the attributes
+    sample_count = interface.sample_count
+    time.sleep(0.05)
+    interface.is_stream_available()
+    assert interface.sample_count == sample_count >= 100  # the process stopped pulling
+    interface.close()
+
+
+def test_device_that_starts_a_process():
+    interface = SubprocessInterface(ProcessDevice, returns_messages=True)
+    interface.start_stream(n_samples=100)
+    frames, timestamps, _ = pull(interface, 0.5)
+    interface.stop_stream()
+    assert np.array_equal(np.concatenate(timestamps), np.arange(100) / 1000.)
+    interface.close()
+
+
+def test_calls_from_two_threads():
+    interface = SubprocessInterface(CounterDevice, 4, returns_messages=True)
+    availabilities, done = [], threading.Event()
+
+    def check_availability():  # as the workers do on their thread
+        while not done.is_set():
+            try:
+                availabilities.append(interface.is_stream_available())
+            except Exception as e:
+                availabilities.append(e)
+
+    def start_and_stop():  # as the GUI thread does
+        for _ in range(50):
+            replies.append(interface.start_stream(chunk_size=5))
+            interface.process_frames()
+            replies.append(interface.stop_stream())
+        done.set()
+
+    replies = []
+    threads = [threading.Thread(target=check_availability, daemon=True), threading.Thread(target=start_and_stop, daemon=True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)  # a reply received by the wrong thread leaves the other waiting
+    assert replies == [None] * 100
+    assert len(availabilities) > 0 and all(availability is True for availability in availabilities)
+    interface.close()
+
+
+class Publisher(multiprocessing.Process):
+    """
+    publishes the samples of a counter as a ZMQ stream, in chunks of chunk_size every chunk_interval, the timestamps
+    are the clock time the chunk is sent
+    """
+    def __init__(self, stream_name, port, n_channels, chunk_size, chunk_interval, duration):
+        super().__init__(daemon=True)
+        self.args = stream_name, port, n_channels, chunk_size, chunk_interval, duration
+
+    def run(self):
+        stream_name, port, n_channels, chunk_size, chunk_interval, duration = self.args
+        context = zmq.Context()
+        socket = context.socket(zmq.PUB)
+        socket.bind(f'tcp://127.0.0.1:{port}')
+        time.sleep(0.5)  # let the subscribers connect
+        sample_count = 0
+        start_time = time.time()
+        while time.time() - start_time < duration:
+            sample_indices = np.arange(sample_count, sample_count + chunk_size)
+            send_zmq_samples(socket, stream_name, np.full(chunk_size, time.time()), np.tile(sample_indices, (n_channels, 1)).astype(np.float32))
+            sample_count += chunk_size
+            time.sleep(max(0., start_time + sample_count / chunk_size * chunk_interval - time.time()))
+        socket.close()
+        context.term()
+
+
+def get_free_ports(n):
+    context = zmq.Context()
+    sockets = [context.socket(zmq.PUB) for _ in range(n)]
+    ports = [socket.bind_to_random_port('tcp://127.0.0.1') for socket in sockets]
+    for socket in sockets:
+        socket.close()
+    context.term()
+    return ports
+
+
+def test_zmq_in_process_matches_main_process():
+    port, = get_free_ports(1)
+    publisher = Publisher('EEG', port, 8, 10, 0.005, 1.5)
+    in_process, in_subprocess = ZMQInterface(port, 'EEG', 'float32'), SubprocessInterface(ZMQInterface, port, 'EEG', 'float32')
+    assert in_subprocess.subtopic == 'EEG'
+    in_process.start_stream()
+    in_subprocess.start_stream()
+    publisher.start()
+    assert in_subprocess.is_stream_available(timeout=2000)
+    results = [pull(interface, 2.) for interface in (in_process, in_subprocess)]  # one after the other, the messages wait in the sockets
+    publisher.join()
+    in_process.close()
+    in_subprocess.close()
+    (frames, timestamps, _), (subprocess_frames, subprocess_timestamps, _) = results
+    assert np.array_equal(np.concatenate(frames, axis=1), np.concatenate(subprocess_frames, axis=1))
+    assert np.array_equal(np.concatenate(timestamps), np.concatenate(subprocess_timestamps))
+    frames = np.concatenate(frames, axis=1)
+    assert np.array_equal(frames, np.tile(np.arange(frames.shape[1]), (8, 1))) and frames.shape[1] > 1000  # no sample is lost
+
+
+def run_workers(interfaces, duration, pull_interval=0.002, gui_load=True):
+    """
+    pull each interface on its own thread into a buffer as the workers and stream widgets do, while a thread stands in
+    for the plotting and processing of the GUI
+    @return: the number of samples received and the latency of every chunk
+    """
+    buffer, lock = DataBuffer(), threading.Lock()
+    sample_counts, latencies = {}, []
+    running = True
+
+    def work(name, interface):
+        sample_counts[name] = 0
+        while running:
+            frames, timestamps = interface.process_frames()
+            if len(timestamps) > 0:
+                latencies.append(time.time() - timestamps[-1])
+                sample_counts[name] += len(timestamps)
+                with lock:
+                    buffer.update_buffer({'stream_name': name, 'frames': frames, 'timestamps': timestamps})
+                    buffer.clear_buffer()
+            time.sleep(pull_interval)
+
+    def gui():
+        while running:
+            sum(i * i for i in range(20000))  # python code that holds the GIL, e.g., updating the plots
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=work, args=(name, interface)) for name, interface in interfaces.items()]
+    if gui_load:
+        threads.append(threading.Thread(target=gui))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    running = False
+    for thread in threads:
+        thread.join()
+    return sum(sample_counts.values()), np.array(latencies)
+
+
+def test_thread_vs_process_throughput():
+    n_streams, n_channels, chunk_size, chunk_interval, duration = 8, 64, 20, 0.001, 3.
+    results = {}
+    for mode in ('thread', 'process'):
+        ports = get_free_ports(n_streams)
+        publishers = [Publisher(f'stream{i}', port, n_channels, chunk_size, chunk_interval, duration + 1) for i, port in enumerate(ports)]
+        if mode == 'thread':
+            interfaces = {f'stream{i}': ZMQInterface(port, f'stream{i}', 'float32') for i, port in enumerate(ports)}
+        else:
+            interfaces = {f'stream{i}': SubprocessInterface(ZMQInterface, port, f'stream{i}', 'float32', pull_interval=0.001) for i, port in enumerate(ports)}
+        for interface in interfaces.values():
+            interface.start_stream()
+        for publisher in publishers:
+            publisher.start()
+        time.sleep(0.7)
+        for interface in interfaces.values():  # what arrived before the publishers sent at full rate
+            interface.process_frames()
+        results[mode] = run_workers(interfaces, duration)
+        for publisher in publishers:
+            publisher.join()
+        for interface in interfaces.values():
+            interface.close()
+
+    print(f"\n{n_streams} streams of {n_channels} channels at {chunk_size / chunk_interval:.0f} Hz each, pulled on threads with a busy GUI thread for {duration}s")
+    print(f"{'mode':>10}{'samples/s':>14}{'latency mean (ms)':>20}{'latency p99 (ms)':>20}")
+    for mode, (n_samples, latencies) in results.items():
+        print(f"{mode:>10}{n_samples / duration:>14.0f}{np.mean(latencies) * 1e3:>20.2f}{np.percentile(latencies, 99) * 1e3:>20.2f}")
+    assert all(n_samples > 0 for n_samples, _ in results.values())
+    if os.cpu_count() > n_streams:  # the stream processes only run in parallel with the main process on enough cores
+        assert results['process'][0] >= results['thread'][0] or np.mean(results['process'][1]) < np.mean(results['thread'][1])
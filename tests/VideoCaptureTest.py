@@ -0,0 +1,115 @@
+"""
+Tests the preprocessing of the video frames against the process_image, flip and swapaxes the video workers and widget
+used to do, and the capture threads with simulated cameras.
+
+Run with pytest -s to see the time to preprocess a frame and to take the frames of four cameras.
+"""
+import time
+
+import numpy as np
+import pytest
+
+from physiolabxr.presets.PresetEnums import VideoDeviceChannelOrder
+from physiolabxr.threadings.VideoCaptureThread import VideoCaptureThread
+from physiolabxr.utils.image_utils import FramePreprocessor, process_image
+
+
+def preprocess_frame_copies(frame, channel_order, scale):
+    """
+    what WebcamWorker.process_on_tick and VideoWidget.process_stream_data did
+    """
+    frame = frame.astype(np.uint8)
+    frame = process_image(frame, channel_order, scale)
+    frame = np.flip(frame, axis=0)
+    return np.swapaxes(frame, 0, 1)
+
+
+class Camera:
+    """
+    gives a new frame every 1 / fps seconds, like cv2.VideoCapture.read blocks until the camera has one
+    """
+    def __init__(self, fps=30, shape=(720, 1280, 3)):
+        self.fps = fps
+        self.frames = np.random.randint(0, 256, (4,) + shape, dtype=np.uint8)
+        self.count = 0
+        self.next_frame_time = time.perf_counter()
+
+    def read(self):
+        self.next_frame_time += 1 / self.fps
+        time.sleep(max(0., self.next_frame_time - time.perf_counter()))
+        self.count += 1
+        return self.frames[self.count % len(self.frames)]
+
+
+@pytest.mark.parametrize('channel_order', [VideoDeviceChannelOrder.BGR, VideoDeviceChannelOrder.RGB])
+@pytest.mark.parametrize('scale', [1., 0.5, 0.33, 2.])
+def test_preprocess_matches_copies(channel_order, scale):
+    preprocessor = FramePreprocessor()
+    for shape in [(480, 640, 3), (480, 640, 3), (241, 321, 3)]:  # the scaled frame is reused, then reallocated
+        frame = np.random.randint(0, 256, shape, dtype=np.uint8)
+        expected = preprocess_frame_copies(frame, channel_order, scale)
+        out = np.empty(FramePreprocessor.get_output_shape(shape, scale), dtype=np.uint8)
+        assert preprocessor.process(frame, channel_order, scale, out=out) is out
+        assert np.array_equal(out, expected) and out.flags['C_CONTIGUOUS']
+        assert np.array_equal(preprocessor.process(frame.astype(np.float64), channel_order, scale), expected)
+
+
+def test_capture_thread_drops_oldest():
+    camera = Camera(fps=100, shape=(48, 64, 3))
+    capture_thread = VideoCaptureThread(camera.read, lambda: (VideoDeviceChannelOrder.BGR, 1.))
+    capture_thread.start()
+    time.sleep(0.2)  # nothing is taken, the frames before the latest are dropped
+    frame, timestamp = capture_thread.get_latest_frame()
+    assert capture_thread.dropped_frame_count >= capture_thread.capture_count - 2
+    assert frame.shape == (64, 48, 3) and capture_thread.get_latest_frame() is None
+
+    taken_frames = []
+    for i in range(20):  # taken faster than captured, a frame is never given twice
+        time.sleep(0.005)
+        latest_frame = capture_thread.get_latest_frame()
+        if latest_frame is not None:
+            assert all(latest_frame[0] is not f for f in taken_frames)
+            taken_frames.append(latest_frame[0])
+            if len(taken_frames) > 2:  # as VideoWidget does, give back the frame before the one shown
+                capture_thread.release_frame(taken_frames.pop(0))
+    capture_thread.stop()
+    assert not capture_thread.is_alive()
+    assert len({id(f) for f in capture_thread.free_frames}) == len(capture_thread.free_frames)
+
+
+def test_four_cameras_speed():
+    n_cameras, duration, fps = 4, 2., 30
+    frames = [Camera(fps).read() for _ in range(n_cameras)]
+    start_time = time.perf_counter()
+    for i in range(int(duration * fps)):  # the work done on the ticks of the worker and the widget for each frame
+        for frame in frames:
+            preprocess_frame_copies(frame, VideoDeviceChannelOrder.BGR, 1.).reshape(-1)
+    copies_time = (time.perf_counter() - start_time) / (duration * fps * n_cameras)
+
+    cameras = [Camera(fps) for _ in range(n_cameras)]
+    capture_threads = [VideoCaptureThread(camera.read, lambda: (VideoDeviceChannelOrder.BGR, 1.)) for camera in cameras]
+    for capture_thread in capture_threads:
+        capture_thread.start()
+    take_times, shown_frames, n_taken = [], [None] * n_cameras, 0
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < duration:  # the ticks of the video widgets
+        time.sleep(1 / fps)
+        for i, capture_thread in enumerate(capture_threads):
+            take_start_time = time.perf_counter()
+            latest_frame = capture_thread.get_latest_frame()
+            if latest_frame is not None:
+                latest_frame[0].reshape(-1)
+                if shown_frames[i] is not None:
+                    capture_thread.release_frame(shown_frames[i])
+                shown_frames[i] = latest_frame[0]
+                n_taken += 1
+            take_times.append(time.perf_counter() - take_start_time)
+    for capture_thread in capture_threads:
+        capture_thread.stop()
+    preprocess_time = np.mean([t for capture_thread in capture_threads for t in capture_thread.preprocess_times])
+
+    print(f"\n{n_cameras} cameras of 1280x720 at {fps} fps for {duration}s: preprocessing with copies {copies_time * 1e3:.3f}ms per frame, "
+          f"fused {preprocess_time * 1e3:.3f}ms per frame on the capture threads, {np.mean(take_times) * 1e6:.1f}us to take a frame on a tick, "
+          f"{n_taken} frames taken, {sum(t.capture_count for t in capture_threads)} captured, {sum(t.dropped_frame_count for t in capture_threads)} dropped")
+    assert preprocess_time < copies_time
+    assert np.mean(take_times) < copies_time
@@ -0,0 +1,101 @@
+"""
+Benchmark of the xdf export against the per-sample encoder save_xdf used before it was vectorized. Both encoders must
+produce the same Samples chunks.
+
+Run with pytest -s to see the results.
+"""
+import io
+import struct
+import time
+
+import numpy as np
+import pytest
+
+from physiolabxr.utils.RNStream import RNStream
+from physiolabxr.utils.xdf_utils import write_samples_chunks, save_xdf, load_xdf, XdfTag, get_num_length_bytes
+
+
+def legacy_write_samples_chunks(out_file, data_array, ts_array, stream_id, sample_chunk_max_size=50):
+    """
+    how save_xdf wrote the samples of a stream before it was vectorized, one write per sample
+    """
+    total_samples = len(ts_array)
+    nchannels = np.prod(data_array.shape[:-1])
+    stream_data_type = data_array.dtype
+    n_sample_chunks = total_samples // sample_chunk_max_size + 1
+    samples_stored = 0
+    for i in range(n_sample_chunks):
+        num_samples = total_samples - samples_stored if i == n_sample_chunks - 1 else sample_chunk_max_size
+        num_sample_bytes = get_num_length_bytes(num_samples)
+        samples_byte_len = 9 * num_samples + nchannels * num_samples * stream_data_type.itemsize
+        content_tag_byte_len = int(2 + 4 + 1 + num_sample_bytes + samples_byte_len)
+        num_chunk_byte_len = get_num_length_bytes(content_tag_byte_len)
+        stream_content_head = num_chunk_byte_len.to_bytes(1, byteorder='little') + \
+                              content_tag_byte_len.to_bytes(num_chunk_byte_len, byteorder='little') + \
+                              XdfTag.Samples.value.to_bytes(2, byteorder='little') + \
+                              stream_id.to_bytes(4, byteorder='little') + \
+                              num_sample_bytes.to_bytes(1, byteorder='little') + \
+                              num_samples.to_bytes(num_sample_bytes, byteorder='little')
+        out_file.write(stream_content_head)
+        for j in range(num_samples):
+            timestampbytes = int(8).to_bytes(1, byteorder='little')
+            timestamp = struct.pack('<d', ts_array[i * sample_chunk_max_size + j])
+            values = data_array[..., i * sample_chunk_max_size + j].tobytes()
+            out_file.write(timestampbytes + timestamp + values)
+        samples_stored += num_samples
+
+
+def random_stream(frame_shape, n_samples, dtype):
+    data = (np.random.random(frame_shape + (n_samples,)) * 100).astype(dtype)
+    return data, np.cumsum(np.random.random(n_samples) + 1e-3)
+
+
+@pytest.mark.parametrize('frame_shape, dtype, n_samples, sample_chunk_max_size',
+                         [((64,), np.float32, 1234, 50), ((3,), np.float64, 7, 50), ((4, 5, 3), np.uint8, 101, 10),
+                          ((2,), np.int16, 300 * 300 + 1, 300)])  # the last one has four-byte chunk lengths
+def test_samples_chunks_match_legacy(frame_shape, dtype, n_samples, sample_chunk_max_size):
+    data, timestamps = random_stream(frame_shape, n_samples, dtype)
+    legacy, vectorized = io.BytesIO(), io.BytesIO()
+    legacy_write_samples_chunks(legacy, data, timestamps, 3, sample_chunk_max_size)
+    write_samples_chunks(vectorized, data, timestamps, 3, sample_chunk_max_size, write_buffer_size=2 ** 12)
+    assert vectorized.getvalue() == legacy.getvalue()
+
+
+def test_save_xdf_from_memmap(tmp_path, monkeypatch):
+    monkeypatch.setattr('physiolabxr.utils.xdf_utils.get_stream_nominal_sampling_rate', lambda stream_name: 0)  # no presets
+    stream = RNStream(str(tmp_path / 'test.dats'))
+    written = {'EEG': ([], []), 'Camera': ([], [])}
+    for i in range(5):
+        eeg, eeg_timestamps = random_stream((8,), 97, np.float32)
+        camera, camera_timestamps = random_stream((6, 4, 3), 5, np.uint8)
+        eeg_timestamps, camera_timestamps = eeg_timestamps + i * 1000, camera_timestamps + i * 1000
+        stream.stream_out({'EEG': [eeg, eeg_timestamps], 'Camera': [camera, camera_timestamps]})
+        for stream_name, data, timestamps in (('EEG', eeg, eeg_timestamps), ('Camera', camera, camera_timestamps)):
+            written[stream_name][0].append(data)
+            written[stream_name][1].append(timestamps)
+
+    save_xdf(str(tmp_path / 'test.xdf'), RNStream(stream.fn).stream_in_memmap(jitter_removal=False))
+    loaded = load_xdf(str(tmp_path / 'test.xdf'))
+    for stream_name, (data, timestamps) in written.items():
+        assert np.array_equal(loaded[stream_name][0], np.concatenate(data, axis=-1))
+        assert np.allclose(loaded[stream_name][1], np.concatenate(timestamps))
+
+
+def time_export(write, data, timestamps):
+    start_time = time.perf_counter()
+    write(io.BytesIO(), data, timestamps, 0)
+    return time.perf_counter() - start_time
+
+
+def test_export_speed():
+    n_samples = 2 ** 16
+    results = {}
+    for n_channels in [1, 8, 64, 512]:
+        data, timestamps = random_stream((n_channels,), n_samples, np.float32)
+        results[n_channels] = time_export(legacy_write_samples_chunks, data, timestamps), time_export(write_samples_chunks, data, timestamps)
+
+    print(f"\nexport time of {n_samples} samples (ms)")
+    print(f"{'channels':>10}{'legacy':>10}{'vectorized':>12}{'speedup':>10}")
+    for n_channels, (legacy_time, vectorized_time) in results.items():
+        print(f"{n_channels:>10}{legacy_time * 1e3:>10.1f}{vectorized_time * 1e3:>12.1f}{legacy_time / vectorized_time:>10.1f}")
+    assert all(vectorized_time < legacy_time for legacy_time, vectorized_time in results.values())
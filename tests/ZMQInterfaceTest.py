@@ -0,0 +1,114 @@
+"""
+Tests the batched ingest of ZMQInterface against decoding and concatenating the messages one by one, as ZMQWorker did,
+for single-sample and multi-sample frames, and benchmarks the two.
+
+Run with pytest -s to see the time to drain the messages.
+"""
+import time
+
+import numpy as np
+import pytest
+import zmq
+
+from physiolabxr.exceptions.exceptions import InvalidZMQMessageError
+from physiolabxr.interfaces.ZMQInterface import ZMQInterface, decode_zmq_frame
+from physiolabxr.utils.networking_utils import send_zmq_samples
+
+
+@pytest.fixture
+def publisher():
+    context = zmq.Context()
+    socket = context.socket(zmq.PUB)
+    socket.setsockopt(zmq.SNDHWM, 0)
+    socket.setsockopt(zmq.LINGER, 0)
+    port = socket.bind_to_random_port('tcp://127.0.0.1')
+    yield socket, port
+    socket.close()
+    context.term()
+
+
+def connect(port, stream_name='EEG', data_type='float32'):
+    interface = ZMQInterface(port, stream_name, data_type)
+    interface.socket.setsockopt(zmq.RCVHWM, 0)
+    time.sleep(0.3)  # let the subscriber connect
+    return interface
+
+
+def publish_counter(socket, n_channels, n_samples, chunk_size, start=0, stream_name='EEG'):
+    for i in range(start, start + n_samples, chunk_size):
+        sample_indices = np.arange(i, i + chunk_size)
+        send_zmq_samples(socket, stream_name, sample_indices / 1000., np.tile(sample_indices, (n_channels, 1)).astype(np.float32))
+    time.sleep(0.3)  # let the messages arrive
+
+
+def process_frames_by_message(interface):
+    """
+    drain the socket a message at a time, as ZMQWorker did before the batched ingest
+    """
+    timestamp_list, data_list = [], []
+    while True:
+        try:
+            message = interface.socket.recv_multipart(flags=zmq.NOBLOCK)
+        except zmq.error.Again:
+            break
+        _, timestamps, data = decode_zmq_frame(message, interface.data_type)
+        timestamp_list.append(timestamps)
+        data_list.append(data)
+    if len(timestamp_list) == 0:
+        return [], []
+    return np.concatenate(data_list, axis=1), np.concatenate(timestamp_list)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+def test_batched_ingest_matches_by_message(publisher, chunk_size):
+    socket, port = publisher
+    interface, reference = connect(port), connect(port)
+    publish_counter(socket, 8, 700, chunk_size)
+    frames, timestamps = interface.process_frames()
+    expected_frames, expected_timestamps = process_frames_by_message(reference)
+    assert np.array_equal(frames, expected_frames) and np.array_equal(timestamps, expected_timestamps)
+    assert frames.shape == (8, 700) and frames.dtype == np.float32 and timestamps.dtype == np.float64
+
+    # what was returned before is left as it was by the next call
+    publish_counter(socket, 8, 700, chunk_size, start=700)
+    new_frames, new_timestamps = interface.process_frames()
+    assert np.array_equal(frames, expected_frames) and np.array_equal(new_timestamps, np.arange(700, 1400) / 1000.)
+    assert interface.process_frames() == ([], [])
+    interface.close()
+    reference.close()
+
+
+def test_channel_change(publisher):
+    socket, port = publisher
+    interface = connect(port)
+    publish_counter(socket, 8, 10, 5)
+    assert interface.process_frames()[0].shape == (8, 10)
+    publish_counter(socket, 4, 10, 5)  # across calls the number of channels can change
+    assert interface.process_frames()[0].shape == (4, 10)
+    publish_counter(socket, 4, 5, 5)
+    publish_counter(socket, 8, 5, 5)  # but not within one
+    with pytest.raises(InvalidZMQMessageError):
+        interface.process_frames()
+    interface.close()
+
+
+def test_ingest_speed(publisher):
+    socket, port = publisher
+    n_channels, n_samples, n_repeats = 64, 5000, 5
+    print(f"\nbest of {n_repeats} drains of {n_samples} samples of {n_channels} channels")
+    print(f"{'chunk size':>12}{'by message (ms)':>18}{'batched (ms)':>15}")
+    for chunk_size in (1, 10, 100):
+        times = {}
+        for name, process_frames in (('by message', process_frames_by_message), ('batched', ZMQInterface.process_frames)):
+            interface = connect(port)
+            times[name] = []
+            for _ in range(n_repeats):
+                publish_counter(socket, n_channels, n_samples, chunk_size)
+                start_time = time.perf_counter()
+                frames, _ = process_frames(interface)
+                times[name].append(time.perf_counter() - start_time)
+                assert frames.shape == (n_channels, n_samples)
+            interface.close()
+        print(f"{chunk_size:>12}{min(times['by message']) * 1e3:>18.2f}{min(times['batched']) * 1e3:>15.2f}")
+        if chunk_size == 1:  # where the overhead of every message matters most
+            assert min(times['batched']) < min(times['by message'])
@@ -535,7 +535,7 @@ def run_replay_benchmark(app_main_window, test_context: ContextBot, test_stream_
         print("test: completed loading replayed file, now computing performance metrics")
         for measure in metrics:
             if measure == 'replay push data loop time':
-                average_loop_time = app_main_window.replay_tab._request_replay_performance()
+                average_loop_time, _ = app_main_window.replay_tab._request_replay_performance()
                 if average_loop_time == 0:
                     raise ValueError()
                 results[measure][n_streams, num_channels, sampling_rate][measure] = average_loop_time